@@ -30,6 +30,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'xscriber.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -93,4 +94,75 @@ DATA_DIR = BASE_DIR / 'data'
 AUDIO_RECORDINGS_DIR = DATA_DIR / 'audio-recordings'
 RAW_TRANSCRIPTIONS_DIR = DATA_DIR / 'raw-transcriptions'
 OUTPUT_DIR = DATA_DIR / 'output'
-PROJECT_METADATA_DIR = DATA_DIR / 'project_metadata'
\ No newline at end of file
+PROJECT_METADATA_DIR = DATA_DIR / 'project_metadata'
+LLM_CACHE_DIR = DATA_DIR / 'llm_cache'
+
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'True').lower() == 'true'
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '500'))
+LLM_CACHE_MAX_BYTES = int(os.getenv('LLM_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+
+# Server-side recording sessions (each with its own capture thread) that may run at once
+RECORDING_MAX_SESSIONS = int(os.getenv('RECORDING_MAX_SESSIONS', '4'))
+
+# "full" regenerates the whole TRD on update; "patch" applies section-level edits per transcription
+TRD_UPDATE_MODE = os.getenv('TRD_UPDATE_MODE', 'full')
+
+# Model tiers for TRD generation: the preview model refreshes the TRD while a session is
+# recording, and the final model produces the final document when the session ends. Both
+# default to gpt-3.5-turbo, the model used before tiers existed; set TRD_PREVIEW_MODEL to
+# a cheaper model (e.g. gpt-4o-mini) and TRD_FINAL_MODEL to a stronger one (e.g. gpt-4o)
+# to opt in. Projects can override either in their metadata "model_policy".
+TRD_FINAL_MODEL = os.getenv('TRD_FINAL_MODEL', 'gpt-3.5-turbo')
+TRD_PREVIEW_MODEL = os.getenv('TRD_PREVIEW_MODEL', TRD_FINAL_MODEL)
+
+# Number of concurrent workers per pipeline stage; TRD updates stay serialised per project
+PIPELINE_TRANSCRIPTION_CONCURRENCY = int(os.getenv('PIPELINE_TRANSCRIPTION_CONCURRENCY', '2'))
+PIPELINE_TRD_CONCURRENCY = int(os.getenv('PIPELINE_TRD_CONCURRENCY', '2'))
+# Run pipeline workers inside the web process. Set to False in production and run
+# `python manage.py run_pipeline` instead, so web workers only enqueue jobs and read results.
+PIPELINE_IN_WEB_PROCESS = os.getenv('PIPELINE_IN_WEB_PROCESS', 'True').lower() == 'true'
+# Preview TRD updates not finished within this many seconds are cancelled (0 disables);
+# the final pass at the end of the session covers them anyway
+PIPELINE_PREVIEW_DEADLINE_SECONDS = int(os.getenv('PIPELINE_PREVIEW_DEADLINE_SECONDS', '600'))
+# How often idle workers re-check the journal for jobs enqueued by other processes
+PIPELINE_POLL_INTERVAL = float(os.getenv('PIPELINE_POLL_INTERVAL', '1.0'))
+# OpenAI clients, pydub and pipeline workers are created on first use. When True, the
+# WSGI/ASGI entry points create them at server start instead (management commands and
+# tests never do), so the first request does not pay for it.
+PIPELINE_WARM_UP_ON_START = os.getenv('PIPELINE_WARM_UP_ON_START', 'True').lower() == 'true'
+
+# Upload admission control: chunk uploads get 429 with a Retry-After while the transcription
+# backlog (queued plus running jobs) is over these limits or free disk space is below the floor
+UPLOAD_MAX_TRANSCRIPTION_BACKLOG = int(os.getenv('UPLOAD_MAX_TRANSCRIPTION_BACKLOG', '20'))
+UPLOAD_MAX_PROJECT_BACKLOG = int(os.getenv('UPLOAD_MAX_PROJECT_BACKLOG', '5'))
+UPLOAD_MIN_FREE_DISK_MB = int(os.getenv('UPLOAD_MIN_FREE_DISK_MB', '500'))
+UPLOAD_MAX_RETRY_AFTER_SECONDS = int(os.getenv('UPLOAD_MAX_RETRY_AFTER_SECONDS', '120'))
+
+# Durable job journal (data/jobs.sqlite3): claims hold a lease that workers renew while
+# working; jobs whose lease expires are retried, up to JOB_MAX_ATTEMPTS claims in total.
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '300'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+# Finished (done, failed or cancelled) jobs are deleted after JOB_RETENTION_SECONDS by
+# processes running workers, checked every JOB_PURGE_INTERVAL_SECONDS
+JOB_RETENTION_SECONDS = int(os.getenv('JOB_RETENTION_SECONDS', str(7 * 24 * 3600)))
+JOB_PURGE_INTERVAL_SECONDS = int(os.getenv('JOB_PURGE_INTERVAL_SECONDS', '3600'))
+# Re-enqueue untranscribed audio and stale TRDs when the pipeline starts
+JOB_RECONCILE_ON_STARTUP = os.getenv('JOB_RECONCILE_ON_STARTUP', 'True').lower() == 'true'
+
+# Structured logging: xscriber loggers write JSON lines (or LOG_FORMAT=text) to stderr from a
+# background thread. LOG_LEVELS overrides LOG_LEVEL per stage ("trd=DEBUG,pipeline=WARNING");
+# LOG_SAMPLING keeps one in N high-volume messages ("chunk_progress=10,trd_progress=10").
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+LOG_SAMPLING = os.getenv('LOG_SAMPLING', '')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+# Records logged while the queue is full are dropped (counted in the pipeline status)
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+# On-demand profiling (/api/admin/profiling/): staff users, or requests with
+# "Authorization: Bearer $PROFILING_TOKEN" when it is set. Sessions last at most
+# PROFILING_MAX_SECONDS; sampling mode records stacks every PROFILING_SAMPLE_INTERVAL seconds.
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+PROFILING_MAX_SECONDS = int(os.getenv('PROFILING_MAX_SECONDS', '600'))
+PROFILING_SAMPLE_INTERVAL = float(os.getenv('PROFILING_SAMPLE_INTERVAL', '0.005'))
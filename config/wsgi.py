@@ -4,4 +4,10 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+from django.conf import settings
+
+if getattr(settings, 'PIPELINE_WARM_UP_ON_START', True):
+    from xscriber.views import project_handler
+    project_handler.warm_up()
@@ -40,8 +40,8 @@ def simulate_trd_updates():
 
         # Queue the transcription for TRD processing
         print(f"  📋 Queuing transcription for TRD update...")
-        project_handler.trd_update_queue.put((project_id, transcription_file))
-        print(f"  ✅ Queued successfully. Queue size: {project_handler.trd_update_queue.qsize()}")
+        project_handler._queue_trd_update(project_id, transcription_file)
+        print(f"  ✅ Queued successfully. Queue size: {project_handler.get_pipeline_stats()['trd_queue_size']}")
 
         # Give some time for processing
         import time
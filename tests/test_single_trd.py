@@ -32,8 +32,8 @@ def test_single_trd_update():
 
     # Queue the transcription for TRD processing
     print(f"  📋 Queuing transcription for TRD update...")
-    project_handler.trd_update_queue.put((project_id, transcription_file))
-    print(f"  ✅ Queued successfully. Queue size: {project_handler.trd_update_queue.qsize()}")
+    project_handler._queue_trd_update(project_id, transcription_file)
+    print(f"  ✅ Queued successfully. Queue size: {project_handler.get_pipeline_stats()['trd_queue_size']}")
 
     # Give some time for processing
     print("Waiting 10 seconds for processing...")
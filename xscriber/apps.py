@@ -3,4 +3,9 @@ from django.apps import AppConfig
 
 class XscriberConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'xscriber'
\ No newline at end of file
+    name = 'xscriber'
+
+    def ready(self):
+        # The writer thread starts with the first log record, not here
+        from .modules.structured_log import configure_logging
+        configure_logging()
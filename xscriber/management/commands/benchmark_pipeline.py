@@ -0,0 +1,83 @@
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from xscriber.modules.pipeline_benchmark import PipelineBenchmark, compare_results, save_result
+
+
+class Command(BaseCommand):
+    help = ("Run concurrent sessions through upload, transcription and TRD generation against a local "
+            "fake OpenAI server and write per-stage latency, throughput and peak RSS as JSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projects', type=int, default=4, help='Concurrent recording sessions (default 4)')
+        parser.add_argument('--chunks', type=int, default=5, help='Chunks per session (default 5)')
+        parser.add_argument('--chunk-seconds', type=float, default=30.0, help='Audio length of each chunk (default 30)')
+        parser.add_argument('--chunk-interval', type=float, default=1.0,
+                            help='Seconds between a session\'s chunks (default 1; 30 is real time)')
+        parser.add_argument('--transcription-concurrency', type=int, help='Override PIPELINE_TRANSCRIPTION_CONCURRENCY')
+        parser.add_argument('--trd-concurrency', type=int, help='Override PIPELINE_TRD_CONCURRENCY')
+        parser.add_argument('--whisper-latency', type=float, default=0.5, help='Fake transcription latency in seconds')
+        parser.add_argument('--whisper-realtime-factor', type=float, default=0.05,
+                            help='Extra fake transcription latency per second of audio')
+        parser.add_argument('--chat-latency', type=float, default=0.3, help='Fake time to first token in seconds')
+        parser.add_argument('--token-rate', type=float, default=50.0,
+                            help='Fake completion tokens per second (0 for instant)')
+        parser.add_argument('--completion-tokens', type=int, default=300, help='Approximate tokens per fake TRD')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of fake API requests that fail')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for injected failures')
+        parser.add_argument('--timeout', type=float, default=600.0, help='Give up waiting for the pipeline after this')
+        parser.add_argument('--output', help='Result file (default data/benchmarks/pipeline_<timestamp>.json)')
+        parser.add_argument('--compare', metavar='BASELINE', help='Fail if the run regresses against this result file')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed regression for --compare (default 0.2)')
+        parser.add_argument('--keep-data', action='store_true', help='Keep the temporary data directory')
+
+    def handle(self, *args, **options):
+        benchmark = PipelineBenchmark(
+            projects=options['projects'],
+            chunks_per_project=options['chunks'],
+            chunk_seconds=options['chunk_seconds'],
+            chunk_interval=options['chunk_interval'],
+            transcription_concurrency=options['transcription_concurrency'],
+            trd_concurrency=options['trd_concurrency'],
+            timeout=options['timeout'],
+            keep_data=options['keep_data'],
+            server_options={
+                "whisper_latency": options['whisper_latency'],
+                "whisper_realtime_factor": options['whisper_realtime_factor'],
+                "chat_latency": options['chat_latency'],
+                "token_rate": options['token_rate'],
+                "completion_tokens": options['completion_tokens'],
+                "error_rate": options['error_rate'],
+                "seed": options['seed']
+            }
+        )
+
+        self.stdout.write(f"Running {options['projects']} session(s) of {options['chunks']} chunk(s)...")
+        result = benchmark.run()
+
+        output = options['output'] or (settings.DATA_DIR / 'benchmarks' /
+                                       f"pipeline_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        output_path = save_result(result, output)
+
+        self.stdout.write(f"Finished in {result['duration_seconds']}s"
+                          + ("" if result['completed'] else " (timed out before the pipeline was idle)"))
+        self.stdout.write(f"Throughput: {json.dumps(result['throughput'])}")
+        for stage, summary in result['stages'].items():
+            if summary['count']:
+                self.stdout.write(f"  {stage:<28} n={summary['count']:<5} p50={summary['p50']}s "
+                                  f"p95={summary['p95']}s p99={summary['p99']}s")
+        self.stdout.write(f"Peak RSS: {result['memory']['peak_rss_mb']}MB")
+        self.stdout.write(f"Results written to {output_path}")
+
+        if options['compare']:
+            with open(options['compare'], 'r') as f:
+                baseline = json.load(f)
+            regressions = compare_results(baseline, result, options['tolerance'])
+            if regressions:
+                for regression in regressions:
+                    self.stdout.write(f"REGRESSION: {regression}")
+                raise CommandError(f"{len(regressions)} regression(s) against {options['compare']}")
+            self.stdout.write(f"No regressions against {options['compare']}")
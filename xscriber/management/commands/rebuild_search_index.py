@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from xscriber.modules.project_handler import ProjectHandler
+
+
+class Command(BaseCommand):
+    help = "Index existing transcriptions for full-text search (only new or changed files unless --full)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', action='append', dest='project_ids',
+                            help='Only index this project id (repeatable)')
+        parser.add_argument('--full', action='store_true', help='Reindex every transcription, changed or not')
+
+    def handle(self, *args, **options):
+        project_handler = ProjectHandler(start_workers=False)
+        try:
+            search_index = project_handler.search_index
+            counts = search_index.rebuild(project_handler.transcription_dir,
+                                          project_ids=options['project_ids'], full=options['full'])
+            if counts["indexed"] or counts["removed"]:
+                search_index.optimize()
+
+            stats = search_index.get_stats()
+            self.stdout.write(
+                f"Indexed {counts['indexed']} transcription(s), {counts['unchanged']} unchanged, "
+                f"{counts['removed']} removed, {counts['errors']} unreadable"
+            )
+            self.stdout.write(
+                f"Index holds {stats['segments']} segment(s) from {stats['chunks']} chunk(s) "
+                f"across {stats['projects']} project(s)"
+            )
+        finally:
+            project_handler.cleanup()
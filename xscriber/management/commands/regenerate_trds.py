@@ -0,0 +1,127 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from xscriber.modules.job_journal import JobJournal
+from xscriber.modules.project_handler import ProjectHandler
+from xscriber.modules.trd_regeneration import TRDRegenerationJob
+
+
+class Command(BaseCommand):
+    help = "Regenerate the TRD of every project (or a filtered set) with checkpointing and resume"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', action='append', dest='project_ids',
+                            help='Only regenerate this project id (repeatable)')
+        parser.add_argument('--name-contains', help='Only regenerate projects whose name contains this text')
+        parser.add_argument('--updated-before', help='Only regenerate projects last updated before this ISO date')
+        parser.add_argument('--concurrency', type=int, help='Projects regenerated at the same time (default 4)')
+        parser.add_argument('--bypass-cache', action='store_true', help='Always call the model, refreshing the LLM cache')
+        parser.add_argument('--dry-run', action='store_true', help='Estimate tokens and cost without regenerating')
+        parser.add_argument('--enqueue', action='store_true',
+                            help='Queue bulk-priority regenerations for the pipeline workers instead of running them here')
+        parser.add_argument('--resume', metavar='JOB_ID', help='Resume an interrupted job from its checkpoint')
+        parser.add_argument('--retry-failed', action='store_true', help='When resuming, also retry failed projects')
+
+    def handle(self, *args, **options):
+        # Regeneration runs its own coroutines; queued pipeline jobs are left to the pipeline workers
+        project_handler = ProjectHandler(start_workers=False)
+        try:
+            if options['resume']:
+                job = self._resume_job(project_handler, options)
+                retry_failed = options['retry_failed']
+                if options['dry_run']:
+                    self._print_estimate(job.estimate(job.remaining_projects(retry_failed)))
+                    return
+            else:
+                project_ids = TRDRegenerationJob.select_projects(
+                    project_handler,
+                    project_ids=options['project_ids'],
+                    name_contains=options['name_contains'],
+                    updated_before=options['updated_before']
+                )
+                if not project_ids:
+                    self.stdout.write("No projects match the given filters")
+                    return
+
+                job = TRDRegenerationJob(project_handler, concurrency=options['concurrency'] or 4,
+                                         bypass_cache=options['bypass_cache'])
+
+                if options['dry_run']:
+                    self._print_estimate(job.estimate(project_ids))
+                    return
+
+                if options['enqueue']:
+                    queued = sum(project_handler.queue_trd_regeneration(project_id, priority=JobJournal.PRIORITY_BULK)
+                                 for project_id in project_ids)
+                    self.stdout.write(f"Queued {queued} bulk TRD regeneration(s); live sessions are served first")
+                    return
+
+                job.create(project_ids, {
+                    "concurrency": job.concurrency,
+                    "bypass_cache": job.bypass_cache
+                })
+                retry_failed = False
+
+            self._run_job(job, retry_failed)
+        finally:
+            project_handler.cleanup()
+
+    def _resume_job(self, project_handler, options) -> TRDRegenerationJob:
+        job = TRDRegenerationJob(project_handler, job_id=options['resume'])
+        if not job.load():
+            raise CommandError(f"No checkpoint found for job {options['resume']}")
+
+        saved_options = job.state.get("options", {})
+        job.concurrency = max(1, options['concurrency'] or saved_options.get("concurrency", 4))
+        job.bypass_cache = options['bypass_cache'] or saved_options.get("bypass_cache", False)
+        return job
+
+    def _run_job(self, job: TRDRegenerationJob, retry_failed: bool):
+        remaining = job.remaining_projects(retry_failed)
+        total = len(remaining)
+        self.stdout.write(f"Job {job.job_id}: regenerating {total} project(s) with concurrency {job.concurrency}")
+        self.stdout.write(f"Checkpoint: {job.checkpoint_file}")
+
+        done = [0]
+
+        def on_progress(project_id, result):
+            done[0] += 1
+            line = f"[{done[0]}/{total}] {project_id}: {result['status']} ({result['duration_seconds']}s)"
+            if result.get("error"):
+                line += f" - {result['error']}"
+            self.stdout.write(line)
+
+        try:
+            summary = job.run(retry_failed=retry_failed, on_progress=on_progress)
+        except KeyboardInterrupt:
+            self.stdout.write(f"\nInterrupted. Resume with: python manage.py regenerate_trds --resume {job.job_id}")
+            raise SystemExit(1)
+
+        self.stdout.write(
+            f"Job {job.job_id} finished: {summary['completed']} completed, "
+            f"{summary['failed']} failed, {summary['pending']} pending"
+        )
+        if summary['failed']:
+            self.stdout.write(f"Retry failures with: python manage.py regenerate_trds --resume {job.job_id} --retry-failed")
+
+    def _print_estimate(self, estimate):
+        for project_id, project_estimate in estimate["projects"].items():
+            if project_estimate is None:
+                self.stdout.write(f"{project_id}: no transcriptions, skipped")
+                continue
+
+            cost = project_estimate["estimated_cost"]
+            self.stdout.write(
+                f"{project_id}: {project_estimate['transcription_count']} transcription(s), "
+                f"~{project_estimate['prompt_tokens']} prompt + {project_estimate['completion_tokens']} completion tokens"
+                + (f", ~${cost:.4f}" if cost is not None else "")
+                + (" (includes summary call)" if project_estimate["needs_summary"] else "")
+            )
+
+        totals = estimate["totals"]
+        cost = totals["estimated_cost"]
+        self.stdout.write(
+            f"Total: ~{totals['prompt_tokens']} prompt + {totals['completion_tokens']} completion tokens, "
+            + (f"~${cost:.2f}" if cost is not None else "cost unknown for this model")
+            + f" ({totals['skipped']} project(s) skipped)"
+        )
+        self.stdout.write("Completion tokens are the planned maximum, so the cost is an upper bound.")
@@ -0,0 +1,88 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from xscriber.modules.pipeline_benchmark import save_result
+from xscriber.modules.session_replay import SessionReplay, BACKENDS
+
+
+class Command(BaseCommand):
+    help = ("Replay a recorded project's chunks with their original timing (or sped up) and report "
+            "TRD freshness and pipeline backlog over the session")
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_id', help='Recorded project to replay')
+        parser.add_argument('--source-dir', help='Data directory holding the recording (default DATA_DIR)')
+        parser.add_argument('--speed', type=float, default=1.0, help='Replay this many times faster (default 1)')
+        parser.add_argument('--backend', choices=BACKENDS, default='stub',
+                            help='real: OpenAI API; cached: stored transcripts and LLM cache; '
+                                 'stub: local fake server (default)')
+        parser.add_argument('--target-url',
+                            help='Upload to a running server (e.g. http://localhost:8000) instead of '
+                                 'replaying in-process; the server uses its own backends')
+        parser.add_argument('--sample-interval', type=float, default=1.0,
+                            help='Seconds between freshness and backlog samples (default 1)')
+        parser.add_argument('--timeout', type=float, default=600.0, help='Give up waiting for the pipeline after this')
+        parser.add_argument('--whisper-latency', type=float, default=0.5, help='Stub transcription latency in seconds')
+        parser.add_argument('--chat-latency', type=float, default=0.3, help='Stub time to first token in seconds')
+        parser.add_argument('--token-rate', type=float, default=50.0, help='Stub completion tokens per second')
+        parser.add_argument('--output', help='Result file (default data/replays/<project>_<timestamp>.json)')
+        parser.add_argument('--keep-data', action='store_true', help='Keep the temporary replay data directory')
+
+    def handle(self, *args, **options):
+        replay = SessionReplay(
+            options['project_id'],
+            source_dir=options['source_dir'],
+            speed=options['speed'],
+            backend=options['backend'],
+            target_url=options['target_url'],
+            sample_interval=options['sample_interval'],
+            timeout=options['timeout'],
+            keep_data=options['keep_data'],
+            server_options={
+                "whisper_latency": options['whisper_latency'],
+                "chat_latency": options['chat_latency'],
+                "token_rate": options['token_rate']
+            }
+        )
+
+        try:
+            result = replay.run()
+        except (ValueError, RuntimeError) as e:
+            raise CommandError(str(e))
+
+        output = options['output'] or (settings.DATA_DIR / 'replays' /
+                                       f"{options['project_id']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        output_path = save_result(result, output)
+
+        source = result['source']
+        self.stdout.write(f"Replayed {result['uploads']['sent']} of {source['chunks']} chunk(s) "
+                          f"({source['session_seconds']}s session at {options['speed']}x) "
+                          f"in {result['duration_seconds']}s"
+                          + ("" if result['completed'] else " (timed out before the pipeline was idle)"))
+        if source['skipped']:
+            self.stdout.write(f"Skipped chunks without audio: {[c['chunk_id'] for c in source['skipped']]}")
+
+        self.stdout.write(f"{'elapsed':>8} {'sent':>5} {'done':>5} {'in TRD':>6} {'stale':>6} "
+                          f"{'age':>7} {'tx q':>5} {'trd q':>5}")
+        timeline = result['timeline']
+        step = max(1, len(timeline) // 20)
+        for sample in timeline[::step] + ([timeline[-1]] if (len(timeline) - 1) % step else []):
+            self.stdout.write(f"{sample['elapsed']:>8} {sample['chunks_sent']:>5} {sample['chunks_transcribed']:>5} "
+                              f"{sample['chunks_in_trd']:>6} {sample['stale_chunks']:>6} "
+                              f"{sample['staleness_seconds']:>7} {sample['transcription_backlog']:>5} "
+                              f"{sample['trd_backlog']:>5}")
+
+        def seconds(value):
+            return "-" if value is None else f"{value}s"
+
+        freshness = result['freshness']
+        self.stdout.write(f"Chunk to TRD: p50={seconds(freshness['chunk_to_trd']['p50'])} "
+                          f"p95={seconds(freshness['chunk_to_trd']['p95'])} "
+                          f"(original p50={seconds(freshness['original_chunk_to_trd']['p50'])} "
+                          f"p95={seconds(freshness['original_chunk_to_trd']['p95'])})")
+        self.stdout.write(f"Peak backlog: {result['backlog']['max_transcription']} transcription(s), "
+                          f"{result['backlog']['max_trd']} TRD job(s); "
+                          f"{result['uploads']['rejected']} upload(s) turned away")
+        self.stdout.write(f"Results written to {output_path}")
@@ -0,0 +1,59 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from xscriber.modules.metrics import serve_metrics
+from xscriber.modules.project_handler import ProjectHandler
+
+
+class Command(BaseCommand):
+    help = "Run transcription and TRD pipeline workers, claiming jobs from the shared job journal"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transcription-concurrency', type=int,
+                            help='Concurrent transcription jobs (default PIPELINE_TRANSCRIPTION_CONCURRENCY)')
+        parser.add_argument('--trd-concurrency', type=int,
+                            help='Concurrent TRD jobs (default PIPELINE_TRD_CONCURRENCY)')
+        parser.add_argument('--no-reconcile', action='store_true',
+                            help='Do not re-enqueue untranscribed audio and stale TRDs on startup')
+        parser.add_argument('--metrics-port', type=int,
+                            help='Serve this worker\'s Prometheus metrics on http://0.0.0.0:<port>/metrics')
+
+    def handle(self, *args, **options):
+        project_handler = ProjectHandler(start_workers=False)
+        if options['transcription_concurrency']:
+            project_handler.pipeline.concurrency["transcription"] = max(1, options['transcription_concurrency'])
+        if options['trd_concurrency']:
+            project_handler.pipeline.concurrency["trd"] = max(1, options['trd_concurrency'])
+
+        stopping = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write("Stopping pipeline workers...")
+            stopping.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        metrics_server = None
+        if options['metrics_port']:
+            metrics_server = serve_metrics(options['metrics_port'], before_render=project_handler.refresh_metrics)
+            self.stdout.write(f"Serving metrics on port {options['metrics_port']}")
+
+        try:
+            reconcile = project_handler.reconcile_on_start and not options['no_reconcile']
+            project_handler.start_pipeline(reconcile=reconcile)
+
+            concurrency = project_handler.pipeline.concurrency
+            self.stdout.write(f"Pipeline worker {project_handler.pipeline.worker_id} running "
+                              f"({concurrency['transcription']} transcription, {concurrency['trd']} TRD)")
+
+            while not stopping.wait(1.0):
+                pass
+        finally:
+            # Jobs still in flight are released back to the journal for another worker
+            project_handler.cleanup()
+            if metrics_server:
+                metrics_server.shutdown()
+            self.stdout.write("Pipeline workers stopped")
@@ -0,0 +1,15 @@
+class ProfilingMiddleware:
+    """Profiles requests while an on-demand profiling session covers them (see ProfilingController)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Imported here so loading the middleware does not construct the ProjectHandler
+        from .views import project_handler
+
+        # Profiling endpoints are left out of their own profiles
+        if request.path.startswith('/api/admin/profiling/'):
+            return self.get_response(request)
+        with project_handler.profiler.profile("requests", f"{request.method} {request.path}"):
+            return self.get_response(request)
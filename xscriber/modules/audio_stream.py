@@ -0,0 +1,267 @@
+import os
+import re
+import json
+import struct
+import threading
+from typing import Dict, List, Optional, Any, Iterator, Tuple
+from pathlib import Path
+
+from .structured_log import get_logger
+
+log = get_logger("storage")
+
+
+CHUNK_FILE_PATTERN = re.compile(r"^(?P<project_id>.+)_audiochunk_(?P<chunk_id>\d+)\.(?P<ext>wav|webm)$")
+CONTENT_TYPES = {"wav": "audio/wav", "webm": "audio/webm"}
+WAV_HEADER_SIZE = 44
+BLOCK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range_header(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single `bytes=` range into inclusive (start, end) offsets. Returns None when the
+    whole resource should be served (no header, or a form we do not handle such as
+    multiple ranges) and raises RangeNotSatisfiable when the range lies outside it.
+    """
+    if not header:
+        return None
+
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header)
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+
+    first, last = match.group(1), match.group(2)
+    if not first:
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable(header)
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+def read_wav_layout(path) -> Optional[Dict[str, Any]]:
+    """Format of a PCM WAV file and where its sample data sits, from the RIFF chunk headers only"""
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+            return None
+
+        layout: Dict[str, Any] = {}
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                return None
+            chunk_id, chunk_size = chunk_header[:4], struct.unpack("<I", chunk_header[4:])[0]
+
+            if chunk_id == b"fmt ":
+                fmt = f.read(chunk_size)
+                audio_format, channels, sample_rate, byte_rate, block_align, bits = struct.unpack("<HHIIHH", fmt[:16])
+                if audio_format not in (1, 0xFFFE):
+                    return None
+                layout.update(channels=channels, sample_rate=sample_rate, sample_width=bits // 8,
+                              byte_rate=byte_rate, block_align=block_align)
+                if chunk_size % 2:
+                    f.seek(1, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                if "block_align" not in layout or not layout["block_align"]:
+                    return None
+                data_offset = f.tell()
+                # Streaming writers may leave the size unset; trust the file length instead
+                data_length = min(chunk_size, file_size - data_offset)
+                layout["data_offset"] = data_offset
+                layout["data_length"] = data_length - data_length % layout["block_align"]
+                return layout
+            else:
+                f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+
+def wav_header(channels: int, sample_rate: int, sample_width: int, data_length: int) -> bytes:
+    block_align = channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_length, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, sample_width * 8,
+        b"data", data_length
+    )
+
+
+def iter_file_range(path, start: int, end: int, block_size: int = BLOCK_SIZE) -> Iterator[bytes]:
+    """Yield bytes start..end (inclusive) of a file"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+class SessionAudioIndex:
+    """
+    Per-project index of audio chunks, in chunk order, for playback.
+
+    For every WAV chunk it records the sample data's position in the file, its duration and
+    where it starts within the whole session, both in seconds and in bytes of the virtual
+    session WAV (one header followed by every chunk's samples). Session streams and seeks
+    are served from the index without decoding or merging audio; a chunk's header is only
+    parsed again when the file's size or mtime changes.
+
+    WebM chunks (saved when ffmpeg is unavailable) are listed under `skipped`, as are WAV
+    chunks whose format differs from the session's first chunk.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _index_file(self, project_id: str) -> Path:
+        return self.index_dir / f"{project_id}_audio_index.json"
+
+    def _load(self, project_id: str) -> Dict[str, Any]:
+        try:
+            with open(self._index_file(project_id), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, project_id: str, index: Dict[str, Any]):
+        index_file = self._index_file(project_id)
+        temp_file = self.index_dir / f".{project_id}_audio_index.json.{os.getpid()}.tmp"
+        try:
+            with open(temp_file, 'w') as f:
+                json.dump(index, f)
+            os.replace(temp_file, index_file)
+        except Exception as e:
+            log.warning("Failed to save audio index for %s: %s", project_id, e)
+
+    @staticmethod
+    def list_chunk_files(audio_dir, project_id: str) -> List[Tuple[int, Path]]:
+        chunks = []
+        for path in Path(audio_dir).glob(f"{project_id}_audiochunk_*"):
+            match = CHUNK_FILE_PATTERN.match(path.name)
+            if match and match.group("project_id") == project_id:
+                chunks.append((int(match.group("chunk_id")), path))
+        return sorted(chunks)
+
+    def refresh(self, project_id: str, audio_dir) -> Dict[str, Any]:
+        """Bring the project's index up to date with its chunk files and return it"""
+        with self._lock:
+            saved = self._load(project_id)
+            previous = {entry["file"]: entry for entry in saved.get("entries", [])}
+
+            entries = []
+            for chunk_id, path in self.list_chunk_files(audio_dir, project_id):
+                stat = path.stat()
+                cached = previous.get(path.name)
+                if cached and cached["size"] == stat.st_size and cached["mtime"] == stat.st_mtime:
+                    entries.append(cached)
+                    continue
+
+                entry = {"chunk_id": chunk_id, "file": path.name, "size": stat.st_size, "mtime": stat.st_mtime,
+                         "layout": read_wav_layout(path) if path.suffix == ".wav" else None}
+                entries.append(entry)
+
+            if saved and entries == saved.get("entries"):
+                return saved
+
+            index = self._build(project_id, entries)
+            self._save(project_id, index)
+            return index
+
+    @staticmethod
+    def _build(project_id: str, entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        session_format = None
+        chunks, skipped = [], []
+        duration, byte_start = 0.0, WAV_HEADER_SIZE
+
+        for entry in entries:
+            layout = entry["layout"]
+            entry_format = layout and {k: layout[k] for k in ("channels", "sample_rate", "sample_width")}
+            if session_format is None and entry_format:
+                session_format = entry_format
+
+            if not entry_format or entry_format != session_format:
+                skipped.append({"chunk_id": entry["chunk_id"], "file": entry["file"],
+                                "reason": "not PCM WAV" if not entry_format else "format differs from session"})
+                continue
+
+            chunk_duration = layout["data_length"] / layout["byte_rate"] if layout["byte_rate"] else 0.0
+            chunks.append({
+                "chunk_id": entry["chunk_id"],
+                "file": entry["file"],
+                "data_offset": layout["data_offset"],
+                "data_length": layout["data_length"],
+                "duration": chunk_duration,
+                "start_time": duration,
+                "byte_start": byte_start
+            })
+            duration += chunk_duration
+            byte_start += layout["data_length"]
+
+        return {
+            "project_id": project_id,
+            "format": session_format,
+            "duration": duration,
+            "size": byte_start if chunks else 0,
+            "chunks": chunks,
+            "skipped": skipped,
+            "entries": entries
+        }
+
+    def discard(self, project_id: str):
+        with self._lock:
+            try:
+                self._index_file(project_id).unlink()
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def session_time(index: Dict[str, Any], chunk_id: int, offset_seconds: float = 0.0) -> Optional[float]:
+        """Position in the session of a time within one chunk (e.g. a search hit's segment start)"""
+        for chunk in index["chunks"]:
+            if chunk["chunk_id"] == chunk_id:
+                return chunk["start_time"] + min(max(offset_seconds, 0.0), chunk["duration"])
+        return None
+
+    @staticmethod
+    def byte_offset(index: Dict[str, Any], seconds: float) -> int:
+        """Frame-aligned byte offset of a session time within the virtual session WAV"""
+        session_format = index["format"]
+        if not session_format:
+            return 0
+        block_align = session_format["channels"] * session_format["sample_width"]
+        frame = int(max(seconds, 0.0) * session_format["sample_rate"])
+        return min(WAV_HEADER_SIZE + frame * block_align, max(index["size"] - 1, 0))
+
+    @staticmethod
+    def iter_session_bytes(index: Dict[str, Any], audio_dir, start: int, end: int,
+                           block_size: int = BLOCK_SIZE) -> Iterator[bytes]:
+        """Yield bytes start..end (inclusive) of the virtual session WAV"""
+        if start < WAV_HEADER_SIZE:
+            session_format = index["format"]
+            header = wav_header(session_format["channels"], session_format["sample_rate"],
+                                session_format["sample_width"], index["size"] - WAV_HEADER_SIZE)
+            yield header[start:min(end + 1, WAV_HEADER_SIZE)]
+
+        for chunk in index["chunks"]:
+            chunk_end = chunk["byte_start"] + chunk["data_length"] - 1
+            if chunk_end < start or chunk["byte_start"] > end:
+                continue
+            first = max(start, chunk["byte_start"]) - chunk["byte_start"]
+            last = min(end, chunk_end) - chunk["byte_start"]
+            yield from iter_file_range(Path(audio_dir) / chunk["file"], chunk["data_offset"] + first,
+                                       chunk["data_offset"] + last, block_size)
@@ -1,21 +1,49 @@
 import os
 import re
 import json
-from typing import Optional, Dict, Any, List
+import time
+import copy
+import asyncio
+import functools
+import contextvars
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Callable, Tuple
 from pathlib import Path
 import openai
 from django.conf import settings
 
+from .response_cache import ResponseCache
+from .usage_accounting import track_usage, record_usage
+from .trd_model import TRDDocument, TRDPatchError, TRD_SECTIONS, PLACEHOLDER, parse_trd
+from .token_budget import (TokenBudgetPlanner, TRANSCRIPTION_SEPARATOR, estimate_message_tokens,
+                           estimate_tokens, truncate_to_tokens, estimate_cost)
+from .structured_log import get_logger
+
+log = get_logger("llm")
+
+
+HOLISTIC_MAX_TOKENS = 4096
+
+
+async def _run_in_thread(func, *args):
+    """asyncio.to_thread for Python 3.8: run func on the default executor with this context"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(context.run, func, *args))
+
 
 class ChatCompletionProcessor:
-    def __init__(self, api_key: Optional[str] = None, model: str = "gpt-3.5-turbo"):
+    def __init__(self, api_key: Optional[str] = None, model: str = "gpt-3.5-turbo",
+                 cache: Optional[ResponseCache] = None, async_http_client=None):
         self.api_key = api_key or settings.OPENAI_API_KEY
         self.model = model
-        self.client = openai.OpenAI(api_key=self.api_key)
-
         if not self.api_key:
             raise ValueError("OpenAI API key is required")
 
+        self.client = openai.OpenAI(api_key=self.api_key)
+        self.async_client = openai.AsyncOpenAI(api_key=self.api_key, http_client=async_http_client)
+        self.cache = cache
+        self.budget_planner = TokenBudgetPlanner(model)
+
         self.trd_ontology_prompts = {
             "overview": "Extract or update the overview/summary section from the transcription",
             "requirements": "Extract or update functional requirements from the transcription",
@@ -27,27 +55,188 @@ class ChatCompletionProcessor:
             "dependencies": "Extract or update external dependencies from the transcription"
         }
 
-    def parse_trd_ontology(self, trd_content: str) -> Dict[str, str]:
-        ontology = {}
-
-        sections = {
-            "overview": r"# Overview\n(.*?)(?=\n# |\Z)",
-            "requirements": r"# Requirements\n(.*?)(?=\n# |\Z)",
-            "technical_specs": r"# Technical Specifications\n(.*?)(?=\n# |\Z)",
-            "architecture": r"# Architecture\n(.*?)(?=\n# |\Z)",
-            "constraints": r"# Constraints\n(.*?)(?=\n# |\Z)",
-            "assumptions": r"# Assumptions\n(.*?)(?=\n# |\Z)",
-            "acceptance_criteria": r"# Acceptance Criteria\n(.*?)(?=\n# |\Z)",
-            "dependencies": r"# Dependencies\n(.*?)(?=\n# |\Z)"
+    def with_model(self, model: str) -> "ChatCompletionProcessor":
+        """Processor for another model that shares this one's API clients and response cache"""
+        if model == self.model:
+            return self
+
+        processor = copy.copy(self)
+        processor.model = model
+        processor.budget_planner = TokenBudgetPlanner(model)
+        return processor
+
+    def track_usage(self):
+        """
+        Collect a usage record for every completion made inside the block.
+
+            with processor.track_usage() as usage_records:
+                processor.generate_trd_holistically(...)
+        """
+        return track_usage()
+
+    def _record_usage(self, record: Dict[str, Any]):
+        record_usage(record)
+
+    def _begin_completion(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int,
+                          bypass_cache: bool) -> Dict[str, Any]:
+        """
+        Plan the request against the context window and look it up in the response cache.
+        The returned request carries "cached_content" when the cache can answer it.
+        """
+        request = {
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": self.budget_planner.plan_max_tokens(messages, max_tokens),
+            "estimated_prompt_tokens": estimate_message_tokens(messages),
+            "started_at": time.time(),
+            "cache_key": None,
+            "cached_content": None
         }
 
-        for section_name, pattern in sections.items():
-            match = re.search(pattern, trd_content, re.DOTALL | re.IGNORECASE)
-            ontology[section_name] = match.group(1).strip() if match else ""
+        if self.cache:
+            request["cache_key"] = self.cache.make_key(self.model, temperature, request["max_tokens"], messages)
+            if not bypass_cache:
+                cached = self.cache.get(request["cache_key"])
+                if cached is not None:
+                    request["cached_content"] = cached["content"]
+                    self._record_usage(self._build_usage_record(
+                        cached.get("metadata", {}).get("usage", {}), request, cached=True
+                    ))
+
+        return request
+
+    def _finish_completion(self, request: Dict[str, Any], content: str, usage: Dict[str, int]):
+        self._record_usage(self._build_usage_record(usage, request))
+
+        if self.cache:
+            self.cache.set(request["cache_key"], content, {"model": self.model, "usage": usage})
+
+    def _completion_options(self, request: Dict[str, Any], response_format: Optional[Dict[str, str]] = None,
+                            stream: bool = False) -> Dict[str, Any]:
+        options = {
+            "model": self.model,
+            "messages": request["messages"],
+            "temperature": request["temperature"],
+            "max_tokens": request["max_tokens"]
+        }
+        if response_format:
+            options["response_format"] = response_format
+        if stream:
+            options["stream"] = True
+            options["stream_options"] = {"include_usage": True}
+        return options
+
+    def _accumulate_stream_chunk(self, chunk, parts: List[str], usage: Dict[str, int],
+                                 on_delta: Callable[[str], None]):
+        # The final chunk carries usage and no choices
+        if getattr(chunk, 'usage', None):
+            usage.update(self._usage_to_dict(chunk.usage))
+        if not chunk.choices:
+            return
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            return
+
+        parts.append(delta)
+        try:
+            on_delta(delta)
+        except Exception as e:
+            log.warning("Error in streaming delta callback: %s", e)
 
-        return ontology
+    def _create_completion(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int,
+                           bypass_cache: bool = False,
+                           on_delta: Optional[Callable[[str], None]] = None,
+                           response_format: Optional[Dict[str, str]] = None) -> str:
+        """
+        Run a chat completion, serving identical requests from the response cache.
+        With bypass_cache the model is always called and the cache entry is refreshed.
+        When on_delta is given the completion is streamed and on_delta receives each
+        piece of text as it arrives (a cached response arrives as a single piece).
 
-    def update_trd_section(self, section_name: str, existing_content: str, new_transcription: str) -> str:
+        max_tokens is an upper bound; it is reduced to what remains of the model's
+        context window after the prompt.
+        """
+        request = self._begin_completion(messages, temperature, max_tokens, bypass_cache)
+        if request["cached_content"] is not None:
+            if on_delta:
+                on_delta(request["cached_content"])
+            return request["cached_content"]
+
+        if on_delta:
+            parts, usage = [], {}
+            stream = self.client.chat.completions.create(**self._completion_options(request, stream=True))
+            for chunk in stream:
+                self._accumulate_stream_chunk(chunk, parts, usage, on_delta)
+            content = ''.join(parts).strip()
+        else:
+            response = self.client.chat.completions.create(**self._completion_options(request, response_format))
+            content = response.choices[0].message.content.strip()
+            usage = self._usage_to_dict(getattr(response, 'usage', None))
+
+        self._finish_completion(request, content, usage)
+        return content
+
+    async def _acreate_completion(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int,
+                                  bypass_cache: bool = False,
+                                  on_delta: Optional[Callable[[str], None]] = None,
+                                  response_format: Optional[Dict[str, str]] = None) -> str:
+        """Async counterpart of _create_completion using the AsyncOpenAI client"""
+        request = self._begin_completion(messages, temperature, max_tokens, bypass_cache)
+        if request["cached_content"] is not None:
+            if on_delta:
+                on_delta(request["cached_content"])
+            return request["cached_content"]
+
+        if on_delta:
+            parts, usage = [], {}
+            stream = await self.async_client.chat.completions.create(**self._completion_options(request, stream=True))
+            async for chunk in stream:
+                self._accumulate_stream_chunk(chunk, parts, usage, on_delta)
+            content = ''.join(parts).strip()
+        else:
+            response = await self.async_client.chat.completions.create(
+                **self._completion_options(request, response_format)
+            )
+            content = response.choices[0].message.content.strip()
+            usage = self._usage_to_dict(getattr(response, 'usage', None))
+
+        self._finish_completion(request, content, usage)
+        return content
+
+    def _usage_to_dict(self, usage) -> Dict[str, int]:
+        if not usage:
+            return {}
+
+        return {
+            "prompt_tokens": int(getattr(usage, 'prompt_tokens', 0) or 0),
+            "completion_tokens": int(getattr(usage, 'completion_tokens', 0) or 0),
+            "total_tokens": int(getattr(usage, 'total_tokens', 0) or 0)
+        }
+
+    def _build_usage_record(self, usage: Dict[str, int], request: Dict[str, Any],
+                            cached: bool = False) -> Dict[str, Any]:
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        return {
+            "kind": "chat",
+            "timestamp": datetime.now().isoformat(),
+            "model": self.model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": usage.get("total_tokens", 0),
+            "estimated_prompt_tokens": request["estimated_prompt_tokens"],
+            "max_tokens": request["max_tokens"],
+            "latency_seconds": round(time.time() - request["started_at"], 3),
+            "cached": cached,
+            # For cache hits, what the original call cost
+            "estimated_cost": estimate_cost(self.model, prompt_tokens, completion_tokens)
+        }
+
+    def parse_trd_ontology(self, trd_content: str) -> Dict[str, str]:
+        return parse_trd(trd_content).sections
+
+    def update_trd_section(self, section_name: str, existing_content: str, new_transcription: str,
+                           bypass_cache: bool = False) -> str:
         prompt_template = self.trd_ontology_prompts.get(section_name, "Update this section with new information")
 
         system_prompt = f"""You are a technical documentation expert. Your task is to {prompt_template}.
@@ -75,26 +264,25 @@ class ChatCompletionProcessor:
         Please update the {section_name} section:"""
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
+            return self._create_completion(
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
                 temperature=0.3,
-                max_tokens=1000
+                max_tokens=1000,
+                bypass_cache=bypass_cache
             )
-
-            return response.choices[0].message.content.strip()
         except Exception as e:
-            print(f"Failed to update {section_name} section: {str(e)}")
+            log.error("Failed to update %s section: %s", section_name, e)
             return existing_content
 
-    def update_trd_sections(self, ontology: Dict[str, str], new_transcription: str) -> Dict[str, str]:
+    def update_trd_sections(self, ontology: Dict[str, str], new_transcription: str,
+                            bypass_cache: bool = False) -> Dict[str, str]:
         updated_ontology = {}
 
         for section_name, existing_content in ontology.items():
-            updated_content = self.update_trd_section(section_name, existing_content, new_transcription)
+            updated_content = self.update_trd_section(section_name, existing_content, new_transcription, bypass_cache)
             updated_ontology[section_name] = updated_content
 
         return updated_ontology
@@ -124,59 +312,81 @@ class ChatCompletionProcessor:
 
             return '\n'.join(cleaned_lines) if cleaned_lines else "To be defined"
 
-        trd_content = f"""# Technical Requirements Document
-
-## Overview
-{clean_content(ontology.get("overview", "To be defined"))}
-
-## Requirements
-{clean_content(ontology.get("requirements", "To be defined"))}
-
-## Technical Specifications
-{clean_content(ontology.get("technical_specs", "To be defined"))}
-
-## Architecture
-{clean_content(ontology.get("architecture", "To be defined"))}
-
-## Constraints
-{clean_content(ontology.get("constraints", "To be defined"))}
+        document = TRDDocument(sections={
+            section: clean_content(ontology.get(section, PLACEHOLDER)) for section in self.trd_ontology_prompts
+        })
+        return document.render(generated_at=timestamp)
 
-## Assumptions
-{clean_content(ontology.get("assumptions", "To be defined"))}
-
-## Acceptance Criteria
-{clean_content(ontology.get("acceptance_criteria", "To be defined"))}
-
-## Dependencies
-{clean_content(ontology.get("dependencies", "To be defined"))}
-
----
-*Generated by X-Scriber on {timestamp}*
-"""
-
-        return trd_content
-
-    def process_transcription_to_trd(self, transcription: str, existing_trd: str = "") -> str:
+    def process_transcription_to_trd(self, transcription: str, existing_trd: str = "",
+                                     bypass_cache: bool = False) -> str:
         if existing_trd:
             ontology = self.parse_trd_ontology(existing_trd)
         else:
             ontology = {section: "" for section in self.trd_ontology_prompts.keys()}
 
-        updated_ontology = self.update_trd_sections(ontology, transcription)
+        updated_ontology = self.update_trd_sections(ontology, transcription, bypass_cache)
         return self.generate_trd_document(updated_ontology)
 
-    def process_all_transcriptions_to_trd(self, all_transcriptions: List[str], existing_trd: str = "") -> str:
+    def _fit_transcriptions(self, all_transcriptions: List[str], existing_trd: str) -> str:
+        # Keep the prompt within the context window, condensing the oldest transcriptions if needed
+        prompt_overhead = estimate_message_tokens(self._build_holistic_messages("", existing_trd))
+        fitted_transcriptions = self.budget_planner.fit_transcriptions(
+            all_transcriptions, prompt_overhead, HOLISTIC_MAX_TOKENS, summarize=self.summarize_transcriptions
+        )
+
+        # Combine all transcriptions into a single context
+        return TRANSCRIPTION_SEPARATOR.join(fitted_transcriptions)
+
+    def estimate_holistic_request(self, all_transcriptions: List[str], existing_trd: str = "") -> Dict[str, Any]:
+        return estimate_holistic_request(self.model, all_transcriptions, existing_trd)
+
+    def process_all_transcriptions_to_trd(self, all_transcriptions: List[str], existing_trd: str = "",
+                                          bypass_cache: bool = False,
+                                          on_delta: Optional[Callable[[str], None]] = None) -> str:
         """
         Process all transcriptions at once to generate a comprehensive TRD.
         This method reduces duplication by considering all transcription context together.
         """
-        # Combine all transcriptions into a single context
-        combined_transcriptions = "\n\n---\n\n".join(all_transcriptions)
+        combined_transcriptions = self._fit_transcriptions(all_transcriptions, existing_trd)
 
         # Use the truly comprehensive single-pass method
-        return self.generate_trd_holistically(combined_transcriptions, existing_trd)
+        return self.generate_trd_holistically(combined_transcriptions, existing_trd, bypass_cache, on_delta)
 
-    def update_trd_sections_comprehensive(self, ontology: Dict[str, str], all_transcriptions: str) -> Dict[str, str]:
+    async def aprocess_all_transcriptions_to_trd(self, all_transcriptions: List[str], existing_trd: str = "",
+                                                 bypass_cache: bool = False,
+                                                 on_delta: Optional[Callable[[str], None]] = None) -> str:
+        # Fitting only calls the model when older transcriptions must be summarized; keep that off the loop
+        combined_transcriptions = await _run_in_thread(self._fit_transcriptions, all_transcriptions, existing_trd)
+        return await self.agenerate_trd_holistically(combined_transcriptions, existing_trd, bypass_cache, on_delta)
+
+    def summarize_transcriptions(self, transcriptions: List[str], max_tokens: int) -> str:
+        """
+        Condense older transcriptions so they still inform the TRD when the full text
+        no longer fits in the prompt.
+        """
+        system_prompt = """You are a technical documentation expert. Condense the following project transcriptions into a dense summary.
+
+        Preserve every requirement, technical decision, constraint, assumption and dependency that is mentioned.
+        Omit small talk, filler and repetition. Use short bullet points."""
+
+        overhead = estimate_message_tokens([
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": ""}
+        ])
+        available = self.budget_planner.remaining_tokens(overhead) - max_tokens
+        combined = truncate_to_tokens(TRANSCRIPTION_SEPARATOR.join(transcriptions), available, keep="end")
+
+        return self._create_completion(
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": combined}
+            ],
+            temperature=0.2,
+            max_tokens=max_tokens
+        )
+
+    def update_trd_sections_comprehensive(self, ontology: Dict[str, str], all_transcriptions: str,
+                                          bypass_cache: bool = False) -> Dict[str, str]:
         """
         Update all TRD sections by processing all transcriptions together.
         This provides better context and reduces duplication.
@@ -185,13 +395,14 @@ class ChatCompletionProcessor:
 
         for section_name, existing_content in ontology.items():
             updated_content = self.update_trd_section_comprehensive(
-                section_name, existing_content, all_transcriptions
+                section_name, existing_content, all_transcriptions, bypass_cache
             )
             updated_ontology[section_name] = updated_content
 
         return updated_ontology
 
-    def update_trd_section_comprehensive(self, section_name: str, existing_content: str, all_transcriptions: str) -> str:
+    def update_trd_section_comprehensive(self, section_name: str, existing_content: str, all_transcriptions: str,
+                                         bypass_cache: bool = False) -> str:
         """
         Update a TRD section considering all transcriptions as context.
         """
@@ -223,26 +434,21 @@ class ChatCompletionProcessor:
         Please create a comprehensive {section_name} section that incorporates all relevant information:"""
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
+            return self._create_completion(
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
                 temperature=0.3,
-                max_tokens=2000  # Increased for comprehensive content
+                max_tokens=2000,  # Increased for comprehensive content
+                bypass_cache=bypass_cache
             )
-
-            return response.choices[0].message.content.strip()
         except Exception as e:
-            print(f"Failed to update {section_name} section comprehensively: {str(e)}")
+            log.error("Failed to update %s section comprehensively: %s", section_name, e)
             return existing_content
 
-    def generate_trd_holistically(self, all_transcriptions: str, existing_trd: str = "") -> str:
-        """
-        Generate the entire TRD in a single LLM call, processing all transcriptions holistically.
-        This eliminates subsection processing and creates a truly comprehensive document.
-        """
+    @staticmethod
+    def _build_holistic_messages(all_transcriptions: str, existing_trd: str = "") -> List[Dict[str, str]]:
         system_prompt = """You are a technical documentation expert. Your task is to create a comprehensive Technical Requirements Document (TRD) based on all provided transcriptions.
 
         You must generate a COMPLETE TRD document in a single response that synthesizes all transcription content intelligently.
@@ -283,38 +489,148 @@ class ChatCompletionProcessor:
 
         Generate a complete, comprehensive Technical Requirements Document that synthesizes all this information:"""
 
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    def _finalize_holistic_trd(self, generated_trd: str) -> str:
+        # Add timestamp if not already present
+        from datetime import datetime
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        if "*Generated by X-Scriber on" not in generated_trd:
+            generated_trd += f"\n\n---\n*Generated by X-Scriber on {timestamp}*\n"
+
+        return generated_trd
+
+    def _generate_trd_by_sections(self, all_transcriptions: str, existing_trd: str, bypass_cache: bool) -> str:
+        # Fallback to section-based method
+        if existing_trd:
+            ontology = self.parse_trd_ontology(existing_trd)
+        else:
+            ontology = {section: "To be defined" for section in self.trd_ontology_prompts.keys()}
+
+        updated_ontology = self.update_trd_sections_comprehensive(ontology, all_transcriptions, bypass_cache)
+        return self.generate_trd_document(updated_ontology)
+
+    def generate_trd_holistically(self, all_transcriptions: str, existing_trd: str = "",
+                                  bypass_cache: bool = False,
+                                  on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Generate the entire TRD in a single LLM call, processing all transcriptions holistically.
+        This eliminates subsection processing and creates a truly comprehensive document.
+        Pass on_delta to stream the partially generated document as it is produced.
+        """
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+            generated_trd = self._create_completion(
+                messages=self._build_holistic_messages(all_transcriptions, existing_trd),
+                temperature=0.3,
+                max_tokens=HOLISTIC_MAX_TOKENS,  # Maximum for comprehensive single response
+                bypass_cache=bypass_cache,
+                on_delta=on_delta
+            )
+            return self._finalize_holistic_trd(generated_trd)
+
+        except Exception as e:
+            log.error("Failed to generate TRD holistically: %s", e)
+            return self._generate_trd_by_sections(all_transcriptions, existing_trd, bypass_cache)
+
+    async def agenerate_trd_holistically(self, all_transcriptions: str, existing_trd: str = "",
+                                         bypass_cache: bool = False,
+                                         on_delta: Optional[Callable[[str], None]] = None) -> str:
+        try:
+            generated_trd = await self._acreate_completion(
+                messages=self._build_holistic_messages(all_transcriptions, existing_trd),
                 temperature=0.3,
-                max_tokens=4096  # Maximum for comprehensive single response
+                max_tokens=HOLISTIC_MAX_TOKENS,
+                bypass_cache=bypass_cache,
+                on_delta=on_delta
             )
+            return self._finalize_holistic_trd(generated_trd)
 
-            generated_trd = response.choices[0].message.content.strip()
+        except Exception as e:
+            log.error("Failed to generate TRD holistically: %s", e)
+            # The section fallback makes eight sequential calls; run it on a worker thread
+            return await _run_in_thread(self._generate_trd_by_sections, all_transcriptions, existing_trd, bypass_cache)
+
+    def _build_patch_messages(self, document: TRDDocument, new_transcription: str) -> List[Dict[str, str]]:
+        section_keys = ", ".join(key for key, _ in TRD_SECTIONS)
+        system_prompt = f"""You are a technical documentation expert maintaining a Technical Requirements Document (TRD).
+
+        Given the current TRD sections and a new transcription, return ONLY the edits needed to incorporate the new information.
+
+        Respond with a JSON object of the form:
+        {{"operations": [
+          {{"op": "add", "section": "<section>", "item": "<new bullet text>"}},
+          {{"op": "replace", "section": "<section>", "old": "<existing line, verbatim>", "new": "<revised text>"}},
+          {{"op": "remove", "section": "<section>", "item": "<existing line, verbatim>"}}
+        ]}}
+
+        RULES:
+        1. Valid sections: {section_keys}
+        2. "old" and "remove" items must quote an existing line of that section exactly
+        3. Prefer "replace" when the transcription revises or contradicts an existing item
+        4. Do not add items that duplicate existing ones
+        5. Return {{"operations": []}} if the transcription adds nothing relevant
+        """
 
-            # Add timestamp if not already present
-            from datetime import datetime
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        current_sections = "\n\n".join(
+            f"[{key}]\n{document.get_section(key).strip() or PLACEHOLDER}" for key, _ in TRD_SECTIONS
+        )
+        user_prompt = f"""Current TRD sections:
+        {current_sections}
 
-            if "*Generated by X-Scriber on" not in generated_trd:
-                generated_trd += f"\n\n---\n*Generated by X-Scriber on {timestamp}*\n"
+        New transcription to incorporate:
+        {new_transcription}
 
-            return generated_trd
+        Return the JSON edit operations:"""
 
-        except Exception as e:
-            print(f"Failed to generate TRD holistically: {str(e)}")
-            # Fallback to section-based method
-            if existing_trd:
-                ontology = self.parse_trd_ontology(existing_trd)
-            else:
-                ontology = {section: "To be defined" for section in self.trd_ontology_prompts.keys()}
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
 
-            updated_ontology = self.update_trd_sections_comprehensive(ontology, all_transcriptions)
-            return self.generate_trd_document(updated_ontology)
+    def _parse_trd_patch(self, content: str) -> List[Dict[str, Any]]:
+        # Tolerate a fenced code block around the JSON
+        content = re.sub(r"^```(?:json)?\s*|\s*```$", "", content.strip())
+        try:
+            patch = json.loads(content)
+        except json.JSONDecodeError as e:
+            raise TRDPatchError(f"Patch response is not valid JSON: {str(e)}")
+
+        if not isinstance(patch, dict) or not isinstance(patch.get("operations"), list):
+            raise TRDPatchError("Patch response has no operations list")
+
+        return patch["operations"]
+
+    def generate_trd_patch(self, document: TRDDocument, new_transcription: str,
+                           bypass_cache: bool = False) -> List[Dict[str, Any]]:
+        """
+        Ask the model for section-level edit operations that fold a new transcription
+        into an existing TRD, instead of re-emitting the whole document.
+        Raises TRDPatchError if the response is not a well-formed operation list;
+        apply_trd_patch validates the operations against the document.
+        """
+        content = self._create_completion(
+            messages=self._build_patch_messages(document, new_transcription),
+            temperature=0.2,
+            max_tokens=1000,
+            bypass_cache=bypass_cache,
+            response_format={"type": "json_object"}
+        )
+        return self._parse_trd_patch(content)
+
+    async def agenerate_trd_patch(self, document: TRDDocument, new_transcription: str,
+                                  bypass_cache: bool = False) -> List[Dict[str, Any]]:
+        content = await self._acreate_completion(
+            messages=self._build_patch_messages(document, new_transcription),
+            temperature=0.2,
+            max_tokens=1000,
+            bypass_cache=bypass_cache,
+            response_format={"type": "json_object"}
+        )
+        return self._parse_trd_patch(content)
 
     def save_trd_document(self, trd_content: str, output_path: str) -> bool:
         try:
@@ -326,5 +642,40 @@ class ChatCompletionProcessor:
 
             return True
         except Exception as e:
-            print(f"Failed to save TRD document: {str(e)}")
-            return False
\ No newline at end of file
+            log.error("Failed to save TRD document: %s", e)
+            return False
+
+
+def estimate_holistic_request(model: str, all_transcriptions: List[str], existing_trd: str = "") -> Dict[str, Any]:
+    """
+    Estimate the tokens and cost of a comprehensive regeneration with the given model, without
+    calling the model or creating an API client.
+    Completion tokens are the planned maximum, so the cost is an upper bound for the main call;
+    summarizing transcriptions that overflow the context window adds one more call.
+    """
+    budget_planner = TokenBudgetPlanner(model)
+    prompt_overhead = estimate_message_tokens(ChatCompletionProcessor._build_holistic_messages("", existing_trd))
+    fitted_transcriptions = budget_planner.fit_transcriptions(
+        all_transcriptions, prompt_overhead, HOLISTIC_MAX_TOKENS
+    )
+    messages = ChatCompletionProcessor._build_holistic_messages(
+        TRANSCRIPTION_SEPARATOR.join(fitted_transcriptions), existing_trd
+    )
+
+    prompt_tokens = estimate_message_tokens(messages)
+    completion_tokens = budget_planner.plan_max_tokens(messages, HOLISTIC_MAX_TOKENS)
+    needs_summary = fitted_transcriptions != list(all_transcriptions)
+    if needs_summary:
+        # The summary call reads at most a context window's worth of the older transcriptions
+        summary_budget = budget_planner.summary_tokens
+        prompt_tokens += min(estimate_tokens(TRANSCRIPTION_SEPARATOR.join(all_transcriptions)),
+                             budget_planner.remaining_tokens(0) - summary_budget)
+        completion_tokens += summary_budget
+
+    return {
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "needs_summary": needs_summary,
+        "estimated_cost": estimate_cost(model, prompt_tokens, completion_tokens)
+    }
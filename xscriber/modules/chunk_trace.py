@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Iterable, Union
+
+from .structured_log import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: trace writes are only serialised within a process
+    fcntl = None
+
+log = get_logger("trace")
+
+# Spans timed by trace_span() inside the active collect_spans() block of this thread or task
+_active_spans: contextvars.ContextVar = contextvars.ContextVar("active_spans", default=None)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def make_span(name: str, started: float, ended: float, **attrs) -> Dict[str, Any]:
+    return {"name": name, "started_at": started, "duration_seconds": round(max(ended - started, 0.0), 4), **attrs}
+
+
+@contextmanager
+def collect_spans():
+    """
+    Collect the spans timed by trace_span() inside the block, in this thread or task:
+
+        with collect_spans() as spans:
+            await transcriber.atranscribe_and_save(...)
+    """
+    spans = []
+    token = _active_spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _active_spans.reset(token)
+
+
+def current_spans() -> List[Dict[str, Any]]:
+    """Spans collected so far by the enclosing collect_spans() block"""
+    return list(_active_spans.get() or [])
+
+
+@contextmanager
+def trace_span(name: str, spans: Optional[List[Dict[str, Any]]] = None, **attrs):
+    """
+    Time the block as a span of the chunk being traced, appending it to spans or to the
+    enclosing collect_spans() block. Does nothing when neither is there.
+    """
+    target = spans if spans is not None else _active_spans.get()
+    if target is None:
+        yield
+        return
+
+    started = time.time()
+    try:
+        yield
+    except BaseException:
+        attrs["error"] = True
+        raise
+    finally:
+        target.append(make_span(name, started, time.time(), **attrs))
+
+
+def build_timeline(trace: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    A chunk's trace with its spans in order and placed relative to the start of its upload,
+    plus the time from upload to transcript and to the first TRD version including it
+    """
+    spans = sorted(trace.get("spans", []), key=lambda span: span["started_at"])
+    origin = min([span["started_at"] for span in spans] + [trace[key] for key in ("queued_at",) if trace.get(key)],
+                 default=None)
+
+    def since_origin(at: Optional[float]) -> Optional[float]:
+        return round(at - origin, 4) if at is not None and origin is not None else None
+
+    return {
+        **{key: value for key, value in trace.items() if key != "spans"},
+        "started_at": origin,
+        "chunk_to_transcript_seconds": since_origin(trace.get("transcribed_at")),
+        "chunk_to_trd_seconds": since_origin(trace.get("included_at")),
+        "spans": [{**span, "offset_seconds": since_origin(span["started_at"])} for span in spans]
+    }
+
+
+class ChunkTraceStore:
+    """
+    Per-chunk record of where a recording chunk spent its time on the way from upload to
+    the TRD: a trace id assigned at upload, timed spans from the upload view, the
+    transcription worker and the TRD worker, and the first TRD version that included it.
+
+    One JSON file per chunk, so the web process and pipeline workers in other processes
+    add to the same trace; updates hold a lock file in the trace directory so concurrent
+    writers don't lose each other's spans. Fields are written once (the first queue time, the first TRD
+    version); spans accumulate.
+    """
+
+    def __init__(self, trace_dir):
+        self.trace_dir = Path(trace_dir)
+        self.trace_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _trace_file(self, project_id: str, chunk_id: Union[str, int]) -> Path:
+        return self.trace_dir / f"{project_id}_trace_{chunk_id}.json"
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+
+            with open(self.trace_dir / '.traces.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get(self, project_id: str, chunk_id: Union[str, int]) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._trace_file(project_id, chunk_id), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def record(self, project_id: str, chunk_id: Union[str, int], spans: Iterable[Dict[str, Any]] = (),
+               trace_id: Optional[str] = None, **fields) -> Optional[str]:
+        """Add spans and first-time fields to the chunk's trace; returns its trace id"""
+        with self._locked():
+            trace = self.get(project_id, chunk_id) or {
+                "trace_id": trace_id or new_trace_id(),
+                "project_id": project_id,
+                "chunk_id": str(chunk_id),
+                "spans": []
+            }
+            for key, value in fields.items():
+                if value is not None and trace.get(key) is None:
+                    trace[key] = value
+            trace["spans"].extend(spans)
+
+            trace_file = self._trace_file(project_id, chunk_id)
+            # Written via a temp file so readers never see a partial trace
+            temp_file = self.trace_dir / f".{trace_file.name}.{os.getpid()}.tmp"
+            try:
+                with open(temp_file, 'w') as f:
+                    json.dump(trace, f)
+                os.replace(temp_file, trace_file)
+            except Exception as e:
+                log.warning("Failed to save trace for chunk %s of %s: %s", chunk_id, project_id, e)
+                return None
+            return trace["trace_id"]
+
+    def discard(self, project_id: str):
+        for trace_file in self.trace_dir.glob(f"{project_id}_trace_*.json"):
+            trace_file.unlink(missing_ok=True)
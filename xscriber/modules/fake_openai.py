@@ -0,0 +1,246 @@
+import json
+import time
+import random
+import struct
+import threading
+from typing import Dict, List, Optional, Any
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .trd_model import TRDDocument, TRD_SECTIONS
+
+
+WORDS = ("the system should export reports and support login with audit logs for every user "
+         "request while keeping latency low across regions and storing data encrypted at rest").split()
+
+
+def wav_duration(body: bytes) -> Optional[float]:
+    """Duration of the first PCM WAV file found in a (multipart) request body"""
+    start = body.find(b"RIFF")
+    if start == -1 or body[start + 8:start + 12] != b"WAVE":
+        return None
+
+    position, byte_rate = start + 12, None
+    while position + 8 <= len(body):
+        chunk_id = body[position:position + 4]
+        chunk_size = struct.unpack("<I", body[position + 4:position + 8])[0]
+        if chunk_id == b"fmt ":
+            byte_rate = struct.unpack("<I", body[position + 16:position + 20])[0]
+        elif chunk_id == b"data":
+            # Clamp to what was actually sent, in case the header overstates it
+            data_length = min(chunk_size, len(body) - position - 8)
+            return data_length / byte_rate if byte_rate else None
+        position += 8 + chunk_size + chunk_size % 2
+    return None
+
+
+class FakeOpenAIServer:
+    """
+    Local stand-in for the OpenAI transcription and chat completion endpoints.
+
+    Point the SDK at base_url (OPENAI_BASE_URL) to run the pipeline without the real
+    API. Responses follow the shapes the app relies on: verbose_json transcriptions
+    with segments, TRD markdown from chat completions (streamed as server-sent events
+    when requested) and {"operations": [...]} patches for JSON-mode requests.
+
+    Latency is configurable per endpoint: transcriptions take whisper_latency plus
+    whisper_realtime_factor times the audio duration, and completions wait chat_latency
+    before emitting completion_tokens tokens at token_rate tokens per second (0 for no
+    delay). A share error_rate of requests, drawn from a seeded RNG, fails with
+    error_status. Every request's server-side duration is kept for reporting.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, whisper_latency: float = 0.5,
+                 whisper_realtime_factor: float = 0.05, chat_latency: float = 0.3, token_rate: float = 50.0,
+                 completion_tokens: int = 300, error_rate: float = 0.0, error_status: int = 500,
+                 default_audio_seconds: float = 30.0, seed: Optional[int] = None):
+        self.host = host
+        self.port = port
+        self.whisper_latency = whisper_latency
+        self.whisper_realtime_factor = whisper_realtime_factor
+        self.chat_latency = chat_latency
+        self.token_rate = token_rate
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.default_audio_seconds = default_audio_seconds
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._requests: Dict[str, List[float]] = {}
+        self._errors: Dict[str, int] = {}
+        self._transcriptions = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                fake._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def _record(self, endpoint: str, duration: float, failed: bool = False):
+        with self._lock:
+            self._requests.setdefault(endpoint, []).append(duration)
+            if failed:
+                self._errors[endpoint] = self._errors.get(endpoint, 0) + 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                endpoint: {"requests": len(durations), "errors": self._errors.get(endpoint, 0),
+                           "durations": list(durations)}
+                for endpoint, durations in self._requests.items()
+            }
+
+    def _handle(self, request: BaseHTTPRequestHandler):
+        started = time.perf_counter()
+        body = request.rfile.read(int(request.headers.get("Content-Length", 0)))
+        path = request.path.split("?")[0]
+
+        if path.endswith("/audio/transcriptions"):
+            endpoint = "transcriptions"
+        elif path.endswith("/chat/completions"):
+            endpoint = "chat_completions"
+        else:
+            self._send_json(request, 404, {"error": {"message": f"Unknown endpoint {path}"}})
+            return
+
+        if self._should_fail():
+            self._send_json(request, self.error_status,
+                            {"error": {"message": "Injected failure", "type": "server_error"}})
+            self._record(endpoint, time.perf_counter() - started, failed=True)
+            return
+
+        try:
+            if endpoint == "transcriptions":
+                self._transcription(request, body)
+            else:
+                self._chat_completion(request, json.loads(body or b"{}"))
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up (timeout or cancellation)
+            pass
+        self._record(endpoint, time.perf_counter() - started)
+
+    def _send_json(self, request: BaseHTTPRequestHandler, status: int, payload: Dict[str, Any]):
+        data = json.dumps(payload).encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
+
+    def _words(self, count: int, offset: int = 0) -> List[str]:
+        return [WORDS[(offset + index) % len(WORDS)] for index in range(count)]
+
+    def _transcription(self, request: BaseHTTPRequestHandler, body: bytes):
+        duration = wav_duration(body) or self.default_audio_seconds
+        time.sleep(self.whisper_latency + self.whisper_realtime_factor * duration)
+
+        # Vary the text between requests so chunks do not produce identical prompts
+        with self._lock:
+            sequence = self._transcriptions
+            self._transcriptions += 1
+
+        # About 2.5 spoken words per second, in five-second segments
+        segments, position = [], 0.0
+        while position < duration:
+            end = min(position + 5.0, duration)
+            text = " ".join(self._words(max(1, int((end - position) * 2.5)), offset=sequence * 7 + len(segments)))
+            if not segments:
+                text = f"note {sequence} {text}"
+            segments.append({"id": len(segments), "seek": 0, "start": position, "end": end, "text": f" {text}",
+                             "tokens": [], "temperature": 0.0, "avg_logprob": -0.2,
+                             "compression_ratio": 1.2, "no_speech_prob": 0.01})
+            position = end
+
+        self._send_json(request, 200, {
+            "task": "transcribe",
+            "language": "english",
+            "duration": duration,
+            "text": "".join(segment["text"] for segment in segments).strip(),
+            "segments": segments
+        })
+
+    def _completion_content(self, payload: Dict[str, Any]) -> str:
+        response_format = payload.get("response_format") or {}
+        if response_format.get("type") == "json_object":
+            item = " ".join(self._words(8, offset=len(payload.get("messages", []))))
+            return json.dumps({"operations": [{"op": "add", "section": "requirements", "item": item}]})
+
+        # A whole TRD with every section filled, about completion_tokens words long
+        words_per_section = max(1, self.completion_tokens // len(TRD_SECTIONS))
+        document = TRDDocument(sections={
+            key: "\n".join(f"- {' '.join(self._words(10, offset=line))}"
+                           for line in range(max(1, words_per_section // 10)))
+            for key, _ in TRD_SECTIONS
+        })
+        return document.render()
+
+    def _chat_completion(self, request: BaseHTTPRequestHandler, payload: Dict[str, Any]):
+        content = self._completion_content(payload)
+        prompt_chars = sum(len(message.get("content", "")) for message in payload.get("messages", []))
+        # Tokens are whole words with their leading whitespace
+        tokens = [word if index == 0 else f" {word}" for index, word in enumerate(content.split(" "))]
+        usage = {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(tokens),
+                 "total_tokens": prompt_chars // 4 + len(tokens)}
+        model = payload.get("model", "fake-model")
+        created = int(time.time())
+
+        time.sleep(self.chat_latency)
+        if not payload.get("stream"):
+            if self.token_rate:
+                time.sleep(len(tokens) / self.token_rate)
+            self._send_json(request, 200, {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": usage
+            })
+            return
+
+        request.send_response(200)
+        request.send_header("Content-Type", "text/event-stream")
+        request.send_header("Connection", "close")
+        request.end_headers()
+        request.close_connection = True
+
+        def send(event: Dict[str, Any]):
+            request.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            request.wfile.flush()
+
+        for token in tokens:
+            if self.token_rate:
+                time.sleep(1.0 / self.token_rate)
+            send({"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created, "model": model,
+                  "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]})
+        send({"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created, "model": model,
+              "choices": [], "usage": usage})
+        request.wfile.write(b"data: [DONE]\n\n")
+        request.wfile.flush()
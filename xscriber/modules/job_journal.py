@@ -0,0 +1,437 @@
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Any
+from pathlib import Path
+
+
+class JobJournal:
+    """
+    Persistent job queue backed by SQLite.
+
+    Jobs move through queued -> claimed -> done, or back to queued when a claim
+    fails or its lease expires, and to failed after max_attempts. Queued or
+    claimed jobs can be cancelled (superseded by newer work, their project
+    deleted, or their deadline passed); the reason is kept in the error column
+    and a worker holding a cancelled claim sees is_active() turn False. A claim holds
+    a lease that the worker renews while it works; if the worker dies the lease
+    runs out and the job becomes claimable again, so nothing queued is lost
+    across restarts.
+
+    TRD jobs are claimed one at a time per project, and a project's final TRD
+    pass is only claimable once its transcriptions and earlier TRD updates have
+    finished.
+
+    A dedupe_key normally covers queued and claimed jobs. For final passes it only
+    covers queued ones: the key is cleared when the pass is claimed, so a final pass
+    requested while one is running is queued to run after it and sees the
+    transcriptions that arrived in the meantime.
+
+    Claims go by priority class first (live sessions, then interactive requests,
+    then bulk work), and within a class round-robin across projects: the project
+    whose last claim in that class is oldest goes next, so one project with a
+    deep backlog cannot starve the others. The time each job waited in the
+    queue is recorded at claim time and summarised per class by get_wait_stats().
+    """
+
+    QUEUED = "queued"
+    CLAIMED = "claimed"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    # Cancellation reasons
+    SUPERSEDED = "superseded"
+    PROJECT_DELETED = "project deleted"
+    DEADLINE_EXCEEDED = "deadline exceeded"
+    # Failure reason for a job whose lease ran out on its last attempt
+    LEASE_EXPIRED = "lease expired"
+
+    TRANSCRIPTION = "transcription"
+    TRD_UPDATE = "trd_update"
+    TRD_FINAL = "trd_final"
+    TRD_KINDS = (TRD_UPDATE, TRD_FINAL)
+    # Kinds whose dedupe_key is released on claim (see the class docstring)
+    QUEUED_DEDUPE_KINDS = (TRD_FINAL,)
+
+    # Lower values are claimed first
+    PRIORITY_LIVE = 0
+    PRIORITY_INTERACTIVE = 1
+    PRIORITY_BULK = 2
+    PRIORITY_NAMES = {PRIORITY_LIVE: "live", PRIORITY_INTERACTIVE: "interactive", PRIORITY_BULK: "bulk"}
+
+    # Columns added after the first release, created on existing databases at startup
+    _ADDED_COLUMNS = {
+        "priority": "INTEGER NOT NULL DEFAULT 1",
+        "queued_at": "REAL",
+        "claimed_at": "REAL",
+        "wait_seconds": "REAL",
+        "deadline_at": "REAL",
+    }
+
+    def __init__(self, db_path, lease_seconds: float = 300.0, max_attempts: int = 3):
+        self.db_path = Path(db_path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._create_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared between threads; keep one per thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(str(self.db_path), timeout=30.0, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _create_schema(self):
+        connection = self._connection()
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                project_id TEXT NOT NULL,
+                payload TEXT NOT NULL DEFAULT '{}',
+                dedupe_key TEXT,
+                priority INTEGER NOT NULL DEFAULT 1,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                claimed_by TEXT,
+                lease_expires_at REAL,
+                error TEXT,
+                queued_at REAL,
+                claimed_at REAL,
+                wait_seconds REAL,
+                deadline_at REAL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_project ON jobs (project_id, status);
+            CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_dedupe ON jobs (dedupe_key)
+                WHERE dedupe_key IS NOT NULL AND status IN ('queued', 'claimed');
+        """)
+
+        existing = {row["name"] for row in connection.execute("PRAGMA table_info(jobs)")}
+        for column, definition in self._ADDED_COLUMNS.items():
+            if column not in existing:
+                connection.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+
+        connection.executescript("""
+            CREATE INDEX IF NOT EXISTS jobs_status_kind ON jobs (status, kind, priority, id);
+            CREATE INDEX IF NOT EXISTS jobs_project_claims ON jobs (project_id, priority, claimed_at);
+        """)
+
+    def _row_to_job(self, row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"] or "{}")
+        return job
+
+    def enqueue(self, kind: str, project_id: str, payload: Optional[Dict[str, Any]] = None,
+                dedupe_key: Optional[str] = None, priority: int = PRIORITY_INTERACTIVE,
+                deadline_seconds: Optional[float] = None) -> Optional[int]:
+        """
+        Add a job and return its id. Returns None when an active job with the same
+        dedupe_key is already queued or claimed; a queued duplicate is raised to this
+        job's priority if that is higher, so live work never waits behind bulk work.
+        A job with deadline_seconds is cancelled if it has not finished by then.
+        """
+        now = time.time()
+        deadline_at = now + deadline_seconds if deadline_seconds is not None else None
+        connection = self._connection()
+        cursor = connection.execute(
+            "INSERT OR IGNORE INTO jobs (kind, project_id, payload, dedupe_key, priority, status, "
+            "queued_at, deadline_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (kind, project_id, json.dumps(payload or {}), dedupe_key, priority, self.QUEUED,
+             now, deadline_at, now, now)
+        )
+        if cursor.rowcount:
+            return cursor.lastrowid
+
+        if dedupe_key is not None:
+            connection.execute(
+                "UPDATE jobs SET priority = ?, updated_at = ? WHERE dedupe_key = ? AND status = ? AND priority > ?",
+                (priority, now, dedupe_key, self.QUEUED, priority)
+            )
+        return None
+
+    def claim(self, kinds: List[str], worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Claim the next claimable job of the given kinds, taking a lease on it: the highest
+        priority class first, then the project served least recently in that class, then
+        that project's oldest job.
+        """
+        now = time.time()
+        placeholders = ", ".join("?" for _ in kinds)
+        trd_placeholders = ", ".join("?" for _ in self.TRD_KINDS)
+
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Work nobody started before its deadline is no longer wanted
+            connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_expires_at = NULL, updated_at = ? "
+                "WHERE deadline_at < ? AND (status = ? OR (status = ? AND lease_expires_at < ?))",
+                (self.CANCELLED, self.DEADLINE_EXCEEDED, now, now, self.QUEUED, self.CLAIMED, now)
+            )
+            # A job whose worker died or hung on every attempt never reaches fail()
+            connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_expires_at = NULL, updated_at = ? "
+                "WHERE status = ? AND lease_expires_at < ? AND attempts >= ?",
+                (self.FAILED, self.LEASE_EXPIRED, now, self.CLAIMED, now, self.max_attempts)
+            )
+
+            row = connection.execute(f"""
+                SELECT * FROM jobs AS job
+                WHERE job.kind IN ({placeholders})
+                  AND (job.status = 'queued' OR (job.status = 'claimed' AND job.lease_expires_at < ?))
+                  -- one TRD job per project at a time
+                  AND (job.kind NOT IN ({trd_placeholders}) OR NOT EXISTS (
+                      SELECT 1 FROM jobs AS other
+                      WHERE other.project_id = job.project_id AND other.id != job.id
+                        AND other.kind IN ({trd_placeholders})
+                        AND other.status = 'claimed' AND other.lease_expires_at >= ?))
+                  -- the final pass waits for the project's transcriptions and earlier TRD updates
+                  AND (job.kind != ? OR NOT EXISTS (
+                      SELECT 1 FROM jobs AS other
+                      WHERE other.project_id = job.project_id AND other.id != job.id
+                        AND other.kind IN (?, ?)
+                        AND other.status IN ('queued', 'claimed')))
+                ORDER BY job.priority,
+                  -- round-robin within the class: projects never served (NULL) sort first
+                  (SELECT MAX(other.claimed_at) FROM jobs AS other
+                   WHERE other.project_id = job.project_id AND other.priority = job.priority
+                     AND other.kind IN ({placeholders})),
+                  job.id
+                LIMIT 1
+            """, (*kinds, now, *self.TRD_KINDS, *self.TRD_KINDS, now,
+                  self.TRD_FINAL, self.TRANSCRIPTION, self.TRD_UPDATE, *kinds)).fetchone()
+
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+
+            # Reclaiming an expired lease counts from the expiry, not the original queueing
+            queued_at = row["queued_at"] or row["created_at"]
+            if row["status"] == self.CLAIMED:
+                queued_at = row["lease_expires_at"]
+            wait_seconds = max(0.0, now - queued_at)
+
+            dedupe_key = None if row["kind"] in self.QUEUED_DEDUPE_KINDS else row["dedupe_key"]
+            connection.execute(
+                "UPDATE jobs SET status = ?, claimed_by = ?, lease_expires_at = ?, attempts = attempts + 1, "
+                "claimed_at = ?, wait_seconds = ?, dedupe_key = ?, updated_at = ? WHERE id = ?",
+                (self.CLAIMED, worker_id, now + self.lease_seconds, now, wait_seconds, dedupe_key, now, row["id"])
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+        job = self._row_to_job(row)
+        job.update(status=self.CLAIMED, claimed_by=worker_id, attempts=job["attempts"] + 1,
+                   lease_expires_at=now + self.lease_seconds, claimed_at=now, wait_seconds=wait_seconds,
+                   dedupe_key=dedupe_key)
+        return job
+
+    def renew(self, job_id: int, worker_id: str) -> bool:
+        """Extend a claim's lease; False if the job is no longer held by this worker"""
+        now = time.time()
+        cursor = self._connection().execute(
+            "UPDATE jobs SET lease_expires_at = ?, updated_at = ? WHERE id = ? AND status = ? AND claimed_by = ?",
+            (now + self.lease_seconds, now, job_id, self.CLAIMED, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def ack(self, job_id: int, worker_id: str) -> bool:
+        cursor = self._connection().execute(
+            "UPDATE jobs SET status = ?, lease_expires_at = NULL, error = NULL, updated_at = ? "
+            "WHERE id = ? AND status = ? AND claimed_by = ?",
+            (self.DONE, time.time(), job_id, self.CLAIMED, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: int, worker_id: str, error: str) -> bool:
+        """Release a failed claim: requeue it, or mark it failed after max_attempts"""
+        now = time.time()
+        cursor = self._connection().execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+            "lease_expires_at = NULL, error = ?, queued_at = ?, updated_at = ? "
+            "WHERE id = ? AND status = ? AND claimed_by = ?",
+            (self.max_attempts, self.FAILED, self.QUEUED, error[:1000], now, now,
+             job_id, self.CLAIMED, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def release(self, job_id: int, worker_id: str) -> bool:
+        """Hand a claim back without counting it as an attempt, e.g. on shutdown"""
+        now = time.time()
+        cursor = self._connection().execute(
+            "UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), lease_expires_at = NULL, "
+            "queued_at = ?, updated_at = ? WHERE id = ? AND status = ? AND claimed_by = ?",
+            (self.QUEUED, now, now, job_id, self.CLAIMED, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def is_active(self, job_id: int, worker_id: str) -> bool:
+        """True while the job is still claimed by this worker (not cancelled or reclaimed)"""
+        row = self._connection().execute(
+            "SELECT 1 FROM jobs WHERE id = ? AND status = ? AND claimed_by = ?",
+            (job_id, self.CLAIMED, worker_id)
+        ).fetchone()
+        return row is not None
+
+    def cancel(self, job_id: int, reason: str = CANCELLED) -> bool:
+        """Cancel a queued or claimed job; a worker holding it stops at its next check"""
+        cursor = self._connection().execute(
+            "UPDATE jobs SET status = ?, error = ?, lease_expires_at = NULL, updated_at = ? "
+            "WHERE id = ? AND status IN ('queued', 'claimed')",
+            (self.CANCELLED, reason, time.time(), job_id)
+        )
+        return cursor.rowcount == 1
+
+    def cancel_matching(self, project_id: str, kinds: Optional[List[str]] = None, before_id: Optional[int] = None,
+                        include_claimed: bool = True, reason: str = CANCELLED) -> List[int]:
+        """
+        Cancel a project's active jobs, optionally only some kinds and only jobs older
+        than before_id. Returns the ids of the cancelled jobs.
+        """
+        statuses = [self.QUEUED, self.CLAIMED] if include_claimed else [self.QUEUED]
+        where = f"project_id = ? AND status IN ({', '.join('?' for _ in statuses)})"
+        params: List[Any] = [project_id, *statuses]
+        if kinds:
+            where += f" AND kind IN ({', '.join('?' for _ in kinds)})"
+            params.extend(kinds)
+        if before_id is not None:
+            where += " AND id < ?"
+            params.append(before_id)
+
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            job_ids = [row["id"] for row in connection.execute(f"SELECT id FROM jobs WHERE {where}", params)]
+            connection.execute(
+                f"UPDATE jobs SET status = ?, error = ?, lease_expires_at = NULL, updated_at = ? WHERE {where}",
+                [self.CANCELLED, reason, time.time(), *params]
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return job_ids
+
+    def get_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list_jobs(self, project_id: Optional[str] = None, statuses: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Jobs in id order, optionally filtered by project and status"""
+        query = "SELECT * FROM jobs WHERE 1 = 1"
+        params: List[Any] = []
+        if project_id:
+            query += " AND project_id = ?"
+            params.append(project_id)
+        if statuses:
+            query += f" AND status IN ({','.join('?' * len(statuses))})"
+            params.extend(statuses)
+        return [self._row_to_job(row) for row in self._connection().execute(query + " ORDER BY id", params)]
+
+    def count_active(self, kinds: Optional[List[str]] = None, project_id: Optional[str] = None) -> int:
+        """Queued plus claimed jobs, optionally filtered by kind and project"""
+        query = "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'claimed')"
+        params: List[Any] = []
+        if kinds:
+            query += f" AND kind IN ({', '.join('?' for _ in kinds)})"
+            params.extend(kinds)
+        if project_id:
+            query += " AND project_id = ?"
+            params.append(project_id)
+        return self._connection().execute(query, params).fetchone()[0]
+
+    def count_in_progress(self, kinds: List[str]) -> int:
+        """Claimed jobs of these kinds whose lease is live, i.e. being worked on in any process"""
+        row = self._connection().execute(
+            f"SELECT COUNT(*) FROM jobs WHERE status = ? AND lease_expires_at >= ? "
+            f"AND kind IN ({', '.join('?' for _ in kinds)})",
+            (self.CLAIMED, time.time(), *kinds)
+        ).fetchone()
+        return row[0]
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        stats: Dict[str, Dict[str, int]] = {}
+        for row in self._connection().execute("SELECT kind, status, COUNT(*) AS total FROM jobs GROUP BY kind, status"):
+            stats.setdefault(row["kind"], {})[row["status"]] = row["total"]
+        return stats
+
+    def get_average_duration(self, kinds: List[str], window_seconds: float = 900.0) -> Optional[float]:
+        """Mean seconds from claim to completion of jobs of these kinds finished within the window"""
+        row = self._connection().execute(
+            f"SELECT AVG(updated_at - claimed_at) FROM jobs WHERE status = ? AND claimed_at IS NOT NULL "
+            f"AND updated_at >= ? AND kind IN ({', '.join('?' for _ in kinds)})",
+            (self.DONE, time.time() - window_seconds, *kinds)
+        ).fetchone()
+        return row[0]
+
+    def get_cancellation_stats(self) -> Dict[str, int]:
+        """Cancelled jobs by reason"""
+        return {row["error"] or self.CANCELLED: row["total"] for row in self._connection().execute(
+            "SELECT error, COUNT(*) AS total FROM jobs WHERE status = ? GROUP BY error", (self.CANCELLED,))}
+
+    def get_wait_stats(self, window_seconds: float = 3600.0) -> Dict[str, Dict[str, Any]]:
+        """
+        Queue wait per priority class: jobs still queued and how long the oldest has
+        waited, plus average, p95 and max wait of jobs claimed within the window.
+        """
+        now = time.time()
+        stats: Dict[str, Dict[str, Any]] = {}
+
+        def entry(priority: int) -> Dict[str, Any]:
+            return stats.setdefault(self.PRIORITY_NAMES.get(priority, str(priority)), {
+                "queued": 0, "oldest_queued_seconds": 0.0, "claimed": 0,
+                "avg_wait_seconds": None, "p95_wait_seconds": None, "max_wait_seconds": None
+            })
+
+        for priority in self.PRIORITY_NAMES:
+            entry(priority)
+
+        connection = self._connection()
+        for row in connection.execute(
+                "SELECT priority, COUNT(*) AS total, MIN(COALESCE(queued_at, created_at)) AS oldest "
+                "FROM jobs WHERE status = ? GROUP BY priority", (self.QUEUED,)):
+            entry(row["priority"]).update(queued=row["total"], oldest_queued_seconds=round(now - row["oldest"], 3))
+
+        waits: Dict[int, List[float]] = {}
+        for row in connection.execute(
+                "SELECT priority, wait_seconds FROM jobs WHERE claimed_at >= ? AND wait_seconds IS NOT NULL",
+                (now - window_seconds,)):
+            waits.setdefault(row["priority"], []).append(row["wait_seconds"])
+
+        for priority, values in waits.items():
+            values.sort()
+            entry(priority).update(
+                claimed=len(values),
+                avg_wait_seconds=round(sum(values) / len(values), 3),
+                p95_wait_seconds=round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+                max_wait_seconds=round(values[-1], 3)
+            )
+
+        return stats
+
+    def purge(self, older_than_seconds: float = 7 * 24 * 3600) -> int:
+        """Delete finished jobs older than the given age"""
+        cursor = self._connection().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND updated_at < ?",
+            (time.time() - older_than_seconds,)
+        )
+        return cursor.rowcount
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
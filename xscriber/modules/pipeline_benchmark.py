@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import time
+import wave
+import shutil
+import platform
+import resource
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Any
+
+from .fake_openai import FakeOpenAIServer
+from .job_journal import JobJournal
+from .project_handler import ProjectHandler
+
+
+RESULT_FORMAT_VERSION = 1
+
+
+def percentile_summary(values: List[float]) -> Dict[str, Any]:
+    """count, mean, p50/p95/p99 (nearest rank) and max of a sample, in seconds"""
+    if not values:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+
+    ordered = sorted(values)
+
+    def rank(percent):
+        return round(ordered[max(0, -(-len(ordered) * percent // 100) - 1)], 4)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 4),
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+        "max": round(ordered[-1], 4)
+    }
+
+
+def _rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def write_silent_wav(path, seconds: float, sample_rate: int = 16000):
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(b"\x00\x00" * int(seconds * sample_rate))
+
+
+class PipelineBenchmark:
+    """
+    Drives concurrent recording sessions through transcription and TRD generation
+    against a FakeOpenAIServer and reports latency per stage.
+
+    Each project is a session that saves a chunk_seconds WAV chunk every
+    chunk_interval seconds and queues it exactly as an upload does, then queues the
+    final pass. The run ends when the pipeline is idle. Stage timings come from the
+    job journal (queue wait and run time per job kind), the transcription files and
+    TRD provenance (chunk-to-transcript, chunk-to-TRD) and the fake server (time
+    spent in each endpoint). Everything runs in one process against a throwaway data
+    directory, so peak RSS covers the pipeline, the clients and the fake server.
+    """
+
+    def __init__(self, projects: int = 4, chunks_per_project: int = 5, chunk_seconds: float = 30.0,
+                 chunk_interval: float = 1.0, transcription_concurrency: Optional[int] = None,
+                 trd_concurrency: Optional[int] = None, timeout: float = 600.0,
+                 server_options: Optional[Dict[str, Any]] = None, keep_data: bool = False):
+        self.projects = projects
+        self.chunks_per_project = chunks_per_project
+        self.chunk_seconds = chunk_seconds
+        self.chunk_interval = chunk_interval
+        self.transcription_concurrency = transcription_concurrency
+        self.trd_concurrency = trd_concurrency
+        self.timeout = timeout
+        self.server_options = server_options or {}
+        self.keep_data = keep_data
+
+        self._upload_times: Dict[tuple, float] = {}
+        self._upload_durations: List[float] = []
+
+    def run(self) -> Dict[str, Any]:
+        data_dir = Path(tempfile.mkdtemp(prefix="xscriber-benchmark-"))
+        server = FakeOpenAIServer(**self.server_options).start()
+        previous_base_url = os.environ.get("OPENAI_BASE_URL")
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+
+        handler = None
+        try:
+            handler = self._make_handler(data_dir)
+            rss_start = _rss_mb()
+
+            project_ids = [handler.create_project(f"Benchmark {index + 1}") for index in range(self.projects)]
+            started = time.time()
+            with ThreadPoolExecutor(max_workers=self.projects) as executor:
+                list(executor.map(lambda project_id: self._run_session(handler, project_id), project_ids))
+            uploads_done = time.time()
+
+            idle = handler.pipeline.wait_until_idle(timeout=self.timeout)
+            finished = time.time()
+
+            return self._build_result(handler, server, project_ids, started, uploads_done, finished,
+                                      idle, rss_start)
+        finally:
+            if handler:
+                handler.cleanup()
+            server.stop()
+            if previous_base_url is None:
+                os.environ.pop("OPENAI_BASE_URL", None)
+            else:
+                os.environ["OPENAI_BASE_URL"] = previous_base_url
+            if not self.keep_data:
+                shutil.rmtree(data_dir, ignore_errors=True)
+
+    def _make_handler(self, data_dir: Path) -> ProjectHandler:
+        from .transcriber import WhisperTranscriber
+        from .chat_completion import ChatCompletionProcessor
+
+        handler = ProjectHandler(data_dir=data_dir, start_workers=True)
+        handler.reconcile_on_start = False
+        if self.transcription_concurrency:
+            handler.pipeline.concurrency["transcription"] = self.transcription_concurrency
+        if self.trd_concurrency:
+            handler.pipeline.concurrency["trd"] = self.trd_concurrency
+
+        # Created now, while OPENAI_BASE_URL points at the fake server
+        handler.transcriber = WhisperTranscriber(api_key="benchmark", async_http_client=handler.pipeline.http_client)
+        handler.chat_processor = ChatCompletionProcessor(api_key="benchmark", model=handler.default_model,
+                                                         cache=handler.response_cache,
+                                                         async_http_client=handler.pipeline.http_client)
+        return handler
+
+    def _run_session(self, handler: ProjectHandler, project_id: str):
+        for chunk_id in range(1, self.chunks_per_project + 1):
+            if chunk_id > 1 and self.chunk_interval:
+                time.sleep(self.chunk_interval)
+
+            upload_started = time.time()
+            audio_file = handler.audio_dir / f"{project_id}_audiochunk_{chunk_id}.wav"
+            write_silent_wav(audio_file, self.chunk_seconds)
+            handler._queue_transcription(project_id, str(audio_file.resolve()))
+
+            self._upload_times[(project_id, str(chunk_id))] = upload_started
+            self._upload_durations.append(time.time() - upload_started)
+
+        handler.finalize_session(project_id)
+
+    def _build_result(self, handler: ProjectHandler, server: FakeOpenAIServer, project_ids: List[str],
+                      started: float, uploads_done: float, finished: float, idle: bool,
+                      rss_start: Optional[float]) -> Dict[str, Any]:
+        jobs = handler.job_journal.list_jobs()
+        queue_wait: Dict[str, List[float]] = {}
+        run_time: Dict[str, List[float]] = {}
+        outcomes: Dict[str, Dict[str, int]] = {}
+        for job in jobs:
+            kind_outcomes = outcomes.setdefault(job["kind"], {})
+            kind_outcomes[job["status"]] = kind_outcomes.get(job["status"], 0) + 1
+            if job["wait_seconds"] is not None:
+                queue_wait.setdefault(job["kind"], []).append(job["wait_seconds"])
+            if job["status"] == JobJournal.DONE and job["claimed_at"]:
+                run_time.setdefault(job["kind"], []).append(job["updated_at"] - job["claimed_at"])
+
+        chunk_to_transcript, chunk_to_trd = [], []
+        trd_versions = 0
+        for project_id in project_ids:
+            for transcription_file in handler.transcription_dir.glob(f"{project_id}_transcription_*.json"):
+                chunk_id = transcription_file.stem.split('_')[-1]
+                uploaded = self._upload_times.get((project_id, chunk_id))
+                if uploaded:
+                    chunk_to_transcript.append(transcription_file.stat().st_mtime - uploaded)
+
+            versions = (handler.get_project_metadata(project_id) or {}).get("trd_versions", [])
+            trd_versions += len(versions)
+            for version in versions:
+                generated = datetime.fromisoformat(version["generated_at"]).timestamp()
+                for chunk_id in version.get("new_chunk_ids", []):
+                    uploaded = self._upload_times.get((project_id, str(chunk_id)))
+                    if uploaded:
+                        chunk_to_trd.append(generated - uploaded)
+
+        stages = {"upload": percentile_summary(self._upload_durations)}
+        for kind in (JobJournal.TRANSCRIPTION, JobJournal.TRD_UPDATE, JobJournal.TRD_FINAL):
+            stages[f"{kind}_queue_wait"] = percentile_summary(queue_wait.get(kind, []))
+            stages[f"{kind}_run"] = percentile_summary(run_time.get(kind, []))
+        stages["chunk_to_transcript"] = percentile_summary(chunk_to_transcript)
+        stages["chunk_to_trd"] = percentile_summary(chunk_to_trd)
+
+        fake_stats = server.get_stats()
+        for endpoint, endpoint_stats in fake_stats.items():
+            stages[f"openai_{endpoint}"] = percentile_summary(endpoint_stats.pop("durations"))
+
+        elapsed = finished - started
+        total_chunks = self.projects * self.chunks_per_project
+        return {
+            "benchmark": "pipeline",
+            "format_version": RESULT_FORMAT_VERSION,
+            "started_at": datetime.fromtimestamp(started).isoformat(),
+            "environment": {"python": platform.python_version(), "platform": platform.platform()},
+            "config": {
+                "projects": self.projects,
+                "chunks_per_project": self.chunks_per_project,
+                "chunk_seconds": self.chunk_seconds,
+                "chunk_interval": self.chunk_interval,
+                "transcription_concurrency": handler.pipeline.concurrency["transcription"],
+                "trd_concurrency": handler.pipeline.concurrency["trd"],
+                "trd_update_mode": handler.trd_update_mode,
+                "fake_openai": {
+                    "whisper_latency": server.whisper_latency,
+                    "whisper_realtime_factor": server.whisper_realtime_factor,
+                    "chat_latency": server.chat_latency,
+                    "token_rate": server.token_rate,
+                    "completion_tokens": server.completion_tokens,
+                    "error_rate": server.error_rate
+                }
+            },
+            "completed": idle,
+            "duration_seconds": round(elapsed, 3),
+            "upload_seconds": round(uploads_done - started, 3),
+            "throughput": {
+                "chunks_per_second": round(len(chunk_to_transcript) / elapsed, 4) if elapsed else None,
+                "audio_seconds_per_second": round(len(chunk_to_transcript) * self.chunk_seconds / elapsed, 2)
+                if elapsed else None,
+                "trd_versions_per_minute": round(trd_versions * 60 / elapsed, 2) if elapsed else None
+            },
+            "chunks": {"uploaded": total_chunks, "transcribed": len(chunk_to_transcript)},
+            "jobs": outcomes,
+            "stages": stages,
+            "openai_requests": fake_stats,
+            "memory": {"rss_start_mb": rss_start, "peak_rss_mb": _peak_rss_mb()}
+        }
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = 0.2) -> List[str]:
+    """
+    Regressions of current against baseline: stage p95 latencies or peak RSS more than
+    tolerance above the baseline, or throughput more than tolerance below it.
+    """
+    regressions = []
+    for stage, summary in current.get("stages", {}).items():
+        baseline_p95 = baseline.get("stages", {}).get(stage, {}).get("p95")
+        if baseline_p95 and summary.get("p95") is not None and summary["p95"] > baseline_p95 * (1 + tolerance):
+            regressions.append(f"{stage} p95 {summary['p95']}s vs {baseline_p95}s")
+
+    for key, value in current.get("throughput", {}).items():
+        baseline_value = baseline.get("throughput", {}).get(key)
+        if baseline_value and value is not None and value < baseline_value * (1 - tolerance):
+            regressions.append(f"throughput {key} {value} vs {baseline_value}")
+
+    baseline_rss = baseline.get("memory", {}).get("peak_rss_mb")
+    current_rss = current.get("memory", {}).get("peak_rss_mb")
+    if baseline_rss and current_rss and current_rss > baseline_rss * (1 + tolerance):
+        regressions.append(f"peak RSS {current_rss}MB vs {baseline_rss}MB")
+
+    return regressions
+
+
+def save_result(result: Dict[str, Any], output_path) -> Path:
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump(result, f, indent=2)
+    return output_path
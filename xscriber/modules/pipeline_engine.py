@@ -0,0 +1,488 @@
+import os
+import time
+import socket
+import asyncio
+import threading
+import functools
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Dict, Any, Optional, Callable, Awaitable, Set
+
+from .job_journal import JobJournal
+from .metrics import PIPELINE_JOBS, PIPELINE_JOB_SECONDS
+from .structured_log import get_logger, log_context, chunk_correlation_id
+
+log = get_logger("pipeline")
+
+# The job a worker task is running, so follow-up jobs it submits inherit its priority
+_current_job: contextvars.ContextVar = contextvars.ContextVar("current_job", default=None)
+
+
+class PipelineEngine:
+    """
+    Runs the transcription and TRD update stages on a single asyncio event loop.
+
+    The loop lives in a daemon thread so synchronous callers (Django views, the
+    recording handler's chunk callback) can hand work over without blocking.
+    Jobs are recorded in a JobJournal before anything else happens, so queued
+    work survives restarts; each stage has a fixed number of worker tasks that
+    claim jobs from the journal, renew their lease while working, and ack or
+    fail the job when done. Submitting a job wakes the workers immediately;
+    they also poll at poll_interval to pick up jobs whose lease expired.
+
+    TRD updates for the same project are serialised: the journal hands out one
+    TRD job per project at a time, and in-process callers such as bulk
+    regeneration share the project_lock() with the TRD workers.
+
+    Every job has a priority class (live, interactive or bulk, see JobJournal).
+    Jobs submitted while a job is running, such as the TRD update queued after a
+    transcription, inherit the running job's priority unless one is given.
+
+    Jobs can be cancelled while queued or running: a newer TRD request
+    supersedes older ones, deleting a project cancels its jobs, and jobs with a
+    deadline are cancelled once it passes. A running job is stopped at its next
+    await; workers notice cancellations made by other processes within
+    poll_interval. Cancelled jobs are counted separately from failures.
+
+    TRD jobs carry the model tier to use: "preview" for refreshes while a
+    session is recording and "final" for the pass queued when it ends. A final
+    pass is only claimed once the project's outstanding transcriptions and TRD
+    updates have finished, so it always sees the whole session.
+
+    Processes running workers also purge finished jobs older than
+    job_retention_seconds from the journal every purge_interval, so the table
+    the claim query scans stays bounded.
+
+    The loop can run without workers: a process that only enqueues jobs (a web
+    server when the pipeline runs in run_pipeline workers) never claims any,
+    and one that needs run() for its own coroutines starts just the loop.
+
+    Blocking calls made by jobs and workers (journal queries, locked metadata
+    writes, file I/O) run in a small executor through run_blocking(), so a slow
+    disk or a lock held by another process stalls only that job, not the loop.
+
+    All OpenAI traffic issued from the loop shares one HTTP client, so
+    connections are pooled and kept alive across requests and stages. The
+    client (and the openai import behind it) is created on first use.
+    """
+
+    STAGE_KINDS = {
+        "transcription": [JobJournal.TRANSCRIPTION],
+        "trd": list(JobJournal.TRD_KINDS),
+    }
+
+    def __init__(self, journal: JobJournal,
+                 transcription_handler: Callable[[str, str], Awaitable[Optional[bool]]],
+                 trd_handler: Callable[[str, Optional[str], str], Awaitable[Optional[bool]]],
+                 transcription_concurrency: int = 2, trd_concurrency: int = 1,
+                 poll_interval: float = 5.0, job_retention_seconds: float = 7 * 24 * 3600,
+                 purge_interval: float = 3600.0):
+        self.journal = journal
+        self.transcription_handler = transcription_handler
+        self.trd_handler = trd_handler
+        self.concurrency = {
+            "transcription": max(1, transcription_concurrency),
+            "trd": max(1, trd_concurrency),
+        }
+        self.poll_interval = poll_interval
+        self.job_retention_seconds = job_retention_seconds
+        self.purge_interval = purge_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._http_client = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Executor calls not yet finished, cancelled on shutdown if they haven't started
+        self._pending_calls: Set[Future] = set()
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self._project_locks: Dict[str, asyncio.Lock] = {}
+        self._workers = []
+        self._purger: Optional[asyncio.Task] = None
+        self._in_flight = {stage: 0 for stage in self.STAGE_KINDS}
+        self._cancelled = {stage: 0 for stage in self.STAGE_KINDS}
+        # Dispatch tasks of jobs running in this process, and why any of them was cancelled
+        self._running: Dict[int, asyncio.Task] = {}
+        self._cancel_reasons: Dict[int, str] = {}
+        # Set by the owner to profile jobs on demand (see ProfilingController)
+        self.profiler = None
+
+    @property
+    def is_running(self) -> bool:
+        return self.loop is not None and self.loop.is_running()
+
+    @property
+    def http_client(self):
+        if self._http_client is None:
+            import openai
+            self._http_client = openai.DefaultAsyncHttpxClient()
+        return self._http_client
+
+    @property
+    def has_workers(self) -> bool:
+        return bool(self._workers)
+
+    def start(self, run_workers: bool = True):
+        """Start the event loop thread and, unless run_workers is False, the stage workers"""
+        if not (self._thread and self._thread.is_alive()):
+            self._started.clear()
+            self._thread = threading.Thread(target=self._run_loop, name="pipeline-engine", daemon=True)
+            self._thread.start()
+            self._started.wait(timeout=5.0)
+
+        if run_workers and not self._workers:
+            asyncio.run_coroutine_threadsafe(self._start_workers(), self.loop).result(5.0)
+
+    async def _start_workers(self):
+        self._workers = [
+            asyncio.ensure_future(self._worker(stage, index))
+            for stage in self.STAGE_KINDS
+            for index in range(self.concurrency[stage])
+        ]
+        self._purger = asyncio.ensure_future(self._purge_finished_jobs())
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        self._wakeups = {stage: asyncio.Event() for stage in self.STAGE_KINDS}
+
+        self.loop.call_soon(self._started.set)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.run_until_complete(self._shutdown())
+            self.loop.close()
+
+    async def _shutdown(self):
+        tasks = self._workers + ([self._purger] if self._purger else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._purger = None
+
+        if self._executor is not None:
+            # shutdown(cancel_futures=True) needs Python 3.9
+            for future in list(self._pending_calls):
+                future.cancel()
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+        if self._http_client is None:
+            return
+        try:
+            await self._http_client.aclose()
+        except Exception as e:
+            log.warning("Error closing HTTP client: %s", e)
+
+    def stop(self, timeout: float = 5.0):
+        if not self._thread:
+            return
+
+        if self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """
+        Run a blocking call in the engine's executor and await its result. Context variables
+        (the current job, log context, span and usage collectors) carry over to the call.
+        """
+        if self._executor is None:
+            # Workers and their lease watchers each need a thread for journal calls
+            self._executor = ThreadPoolExecutor(max_workers=2 * sum(self.concurrency.values()) + 2,
+                                                thread_name_prefix="pipeline-io")
+        context = contextvars.copy_context()
+        future = self._executor.submit(functools.partial(context.run, func, *args, **kwargs))
+        self._pending_calls.add(future)
+        future.add_done_callback(self._pending_calls.discard)
+        return await asyncio.wrap_future(future)
+
+    def _wake(self):
+        """Wake idle workers; safe to call from any thread"""
+        if not self.is_running:
+            return
+
+        def wake_all():
+            for event in self._wakeups.values():
+                event.set()
+
+        self.loop.call_soon_threadsafe(wake_all)
+
+    async def _worker(self, stage: str, index: int):
+        worker_id = f"{self.worker_id}:{stage}:{index}"
+        wakeup = self._wakeups[stage]
+
+        while True:
+            wakeup.clear()
+            try:
+                job = await self.run_blocking(self.journal.claim, self.STAGE_KINDS[stage], worker_id)
+            except Exception as e:
+                log.error("Error claiming %s job: %s", stage, e)
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run_job(stage, job, worker_id)
+
+    async def _purge_finished_jobs(self):
+        while True:
+            try:
+                purged = await self.run_blocking(self.journal.purge, self.job_retention_seconds)
+                if purged:
+                    log.info("Purged %d finished jobs from the journal", purged)
+            except Exception as e:
+                log.error("Error purging finished jobs: %s", e)
+            await asyncio.sleep(self.purge_interval)
+
+    async def _run_job(self, stage: str, job: Dict[str, Any], worker_id: str):
+        self._in_flight[stage] += 1
+        started = time.perf_counter()
+        outcome = None
+        token = _current_job.set(job)
+        # The task copies the context, so everything logged for the job carries its correlation id
+        with log_context(**self._job_log_fields(job)):
+            dispatch = asyncio.ensure_future(self._dispatch(job))
+        self._running[job["id"]] = dispatch
+        watcher = asyncio.ensure_future(self._watch_job(job, worker_id, dispatch))
+        try:
+            with self._profile(job):
+                result = await dispatch
+            if result is False:
+                outcome = "failed"
+                await self.run_blocking(self.journal.fail, job["id"], worker_id, "Handler reported failure")
+            else:
+                outcome = "succeeded"
+                await self.run_blocking(self.journal.ack, job["id"], worker_id)
+        except asyncio.CancelledError:
+            reason = self._cancel_reasons.get(job["id"])
+            if reason is None:
+                # Shutting down: hand the job back without counting the attempt
+                await self.run_blocking(self.journal.release, job["id"], worker_id)
+                raise
+            outcome = "cancelled"
+            self._cancelled[stage] += 1
+            log.info("Cancelled %s job %s (%s)", stage, job["id"], reason, extra=self._job_log_fields(job))
+        except Exception as e:
+            outcome = "error"
+            log.error("Error in %s job %s: %s", stage, job["id"], e, extra=self._job_log_fields(job))
+            await self.run_blocking(self.journal.fail, job["id"], worker_id, str(e))
+        finally:
+            # Jobs handed back on shutdown are not counted
+            if outcome:
+                PIPELINE_JOBS.inc(stage=stage, outcome=outcome)
+                PIPELINE_JOB_SECONDS.observe(time.perf_counter() - started, stage=stage)
+            _current_job.reset(token)
+            watcher.cancel()
+            self._running.pop(job["id"], None)
+            self._cancel_reasons.pop(job["id"], None)
+            self._in_flight[stage] -= 1
+            # Finishing a job can make others claimable (the next TRD job, a final pass)
+            for event in self._wakeups.values():
+                event.set()
+
+    async def _watch_job(self, job: Dict[str, Any], worker_id: str, dispatch: asyncio.Task):
+        """
+        Renew the job's lease while it runs, and stop it if it is cancelled in the journal,
+        its lease is taken over, or its deadline passes.
+        """
+        renew_interval = self.journal.lease_seconds / 3
+        last_renewed = time.monotonic()
+        deadline_at = job.get("deadline_at")
+
+        while True:
+            delay = min(self.poll_interval, renew_interval)
+            if deadline_at:
+                delay = max(0.0, min(delay, deadline_at - time.time()))
+            await asyncio.sleep(delay)
+
+            if deadline_at and time.time() >= deadline_at:
+                await self.run_blocking(self.journal.cancel, job["id"], JobJournal.DEADLINE_EXCEEDED)
+                reason = JobJournal.DEADLINE_EXCEEDED
+            elif not await self.run_blocking(self.journal.is_active, job["id"], worker_id):
+                current = await self.run_blocking(self.journal.get_job, job["id"]) or {}
+                reason = current.get("error") if current.get("status") == JobJournal.CANCELLED else "lease lost"
+                reason = reason or JobJournal.CANCELLED
+            else:
+                if time.monotonic() - last_renewed >= renew_interval:
+                    await self.run_blocking(self.journal.renew, job["id"], worker_id)
+                    last_renewed = time.monotonic()
+                continue
+
+            self._cancel_reasons[job["id"]] = reason
+            dispatch.cancel()
+            return
+
+    def _cancel_running(self, job_ids, reason: str):
+        """Stop jobs cancelled in the journal that are running in this process; safe from any thread"""
+        if not job_ids or not self.is_running:
+            return
+
+        def cancel():
+            for job_id in job_ids:
+                task = self._running.get(job_id)
+                if task is not None and not task.done():
+                    self._cancel_reasons[job_id] = reason
+                    task.cancel()
+
+        if threading.current_thread() is self._thread:
+            cancel()
+        else:
+            self.loop.call_soon_threadsafe(cancel)
+
+    def cancel_project(self, project_id: str, reason: str = JobJournal.PROJECT_DELETED) -> int:
+        """Cancel all of a project's queued and running jobs; returns how many were cancelled"""
+        job_ids = self.journal.cancel_matching(project_id, reason=reason)
+        self._cancel_running(job_ids, reason)
+        return len(job_ids)
+
+    def _supersede(self, project_id: str, job_id: Optional[int], kinds, include_claimed: bool):
+        # Only a job that was actually added replaces the older ones
+        if job_id is None:
+            return
+        job_ids = self.journal.cancel_matching(project_id, kinds, before_id=job_id,
+                                               include_claimed=include_claimed, reason=JobJournal.SUPERSEDED)
+        self._cancel_running(job_ids, JobJournal.SUPERSEDED)
+
+    def _profile(self, job: Dict[str, Any]):
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.profile("jobs", f"{job['kind']} {job['project_id']} #{job['id']}")
+
+    @staticmethod
+    def _job_log_fields(job: Dict[str, Any]) -> Dict[str, Any]:
+        payload = job["payload"]
+        chunk_file = payload.get("audio_file_path") or payload.get("transcription_file")
+        fields = {"project_id": job["project_id"], "job_id": job["id"], "job_kind": job["kind"],
+                  "correlation_id": chunk_correlation_id(job["project_id"], chunk_file)}
+        if payload.get("trace_id"):
+            fields["trace_id"] = payload["trace_id"]
+        return fields
+
+    async def _dispatch(self, job: Dict[str, Any]) -> Optional[bool]:
+        project_id, payload = job["project_id"], job["payload"]
+        if job["kind"] == JobJournal.TRANSCRIPTION:
+            return await self.transcription_handler(project_id, payload["audio_file_path"])
+
+        async with self.project_lock(project_id):
+            return await self.trd_handler(project_id, payload.get("transcription_file"), payload.get("tier", "preview"))
+
+    def project_lock(self, project_id: str) -> asyncio.Lock:
+        """Lock held while a project's TRD is being updated; only usable on the engine's loop"""
+        return self._project_locks.setdefault(project_id, asyncio.Lock())
+
+    @staticmethod
+    def current_job() -> Optional[Dict[str, Any]]:
+        """The job the calling worker task is running, if any"""
+        return _current_job.get()
+
+    def _priority(self, priority: Optional[int]) -> int:
+        if priority is not None:
+            return priority
+        job = _current_job.get()
+        return job["priority"] if job else JobJournal.PRIORITY_INTERACTIVE
+
+    def submit_transcription(self, project_id: str, audio_file_path: str,
+                             priority: Optional[int] = None, trace_id: Optional[str] = None) -> Optional[int]:
+        job_id = self.journal.enqueue(JobJournal.TRANSCRIPTION, project_id,
+                                      self._with_trace({"audio_file_path": audio_file_path}, trace_id),
+                                      dedupe_key=f"transcription:{audio_file_path}",
+                                      priority=self._priority(priority))
+        self._wake()
+        return job_id
+
+    def submit_trd_update(self, project_id: str, transcription_file: str, tier: str = "preview",
+                          priority: Optional[int] = None, supersede: bool = False,
+                          deadline_seconds: Optional[float] = None, trace_id: Optional[str] = None) -> Optional[int]:
+        """
+        Queue a TRD update for one transcription. With supersede, older queued updates for
+        the project are cancelled; only use it when each update covers all transcriptions.
+        """
+        job_id = self.journal.enqueue(JobJournal.TRD_UPDATE, project_id,
+                                      self._with_trace({"transcription_file": transcription_file, "tier": tier},
+                                                       trace_id),
+                                      dedupe_key=f"trd_update:{transcription_file}",
+                                      priority=self._priority(priority), deadline_seconds=deadline_seconds)
+        if supersede:
+            self._supersede(project_id, job_id, [JobJournal.TRD_UPDATE], include_claimed=False)
+        self._wake()
+        return job_id
+
+    @staticmethod
+    def _with_trace(payload: Dict[str, Any], trace_id: Optional[str]) -> Dict[str, Any]:
+        # The chunk's trace id travels in the job payload to the worker that runs it
+        return {**payload, "trace_id": trace_id} if trace_id else payload
+
+    def submit_final_pass(self, project_id: str, priority: Optional[int] = None) -> Optional[int]:
+        """
+        Queue a final-tier TRD pass; it runs once the project's pending transcriptions are done.
+        It supersedes the project's queued and running preview updates, which it redoes anyway.
+        A pass already queued absorbs this one; a pass already running does not, so this one
+        runs after it.
+        """
+        job_id = self.journal.enqueue(JobJournal.TRD_FINAL, project_id, {"tier": "final"},
+                                      dedupe_key=f"trd_final:{project_id}",
+                                      priority=self._priority(priority))
+        self._supersede(project_id, job_id, [JobJournal.TRD_UPDATE], include_claimed=True)
+        self._wake()
+        return job_id
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """
+        Run a coroutine on the engine's loop from another thread and wait for its result.
+        Starts the loop (without workers) if it is not running yet.
+        """
+        if not self.is_running:
+            self.start(run_workers=False)
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("PipelineEngine.run() cannot be called from the engine's own loop")
+
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def wait_until_idle(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the journal has no queued or claimed jobs and no work is in flight.
+        Jobs may be processed by workers in other processes.
+        """
+        async def drain():
+            while await self.run_blocking(self.journal.count_active) or any(self._in_flight.values()):
+                await asyncio.sleep(0.02)
+
+        try:
+            self.run(drain(), timeout)
+            return True
+        except Exception:
+            return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        jobs = self.journal.get_stats()
+
+        def queued(kinds):
+            return sum(jobs.get(kind, {}).get(JobJournal.QUEUED, 0) for kind in kinds)
+
+        return {
+            "running": self.is_running,
+            "workers": len(self._workers),
+            "transcription_queue_size": queued(self.STAGE_KINDS["transcription"]),
+            "trd_queue_size": queued(self.STAGE_KINDS["trd"]),
+            "transcription_in_flight": self._in_flight["transcription"],
+            "trd_in_flight": self._in_flight["trd"],
+            "transcription_cancelled": self._cancelled["transcription"],
+            "trd_cancelled": self._cancelled["trd"],
+            "cancelled_by_reason": self.journal.get_cancellation_stats(),
+            "transcription_concurrency": self.concurrency["transcription"],
+            "trd_concurrency": self.concurrency["trd"],
+            "jobs": jobs,
+            "queue_wait": self.journal.get_wait_stats()
+        }
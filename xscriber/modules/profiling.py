@@ -0,0 +1,371 @@
+import io
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Any
+
+from .structured_log import get_logger
+
+log = get_logger("profiling")
+
+PROFILE_MODES = ("cprofile", "sampling")
+PROFILE_SCOPES = ("requests", "jobs", "all")
+
+_SESSION_ID_PATTERN = re.compile(r"^\d{8}-\d{6}-[0-9a-f]{6}$")
+_PROFILE_NAME_PATTERN = re.compile(r"^[\w.-]+$")
+
+# From Python 3.12 cProfile hooks every thread through sys.monitoring, which holds one
+# profiler at a time, so all units in the process share one (calls running at the same
+# time on different threads are mixed in its call counts); before that a profiler only
+# sees the thread that enabled it, so each thread gets its own
+_PROCESS_WIDE_PROFILER = sys.version_info >= (3, 12)
+
+
+class ProfileRun:
+    """
+    This process's part in one profiling session: the profiled requests or jobs, and the
+    profiler, sampler and tracemalloc snapshot behind them. Writes its results to the
+    session's directory when it finishes.
+
+    In cprofile mode the profiler is enabled while any profiled unit is running. If another
+    profiler already holds the hook (a debugger, coverage, or a session still finishing)
+    the run falls back to sampling.
+    """
+
+    MAX_LOGGED_UNITS = 200
+    MAX_STACK_DEPTH = 128
+
+    def __init__(self, session: Dict[str, Any], output_dir: Path, sample_interval: float = 0.005):
+        self.session = session
+        self.mode = session["mode"]
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.started_units = 0
+        self.completed_units = 0
+        self.samples = 0
+        self.units: List[Dict[str, Any]] = []
+        self.finished = False
+
+        self._lock = threading.Lock()
+        # Profiled units in flight per thread, and the enabled profilers: one for the process
+        # (keyed None) or one per thread, see _PROCESS_WIDE_PROFILER
+        self._threads: Dict[int, int] = {}
+        self._profilers: Dict[Optional[int], cProfile.Profile] = {}
+        self._stats: Optional[pstats.Stats] = None
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+        self._tracemalloc_started = False
+        self._snapshot = None
+        if session.get("tracemalloc"):
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(25)
+                self._tracemalloc_started = True
+            self._snapshot = tracemalloc.take_snapshot()
+
+        if self.mode == "sampling":
+            self._start_sampler()
+
+        self._timer = threading.Timer(max(session["expires_at"] - time.time(), 0), self.finish)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def accepts(self, unit: str) -> bool:
+        return self.session["scope"] in ("all", unit)
+
+    def _start_sampler(self):
+        self._sampler = threading.Thread(target=self._sample, name="profile-sampler", daemon=True)
+        self._sampler.start()
+
+    @staticmethod
+    def _profiler_key(ident: int) -> Optional[int]:
+        return None if _PROCESS_WIDE_PROFILER else ident
+
+    def begin(self) -> bool:
+        """Start profiling a request or job on this thread; False once the session is full or over"""
+        max_units = self.session.get("max_units")
+        ident = threading.get_ident()
+        with self._lock:
+            if self.finished or (max_units and self.started_units >= max_units):
+                return False
+            self.started_units += 1
+            self._threads[ident] = self._threads.get(ident, 0) + 1
+
+            # Pipeline jobs interleave on the event loop thread, so a profiler stays enabled
+            # while any profiled unit it covers is running
+            key = self._profiler_key(ident)
+            if self.mode == "cprofile" and key not in self._profilers:
+                profiler = cProfile.Profile()
+                try:
+                    profiler.enable()
+                except ValueError as e:
+                    log.warning("Profiling session %s falls back to sampling: %s", self.session["id"], e)
+                    self.mode = "sampling"
+                    self._start_sampler()
+                else:
+                    self._profilers[key] = profiler
+        return True
+
+    def end(self, unit: str, label: str, seconds: float):
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] -= 1
+            if not self._threads[ident]:
+                del self._threads[ident]
+            key = self._profiler_key(ident)
+            idle = not self._threads if key is None else ident not in self._threads
+            profiler = self._profilers.pop(key, None) if idle else None
+            if profiler is not None:
+                profiler.disable()
+
+            if self.finished:
+                return
+            if profiler is not None:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profiler)
+                else:
+                    self._stats.add(profiler)
+            self.completed_units += 1
+            if len(self.units) < self.MAX_LOGGED_UNITS:
+                self.units.append({"unit": unit, "label": label, "seconds": round(seconds, 4)})
+            max_units = self.session.get("max_units")
+            done = bool(max_units) and self.completed_units >= max_units
+
+        if done:
+            self.finish()
+
+    def _sample(self):
+        while not self._stop.wait(self.sample_interval):
+            with self._lock:
+                idents = list(self._threads)
+            if not idents:
+                continue
+            frames = sys._current_frames()
+            for ident in idents:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self._stacks[self._fold(frame)] += 1
+            self.samples += 1
+
+    def _fold(self, frame) -> str:
+        # Root first, in the "a;b;c" form flame graph tools read
+        names = []
+        while frame is not None and len(names) < self.MAX_STACK_DEPTH:
+            code = frame.f_code
+            names.append(f"{Path(code.co_filename).name}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def finish(self) -> List[str]:
+        """Stop profiling and write this process's results; returns the files written"""
+        with self._lock:
+            if self.finished:
+                return []
+            self.finished = True
+        self._timer.cancel()
+        self._stop.set()
+        if self._sampler is not None and self._sampler is not threading.current_thread():
+            self._sampler.join(timeout=1.0)
+
+        try:
+            return self._write_results()
+        except Exception as e:
+            log.error("Failed to write profile for session %s: %s", self.session["id"], e)
+            return []
+        finally:
+            if self._tracemalloc_started:
+                tracemalloc.stop()
+
+    def _write_results(self) -> List[str]:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        prefix = str(os.getpid())
+        files = []
+
+        if self._stats is not None:
+            self._stats.dump_stats(self.output_dir / f"{prefix}.prof")
+            report = io.StringIO()
+            self._stats.stream = report
+            self._stats.sort_stats("cumulative").print_stats(40)
+            (self.output_dir / f"{prefix}-top.txt").write_text(report.getvalue())
+            files += [f"{prefix}.prof", f"{prefix}-top.txt"]
+
+        if self._stacks:
+            lines = [f"{stack} {count}" for stack, count in self._stacks.most_common()]
+            (self.output_dir / f"{prefix}.folded").write_text("\n".join(lines) + "\n")
+            files.append(f"{prefix}.folded")
+
+        if self._snapshot is not None:
+            snapshot = tracemalloc.take_snapshot()
+            snapshot.dump(str(self.output_dir / f"{prefix}.snapshot"))
+            top = snapshot.compare_to(self._snapshot, "lineno")[:40]
+            traced, peak = tracemalloc.get_traced_memory()
+            report = [f"traced={traced} peak={peak}", *(str(stat) for stat in top)]
+            (self.output_dir / f"{prefix}-tracemalloc.txt").write_text("\n".join(report) + "\n")
+            files += [f"{prefix}.snapshot", f"{prefix}-tracemalloc.txt"]
+
+        summary = {
+            "session": self.session,
+            "mode": self.mode,
+            "pid": os.getpid(),
+            "finished_at": time.time(),
+            "units": self.completed_units,
+            "samples": self.samples,
+            # Slowest first, to find the requests and jobs worth reading the profile for
+            "slowest": sorted(self.units, key=lambda unit: unit["seconds"], reverse=True)[:50],
+            "files": files
+        }
+        with open(self.output_dir / f"{prefix}-summary.json", 'w') as f:
+            json.dump(summary, f, indent=2)
+        log.info("Wrote profile for session %s: %s", self.session["id"], ", ".join(files) or "no samples")
+        return files + [f"{prefix}-summary.json"]
+
+
+class ProfilingController:
+    """
+    Profiling on demand for the web process and pipeline workers.
+
+    start() records a session in <profile_dir>/active.json; every process sharing the data
+    directory joins it at its next request or pipeline job (the file is checked at most
+    every poll_interval, so nothing is profiled or timed while no session is active). A
+    session profiles requests, jobs or both with cProfile or by sampling stacks, for a
+    bounded window or the next N units per process, and can track allocations with
+    tracemalloc. Each process writes its results to <profile_dir>/<session id>/ when its
+    part ends.
+    """
+
+    def __init__(self, profile_dir, poll_interval: float = 1.0, sample_interval: float = 0.005,
+                 max_seconds: int = 600):
+        self.profile_dir = Path(profile_dir)
+        self.poll_interval = poll_interval
+        self.sample_interval = sample_interval
+        self.max_seconds = max_seconds
+        self._active_file = self.profile_dir / "active.json"
+        self._lock = threading.Lock()
+        self._run: Optional[ProfileRun] = None
+        self._last_check = 0.0
+
+    def start(self, mode: str, scope: str = "all", duration_seconds: Optional[float] = None,
+              max_units: Optional[int] = None, allocations: bool = False) -> Dict[str, Any]:
+        """
+        Start a session: mode is cprofile or sampling, scope is requests, jobs or all.
+        It ends after duration_seconds (capped at max_seconds) or, per process, after
+        max_units requests or jobs. allocations adds tracemalloc snapshots.
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"mode must be one of {', '.join(PROFILE_MODES)}")
+        if scope not in PROFILE_SCOPES:
+            raise ValueError(f"scope must be one of {', '.join(PROFILE_SCOPES)}")
+        if duration_seconds is not None and duration_seconds <= 0:
+            raise ValueError("duration_seconds must be positive")
+        if max_units is not None and max_units < 1:
+            raise ValueError("max_units must be at least 1")
+
+        # Sessions limited to N units are still bounded in time
+        duration = min(duration_seconds or self.max_seconds, self.max_seconds)
+        now = time.time()
+        session = {
+            "id": f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}",
+            "mode": mode,
+            "scope": scope,
+            "max_units": max_units,
+            "tracemalloc": bool(allocations),
+            "started_at": now,
+            "expires_at": now + duration
+        }
+
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        temp_file = self.profile_dir / f".active.json.{os.getpid()}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(session, f)
+        os.replace(temp_file, self._active_file)
+        self._sync()
+        log.info("Started %s profiling of %s for %ss (max_units=%s)", mode, scope, duration, max_units)
+        return session
+
+    def stop(self) -> Optional[Dict[str, Any]]:
+        """End the active session; other processes write their results at their next check"""
+        session = self._read_active()
+        self._active_file.unlink(missing_ok=True)
+        self._sync()
+        return session
+
+    def status(self) -> Dict[str, Any]:
+        session = self._read_active()
+        run = self._run
+        local = None
+        if run and session and run.session["id"] == session["id"]:
+            local = {"pid": os.getpid(), "units": run.completed_units, "samples": run.samples,
+                     "finished": run.finished}
+        return {"active": session, "this_process": local, "profiles": self.list_profiles()}
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        profiles = []
+        if not self.profile_dir.exists():
+            return profiles
+        for session_dir in sorted(self.profile_dir.iterdir(), reverse=True):
+            if session_dir.is_dir() and _SESSION_ID_PATTERN.match(session_dir.name):
+                for path in sorted(session_dir.iterdir()):
+                    profiles.append({"session_id": session_dir.name, "name": path.name,
+                                     "size": path.stat().st_size})
+        return profiles
+
+    def get_profile_file(self, session_id: str, name: str) -> Optional[Path]:
+        if not _SESSION_ID_PATTERN.match(session_id) or not _PROFILE_NAME_PATTERN.match(name):
+            return None
+        path = self.profile_dir / session_id / name
+        return path if path.is_file() else None
+
+    @contextmanager
+    def profile(self, unit: str, label: str = ""):
+        """Profile the block as one request or job if the active session covers it"""
+        run = self._current_run()
+        if run is None or not run.accepts(unit) or not run.begin():
+            yield
+            return
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            run.end(unit, label, time.perf_counter() - started)
+
+    def _current_run(self) -> Optional[ProfileRun]:
+        now = time.monotonic()
+        if now - self._last_check >= self.poll_interval:
+            self._last_check = now
+            self._sync()
+        run = self._run
+        return run if run and not run.finished else None
+
+    def _read_active(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._active_file, 'r') as f:
+                session = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return session if session.get("expires_at", 0) > time.time() else None
+
+    def _sync(self):
+        """Join a newly started session, or finish this process's part of a stopped one"""
+        session = self._read_active()
+        finished = None
+        with self._lock:
+            run = self._run
+            if run and (session is None or session["id"] != run.session["id"]):
+                finished, self._run = run, None
+            if session and self._run is None:
+                self._run = ProfileRun(session, self.profile_dir / session["id"], self.sample_interval)
+        if finished:
+            finished.finish()
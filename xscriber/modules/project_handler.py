@@ -1,63 +1,270 @@
 import os
 import json
+import math
 import uuid
+import time
+import shutil
+import asyncio
 import threading
-import queue
-from typing import Dict, List, Optional, Any
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Any, Callable, TYPE_CHECKING
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 from django.conf import settings
 
-from .transcriber import WhisperTranscriber
-from .chat_completion import ChatCompletionProcessor
-from .recording_handler import RecordingHandler
+from .recording_handler import RecordingHandler, RecordingSessionManager
+from .response_cache import ResponseCache
+from .trd_stream import TRDStreamBroker
+from .pipeline_engine import PipelineEngine
+from .job_journal import JobJournal
+from .search_index import TranscriptSearchIndex
+from .audio_stream import SessionAudioIndex
+from .metrics import (STAGE_SECONDS, STAGE_ERRORS, CHUNK_TO_TRANSCRIPT_SECONDS, CHUNK_TO_TRD_SECONDS,
+                      PIPELINE_QUEUE_DEPTH, PIPELINE_IN_FLIGHT, PIPELINE_OLDEST_QUEUED_SECONDS,
+                      UPLOAD_REJECTIONS, LLM_CACHE_HIT_RATIO)
+from .trd_model import TRDDocument, TRDPatchError, parse_trd, apply_trd_patch
+from .usage_accounting import track_usage, aggregate_usage, merge_buckets, empty_bucket, usage_ratios
+from .structured_log import get_logger, sampled, get_log_stats
+from .profiling import ProfilingController
+from .chunk_trace import ChunkTraceStore, collect_spans, current_spans, trace_span, make_span, build_timeline
+
+if TYPE_CHECKING:
+    from .transcriber import WhisperTranscriber
+    from .chat_completion import ChatCompletionProcessor
+
+try:
+    import fcntl
+except ImportError:  # Windows: metadata writes are only serialised within a process
+    fcntl = None
+
+log = get_logger("project")
+upload_log = get_logger("upload")
+transcription_log = get_logger("transcription")
+trd_log = get_logger("trd")
+
+
+class _lazy_component:
+    """
+    Handler attribute built by the decorated method on first access and then stored on
+    the instance, like functools.cached_property but built once across threads. Assigning
+    the attribute (e.g. in tests) replaces it.
+    """
+
+    def __init__(self, factory: Callable[["ProjectHandler"], Any]):
+        self.factory = factory
+        self.__doc__ = factory.__doc__
+
+    def __set_name__(self, owner, name: str):
+        self.name = name
+
+    def __get__(self, handler: Optional["ProjectHandler"], owner=None) -> Any:
+        if handler is None:
+            return self
+        with handler._lazy_lock:
+            if self.name not in handler.__dict__:
+                handler.__dict__[self.name] = self.factory(handler)
+        return handler.__dict__[self.name]
 
 
 class ProjectHandler:
-    def __init__(self, data_dir: Optional[str] = None):
+    MAX_USAGE_CALLS_IN_METADATA = 100
+    MODEL_TIERS = ("preview", "final")
+
+    def __init__(self, data_dir: Optional[str] = None, start_workers: Optional[bool] = None):
+        """
+        start_workers controls whether this process claims pipeline jobs; it defaults to
+        the PIPELINE_IN_WEB_PROCESS setting. Without workers the handler only enqueues
+        jobs for `manage.py run_pipeline` processes and reads their results.
+
+        Construction is cheap: the OpenAI clients, the audio decoder, the pipeline workers
+        and the journal, indexes and caches under the data directory are created on first use
+        (see warm_up() to do it ahead of traffic), so importing the views or running
+        management commands needs no API key or threads and creates no data files.
+        """
         self.data_dir = Path(data_dir) if data_dir else settings.DATA_DIR
         self.metadata_dir = self.data_dir / 'project_metadata'
         self.audio_dir = self.data_dir / 'audio-recordings'
         self.transcription_dir = self.data_dir / 'raw-transcriptions'
         self.output_dir = self.data_dir / 'output'
         self.output_cache_dir = self.data_dir / 'output_cache'
+        self.llm_cache_dir = self.data_dir / 'llm_cache'
 
         self._ensure_directories()
 
-        self.transcriber = WhisperTranscriber()
-        self.chat_processor = ChatCompletionProcessor()
-        self.recording_handler = RecordingHandler()
-
-        self.transcription_queue = queue.Queue()
-        self.trd_update_queue = queue.Queue()
-        self.worker_threads = []
-        self.is_processing = False
-
-        self._start_worker_threads()
+        # Shared through the data directory, so run_pipeline workers join sessions started here
+        self.profiler = ProfilingController(
+            self.data_dir / 'profiles',
+            sample_interval=getattr(settings, 'PROFILING_SAMPLE_INTERVAL', 0.005),
+            max_seconds=getattr(settings, 'PROFILING_MAX_SECONDS', 600)
+        )
+        # One capture thread, chunk counter and callback per recording project
+        self.recording_sessions = RecordingSessionManager(
+            max_sessions=getattr(settings, 'RECORDING_MAX_SESSIONS', 4),
+            handler_factory=self._create_recording_handler
+        )
+        # "full" regenerates the whole TRD; "patch" applies section-level edits per transcription
+        self.trd_update_mode = getattr(settings, 'TRD_UPDATE_MODE', 'full')
+
+        # Metadata files are read-modify-written from request threads, the pipeline loop and
+        # other processes; the RLock covers this process and a file lock covers the others
+        self._metadata_lock = threading.RLock()
+        self._metadata_lock_file = None
+        self._metadata_lock_depth = 0
+        # Projects already regenerated comprehensively in this session (full mode only)
+        self._comprehensive_projects = set()
+
+        # Created on first use by the accessors below
+        self._transcriber: Optional["WhisperTranscriber"] = None
+        self._chat_processor: Optional["ChatCompletionProcessor"] = None
+        self._audio_decoder = None
+        self._lazy_lock = threading.RLock()
+
+        if start_workers is None:
+            start_workers = getattr(settings, 'PIPELINE_IN_WEB_PROCESS', True)
+        self.start_workers = start_workers
+        self.reconcile_on_start = getattr(settings, 'JOB_RECONCILE_ON_STARTUP', True)
+        self._pipeline_started = False
+        # Chunk uploads turned away by check_upload_admission(), by reason
+        self._upload_rejections: Dict[str, int] = {}
+
+    @_lazy_component
+    def job_journal(self) -> JobJournal:
+        return JobJournal(
+            self.data_dir / 'jobs.sqlite3',
+            lease_seconds=getattr(settings, 'JOB_LEASE_SECONDS', 300),
+            max_attempts=getattr(settings, 'JOB_MAX_ATTEMPTS', 3)
+        )
 
-    def _ensure_directories(self):
-        for directory in [self.metadata_dir, self.audio_dir, self.transcription_dir, self.output_dir, self.output_cache_dir]:
-            directory.mkdir(parents=True, exist_ok=True)
+    @_lazy_component
+    def pipeline(self) -> PipelineEngine:
+        pipeline = PipelineEngine(
+            self.job_journal,
+            self._aprocess_transcription,
+            self._aprocess_trd_update,
+            transcription_concurrency=getattr(settings, 'PIPELINE_TRANSCRIPTION_CONCURRENCY', 2),
+            trd_concurrency=getattr(settings, 'PIPELINE_TRD_CONCURRENCY', 2),
+            poll_interval=getattr(settings, 'PIPELINE_POLL_INTERVAL', 1.0),
+            job_retention_seconds=getattr(settings, 'JOB_RETENTION_SECONDS', 7 * 24 * 3600),
+            purge_interval=getattr(settings, 'JOB_PURGE_INTERVAL_SECONDS', 3600)
+        )
+        pipeline.profiler = self.profiler
+        return pipeline
+
+    @_lazy_component
+    def search_index(self) -> TranscriptSearchIndex:
+        # Fed by the transcription worker; `manage.py rebuild_search_index` backfills it
+        return TranscriptSearchIndex(self.data_dir / 'search.sqlite3')
+
+    @_lazy_component
+    def audio_index(self) -> SessionAudioIndex:
+        return SessionAudioIndex(self.data_dir / 'audio_index')
+
+    @_lazy_component
+    def chunk_traces(self) -> ChunkTraceStore:
+        # Per-chunk spans from upload to the first TRD version that includes the chunk
+        return ChunkTraceStore(self.data_dir / 'chunk_traces')
+
+    @_lazy_component
+    def trd_stream(self) -> TRDStreamBroker:
+        # File-backed so stream subscribers in web processes see generations run by pipeline workers
+        return TRDStreamBroker(state_dir=self.data_dir / 'trd_streams')
+
+    @_lazy_component
+    def response_cache(self) -> Optional[ResponseCache]:
+        if not getattr(settings, 'LLM_CACHE_ENABLED', True):
+            return None
+        return ResponseCache(
+            self.llm_cache_dir,
+            max_entries=getattr(settings, 'LLM_CACHE_MAX_ENTRIES', 500),
+            max_bytes=getattr(settings, 'LLM_CACHE_MAX_BYTES', 50 * 1024 * 1024),
+            ttl_seconds=getattr(settings, 'LLM_CACHE_TTL_SECONDS', 7 * 24 * 3600)
+        )
 
-    def _start_worker_threads(self):
-        self.is_processing = True
+    @property
+    def transcriber(self) -> "WhisperTranscriber":
+        if self._transcriber is None:
+            with self._lazy_lock:
+                if self._transcriber is None:
+                    from .transcriber import WhisperTranscriber
+                    self._transcriber = WhisperTranscriber(async_http_client=self.pipeline.http_client)
+        return self._transcriber
+
+    @transcriber.setter
+    def transcriber(self, transcriber: "WhisperTranscriber"):
+        self._transcriber = transcriber
+
+    @property
+    def chat_processor(self) -> "ChatCompletionProcessor":
+        if self._chat_processor is None:
+            with self._lazy_lock:
+                if self._chat_processor is None:
+                    from .chat_completion import ChatCompletionProcessor
+                    self._chat_processor = ChatCompletionProcessor(model=self.default_model,
+                                                                   cache=self.response_cache,
+                                                                   async_http_client=self.pipeline.http_client)
+        return self._chat_processor
+
+    @chat_processor.setter
+    def chat_processor(self, chat_processor: "ChatCompletionProcessor"):
+        self._chat_processor = chat_processor
+
+    @property
+    def default_model(self) -> str:
+        # config/settings.py holds the one default for the final model
+        return settings.TRD_FINAL_MODEL
+
+    @property
+    def audio_decoder(self):
+        """pydub's AudioSegment, imported on first use; raises ImportError if pydub is missing"""
+        if self._audio_decoder is None:
+            from pydub import AudioSegment
+            self._audio_decoder = AudioSegment
+        return self._audio_decoder
+
+    def start_pipeline(self, reconcile: bool = True):
+        """Start claiming and running pipeline jobs in this process"""
+        with self._lazy_lock:
+            if self._pipeline_started:
+                return
+            self._pipeline_started = True
 
-        transcription_worker = threading.Thread(target=self._transcription_worker, daemon=True)
-        trd_worker = threading.Thread(target=self._trd_update_worker, daemon=True)
+        self.pipeline.start()
 
-        transcription_worker.start()
-        trd_worker.start()
+        if reconcile:
+            self.reconcile_jobs()
 
-        self.worker_threads = [transcription_worker, trd_worker]
+    def _ensure_pipeline(self):
+        """Start this process's workers the first time a job is submitted, if it runs any"""
+        if self.start_workers and not self._pipeline_started:
+            self.start_pipeline(reconcile=self.reconcile_on_start)
 
-    def _stop_worker_threads(self):
-        self.is_processing = False
+    def warm_up(self) -> Dict[str, float]:
+        """
+        Do the work deferred at construction ahead of the first request: build the OpenAI
+        clients, import the audio decoder and start the workers (where this process runs
+        them). Returns the seconds spent on each step.
+        """
+        timings = {}
+        steps = [
+            ("transcriber", lambda: self.transcriber),
+            ("chat_processor", lambda: self.chat_processor),
+            ("audio_decoder", lambda: self.audio_decoder),
+            ("pipeline", self._ensure_pipeline),
+        ]
+        for name, step in steps:
+            started = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                log.warning("Warm-up step %s failed: %s", name, e)
+            timings[name] = round(time.perf_counter() - started, 4)
 
-        self.transcription_queue.put(None)
-        self.trd_update_queue.put(None)
+        log.info("Warm-up finished in %.2fs: %s", sum(timings.values()), timings)
+        return timings
 
-        for thread in self.worker_threads:
-            thread.join(timeout=5.0)
+    def _ensure_directories(self):
+        for directory in [self.metadata_dir, self.audio_dir, self.transcription_dir, self.output_dir, self.output_cache_dir]:
+            directory.mkdir(parents=True, exist_ok=True)
 
     def create_project(self, name: str, description: str = "") -> str:
         project_id = str(uuid.uuid4())[:8]
@@ -77,11 +284,12 @@ class ProjectHandler:
             json.dump(metadata, f, indent=2)
 
         trd_file = self.output_dir / f"{project_id}_trd.md"
-        initial_trd = self.chat_processor.generate_trd_document({})
+        # An empty skeleton; rendering it locally leaves the API clients uncreated
+        initial_trd = TRDDocument().render()
         with open(trd_file, 'w') as f:
             f.write(initial_trd)
 
-        print(f"Created project '{name}' with ID: {project_id}")
+        log.info("Created project '%s' with ID: %s", name, project_id, extra={"project_id": project_id})
         return project_id
 
     def delete_project(self, project_id: str) -> bool:
@@ -89,6 +297,11 @@ class ProjectHandler:
         try:
             import shutil
 
+            # Stop queued and running pipeline work first so nothing writes into a deleted project
+            cancelled = self.pipeline.cancel_project(project_id)
+            if cancelled:
+                log.info("Cancelled %d pipeline job(s) for project %s", cancelled, project_id)
+
             # Delete metadata file
             metadata_file = self.metadata_dir / f"{project_id}_metadata.json"
             if metadata_file.exists():
@@ -103,6 +316,8 @@ class ProjectHandler:
             # Delete all transcription files for this project
             for trans_file in self.transcription_dir.glob(f"{project_id}_transcription_*.json"):
                 trans_file.unlink()
+            self.search_index.remove_project(project_id)
+            self.audio_index.discard(project_id)
 
             # Delete TRD file
             trd_file = self.output_dir / f"{project_id}_trd.md"
@@ -113,11 +328,14 @@ class ProjectHandler:
             for cache_file in self.output_cache_dir.glob(f"{project_id}_trd_*.md"):
                 cache_file.unlink()
 
-            print(f"Successfully deleted project {project_id} and all associated files")
+            self.trd_stream.discard(project_id)
+            self.chunk_traces.discard(project_id)
+
+            log.info("Deleted project %s and all associated files", project_id)
             return True
 
         except Exception as e:
-            print(f"Error deleting project {project_id}: {str(e)}")
+            log.error("Error deleting project %s: %s", project_id, e)
             return False
 
     def get_project_metadata(self, project_id: str) -> Optional[Dict[str, Any]]:
@@ -129,25 +347,57 @@ class ProjectHandler:
             with open(metadata_file, 'r') as f:
                 return json.load(f)
         except Exception as e:
-            print(f"Error reading project metadata: {str(e)}")
+            log.error("Error reading project metadata: %s", e)
             return None
 
+    @contextmanager
+    def _metadata_locked(self):
+        with self._metadata_lock:
+            if fcntl is None:
+                yield
+                return
+
+            # flock is per open file, so nested acquisitions reuse the outermost one
+            if self._metadata_lock_depth == 0:
+                self._metadata_lock_file = open(self.metadata_dir / '.metadata.lock', 'a')
+                fcntl.flock(self._metadata_lock_file, fcntl.LOCK_EX)
+            self._metadata_lock_depth += 1
+            try:
+                yield
+            finally:
+                self._metadata_lock_depth -= 1
+                if self._metadata_lock_depth == 0:
+                    fcntl.flock(self._metadata_lock_file, fcntl.LOCK_UN)
+                    self._metadata_lock_file.close()
+                    self._metadata_lock_file = None
+
     def update_project_metadata(self, project_id: str, updates: Dict[str, Any]) -> bool:
-        metadata = self.get_project_metadata(project_id)
-        if not metadata:
-            return False
+        with self._metadata_locked():
+            metadata = self.get_project_metadata(project_id)
+            if not metadata:
+                return False
 
-        metadata.update(updates)
-        metadata["last_updated"] = datetime.now().isoformat()
+            metadata.update(updates)
+            metadata["last_updated"] = datetime.now().isoformat()
 
-        metadata_file = self.metadata_dir / f"{project_id}_metadata.json"
-        try:
-            with open(metadata_file, 'w') as f:
-                json.dump(metadata, f, indent=2)
-            return True
-        except Exception as e:
-            print(f"Error updating project metadata: {str(e)}")
-            return False
+            metadata_file = self.metadata_dir / f"{project_id}_metadata.json"
+            # Written via a temp file so readers in other processes never see a partial file
+            temp_file = self.metadata_dir / f".{project_id}_metadata.json.{os.getpid()}.tmp"
+            try:
+                with STAGE_SECONDS.time(stage="metadata_write"):
+                    with open(temp_file, 'w') as f:
+                        json.dump(metadata, f, indent=2)
+                    os.replace(temp_file, metadata_file)
+                return True
+            except Exception as e:
+                log.error("Error updating project metadata: %s", e)
+                return False
+
+    def _increment_metadata_counter(self, project_id: str, key: str):
+        with self._metadata_locked():
+            metadata = self.get_project_metadata(project_id)
+            if metadata:
+                self.update_project_metadata(project_id, {key: metadata.get(key, 0) + 1})
 
     def get_project_id(self, name: str) -> Optional[str]:
         for metadata_file in self.metadata_dir.glob("*_metadata.json"):
@@ -168,97 +418,245 @@ class ProjectHandler:
                     metadata = json.load(f)
                     projects.append(metadata)
             except Exception as e:
-                print(f"Error reading metadata file {metadata_file}: {str(e)}")
+                log.error("Error reading metadata file %s: %s", metadata_file, e)
                 continue
 
         projects.sort(key=lambda x: x.get("last_updated", ""), reverse=True)
         return projects
 
-    def start_recording(self, project_id: str) -> bool:
+    def _create_recording_handler(self, **options) -> RecordingHandler:
+        options.setdefault("output_dir", self.audio_dir)
+        return RecordingHandler(**options)
+
+    def start_recording(self, project_id: str, input_device_index: Optional[int] = None) -> bool:
+        """
+        Start a server-side recording session for the project, alongside any other projects'
+        sessions. Raises RecordingLimitError when RECORDING_MAX_SESSIONS are already recording.
+        """
         if not self.get_project_metadata(project_id):
-            print(f"Project {project_id} not found")
+            log.warning("Project %s not found", project_id)
             return False
 
-        self.recording_handler.set_chunk_saved_callback(
-            lambda audio_path: self._queue_transcription(project_id, audio_path)
+        session_id = self.recording_sessions.start_session(
+            project_id,
+            on_chunk_saved=lambda audio_path: self._queue_transcription(project_id, audio_path),
+            input_device_index=input_device_index
         )
+        return session_id is not None
+
+    def stop_recording(self, project_id: Optional[str] = None) -> bool:
+        """Stop the project's recording session, or the only session when no project is given"""
+        if project_id is None:
+            sessions = self.recording_sessions.list_sessions()
+            if len(sessions) != 1:
+                log.warning("Cannot choose a session to stop among %d recording sessions", len(sessions))
+                return False
+            project_id = sessions[0]["project_id"]
+
+        session_id = self.recording_sessions.get_session_id(project_id)
+        if session_id is None or not self.recording_sessions.stop_session(session_id):
+            return False
+        self.finalize_session(project_id)
+        return True
 
-        return self.recording_handler.start_recording(project_id)
+    def get_recording_sessions(self) -> List[Dict[str, Any]]:
+        return self.recording_sessions.list_sessions()
 
-    def stop_recording(self) -> bool:
-        return self.recording_handler.stop_recording()
+    def finalize_session(self, project_id: str) -> bool:
+        """
+        Queue the end-of-session TRD pass with the project's final-tier model. It runs
+        after the session's remaining transcriptions have been processed.
+        """
+        if not self.get_project_metadata(project_id):
+            return False
 
-    def _queue_transcription(self, project_id: str, audio_file_path: str):
-        self.transcription_queue.put((project_id, audio_file_path))
+        trd_log.info("Queuing final TRD pass for project %s", project_id)
+        self._ensure_pipeline()
+        self.pipeline.submit_final_pass(project_id, priority=JobJournal.PRIORITY_LIVE)
+        return True
 
-    def _transcription_worker(self):
-        while self.is_processing:
-            try:
-                item = self.transcription_queue.get(timeout=1.0)
-                if item is None:
-                    break
+    def queue_trd_regeneration(self, project_id: str, priority: int = JobJournal.PRIORITY_INTERACTIVE) -> bool:
+        """
+        Queue a final-tier comprehensive TRD regeneration for the pipeline workers.
+        Interactive requests go ahead of bulk regenerations but behind live sessions.
+        """
+        if not self.get_project_metadata(project_id):
+            return False
 
-                project_id, audio_file_path = item
-                self._process_transcription(project_id, audio_file_path)
-                self.transcription_queue.task_done()
+        self._ensure_pipeline()
+        self.pipeline.submit_final_pass(project_id, priority=priority)
+        return True
 
-            except queue.Empty:
-                continue
-            except Exception as e:
-                print(f"Error in transcription worker: {str(e)}")
+    def get_model_policy(self, project_id: str) -> Dict[str, str]:
+        """Models used per tier: the settings defaults, overridden by the project's model_policy"""
+        policy = {
+            "preview_model": settings.TRD_PREVIEW_MODEL,
+            "final_model": settings.TRD_FINAL_MODEL
+        }
+        metadata = self.get_project_metadata(project_id) or {}
+        policy.update({k: v for k, v in metadata.get("model_policy", {}).items() if k in policy and v})
+        return policy
+
+    def set_model_policy(self, project_id: str, updates: Dict[str, str]) -> bool:
+        unknown = set(updates) - {f"{tier}_model" for tier in self.MODEL_TIERS}
+        if unknown:
+            raise ValueError(f"Unknown model policy keys: {', '.join(sorted(unknown))}")
+
+        with self._metadata_locked():
+            metadata = self.get_project_metadata(project_id)
+            if not metadata:
+                return False
+
+            model_policy = metadata.get("model_policy", {})
+            model_policy.update(updates)
+            return self.update_project_metadata(project_id, {"model_policy": model_policy})
+
+    def _processor_for_tier(self, project_id: str, tier: str) -> "ChatCompletionProcessor":
+        return self.chat_processor.with_model(self.get_model_policy(project_id)[f"{tier}_model"])
+
+    def _queue_transcription(self, project_id: str, audio_file_path: str, trace_id: Optional[str] = None,
+                             spans: List[Dict[str, Any]] = ()):
+        """Queue a newly arrived chunk; trace_id and spans carry over the upload's trace"""
+        # Chunks arrive from a session that is recording right now
+        self._ensure_pipeline()
+        chunk_id = Path(audio_file_path).stem.split('_')[-1]
+        trace_id = self.chunk_traces.record(project_id, chunk_id, spans, trace_id=trace_id, queued_at=time.time())
+        self.pipeline.submit_transcription(project_id, audio_file_path, priority=JobJournal.PRIORITY_LIVE,
+                                           trace_id=trace_id)
+        # Index the new chunk for playback now rather than on the first session request
+        self.refresh_audio_index(project_id)
+
+    def _queue_trd_update(self, project_id: str, transcription_file: str):
+        self._ensure_pipeline()
+        self._submit_preview_update(project_id, transcription_file)
+
+    def _submit_preview_update(self, project_id: str, transcription_file: str, trace_id: Optional[str] = None):
+        # In full mode every update regenerates from all transcriptions, so a newer one replaces
+        # older queued ones; patch updates each carry their own chunk and must all run
+        deadline = getattr(settings, 'PIPELINE_PREVIEW_DEADLINE_SECONDS', 600)
+        self.pipeline.submit_trd_update(project_id, transcription_file,
+                                        supersede=self.trd_update_mode != "patch",
+                                        deadline_seconds=deadline or None, trace_id=trace_id)
 
     def _process_transcription(self, project_id: str, audio_file_path: str):
+        self.pipeline.run(self._aprocess_transcription(project_id, audio_file_path))
+
+    async def _aprocess_transcription(self, project_id: str, audio_file_path: str) -> bool:
+        """Transcribe one chunk and queue its TRD update; False tells the journal to retry"""
         try:
             audio_filename = Path(audio_file_path).name
             chunk_id = audio_filename.split('_')[-1].split('.')[0]
 
             transcription_file = self.transcription_dir / f"{project_id}_transcription_{chunk_id}.json"
 
-            success = self.transcriber.transcribe_and_save(audio_file_path, str(transcription_file))
+            with track_usage() as usage_records, collect_spans() as spans:
+                with trace_span("transcription", spans):
+                    success = await self.transcriber.atranscribe_and_save(audio_file_path, str(transcription_file))
+            return await self.pipeline.run_blocking(self._finish_transcription, project_id, audio_file_path,
+                                                    transcription_file, success, usage_records, spans)
 
-            if success:
-                print(f"Transcription completed for {audio_filename}")
-                self.update_project_metadata(project_id, {"transcription_count":
-                    self.get_project_metadata(project_id).get("transcription_count", 0) + 1})
+        except Exception as e:
+            transcription_log.error("Error processing transcription: %s", e)
+            return False
 
-                print(f"TRD QUEUE: Adding transcription to TRD update queue: {str(transcription_file)}")
-                self.trd_update_queue.put((project_id, str(transcription_file)))
-                print(f"TRD QUEUE: Queue size is now: {self.trd_update_queue.qsize()}")
-            else:
-                print(f"Transcription failed for {audio_filename}")
+    def _finish_transcription(self, project_id: str, audio_file_path: str, transcription_file: Path,
+                              success: bool, usage_records: List[Dict[str, Any]],
+                              spans: List[Dict[str, Any]]) -> bool:
+        """Record a transcription job's usage, trace and counters, and queue its TRD update"""
+        audio_filename = Path(audio_file_path).name
+        chunk_id = transcription_file.stem.split('_')[-1]
+        self._record_usage(project_id, usage_records, "transcription")
+        trace_id = self._trace_chunk(project_id, chunk_id, spans, PipelineEngine.current_job(),
+                                     transcribed_at=time.time() if success else None)
+
+        if success:
+            transcription_log.info("Transcription completed for %s", audio_filename, extra=sampled("chunk_progress"))
+            self._increment_metadata_counter(project_id, "transcription_count")
+            self._index_transcription(transcription_file)
+            if self._in_live_job():
+                CHUNK_TO_TRANSCRIPT_SECONDS.observe(time.time() - os.path.getmtime(audio_file_path))
+
+            trd_log.debug("Adding transcription to TRD update queue: %s", transcription_file)
+            self._submit_preview_update(project_id, str(transcription_file), trace_id=trace_id)
+            return True
 
-        except Exception as e:
-            print(f"Error processing transcription: {str(e)}")
+        transcription_log.warning("Transcription failed for %s", audio_filename)
+        return False
 
-    def _trd_update_worker(self):
-        print("TRD WORKER: TRD update worker thread started")
-        processed_projects = set()  # Track projects we've already processed comprehensively
+    @staticmethod
+    def _in_live_job() -> bool:
+        # Chunk latency SLOs cover live sessions, not reconciliation or bulk regeneration
+        job = PipelineEngine.current_job()
+        return bool(job) and job["priority"] == JobJournal.PRIORITY_LIVE
 
-        while self.is_processing:
-            try:
-                item = self.trd_update_queue.get(timeout=1.0)
-                if item is None:
-                    break
+    def _index_transcription(self, transcription_file: Path):
+        # Search is best effort; a failure here must not fail the transcription job
+        try:
+            self.search_index.index_file(transcription_file)
+        except Exception as e:
+            log.warning("Error indexing transcription %s: %s", transcription_file.name, e)
 
-                project_id, transcription_file = item
+    def get_audio_chunk_file(self, project_id: str, chunk_id: int) -> Optional[Path]:
+        for extension in ("wav", "webm"):
+            audio_file = self.audio_dir / f"{project_id}_audiochunk_{chunk_id}.{extension}"
+            if audio_file.exists():
+                return audio_file
+        return None
 
-                # Use comprehensive update instead of individual transcription processing
-                if project_id not in processed_projects:
-                    print(f"TRD WORKER: Processing comprehensive TRD update for project {project_id}")
-                    self._update_trd_document_comprehensive(project_id)
-                    processed_projects.add(project_id)
-                    print(f"TRD WORKER: Completed comprehensive TRD update for project {project_id}")
-                else:
-                    print(f"TRD WORKER: Project {project_id} already processed comprehensively in this session")
+    def refresh_audio_index(self, project_id: str) -> Optional[Dict[str, Any]]:
+        """Chunk offsets and durations for the project's session audio stream"""
+        try:
+            return self.audio_index.refresh(project_id, self.audio_dir)
+        except Exception as e:
+            log.warning("Error indexing audio for project %s: %s", project_id, e)
+            return None
 
-                self.trd_update_queue.task_done()
+    def search_transcriptions(self, query: str, project_id: Optional[str] = None,
+                              limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Ranked transcript segments matching the query, with the project name and the hit's
+        position in the project's session audio stream attached
+        """
+        results = self.search_index.search(query, project_id=project_id, limit=limit, offset=offset)
+
+        projects = {}
+        for result in results:
+            if result["project_id"] not in projects:
+                metadata = self.get_project_metadata(result["project_id"])
+                projects[result["project_id"]] = (metadata.get("name") if metadata else None,
+                                                  self.refresh_audio_index(result["project_id"]))
+            name, audio_index = projects[result["project_id"]]
+            result["project_name"] = name
+            result["session_time"] = (SessionAudioIndex.session_time(audio_index, result["chunk_id"], result["start"] or 0.0)
+                                      if audio_index else None)
+        return results
+
+    async def _aprocess_trd_update(self, project_id: str, transcription_file: Optional[str], tier: str = "preview"):
+        # Spans timed during the update go to the chunks the resulting TRD version first includes
+        with collect_spans():
+            await self._arun_trd_update(project_id, transcription_file, tier)
+
+    async def _arun_trd_update(self, project_id: str, transcription_file: Optional[str], tier: str):
+        try:
+            if tier == "final":
+                trd_log.info("Processing final TRD pass for project %s", project_id)
+                # The next session starts with in-session previews again
+                self._comprehensive_projects.discard(project_id)
+                await self._aupdate_trd_document_comprehensive(project_id, tier="final")
+            elif self.trd_update_mode == "patch":
+                trd_log.info("Processing patch TRD update for project %s", project_id, extra=sampled("trd_progress"))
+                await self._aupdate_trd_document_patch(project_id, transcription_file, tier)
+            # Use comprehensive update instead of individual transcription processing
+            elif project_id not in self._comprehensive_projects:
+                trd_log.info("Processing comprehensive TRD update for project %s", project_id)
+                self._comprehensive_projects.add(project_id)
+                await self._aupdate_trd_document_comprehensive(project_id, tier=tier)
+                trd_log.info("Completed comprehensive TRD update for project %s", project_id)
+            else:
+                trd_log.debug("Project %s already processed comprehensively in this session", project_id)
 
-            except queue.Empty:
-                continue
-            except Exception as e:
-                print(f"TRD WORKER ERROR: Error in TRD update worker: {str(e)}")
-                import traceback
-                traceback.print_exc()
+        except Exception as e:
+            trd_log.exception("Error in TRD update worker: %s", e)
 
     def _cache_trd_version(self, project_id: str, existing_trd: str):
         """Cache the current TRD version before updating"""
@@ -267,110 +665,401 @@ class ProjectHandler:
         cache_file = self.output_cache_dir / f"{project_id}_trd_{timestamp}.md"
 
         try:
-            with open(cache_file, 'w') as f:
+            with open(cache_file, 'w') as f, trace_span("cache_trd_version"):
                 f.write(existing_trd)
-            print(f"TRD UPDATE: Cached previous version to {cache_file}")
+            trd_log.debug("Cached previous version to %s", cache_file)
         except Exception as e:
-            print(f"TRD UPDATE: Failed to cache TRD version: {str(e)}")
+            trd_log.warning("Failed to cache TRD version: %s", e)
 
     def _update_trd_document(self, project_id: str, transcription_file: str):
         try:
-            print(f"TRD UPDATE: Starting TRD update for project {project_id} with transcription {transcription_file}")
+            trd_log.debug("Starting TRD update for project %s with transcription %s", project_id, transcription_file)
 
             with open(transcription_file, 'r') as f:
                 transcription_data = json.load(f)
 
             transcription_text = transcription_data.get("text", "")
             if not transcription_text:
-                print(f"No text found in transcription file: {transcription_file}")
+                trd_log.warning("No text found in transcription file: %s", transcription_file)
                 return
 
-            print(f"TRD UPDATE: Found transcription text: {transcription_text[:100]}...")
+            trd_log.debug("Found transcription text: %s...", transcription_text[:100])
 
             trd_file = self.output_dir / f"{project_id}_trd.md"
             existing_trd = ""
             if trd_file.exists():
                 with open(trd_file, 'r') as f:
                     existing_trd = f.read()
-                print(f"TRD UPDATE: Found existing TRD file with {len(existing_trd)} characters")
+                trd_log.debug("Found existing TRD file with %d characters", len(existing_trd))
 
                 # Cache the existing version before updating
                 self._cache_trd_version(project_id, existing_trd)
             else:
-                print(f"TRD UPDATE: No existing TRD file, creating new one")
+                trd_log.debug("No existing TRD file, creating new one")
 
-            print(f"TRD UPDATE: Calling OpenAI Chat Completions API...")
-            updated_trd = self.chat_processor.process_transcription_to_trd(
-                transcription_text, existing_trd
-            )
+            trd_log.debug("Calling OpenAI Chat Completions API...")
+            with self.chat_processor.track_usage() as usage_records:
+                updated_trd = self.chat_processor.process_transcription_to_trd(
+                    transcription_text, existing_trd
+                )
+            self._record_usage(project_id, usage_records, "trd_section")
 
             # Write the completely new TRD (replacement, not append)
-            with open(trd_file, 'w') as f:
-                f.write(updated_trd)
+            self._write_trd_atomic(project_id, updated_trd)
+            chunk_id = Path(transcription_file).stem.split('_')[-1]
+            self._record_trd_version(project_id, existing_trd, updated_trd, [chunk_id], "section")
+
+            trd_log.info("Updated TRD document for project %s", project_id, extra=sampled("trd_progress"))
+
+        except Exception as e:
+            trd_log.exception("Error updating TRD document: %s", e)
+
+    def _update_trd_document_patch(self, project_id: str, transcription_file: str, tier: str = "preview"):
+        self.pipeline.run(self._aupdate_trd_document_patch(project_id, transcription_file, tier))
+
+    async def _aupdate_trd_document_patch(self, project_id: str, transcription_file: str, tier: str = "preview"):
+        """
+        Fold one transcription into the TRD by applying model-proposed section edits locally.
+        Falls back to a comprehensive regeneration when there is no TRD content to patch yet
+        or when the proposed patch does not validate.
+        """
+        try:
+            trd_log.debug("Starting patch TRD update for project %s with transcription %s", project_id, transcription_file)
+
+            transcription_text, existing_trd = await self.pipeline.run_blocking(
+                self._read_patch_inputs, project_id, transcription_file)
+
+            if not transcription_text:
+                trd_log.warning("No text found in transcription file: %s", transcription_file)
+                return
 
-            print(f"TRD UPDATE: Successfully updated TRD document for project {project_id}")
+            document = parse_trd(existing_trd)
+            if not any(document.is_defined(key) for key in document.sections):
+                trd_log.info("No existing TRD content to patch, regenerating comprehensively")
+                await self._aupdate_trd_document_comprehensive(project_id, tier=tier)
+                return
+
+            processor = await self.pipeline.run_blocking(self._processor_for_tier, project_id, tier)
+            try:
+                with processor.track_usage() as usage_records, STAGE_SECONDS.time(stage="trd_generation"), \
+                        trace_span("trd_generation", method="patch", model=processor.model):
+                    operations = await processor.agenerate_trd_patch(document, transcription_text)
+                await self.pipeline.run_blocking(self._record_usage, project_id, usage_records, f"trd_patch_{tier}")
+                patched = apply_trd_patch(document, operations)
+            except TRDPatchError as e:
+                trd_log.warning("Patch rejected (%s), falling back to full regeneration", e)
+                await self._aupdate_trd_document_comprehensive(project_id, tier=tier)
+                return
+
+            trd_log.debug("Applied %d patch operation(s)", len(operations))
+            if not document.diff(patched):
+                await self.pipeline.run_blocking(self._trace_chunk, project_id, Path(transcription_file).stem.split('_')[-1],
+                                                 current_spans(), PipelineEngine.current_job(), trd_outcome="no_change")
+                trd_log.info("Transcription added nothing new to the TRD for project %s", project_id, extra=sampled("trd_progress"))
+                return
+
+            updated_trd = patched.render(generated_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            chunk_id = Path(transcription_file).stem.split('_')[-1]
+            await self.pipeline.run_blocking(self._commit_trd, project_id, existing_trd, updated_trd, [chunk_id],
+                                             "patch", processor.model, tier, cache_previous=True)
+
+            trd_log.info("Patched TRD document for project %s", project_id, extra=sampled("trd_progress"))
 
         except Exception as e:
-            print(f"TRD UPDATE ERROR: Error updating TRD document: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            STAGE_ERRORS.inc(stage="trd_generation")
+            trd_log.exception("Error patching TRD document: %s", e)
+
+    def _collect_transcriptions(self, project_id: str):
+        """Non-empty transcription texts for a project in chunk order, with their chunk ids"""
+        all_transcriptions = []
+        chunk_ids = []
+        transcription_files = list(self.transcription_dir.glob(f"{project_id}_transcription_*.json"))
+        transcription_files.sort(key=lambda x: int(x.stem.split('_')[-1]) if x.stem.split('_')[-1].isdigit() else 0)
+
+        for trans_file in transcription_files:
+            try:
+                with open(trans_file, 'r') as f:
+                    transcription_data = json.load(f)
+                    transcription_text = transcription_data.get("text", "")
+                    if transcription_text:
+                        all_transcriptions.append(transcription_text)
+                        chunk_ids.append(trans_file.stem.split('_')[-1])
+            except Exception as e:
+                trd_log.warning("Error reading transcription %s: %s", trans_file, e)
+                continue
 
-    def _update_trd_document_comprehensive(self, project_id: str):
+        return all_transcriptions, chunk_ids
+
+    def _update_trd_document_comprehensive(self, project_id: str, bypass_cache: bool = False,
+                                           tier: str = "final") -> bool:
+        return self.pipeline.run(self._aupdate_trd_document_comprehensive(project_id, bypass_cache, tier))
+
+    async def _aupdate_trd_document_comprehensive(self, project_id: str, bypass_cache: bool = False,
+                                                  tier: str = "final") -> bool:
         """
         Update TRD document using all transcriptions at once for better context and less duplication.
+        tier selects the project's preview or final model. Returns True once the regenerated
+        TRD has been written.
         """
         try:
-            print(f"TRD COMPREHENSIVE UPDATE: Starting comprehensive TRD update for project {project_id}")
+            trd_log.debug("Starting comprehensive TRD update for project %s", project_id)
 
             # Get all transcriptions for this project
-            all_transcriptions = []
-            transcription_files = list(self.transcription_dir.glob(f"{project_id}_transcription_*.json"))
-            transcription_files.sort(key=lambda x: int(x.stem.split('_')[-1]) if x.stem.split('_')[-1].isdigit() else 0)
-
-            for trans_file in transcription_files:
-                try:
-                    with open(trans_file, 'r') as f:
-                        transcription_data = json.load(f)
-                        transcription_text = transcription_data.get("text", "")
-                        if transcription_text:
-                            all_transcriptions.append(transcription_text)
-                except Exception as e:
-                    print(f"Error reading transcription {trans_file}: {str(e)}")
-                    continue
+            all_transcriptions, chunk_ids = await self.pipeline.run_blocking(self._collect_transcriptions, project_id)
 
             if not all_transcriptions:
-                print(f"No valid transcriptions found for project {project_id}")
+                trd_log.info("No valid transcriptions found for project %s", project_id)
+                return False
+
+            trd_log.debug("Found %d transcriptions", len(all_transcriptions))
+
+            # Cache the existing version before updating
+            existing_trd = await self.pipeline.run_blocking(self._read_and_cache_trd, project_id)
+
+            trd_log.debug("Calling OpenAI Chat Completions API with all transcriptions...")
+            processor = await self.pipeline.run_blocking(self._processor_for_tier, project_id, tier)
+            trd_log.info("Using %s model %s", tier, processor.model)
+            await self.pipeline.run_blocking(self.trd_stream.start, project_id)
+            with processor.track_usage() as usage_records, STAGE_SECONDS.time(stage="trd_generation"), \
+                    trace_span("trd_generation", method="comprehensive", model=processor.model):
+                updated_trd = await processor.aprocess_all_transcriptions_to_trd(
+                    all_transcriptions, existing_trd, bypass_cache,
+                    on_delta=lambda delta: self.trd_stream.append(project_id, delta)
+                )
+            await self.pipeline.run_blocking(self._record_usage, project_id, usage_records,
+                                             f"trd_comprehensive_{tier}")
+
+            # Write the completely new TRD (replacement, not append)
+            await self.pipeline.run_blocking(self._commit_trd, project_id, existing_trd, updated_trd, chunk_ids,
+                                             "comprehensive", processor.model, tier)
+
+            trd_log.info("Updated TRD document comprehensively for project %s", project_id)
+            return True
+
+        except asyncio.CancelledError:
+            trd_log.info("Comprehensive TRD update cancelled for project %s", project_id)
+            # Not through run_blocking: on shutdown its executor may already be closed
+            self._close_trd_stream(project_id)
+            raise
+        except Exception as e:
+            STAGE_ERRORS.inc(stage="trd_generation")
+            trd_log.exception("Error updating TRD document comprehensively: %s", e)
+            await self.pipeline.run_blocking(self._close_trd_stream, project_id)
+            return False
+
+    def _close_trd_stream(self, project_id: str):
+        # Close out an unfinished stream so subscribers fall back to the last committed TRD
+        stream_state = self.trd_stream.get_state(project_id)
+        if stream_state and not stream_state["done"]:
+            self.trd_stream.complete(project_id, self.get_trd_content(project_id))
+
+    def _read_patch_inputs(self, project_id: str, transcription_file: str):
+        with open(transcription_file, 'r') as f:
+            transcription_text = json.load(f).get("text", "")
+        return transcription_text, self.get_trd_content(project_id)
+
+    def _read_and_cache_trd(self, project_id: str) -> str:
+        trd_file = self.output_dir / f"{project_id}_trd.md"
+        if not trd_file.exists():
+            trd_log.debug("No existing TRD file, creating new one")
+            return ""
+
+        with open(trd_file, 'r') as f:
+            existing_trd = f.read()
+        trd_log.debug("Found existing TRD file with %d characters", len(existing_trd))
+        self._cache_trd_version(project_id, existing_trd)
+        return existing_trd
+
+    def _commit_trd(self, project_id: str, existing_trd: str, updated_trd: str, chunk_ids: List[str],
+                    method: str, model: str, tier: str, cache_previous: bool = False):
+        """Write a new TRD version, record its provenance and finish its stream"""
+        if cache_previous:
+            self._cache_trd_version(project_id, existing_trd)
+        self._write_trd_atomic(project_id, updated_trd)
+        self._record_trd_version(project_id, existing_trd, updated_trd, chunk_ids, method, model=model, tier=tier)
+        self.trd_stream.complete(project_id, updated_trd)
+
+    def _record_usage(self, project_id: str, usage_records: List[Dict[str, Any]], operation: str):
+        """
+        Fold per-call API usage into the project metadata: the aggregate per day, operation
+        and model under "usage", and the chat calls' token totals and recent history under
+        "token_usage"
+        """
+        if not usage_records:
+            return
+
+        with self._metadata_locked():
+            metadata = self.get_project_metadata(project_id)
+            if not metadata:
                 return
 
-            print(f"TRD COMPREHENSIVE UPDATE: Found {len(all_transcriptions)} transcriptions")
+            for record in usage_records:
+                record["operation"] = operation
+            usage = aggregate_usage(metadata.get("usage"), usage_records, operation)
 
-            trd_file = self.output_dir / f"{project_id}_trd.md"
-            existing_trd = ""
-            if trd_file.exists():
-                with open(trd_file, 'r') as f:
-                    existing_trd = f.read()
-                print(f"TRD COMPREHENSIVE UPDATE: Found existing TRD file with {len(existing_trd)} characters")
+            token_usage = metadata.get("token_usage", {"prompt_tokens": 0, "completion_tokens": 0, "calls": []})
+            for record in usage_records:
+                if record.get("kind") != "chat":
+                    continue
+                token_usage["prompt_tokens"] += record.get("prompt_tokens", 0)
+                token_usage["completion_tokens"] += record.get("completion_tokens", 0)
+                token_usage["calls"].append(record)
 
-                # Cache the existing version before updating
-                self._cache_trd_version(project_id, existing_trd)
-            else:
-                print(f"TRD COMPREHENSIVE UPDATE: No existing TRD file, creating new one")
+            # Keep the per-call history bounded; the totals cover everything
+            token_usage["calls"] = token_usage["calls"][-self.MAX_USAGE_CALLS_IN_METADATA:]
+            self.update_project_metadata(project_id, {"usage": usage, "token_usage": token_usage})
+
+    def get_project_usage(self, project_id: str) -> Optional[Dict[str, Any]]:
+        """API spend of a project with daily, per-operation and per-model breakdowns"""
+        metadata = self.get_project_metadata(project_id)
+        if not metadata:
+            return None
 
-            print(f"TRD COMPREHENSIVE UPDATE: Calling OpenAI Chat Completions API with all transcriptions...")
-            updated_trd = self.chat_processor.process_all_transcriptions_to_trd(
-                all_transcriptions, existing_trd
-            )
+        usage = metadata.get("usage") or aggregate_usage(None, [], "")
+        trd_versions = metadata.get("trd_version", 0)
+        return {
+            "project_id": project_id,
+            "name": metadata.get("name"),
+            "totals": usage["totals"],
+            **usage_ratios(usage["totals"], trd_versions),
+            "trd_versions": trd_versions,
+            "daily": [{"date": day, **bucket} for day, bucket in sorted(usage["daily"].items())],
+            "by_operation": usage["by_operation"],
+            "by_model": usage["by_model"]
+        }
 
-            # Write the completely new TRD (replacement, not append)
-            with open(trd_file, 'w') as f:
-                f.write(updated_trd)
+    def get_usage_report(self, days: Optional[int] = None) -> Dict[str, Any]:
+        """API spend across projects, per day and per project, over the last `days` days (all if None)"""
+        since = (datetime.now() - timedelta(days=days - 1)).date().isoformat() if days else ""
+        totals, daily, projects = empty_bucket(), {}, []
 
-            print(f"TRD COMPREHENSIVE UPDATE: Successfully updated TRD document for project {project_id}")
+        for project in self.list_projects():
+            usage = project.get("usage")
+            if not usage:
+                continue
 
-        except Exception as e:
-            print(f"TRD COMPREHENSIVE UPDATE ERROR: Error updating TRD document: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            project_totals = empty_bucket()
+            for day, bucket in usage["daily"].items():
+                if day < since:
+                    continue
+                merge_buckets(project_totals, bucket)
+                merge_buckets(daily.setdefault(day, empty_bucket()), bucket)
+            if not project_totals["calls"]:
+                continue
+
+            merge_buckets(totals, project_totals)
+            trd_versions = sum(1 for version in project.get("trd_versions", [])
+                               if version.get("generated_at", "")[:10] >= since)
+            projects.append({"project_id": project["project_id"], "name": project.get("name"),
+                             "trd_versions": trd_versions, **project_totals,
+                             **usage_ratios(project_totals, trd_versions)})
+
+        projects.sort(key=lambda project: project["cost"], reverse=True)
+        return {
+            "since": since or None,
+            "totals": totals,
+            "daily": [{"date": day, **bucket} for day, bucket in sorted(daily.items())],
+            "projects": projects
+        }
+
+    def _write_trd_atomic(self, project_id: str, trd_content: str):
+        """Write the TRD to a temporary file and swap it in so readers never see a partial document"""
+        trd_file = self.output_dir / f"{project_id}_trd.md"
+        temp_file = self.output_dir / f".{project_id}_trd.md.tmp"
+
+        with STAGE_SECONDS.time(stage="trd_write"), trace_span("trd_write"):
+            with open(temp_file, 'w') as f:
+                f.write(trd_content)
+            os.replace(temp_file, trd_file)
+
+    def _record_trd_version(self, project_id: str, previous_trd: str, updated_trd: str,
+                            chunk_ids: List[str], method: str, model: Optional[str] = None,
+                            tier: Optional[str] = None):
+        """
+        Bump the project's TRD version and record its provenance: which chunks it was
+        built from, which of those are new in this version, which sections changed, and
+        the model and tier that produced it.
+        """
+        with self._metadata_locked():
+            metadata = self.get_project_metadata(project_id)
+            if not metadata:
+                return
+
+            previous_chunk_ids = set(metadata.get("trd_provenance", {}).get("chunk_ids", []))
+            changed_sections = list(parse_trd(previous_trd).diff(parse_trd(updated_trd)).keys())
+            if method in ("section", "patch"):
+                # Per-chunk updates build on everything the previous version already covered
+                chunk_ids = sorted(previous_chunk_ids | set(chunk_ids), key=lambda c: int(c) if c.isdigit() else 0)
+
+            version = metadata.get("trd_version", 0) + 1
+            provenance = {
+                "version": version,
+                "generated_at": datetime.now().isoformat(),
+                "method": method,
+                "model": model or self.default_model,
+                "tier": tier,
+                "chunk_ids": chunk_ids,
+                "new_chunk_ids": [c for c in chunk_ids if c not in previous_chunk_ids],
+                "changed_sections": changed_sections
+            }
+
+            trd_versions = metadata.get("trd_versions", [])
+            trd_versions.append({k: v for k, v in provenance.items() if k != "chunk_ids"})
+
+            if self._in_live_job():
+                for chunk_id in provenance["new_chunk_ids"]:
+                    audio_file = self.get_audio_chunk_file(project_id, chunk_id)
+                    if audio_file:
+                        CHUNK_TO_TRD_SECONDS.observe(time.time() - audio_file.stat().st_mtime)
+
+            self.update_project_metadata(project_id, {
+                "trd_version": version,
+                "trd_provenance": provenance,
+                "trd_versions": trd_versions
+            })
+
+        job = PipelineEngine.current_job()
+        spans = [dict(span, trd_version=version) for span in current_spans()]
+        included_at = time.time()
+        for chunk_id in provenance["new_chunk_ids"]:
+            self._trace_chunk(project_id, chunk_id, spans, job, first_trd_version=version, included_at=included_at)
+
+    def _trace_chunk(self, project_id: str, chunk_id: str, spans: List[Dict[str, Any]],
+                     job: Optional[Dict[str, Any]] = None, **fields) -> Optional[str]:
+        """Add a worker's spans to a chunk's trace, starting with the time its job sat in the queue"""
+        if job and job.get("queued_at") and job.get("claimed_at"):
+            stage = "transcription" if job["kind"] == JobJournal.TRANSCRIPTION else "trd"
+            spans = [make_span(f"{stage}_queue_wait", job["queued_at"], job["claimed_at"], job_id=job["id"]), *spans]
+        return self.chunk_traces.record(project_id, chunk_id, spans, **fields)
+
+    def get_chunk_timeline(self, project_id: str, chunk_id: int) -> Optional[Dict[str, Any]]:
+        """
+        A chunk's trace from upload to TRD with per-span timings, and the TRD version that
+        first included it (from the version history for chunks recorded before tracing)
+        """
+        metadata = self.get_project_metadata(project_id)
+        trace = self.chunk_traces.get(project_id, chunk_id)
+        if not metadata or (trace is None and self.get_audio_chunk_file(project_id, chunk_id) is None):
+            return None
+
+        timeline = build_timeline(trace or {"project_id": project_id, "chunk_id": str(chunk_id), "trace_id": None})
+        first_version = next((version for version in metadata.get("trd_versions", [])
+                              if str(chunk_id) in version.get("new_chunk_ids", [])), None)
+        timeline["first_trd_version"] = first_version["version"] if first_version else None
+        timeline["trd_version"] = first_version
+        return timeline
+
+    def get_trd_document(self, project_id: str) -> Optional[TRDDocument]:
+        """Parsed TRD with the version and provenance recorded in the project metadata"""
+        trd_content = self.get_trd_content(project_id)
+        if not trd_content:
+            return None
+
+        document = parse_trd(trd_content)
+        metadata = self.get_project_metadata(project_id) or {}
+        document.version = metadata.get("trd_version", 0)
+        document.provenance = metadata.get("trd_provenance", {})
+        return document
 
     def get_trd_content(self, project_id: str) -> str:
         trd_file = self.output_dir / f"{project_id}_trd.md"
@@ -381,7 +1070,7 @@ class ProjectHandler:
             with open(trd_file, 'r') as f:
                 return f.read()
         except Exception as e:
-            print(f"Error reading TRD file: {str(e)}")
+            log.error("Error reading TRD file: %s", e)
             return ""
 
     def get_transcriptions(self, project_id: str) -> List[Dict[str, Any]]:
@@ -400,25 +1089,151 @@ class ProjectHandler:
                     "file_path": str(trans_file)
                 })
             except Exception as e:
-                print(f"Error reading transcription file {trans_file}: {str(e)}")
+                log.error("Error reading transcription file %s: %s", trans_file, e)
                 continue
 
         transcriptions.sort(key=lambda x: x["chunk_id"])
         return transcriptions
 
-    def regenerate_trd_comprehensive(self, project_id: str) -> bool:
+    def regenerate_trd_comprehensive(self, project_id: str, bypass_cache: bool = False) -> bool:
         """
         Manually trigger a comprehensive TRD regeneration for a project.
         Useful for updating existing projects with the new comprehensive method.
+        Pass bypass_cache=True to force fresh generation instead of reusing cached responses.
         """
         try:
-            print(f"Manual comprehensive TRD regeneration requested for project {project_id}")
-            self._update_trd_document_comprehensive(project_id)
-            return True
+            trd_log.info("Manual comprehensive TRD regeneration requested for project %s", project_id)
+            return self._update_trd_document_comprehensive(project_id, bypass_cache)
         except Exception as e:
-            print(f"Error in manual TRD regeneration: {str(e)}")
+            trd_log.error("Error in manual TRD regeneration: %s", e)
             return False
 
+    def estimate_trd_regeneration(self, project_id: str) -> Optional[Dict[str, Any]]:
+        """Token and cost estimate for a comprehensive regeneration, without calling the model"""
+        all_transcriptions, chunk_ids = self._collect_transcriptions(project_id)
+        if not all_transcriptions:
+            return None
+
+        # A dry run needs no API key, so no ChatCompletionProcessor (and no client) is created
+        from .chat_completion import estimate_holistic_request
+        estimate = estimate_holistic_request(self.get_model_policy(project_id)["final_model"], all_transcriptions,
+                                             self.get_trd_content(project_id))
+        estimate["transcription_count"] = len(chunk_ids)
+        return estimate
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        if not self.response_cache:
+            return {"enabled": False}
+
+        stats = self.response_cache.get_stats()
+        stats["enabled"] = True
+        return stats
+
+    def reconcile_jobs(self) -> Dict[str, int]:
+        """
+        Re-enqueue work lost by a crash or restart: audio chunks that have no transcription
+        yet, and a final TRD pass for projects whose TRD is older than their transcriptions.
+        Jobs that are already queued or claimed are not duplicated.
+        """
+        enqueued = {"transcriptions": 0, "trd_passes": 0}
+        try:
+            for metadata in self.list_projects():
+                project_id = metadata.get("project_id")
+                if not project_id:
+                    continue
+
+                trd_file = self.output_dir / f"{project_id}_trd.md"
+                trd_mtime = trd_file.stat().st_mtime if trd_file.exists() else 0
+                needs_trd_pass = False
+
+                for audio_file in sorted(self.audio_dir.glob(f"{project_id}_audiochunk_*")):
+                    if audio_file.suffix not in ('.wav', '.webm'):
+                        continue
+                    chunk_id = audio_file.stem.split('_')[-1]
+                    if (self.transcription_dir / f"{project_id}_transcription_{chunk_id}.json").exists():
+                        continue
+                    needs_trd_pass = True
+                    if self.pipeline.submit_transcription(project_id, str(audio_file.resolve()),
+                                                          priority=JobJournal.PRIORITY_BULK) is not None:
+                        enqueued["transcriptions"] += 1
+
+                for trans_file in self.transcription_dir.glob(f"{project_id}_transcription_*.json"):
+                    if trans_file.stat().st_mtime > trd_mtime:
+                        needs_trd_pass = True
+                        break
+
+                if needs_trd_pass and self.pipeline.submit_final_pass(
+                        project_id, priority=JobJournal.PRIORITY_BULK) is not None:
+                    enqueued["trd_passes"] += 1
+
+            if any(enqueued.values()):
+                log.info("Reconciliation re-enqueued %d transcription(s) and %d TRD pass(es)",
+                         enqueued["transcriptions"], enqueued["trd_passes"])
+        except Exception as e:
+            log.error("Error reconciling jobs: %s", e)
+
+        return enqueued
+
+    def check_upload_admission(self, project_id: str) -> Dict[str, Any]:
+        """
+        Decide whether to accept another audio chunk. Chunks are turned away while the
+        transcription backlog (overall or for this project) is over its limit or the disk is
+        nearly full. retry_after estimates when the backlog will have drained below the limit
+        from the recent transcription time and the number of transcriptions in progress.
+        Everything comes from the job journal, so the estimate holds whichever processes
+        (this one or `manage.py run_pipeline` workers) run the transcriptions.
+        """
+        max_retry_after = getattr(settings, 'UPLOAD_MAX_RETRY_AFTER_SECONDS', 120)
+        kinds = [JobJournal.TRANSCRIPTION]
+
+        free_mb = shutil.disk_usage(self.audio_dir).free / (1024 * 1024)
+        if free_mb < getattr(settings, 'UPLOAD_MIN_FREE_DISK_MB', 500):
+            return self._reject_upload("disk_space", max_retry_after, free_disk_mb=round(free_mb))
+
+        backlog = self.job_journal.count_active(kinds)
+        project_backlog = self.job_journal.count_active(kinds, project_id=project_id)
+        excess = max(
+            backlog - getattr(settings, 'UPLOAD_MAX_TRANSCRIPTION_BACKLOG', 20),
+            project_backlog - getattr(settings, 'UPLOAD_MAX_PROJECT_BACKLOG', 5)
+        ) + 1
+        if excess <= 0:
+            return {"admitted": True, "backlog": backlog, "project_backlog": project_backlog}
+
+        # Without recent history, assume a chunk takes about as long as a typical Whisper call
+        seconds_per_job = self.job_journal.get_average_duration(kinds) or 10.0
+        # Over the limit the workers are saturated, so the jobs in progress count them
+        workers = max(self.job_journal.count_in_progress(kinds), 1)
+        retry_after = math.ceil(excess * seconds_per_job / workers)
+        return self._reject_upload("transcription_backlog", min(max(retry_after, 1), max_retry_after),
+                                   backlog=backlog, project_backlog=project_backlog)
+
+    def _reject_upload(self, reason: str, retry_after: int, **details) -> Dict[str, Any]:
+        self._upload_rejections[reason] = self._upload_rejections.get(reason, 0) + 1
+        UPLOAD_REJECTIONS.inc(reason=reason)
+        upload_log.info("Upload rejected (%s), retry after %ss: %s", reason, retry_after, details,
+                        extra=sampled("upload_rejected"))
+        return {"admitted": False, "reason": reason, "retry_after": retry_after, **details}
+
+    def get_pipeline_stats(self) -> Dict[str, Any]:
+        stats = self.pipeline.get_stats()
+        stats["upload_rejections"] = dict(self._upload_rejections)
+        stats["logging"] = get_log_stats()
+        return stats
+
+    def refresh_metrics(self):
+        """Update the gauges in the metrics registry from the journal, workers and LLM cache"""
+        stats = self.pipeline.get_stats()
+        for stage in ("transcription", "trd"):
+            PIPELINE_QUEUE_DEPTH.set(stats[f"{stage}_queue_size"], stage=stage)
+            PIPELINE_IN_FLIGHT.set(stats[f"{stage}_in_flight"], stage=stage)
+        for priority, wait_stats in stats["queue_wait"].items():
+            PIPELINE_OLDEST_QUEUED_SECONDS.set(wait_stats.get("oldest_queued_seconds") or 0, priority=priority)
+
+        if self.response_cache:
+            LLM_CACHE_HIT_RATIO.set(self.response_cache.get_stats()["hit_rate"])
+
     def cleanup(self):
-        self.recording_handler.cleanup()
-        self._stop_worker_threads()
\ No newline at end of file
+        self.recording_sessions.cleanup()
+        self.pipeline.stop()
+        self.job_journal.close()
+        self.search_index.close()
\ No newline at end of file
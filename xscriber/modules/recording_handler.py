@@ -1,25 +1,47 @@
 import os
-# import wave
-# import pyaudio
+import wave
 import threading
 import time
-from typing import List, Optional, Callable
+from typing import List, Optional, Callable, Dict, Any
 from pathlib import Path
 from django.conf import settings
 
+from .structured_log import get_logger
+
+try:
+    import pyaudio
+except ImportError:  # Without PyAudio, sessions are tracked but no audio is captured
+    pyaudio = None
+
+log = get_logger("recording")
+
+
+class RecordingLimitError(Exception):
+    """Starting another session would exceed the concurrent recording session limit"""
+
 
 class RecordingHandler:
-    def __init__(self, chunk_duration: int = 30, output_dir: Optional[str] = None,
-                 sample_rate: int = 44100, channels: int = 1, chunk_size: int = 1024):
+    """
+    One server-side recording session: captures audio for a project from an input device
+    in its own thread and saves it in chunk_duration chunks, numbered after the project's
+    existing chunks, calling the chunk saved callback for each.
+    """
+
+    def __init__(self, chunk_duration: float = 30, output_dir: Optional[str] = None,
+                 sample_rate: int = 44100, channels: int = 1, chunk_size: int = 1024,
+                 input_device_index: Optional[int] = None):
         self.chunk_duration = chunk_duration
         self.output_dir = Path(output_dir) if output_dir else settings.AUDIO_RECORDINGS_DIR
         self.sample_rate = sample_rate
         self.channels = channels
         self.chunk_size = chunk_size
+        self.input_device_index = input_device_index
+        self.sample_width = 2
 
         self.is_recording = False
         self.current_project_id = None
         self.chunk_counter = 0
+        self.started_at = None
         self.recording_thread = None
         self.audio_stream = None
         self.audio_interface = None
@@ -33,84 +55,111 @@ class RecordingHandler:
 
     def start_recording(self, project_id: str) -> bool:
         if self.is_recording:
-            print(f"Already recording for project {self.current_project_id}")
+            log.warning("Already recording for project %s", self.current_project_id)
             return False
 
         try:
             self.current_project_id = project_id
             self.chunk_counter = self._get_next_chunk_number(project_id)
             self.is_recording = True
-
-            # TODO: Re-enable when PyAudio is installed
-            # self.audio_interface = pyaudio.PyAudio()
-            # self.audio_stream = self.audio_interface.open(
-            #     format=pyaudio.paInt16,
-            #     channels=self.channels,
-            #     rate=self.sample_rate,
-            #     input=True,
-            #     frames_per_buffer=self.chunk_size
-            # )
-
-            # self.recording_thread = threading.Thread(target=self._recording_loop)
-            # self.recording_thread.daemon = True
-            # self.recording_thread.start()
-
-            print(f"Mock recording started for project {project_id} (PyAudio not installed)")
+            self.started_at = time.time()
+
+            if pyaudio is None:
+                log.warning("Mock recording started for project %s (PyAudio not installed)", project_id)
+                return True
+
+            self.audio_interface = pyaudio.PyAudio()
+            self.audio_stream = self.audio_interface.open(
+                format=pyaudio.paInt16,
+                channels=self.channels,
+                rate=self.sample_rate,
+                input=True,
+                input_device_index=self.input_device_index,
+                frames_per_buffer=self.chunk_size
+            )
+
+            self.recording_thread = threading.Thread(target=self._recording_loop, name=f"recording-{project_id}")
+            self.recording_thread.daemon = True
+            self.recording_thread.start()
+
+            log.info("Started recording for project %s", project_id)
             return True
         except Exception as e:
-            print(f"Failed to start recording: {str(e)}")
+            log.error("Failed to start recording: %s", e)
             self.is_recording = False
+            self._close_audio()
             return False
 
     def stop_recording(self) -> bool:
         if not self.is_recording:
-            print("Not currently recording")
+            log.info("Not currently recording")
             return False
 
         try:
             self.is_recording = False
 
+            # The loop saves the partial last chunk before it exits
             if self.recording_thread:
                 self.recording_thread.join(timeout=5.0)
+                self.recording_thread = None
 
-            if self.audio_stream:
-                self.audio_stream.stop_stream()
-                self.audio_stream.close()
-                self.audio_stream = None
+            self._close_audio()
 
-            if self.audio_interface:
-                self.audio_interface.terminate()
-                self.audio_interface = None
-
-            print(f"Stopped recording for project {self.current_project_id}")
+            log.info("Stopped recording for project %s", self.current_project_id)
             self.current_project_id = None
             return True
         except Exception as e:
-            print(f"Error stopping recording: {str(e)}")
+            log.error("Error stopping recording: %s", e)
             return False
 
-    def _recording_loop(self):
-        frames = []
-        chunk_start_time = time.time()
-
-        while self.is_recording:
-            try:
-                data = self.audio_stream.read(self.chunk_size, exception_on_overflow=False)
-                frames.append(data)
-
-                if time.time() - chunk_start_time >= self.chunk_duration:
-                    self._save_audio_chunk(frames)
-                    frames = []
-                    chunk_start_time = time.time()
+    def _close_audio(self):
+        if self.audio_stream:
+            self.audio_stream.stop_stream()
+            self.audio_stream.close()
+            self.audio_stream = None
 
-            except Exception as e:
-                print(f"Error during recording: {str(e)}")
-                break
+        if self.audio_interface:
+            self.audio_interface.terminate()
+            self.audio_interface = None
 
-        if frames:
-            self._save_audio_chunk(frames)
+    def _recording_loop(self):
+        # Chunks are captured into one buffer allocated for the session and reused for every
+        # chunk, and the writer gets a view of it, so memory stays flat however long the
+        # session runs. Chunk boundaries follow the number of frames read, not the clock.
+        try:
+            self.sample_width = self.audio_interface.get_sample_size(pyaudio.paInt16)
+            frame_bytes = self.channels * self.sample_width
+            chunk_bytes = max(int(self.chunk_duration * self.sample_rate), 1) * frame_bytes
+            buffer = bytearray(chunk_bytes)
+        except Exception as e:
+            log.error("Error preparing capture buffer: %s", e)
+            return
 
-    def _save_audio_chunk(self, frames: List[bytes]):
+        filled = 0
+        with memoryview(buffer) as view:
+            while self.is_recording:
+                try:
+                    data = memoryview(self.audio_stream.read(self.chunk_size, exception_on_overflow=False))
+                except Exception as e:
+                    log.error("Error during recording: %s", e)
+                    break
+
+                # A read can run past the chunk boundary; the rest starts the next chunk
+                offset = 0
+                while offset < len(data):
+                    count = min(len(data) - offset, chunk_bytes - filled)
+                    view[filled:filled + count] = data[offset:offset + count]
+                    filled += count
+                    offset += count
+                    if filled == chunk_bytes:
+                        self._save_audio_chunk(view)
+                        filled = 0
+
+            if filled:
+                self._save_audio_chunk(view[:filled])
+
+    def _save_audio_chunk(self, audio):
+        """Write one chunk of captured PCM audio (any bytes-like object, e.g. a buffer view)"""
         if not self.current_project_id:
             return
 
@@ -118,29 +167,29 @@ class RecordingHandler:
             filename = f"{self.current_project_id}_audiochunk_{self.chunk_counter}.wav"
             filepath = self.output_dir / filename
 
-            # TODO: Re-enable when PyAudio/wave is installed
-            # with wave.open(str(filepath), 'wb') as wf:
-            #     wf.setnchannels(self.channels)
-            #     wf.setsampwidth(self.audio_interface.get_sample_size(pyaudio.paInt16))
-            #     wf.setframerate(self.sample_rate)
-            #     wf.writeframes(b''.join(frames))
-
-            # Create mock audio file for demonstration
-            with open(str(filepath), 'w') as f:
-                f.write("Mock audio file - PyAudio not installed")
-
-            print(f"Saved audio chunk: {filename}")
+            if self.audio_interface:
+                with wave.open(str(filepath), 'wb') as wf:
+                    wf.setnchannels(self.channels)
+                    wf.setsampwidth(self.sample_width)
+                    wf.setframerate(self.sample_rate)
+                    wf.writeframes(audio)
+            else:
+                # Mock audio file for demonstration
+                with open(str(filepath), 'w') as f:
+                    f.write("Mock audio file - PyAudio not installed")
+
+            log.info("Saved audio chunk: %s", filename)
 
             if self.on_chunk_saved_callback:
                 try:
                     self.on_chunk_saved_callback(str(filepath))
                 except Exception as e:
-                    print(f"Error in chunk saved callback: {str(e)}")
+                    log.error("Error in chunk saved callback: %s", e)
 
             self.chunk_counter += 1
 
         except Exception as e:
-            print(f"Error saving audio chunk: {str(e)}")
+            log.error("Error saving audio chunk: %s", e)
 
     def _get_next_chunk_number(self, project_id: str) -> int:
         existing_files = list(self.output_dir.glob(f"{project_id}_audiochunk_*.wav"))
@@ -169,4 +218,77 @@ class RecordingHandler:
         return self.current_project_id
 
     def cleanup(self):
-        self.stop_recording()
\ No newline at end of file
+        self.stop_recording()
+
+
+class RecordingSessionManager:
+    """
+    Independent server-side recording sessions, keyed by session id (the project id unless
+    given). Each session is its own RecordingHandler, with its own capture thread, chunk
+    counter and chunk callback. At most max_sessions record at once, and a project records
+    in one session at a time so its chunk numbers stay unique.
+    """
+
+    def __init__(self, max_sessions: int = 4, handler_factory: Optional[Callable[..., RecordingHandler]] = None):
+        self.max_sessions = max_sessions
+        self.handler_factory = handler_factory or RecordingHandler
+        self._sessions: Dict[str, RecordingHandler] = {}
+        self._lock = threading.Lock()
+
+    def start_session(self, project_id: str, on_chunk_saved: Optional[Callable[[str], None]] = None,
+                      session_id: Optional[str] = None, **handler_options) -> Optional[str]:
+        """
+        Start recording a project and return the session id, or None if the project is
+        already recording or capture could not start. Raises RecordingLimitError when
+        max_sessions are already recording.
+        """
+        session_id = session_id or project_id
+        with self._lock:
+            if session_id in self._sessions or self._session_for_project(project_id):
+                log.warning("Project %s is already recording", project_id)
+                return None
+            if len(self._sessions) >= self.max_sessions:
+                raise RecordingLimitError(f"{self.max_sessions} recording sessions are already active")
+            # Hold the slot while the input device is opened outside the lock
+            handler = self.handler_factory(**handler_options)
+            self._sessions[session_id] = handler
+
+        if on_chunk_saved:
+            handler.set_chunk_saved_callback(on_chunk_saved)
+        if not handler.start_recording(project_id):
+            with self._lock:
+                self._sessions.pop(session_id, None)
+            return None
+        return session_id
+
+    def stop_session(self, session_id: str) -> bool:
+        with self._lock:
+            handler = self._sessions.pop(session_id, None)
+        return handler.stop_recording() if handler else False
+
+    def _session_for_project(self, project_id: str) -> Optional[str]:
+        return next((session_id for session_id, handler in self._sessions.items()
+                     if handler.get_current_project_id() == project_id), None)
+
+    def get_session_id(self, project_id: str) -> Optional[str]:
+        with self._lock:
+            return self._session_for_project(project_id)
+
+    def get_session(self, session_id: str) -> Optional[RecordingHandler]:
+        return self._sessions.get(session_id)
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            sessions = list(self._sessions.items())
+        return [{"session_id": session_id, "project_id": handler.get_current_project_id(),
+                 "next_chunk": handler.chunk_counter, "started_at": handler.started_at}
+                for session_id, handler in sessions]
+
+    def active_count(self) -> int:
+        return len(self._sessions)
+
+    def cleanup(self):
+        with self._lock:
+            session_ids = list(self._sessions)
+        for session_id in session_ids:
+            self.stop_session(session_id)
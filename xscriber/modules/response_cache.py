@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Optional, Dict, Any, List
+from pathlib import Path
+
+from .metrics import LLM_CACHE_LOOKUPS
+from .structured_log import get_logger
+
+log = get_logger("llm_cache")
+
+
+class ResponseCache:
+    """
+    Disk-backed cache for chat completion responses.
+
+    Each entry is stored as a JSON file named after the request key. Recency is
+    tracked through the file's modification time, which is refreshed on every hit,
+    so eviction can drop the least recently used entries first.
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 500, max_bytes: int = 50 * 1024 * 1024,
+                 ttl_seconds: int = 7 * 24 * 3600):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def make_key(self, model: str, temperature: float, max_tokens: int, messages: List[Dict[str, str]]) -> str:
+        messages_hash = hashlib.sha256(
+            json.dumps(messages, sort_keys=True, ensure_ascii=False).encode('utf-8')
+        ).hexdigest()
+        key_material = f"{model}|{temperature}|{max_tokens}|{messages_hash}"
+        return hashlib.sha256(key_material.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry_path = self._entry_path(key)
+
+        with self._lock:
+            if not entry_path.exists():
+                self.misses += 1
+                LLM_CACHE_LOOKUPS.inc(result="miss")
+                return None
+
+            try:
+                with open(entry_path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except Exception as e:
+                log.warning("Failed to read cache entry %s: %s", key, e)
+                self.misses += 1
+                LLM_CACHE_LOOKUPS.inc(result="miss")
+                return None
+
+            if time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+                entry_path.unlink(missing_ok=True)
+                self.misses += 1
+                LLM_CACHE_LOOKUPS.inc(result="miss")
+                return None
+
+            # Refresh recency for LRU eviction
+            os.utime(entry_path, None)
+            self.hits += 1
+            LLM_CACHE_LOOKUPS.inc(result="hit")
+            return entry
+
+    def set(self, key: str, content: str, metadata: Optional[Dict[str, Any]] = None) -> bool:
+        entry = {
+            "key": key,
+            "content": content,
+            "created_at": time.time(),
+            "metadata": metadata or {}
+        }
+
+        entry_path = self._entry_path(key)
+        temp_path = entry_path.with_suffix('.tmp')
+
+        with self._lock:
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(entry, f, ensure_ascii=False)
+                os.replace(temp_path, entry_path)
+            except Exception as e:
+                log.warning("Failed to write cache entry %s: %s", key, e)
+                return False
+
+            self._evict()
+            return True
+
+    def _evict(self):
+        now = time.time()
+        entries = []
+        for entry_path in self.cache_dir.glob("*.json"):
+            try:
+                stat = entry_path.stat()
+            except FileNotFoundError:
+                continue
+
+            if now - stat.st_mtime > self.ttl_seconds:
+                entry_path.unlink(missing_ok=True)
+                self.evictions += 1
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+        # Oldest access first
+        entries.sort(key=lambda x: x[0])
+        total_bytes = sum(size for _, size, _ in entries)
+
+        while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+            _, size, entry_path = entries.pop(0)
+            entry_path.unlink(missing_ok=True)
+            total_bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            for entry_path in self.cache_dir.glob("*.json"):
+                entry_path.unlink(missing_ok=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entry_files = list(self.cache_dir.glob("*.json"))
+            total_bytes = 0
+            for entry_path in entry_files:
+                try:
+                    total_bytes += entry_path.stat().st_size
+                except FileNotFoundError:
+                    continue
+
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(entry_files),
+                "bytes": total_bytes
+            }
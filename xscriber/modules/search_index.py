@@ -0,0 +1,255 @@
+import re
+import json
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Any
+from pathlib import Path
+
+from .structured_log import get_logger
+
+log = get_logger("search")
+
+
+TRANSCRIPTION_FILE_PATTERN = re.compile(r"^(?P<project_id>.+)_transcription_(?P<chunk_id>\d+)\.json$")
+
+
+class TranscriptSearchIndex:
+    """
+    Full-text index over transcription segments, backed by SQLite FTS5.
+
+    Each Whisper segment is a row in `segments` with its project, chunk and
+    start/end time; `segments_fts` is an external-content FTS5 table over the
+    segment text, kept in sync by triggers. Chunks are (re)indexed as a unit,
+    and `indexed_chunks` remembers the source file's mtime so rebuilds only
+    touch transcriptions that changed.
+
+    Searches rank with bm25 and stop at the requested page, so they stay fast
+    as the index grows; optimize() merges the FTS b-trees after a bulk rebuild.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._create_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared between threads; keep one per thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(str(self.db_path), timeout=30.0, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _create_schema(self):
+        self._connection().executescript("""
+            CREATE TABLE IF NOT EXISTS segments (
+                id INTEGER PRIMARY KEY,
+                project_id TEXT NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                segment_index INTEGER NOT NULL,
+                start REAL,
+                end REAL,
+                text TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS segments_chunk ON segments (project_id, chunk_id);
+
+            CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(
+                text, content='segments', content_rowid='id', tokenize='porter unicode61'
+            );
+            CREATE TRIGGER IF NOT EXISTS segments_ai AFTER INSERT ON segments BEGIN
+                INSERT INTO segments_fts (rowid, text) VALUES (new.id, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS segments_ad AFTER DELETE ON segments BEGIN
+                INSERT INTO segments_fts (segments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            END;
+
+            CREATE TABLE IF NOT EXISTS indexed_chunks (
+                project_id TEXT NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                source_mtime REAL,
+                PRIMARY KEY (project_id, chunk_id)
+            );
+        """)
+
+    @staticmethod
+    def parse_transcription_path(path) -> Optional[Dict[str, Any]]:
+        match = TRANSCRIPTION_FILE_PATTERN.match(Path(path).name)
+        if not match:
+            return None
+        return {"project_id": match.group("project_id"), "chunk_id": int(match.group("chunk_id"))}
+
+    def index_transcription(self, project_id: str, chunk_id: int, transcription: Dict[str, Any],
+                            source_mtime: Optional[float] = None) -> int:
+        """Replace the chunk's segments with those of this transcription; returns the segment count"""
+        segments = transcription.get("segments") or []
+        if not segments and transcription.get("text", "").strip():
+            # Transcriptions without segment timing are indexed as one segment
+            segments = [{"start": 0.0, "end": transcription.get("duration"), "text": transcription["text"]}]
+
+        rows = [
+            (project_id, chunk_id, index, segment.get("start"), segment.get("end"), segment.get("text", "").strip())
+            for index, segment in enumerate(segments)
+            if segment.get("text", "").strip()
+        ]
+
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM segments WHERE project_id = ? AND chunk_id = ?", (project_id, chunk_id))
+            connection.executemany(
+                "INSERT INTO segments (project_id, chunk_id, segment_index, start, end, text) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO indexed_chunks (project_id, chunk_id, source_mtime) VALUES (?, ?, ?)",
+                (project_id, chunk_id, source_mtime)
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def index_file(self, path) -> bool:
+        """Index one `<project>_transcription_<chunk>.json` file"""
+        path = Path(path)
+        parsed = self.parse_transcription_path(path)
+        if not parsed:
+            return False
+
+        try:
+            with open(path, 'r') as f:
+                transcription = json.load(f)
+        except Exception as e:
+            log.warning("Error reading transcription %s for indexing: %s", path.name, e)
+            return False
+
+        self.index_transcription(parsed["project_id"], parsed["chunk_id"], transcription, path.stat().st_mtime)
+        return True
+
+    def remove_chunk(self, project_id: str, chunk_id: int):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM segments WHERE project_id = ? AND chunk_id = ?", (project_id, chunk_id))
+            connection.execute("DELETE FROM indexed_chunks WHERE project_id = ? AND chunk_id = ?", (project_id, chunk_id))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def remove_project(self, project_id: str) -> int:
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = connection.execute("DELETE FROM segments WHERE project_id = ?", (project_id,))
+            connection.execute("DELETE FROM indexed_chunks WHERE project_id = ?", (project_id,))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return cursor.rowcount
+
+    def rebuild(self, transcription_dir, project_ids: Optional[List[str]] = None, full: bool = False) -> Dict[str, int]:
+        """
+        Bring the index in line with the transcription files: index new or changed files
+        and drop chunks whose file is gone. full=True reindexes every file.
+        """
+        counts = {"indexed": 0, "unchanged": 0, "removed": 0, "errors": 0}
+        wanted = set(project_ids) if project_ids else None
+
+        indexed = {
+            (row["project_id"], row["chunk_id"]): row["source_mtime"]
+            for row in self._connection().execute("SELECT project_id, chunk_id, source_mtime FROM indexed_chunks")
+            if wanted is None or row["project_id"] in wanted
+        }
+
+        seen = set()
+        for path in sorted(Path(transcription_dir).glob("*_transcription_*.json")):
+            parsed = self.parse_transcription_path(path)
+            if not parsed or (wanted is not None and parsed["project_id"] not in wanted):
+                continue
+
+            key = (parsed["project_id"], parsed["chunk_id"])
+            seen.add(key)
+            if not full and indexed.get(key) == path.stat().st_mtime:
+                counts["unchanged"] += 1
+                continue
+
+            if self.index_file(path):
+                counts["indexed"] += 1
+            else:
+                counts["errors"] += 1
+
+        for project_id, chunk_id in set(indexed) - seen:
+            self.remove_chunk(project_id, chunk_id)
+            counts["removed"] += 1
+
+        return counts
+
+    @staticmethod
+    def build_match_query(query: str) -> str:
+        """
+        Turn free text into an FTS5 query that matches all terms, so user input never hits
+        FTS syntax errors. A trailing * on a term keeps prefix matching.
+        """
+        terms = []
+        for term in query.split():
+            prefix = term.endswith("*")
+            term = term.rstrip("*").replace('"', '""')
+            if term:
+                terms.append(f'"{term}"' + ("*" if prefix else ""))
+        return " ".join(terms)
+
+    def search(self, query: str, project_id: Optional[str] = None, limit: int = 20,
+               offset: int = 0) -> List[Dict[str, Any]]:
+        """Segments matching every term of the query, best bm25 match first, with highlighted snippets"""
+        match_query = self.build_match_query(query)
+        if not match_query:
+            return []
+
+        sql = """
+            SELECT s.project_id, s.chunk_id, s.segment_index, s.start, s.end, s.text,
+                   snippet(segments_fts, 0, '<mark>', '</mark>', '...', 16) AS snippet,
+                   bm25(segments_fts) AS score
+            FROM segments_fts
+            JOIN segments AS s ON s.id = segments_fts.rowid
+            WHERE segments_fts MATCH ?
+        """
+        params: List[Any] = [match_query]
+        if project_id:
+            sql += " AND s.project_id = ?"
+            params.append(project_id)
+        sql += " ORDER BY score LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+
+        results = []
+        for row in self._connection().execute(sql, params):
+            result = dict(row)
+            # bm25 is lower-is-better; report a positive relevance instead
+            result["score"] = -result["score"]
+            results.append(result)
+        return results
+
+    def get_stats(self) -> Dict[str, int]:
+        connection = self._connection()
+        return {
+            "segments": connection.execute("SELECT COUNT(*) FROM segments").fetchone()[0],
+            "chunks": connection.execute("SELECT COUNT(*) FROM indexed_chunks").fetchone()[0],
+            "projects": connection.execute("SELECT COUNT(DISTINCT project_id) FROM indexed_chunks").fetchone()[0]
+        }
+
+    def optimize(self):
+        """Merge the FTS index segments; worth running after a large rebuild"""
+        self._connection().execute("INSERT INTO segments_fts (segments_fts) VALUES ('optimize')")
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
@@ -0,0 +1,484 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Tuple
+
+from django.conf import settings
+
+from .audio_stream import SessionAudioIndex, read_wav_layout
+from .fake_openai import FakeOpenAIServer
+from .job_journal import JobJournal
+from .pipeline_benchmark import percentile_summary, write_silent_wav
+from .pipeline_engine import PipelineEngine
+from .project_handler import ProjectHandler
+from .structured_log import get_logger
+
+log = get_logger("replay")
+
+
+BACKENDS = ("real", "cached", "stub")
+
+
+def _chunk_duration(audio_file: Optional[Path], transcription: Optional[Dict[str, Any]]) -> Optional[float]:
+    if transcription and transcription.get("duration"):
+        return float(transcription["duration"])
+    if audio_file and audio_file.suffix == ".wav":
+        layout = read_wav_layout(audio_file)
+        if layout:
+            bytes_per_second = layout["sample_rate"] * layout["channels"] * layout["sample_width"]
+            return layout["data_length"] / bytes_per_second
+    return None
+
+
+def load_source_session(data_dir, project_id: str) -> Optional[Dict[str, Any]]:
+    """
+    A recorded project's chunks in order with their arrival offsets in seconds.
+
+    Arrival is the audio file's mtime (written when the upload arrived), else the
+    transcript's. When the files no longer carry distinct times (copied without
+    preserving them, say), chunks are spaced by their audio duration instead.
+    """
+    data_dir = Path(data_dir)
+    metadata_file = data_dir / 'project_metadata' / f"{project_id}_metadata.json"
+    if not metadata_file.exists():
+        return None
+    with open(metadata_file, 'r') as f:
+        metadata = json.load(f)
+
+    audio_files = {chunk_id: path for chunk_id, path in
+                   SessionAudioIndex.list_chunk_files(data_dir / 'audio-recordings', project_id)}
+    transcription_files = {}
+    for path in (data_dir / 'raw-transcriptions').glob(f"{project_id}_transcription_*.json"):
+        suffix = path.stem.split('_')[-1]
+        if suffix.isdigit():
+            transcription_files[int(suffix)] = path
+
+    chunks = []
+    for chunk_id in sorted(set(audio_files) | set(transcription_files)):
+        audio_file, transcription_file = audio_files.get(chunk_id), transcription_files.get(chunk_id)
+        transcription = None
+        if transcription_file:
+            try:
+                with open(transcription_file, 'r', encoding='utf-8') as f:
+                    transcription = json.load(f)
+            except (OSError, ValueError):
+                transcription_file = None
+        chunks.append({
+            "chunk_id": chunk_id,
+            "audio_file": audio_file,
+            "transcription_file": transcription_file,
+            "arrived_at": (audio_file or transcription_file).stat().st_mtime,
+            "duration": _chunk_duration(audio_file, transcription)
+        })
+
+    if not chunks:
+        return {"project_id": project_id, "name": metadata.get("name"), "metadata": metadata,
+                "chunks": [], "timing": "mtime"}
+
+    timing = "mtime"
+    first_arrival = chunks[0]["arrived_at"]
+    if max(chunk["arrived_at"] for chunk in chunks) - first_arrival < 0.001 and len(chunks) > 1:
+        timing = "duration"
+        offset = 0.0
+        for chunk in chunks:
+            chunk["offset"] = offset
+            offset += chunk["duration"] or 0.0
+    else:
+        # Keep the original order even where mtimes went backwards
+        offset = 0.0
+        for chunk in chunks:
+            offset = max(offset, chunk["arrived_at"] - first_arrival)
+            chunk["offset"] = offset
+
+    return {"project_id": project_id, "name": metadata.get("name"), "metadata": metadata,
+            "chunks": chunks, "timing": timing}
+
+
+def original_chunk_to_trd(source: Dict[str, Any]) -> List[float]:
+    """Seconds from each chunk arriving to the first TRD version that included it, as recorded"""
+    arrivals = {str(chunk["chunk_id"]): chunk["arrived_at"] for chunk in source["chunks"]}
+    latencies = []
+    for version in source["metadata"].get("trd_versions", []):
+        generated = datetime.fromisoformat(version["generated_at"]).timestamp()
+        for chunk_id in version.get("new_chunk_ids", []):
+            if str(chunk_id) in arrivals:
+                latencies.append(generated - arrivals[str(chunk_id)])
+    return latencies
+
+
+class RecordedTranscriber:
+    """
+    Stands in for WhisperTranscriber by answering with the transcripts stored for the
+    source session. transcripts maps the replayed chunk number to its stored file.
+    """
+
+    def __init__(self, transcripts: Dict[str, Path]):
+        self.transcripts = transcripts
+
+    def transcribe_and_save(self, audio_file_path: str, output_path: str, language: Optional[str] = None) -> bool:
+        chunk_number = Path(audio_file_path).stem.split('_')[-1]
+        source = self.transcripts.get(chunk_number)
+        if not source:
+            log.warning("No recorded transcript for replayed chunk %s", chunk_number)
+            return False
+        try:
+            Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(source, output_path)
+            return True
+        except Exception as e:
+            log.error("Failed to copy recorded transcript: %s", e)
+            return False
+
+    async def atranscribe_and_save(self, audio_file_path: str, output_path: str,
+                                   language: Optional[str] = None) -> bool:
+        return self.transcribe_and_save(audio_file_path, output_path, language)
+
+
+class SessionReplay:
+    """
+    Re-feeds a recorded project's chunks at their original pace, or speed times faster,
+    and samples how fresh the TRD is and how far behind the pipeline falls.
+
+    By default chunks go through the same admission check and queues as
+    upload_audio_chunk, in a throwaway data directory, with one of three backends:
+    "real" calls the OpenAI API, "cached" answers transcription with the stored
+    transcripts and serves TRD prompts from a copy of the source LLM cache (misses go to
+    the API), and "stub" uses a FakeOpenAIServer. With target_url the chunks are
+    instead POSTed to a running server's upload endpoint, which uses its own backends.
+    """
+
+    def __init__(self, project_id: str, source_dir=None, speed: float = 1.0, backend: str = "stub",
+                 target_url: Optional[str] = None, sample_interval: float = 1.0, timeout: float = 600.0,
+                 server_options: Optional[Dict[str, Any]] = None, keep_data: bool = False):
+        if backend not in BACKENDS:
+            raise ValueError(f"backend must be one of {BACKENDS}")
+        if speed <= 0:
+            raise ValueError("speed must be positive")
+
+        self.project_id = project_id
+        self.source_dir = Path(source_dir) if source_dir else settings.DATA_DIR
+        self.speed = speed
+        self.backend = backend
+        self.target_url = target_url.rstrip('/') if target_url else None
+        self.sample_interval = sample_interval
+        self.timeout = timeout
+        self.server_options = server_options or {}
+        self.keep_data = keep_data
+
+        self._sent: Dict[str, Dict[str, Any]] = {}
+        self._timeline: List[Dict[str, Any]] = []
+        self._rejections = 0
+        self._failures = 0
+        self._started = 0.0
+
+    def run(self) -> Dict[str, Any]:
+        source = load_source_session(self.source_dir, self.project_id)
+        if source is None:
+            raise ValueError(f"Project {self.project_id} not found in {self.source_dir}")
+
+        chunks, skipped = self._playable_chunks(source)
+        if self.target_url:
+            return self._run_http(source, chunks, skipped)
+        return self._run_local(source, chunks, skipped)
+
+    def _playable_chunks(self, source: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        chunks, skipped = [], []
+        for chunk in source["chunks"]:
+            if chunk["audio_file"] or (self.backend == "cached" and chunk["transcription_file"]
+                                       and not self.target_url):
+                chunks.append(chunk)
+            else:
+                skipped.append({"chunk_id": chunk["chunk_id"], "reason": "no audio"})
+        return chunks, skipped
+
+    # Local replay through the queues
+
+    def _run_local(self, source: Dict[str, Any], chunks: List[Dict[str, Any]],
+                   skipped: List[Dict[str, Any]]) -> Dict[str, Any]:
+        data_dir = Path(tempfile.mkdtemp(prefix="xscriber-replay-"))
+        server = FakeOpenAIServer(**self.server_options).start() if self.backend == "stub" else None
+        handler = None
+        try:
+            if self.backend == "cached":
+                source_cache = self.source_dir / 'llm_cache'
+                if source_cache.exists():
+                    shutil.copytree(source_cache, data_dir / 'llm_cache', dirs_exist_ok=True)
+
+            handler = self._make_handler(data_dir, chunks, server)
+            project_id = handler.create_project(f"Replay of {source['name'] or self.project_id}")
+
+            def observe():
+                return handler.get_project_metadata(project_id) or {}, handler.pipeline.get_stats()
+
+            def send(chunk, number, final):
+                return self._send_local(handler, project_id, chunk, number, final)
+
+            idle = self._replay(chunks, send, observe,
+                                wait_until_idle=lambda timeout: handler.pipeline.wait_until_idle(timeout=timeout))
+            return self._build_result(source, chunks, skipped, observe()[0], idle, data_dir)
+        finally:
+            if handler:
+                handler.cleanup()
+            if server:
+                server.stop()
+            if not self.keep_data:
+                shutil.rmtree(data_dir, ignore_errors=True)
+
+    def _make_handler(self, data_dir: Path, chunks: List[Dict[str, Any]],
+                      server: Optional[FakeOpenAIServer]) -> ProjectHandler:
+        from .transcriber import WhisperTranscriber
+        from .chat_completion import ChatCompletionProcessor
+
+        handler = ProjectHandler(data_dir=data_dir, start_workers=True)
+        handler.reconcile_on_start = False
+
+        if self.backend == "stub":
+            # The SDK reads OPENAI_BASE_URL when the clients are created
+            previous_base_url = os.environ.get("OPENAI_BASE_URL")
+            os.environ["OPENAI_BASE_URL"] = server.base_url
+            try:
+                handler.transcriber = WhisperTranscriber(api_key="replay",
+                                                         async_http_client=handler.pipeline.http_client)
+                handler.chat_processor = ChatCompletionProcessor(api_key="replay", model=handler.default_model,
+                                                                 cache=handler.response_cache,
+                                                                 async_http_client=handler.pipeline.http_client)
+            finally:
+                if previous_base_url is None:
+                    os.environ.pop("OPENAI_BASE_URL", None)
+                else:
+                    os.environ["OPENAI_BASE_URL"] = previous_base_url
+        elif self.backend == "cached":
+            handler.transcriber = RecordedTranscriber({
+                str(number): chunk["transcription_file"]
+                for number, chunk in enumerate(chunks, start=1) if chunk["transcription_file"]
+            })
+            if not settings.OPENAI_API_KEY:
+                log.warning("No OpenAI API key: TRD prompts missing from the LLM cache will fail")
+                handler.chat_processor = ChatCompletionProcessor(api_key="replay-cache-only",
+                                                                 model=handler.default_model,
+                                                                 cache=handler.response_cache,
+                                                                 async_http_client=handler.pipeline.http_client)
+        return handler
+
+    def _send_local(self, handler: ProjectHandler, project_id: str, chunk: Dict[str, Any], number: int,
+                    final: bool) -> bool:
+        # Honour Retry-After the way the recorder does when upload_audio_chunk answers 429
+        while True:
+            admission = handler.check_upload_admission(project_id)
+            if admission["admitted"]:
+                break
+            self._rejections += 1
+            time.sleep(admission["retry_after"])
+
+        source_audio = chunk["audio_file"]
+        suffix = source_audio.suffix if source_audio else ".wav"
+        audio_file = handler.audio_dir / f"{project_id}_audiochunk_{number}{suffix}"
+        if source_audio:
+            # copyfile rather than copy2: the new mtime marks the chunk's arrival
+            shutil.copyfile(source_audio, audio_file)
+        else:
+            # Cached backend without the original audio: the transcript is replayed from disk
+            write_silent_wav(audio_file, chunk["duration"] or 1.0)
+
+        handler._queue_transcription(project_id, str(audio_file.resolve()))
+        if final:
+            handler.finalize_session(project_id)
+        return True
+
+    # Replay against a running server
+
+    def _request(self, method: str, path: str, body: Optional[bytes] = None,
+                 content_type: str = "application/json") -> Tuple[int, Dict[str, str], Dict[str, Any]]:
+        request = urllib.request.Request(f"{self.target_url}{path}", data=body, method=method)
+        if body is not None:
+            request.add_header("Content-Type", content_type)
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                return response.status, dict(response.headers), json.loads(response.read() or b"{}")
+        except urllib.error.HTTPError as e:
+            try:
+                payload = json.loads(e.read() or b"{}")
+            except ValueError:
+                payload = {}
+            return e.code, dict(e.headers), payload
+
+    def _run_http(self, source: Dict[str, Any], chunks: List[Dict[str, Any]],
+                  skipped: List[Dict[str, Any]]) -> Dict[str, Any]:
+        status, _, payload = self._request(
+            "POST", "/api/create_project/",
+            json.dumps({"name": f"Replay of {source['name'] or self.project_id}"}).encode("utf-8"))
+        if status != 200:
+            raise RuntimeError(f"Could not create the replay project: {payload.get('error', status)}")
+        project_id = payload["project_id"]
+
+        def observe():
+            _, _, project = self._request("GET", f"/api/projects/{project_id}/")
+            _, _, pipeline = self._request("GET", "/api/pipeline/status/")
+            return project.get("metadata", {}), pipeline.get("pipeline", {})
+
+        def send(chunk, number, final):
+            return self._send_http(project_id, chunk, final)
+
+        def wait_until_idle(timeout):
+            deadline = time.time() + timeout
+            while time.time() < deadline:
+                if not any(self._backlog(observe()[1]).values()):
+                    return True
+                time.sleep(self.sample_interval)
+            return False
+
+        idle = self._replay(chunks, send, observe, wait_until_idle)
+        result = self._build_result(source, chunks, skipped, observe()[0], idle, None)
+        result["target"] = {"url": self.target_url, "project_id": project_id}
+        return result
+
+    def _send_http(self, project_id: str, chunk: Dict[str, Any], final: bool) -> bool:
+        boundary = uuid.uuid4().hex
+        fields = {"project_id": project_id, "final": "true" if final else "false"}
+        parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+                 for name, value in fields.items()]
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="audio_chunk"; '
+                     f'filename="{chunk["audio_file"].name}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+        parts.append(chunk["audio_file"].read_bytes())
+        parts.append(f'\r\n--{boundary}--\r\n'.encode())
+        body = b"".join(parts)
+
+        while True:
+            status, headers, payload = self._request("POST", "/api/recording/upload_chunk/", body,
+                                                     f"multipart/form-data; boundary={boundary}")
+            if status != 429:
+                break
+            self._rejections += 1
+            time.sleep(int(headers.get("Retry-After", 1)))
+
+        if status != 200:
+            log.error("Replay upload of chunk %s failed: %s", chunk['chunk_id'], payload.get('error', status))
+            return False
+        return True
+
+    # Shared replay loop and reporting
+
+    @staticmethod
+    def _backlog(pipeline_stats: Dict[str, Any]) -> Dict[str, int]:
+        jobs = pipeline_stats.get("jobs", {})
+        return {
+            stage: sum(jobs.get(kind, {}).get(status, 0) for kind in kinds
+                       for status in (JobJournal.QUEUED, JobJournal.CLAIMED))
+            for stage, kinds in PipelineEngine.STAGE_KINDS.items()
+        }
+
+    def _sample(self, observe):
+        metadata, pipeline_stats = observe()
+        now = time.time()
+        covered = set(str(chunk_id) for chunk_id in metadata.get("trd_provenance", {}).get("chunk_ids", []))
+        waiting = [sent["sent_at"] for number, sent in list(self._sent.items()) if number not in covered]
+        backlog = self._backlog(pipeline_stats)
+        self._timeline.append({
+            "elapsed": round(now - self._started, 2),
+            "session_time": round((now - self._started) * self.speed, 2),
+            "chunks_sent": len(self._sent),
+            "chunks_transcribed": metadata.get("transcription_count", 0),
+            "trd_version": metadata.get("trd_version", 0),
+            "chunks_in_trd": len(covered),
+            "stale_chunks": len(waiting),
+            "staleness_seconds": round(now - min(waiting), 2) if waiting else 0.0,
+            "transcription_backlog": backlog["transcription"],
+            "trd_backlog": backlog["trd"]
+        })
+
+    def _replay(self, chunks: List[Dict[str, Any]], send, observe, wait_until_idle) -> bool:
+        stop = threading.Event()
+
+        def sampler():
+            while not stop.wait(self.sample_interval):
+                try:
+                    self._sample(observe)
+                except Exception as e:
+                    log.warning("Replay sample failed: %s", e)
+
+        self._started = time.time()
+        sampler_thread = threading.Thread(target=sampler, name="replay-sampler", daemon=True)
+        sampler_thread.start()
+        try:
+            for number, chunk in enumerate(chunks, start=1):
+                delay = self._started + chunk["offset"] / self.speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+                sent_at = time.time()
+                if send(chunk, number, number == len(chunks)):
+                    self._sent[str(number)] = {"source_chunk_id": chunk["chunk_id"], "offset": chunk["offset"],
+                                               "sent_at": sent_at}
+                else:
+                    self._failures += 1
+
+            idle = wait_until_idle(max(0.0, self._started + self.timeout - time.time()))
+        finally:
+            stop.set()
+            sampler_thread.join()
+        self._sample(observe)
+        return idle
+
+    def _build_result(self, source: Dict[str, Any], chunks: List[Dict[str, Any]], skipped: List[Dict[str, Any]],
+                      metadata: Dict[str, Any], idle: bool, data_dir: Optional[Path]) -> Dict[str, Any]:
+        first_versions: Dict[str, Dict[str, Any]] = {}
+        for version in metadata.get("trd_versions", []):
+            for chunk_id in version.get("new_chunk_ids", []):
+                first_versions.setdefault(str(chunk_id), version)
+
+        chunk_reports, chunk_to_trd = [], []
+        for number, sent in self._sent.items():
+            version = first_versions.get(number)
+            latency = None
+            if version:
+                latency = datetime.fromisoformat(version["generated_at"]).timestamp() - sent["sent_at"]
+                chunk_to_trd.append(latency)
+            chunk_reports.append({
+                "chunk": int(number),
+                "source_chunk_id": sent["source_chunk_id"],
+                "offset": round(sent["offset"], 2),
+                "sent_at": round(sent["sent_at"] - self._started, 2),
+                "first_trd_version": version["version"] if version else None,
+                "chunk_to_trd_seconds": round(latency, 3) if latency is not None else None
+            })
+
+        elapsed = time.time() - self._started
+        return {
+            "source": {
+                "project_id": self.project_id,
+                "name": source["name"],
+                "chunks": len(source["chunks"]),
+                "session_seconds": round(chunks[-1]["offset"], 2) if chunks else 0.0,
+                "timing": source["timing"],
+                "skipped": skipped
+            },
+            "config": {"speed": self.speed, "backend": None if self.target_url else self.backend,
+                       "sample_interval": self.sample_interval, "timeout": self.timeout},
+            "completed": idle,
+            "duration_seconds": round(elapsed, 3),
+            "data_dir": str(data_dir) if data_dir and self.keep_data else None,
+            "uploads": {"sent": len(self._sent), "failed": self._failures, "rejected": self._rejections},
+            "trd_versions": metadata.get("trd_version", 0),
+            "freshness": {
+                # Wall-clock seconds in this replay; multiply by speed to compare with the original
+                "chunk_to_trd": percentile_summary(chunk_to_trd),
+                "original_chunk_to_trd": percentile_summary(original_chunk_to_trd(source)),
+                "max_stale_chunks": max((sample["stale_chunks"] for sample in self._timeline), default=0),
+                "max_staleness_seconds": max((sample["staleness_seconds"] for sample in self._timeline), default=0.0)
+            },
+            "backlog": {
+                "max_transcription": max((sample["transcription_backlog"] for sample in self._timeline), default=0),
+                "max_trd": max((sample["trd_backlog"] for sample in self._timeline), default=0)
+            },
+            "chunks": chunk_reports,
+            "timeline": self._timeline
+        }
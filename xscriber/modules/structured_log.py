@@ -0,0 +1,237 @@
+import sys
+import copy
+import json
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from typing import Dict, Any, Optional, Union
+
+ROOT_LOGGER = "xscriber"
+
+# Fields attached to every record logged in the current thread or task
+_log_context: contextvars.ContextVar = contextvars.ContextVar("log_context", default={})
+
+# Attributes every LogRecord has; anything else on a record came from extra= or the context
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_configured_handler: Optional["BackgroundQueueHandler"] = None
+_configure_lock = threading.Lock()
+
+
+def get_logger(stage: str) -> logging.Logger:
+    """Logger for one pipeline stage (upload, transcription, trd, pipeline, storage, ...)"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{stage}")
+
+
+def chunk_correlation_id(project_id: str, chunk_file: Union[str, Path, int, None]) -> str:
+    """
+    Correlation id shared by every log line about one chunk, from its upload through
+    transcription and the TRD update; derived from the chunk so every process agrees on it.
+    chunk_file is the chunk number or its audio or transcription file.
+    """
+    if chunk_file is None:
+        return f"{project_id}:final"
+    chunk_id = chunk_file if isinstance(chunk_file, int) else Path(str(chunk_file)).stem.split('_')[-1]
+    return f"{project_id}:{chunk_id}"
+
+
+@contextmanager
+def log_context(**fields):
+    """Attach fields (project_id, correlation_id, job_id, ...) to records logged inside the block"""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def sampled(key: str, **fields) -> Dict[str, Any]:
+    """extra= for a high-volume message; LOG_SAMPLING decides how many of them are kept"""
+    return {"sample_key": key, **fields}
+
+
+def _parse_mapping(value: Union[str, Dict[str, Any], None]) -> Dict[str, str]:
+    # "trd=DEBUG,pipeline=WARNING" as set through the environment
+    if not value:
+        return {}
+    if isinstance(value, dict):
+        return {str(key): str(item) for key, item in value.items()}
+    pairs = (item.split("=", 1) for item in value.split(",") if "=" in item)
+    return {key.strip(): item.strip() for key, item in pairs}
+
+
+class ContextFilter(logging.Filter):
+    """Copies the log context and the stage (the logger name below xscriber.) onto the record"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in _log_context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        record.stage = record.name[len(ROOT_LOGGER) + 1:] if record.name.startswith(ROOT_LOGGER + ".") else record.name
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps one in N of the records logged with extra=sampled(key), N per key. Warnings
+    and errors are never sampled away. Kept records carry sample_every so readers can
+    scale counts back up.
+    """
+
+    def __init__(self, rates: Dict[str, int]):
+        super().__init__()
+        self.rates = rates
+        self.seen: Dict[str, int] = {}
+        self.suppressed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "sample_key", None)
+        every = self.rates.get(key, 1) if key else 1
+        if every <= 1 or record.levelno >= logging.WARNING:
+            return True
+
+        with self._lock:
+            seen = self.seen.get(key, 0)
+            self.seen[key] = seen + 1
+            if seen % every:
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                return False
+        record.sample_every = every
+        return True
+
+
+class StructuredFormatter(logging.Formatter):
+    """One JSON object per line, or a key=value line with format="text" """
+
+    def __init__(self, output_format: str = "json"):
+        super().__init__()
+        self.output_format = output_format
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "stage": getattr(record, "stage", record.name),
+            "msg": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key not in fields and key not in ("sample_key", "stage"):
+                fields[key] = value
+        exc_text = record.exc_text or (self.formatException(record.exc_info) if record.exc_info else None)
+        if exc_text:
+            fields["exc"] = exc_text
+
+        if self.output_format == "text":
+            extras = " ".join(f"{key}={value}" for key, value in fields.items()
+                              if key not in ("ts", "level", "stage", "msg", "exc"))
+            line = f"{fields['ts']} {fields['level']:<7} [{fields['stage']}] {fields['msg']}"
+            line = f"{line} {extras}" if extras else line
+            return f"{line}\n{exc_text}" if exc_text else line
+        return json.dumps(fields, default=str)
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """
+    Hands records to a bounded queue drained by a writer thread, so logging never waits
+    on stdout/stderr. The writer starts with the first record (importing the app starts
+    no threads). When the queue is full records are dropped and counted rather than
+    blocking the caller.
+    """
+
+    def __init__(self, target: logging.Handler, max_queue_size: int = 10000):
+        super().__init__(queue.Queue(maxsize=max_queue_size))
+        self.target = target
+        self.dropped = 0
+        self._listener: Optional[QueueListener] = None
+        self._listener_lock = threading.Lock()
+        self._stop_at_exit = False
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render the message and traceback here, while args and exc_info are still valid;
+        # the structured fields stay on the record for the writer thread to format
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self.target.formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self._listener is None:
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+                self._listener.start()
+                if not self._stop_at_exit:
+                    atexit.register(self.stop)
+                    self._stop_at_exit = True
+
+    def stop(self):
+        """Write out everything queued and stop the writer thread"""
+        with self._listener_lock:
+            if self._listener is not None:
+                self._listener.stop()
+                self._listener = None
+
+    def close(self):
+        self.stop()
+        super().close()
+
+
+def configure_logging(settings=None, stream=None) -> BackgroundQueueHandler:
+    """
+    Route the xscriber loggers through a BackgroundQueueHandler. Levels default to
+    LOG_LEVEL with per-stage overrides in LOG_LEVELS ("trd=DEBUG,pipeline=WARNING"),
+    LOG_SAMPLING ("chunk_progress=10") sets how many sampled messages of each kind are
+    kept, and LOG_FORMAT picks json or text. Calling it again reconfigures.
+    """
+    global _configured_handler
+    if settings is None:
+        from django.conf import settings
+
+    with _configure_lock:
+        root = logging.getLogger(ROOT_LOGGER)
+        if _configured_handler is not None:
+            root.removeHandler(_configured_handler)
+            _configured_handler.stop()
+
+        target = logging.StreamHandler(stream or sys.stderr)
+        target.setFormatter(StructuredFormatter(getattr(settings, 'LOG_FORMAT', 'json')))
+
+        handler = BackgroundQueueHandler(target, max_queue_size=getattr(settings, 'LOG_QUEUE_SIZE', 10000))
+        handler.addFilter(ContextFilter())
+        handler.addFilter(SamplingFilter({key: int(value) for key, value in
+                                          _parse_mapping(getattr(settings, 'LOG_SAMPLING', '')).items()}))
+
+        root.setLevel(getattr(settings, 'LOG_LEVEL', 'INFO').upper())
+        root.propagate = False
+        root.addHandler(handler)
+        for stage, level in _parse_mapping(getattr(settings, 'LOG_LEVELS', '')).items():
+            get_logger(stage).setLevel(level.upper())
+
+        _configured_handler = handler
+        return handler
+
+
+def get_log_stats() -> Dict[str, Any]:
+    """Records dropped on a full queue and sampled away, for the pipeline status"""
+    if _configured_handler is None:
+        return {"dropped": 0, "queued": 0, "suppressed": {}}
+    sampler = next(f for f in _configured_handler.filters if isinstance(f, SamplingFilter))
+    return {"dropped": _configured_handler.dropped, "queued": _configured_handler.queue.qsize(),
+            "suppressed": dict(sampler.suppressed)}
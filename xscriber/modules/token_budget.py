@@ -0,0 +1,196 @@
+import re
+import math
+from typing import Optional, Dict, List, Callable, Any
+
+from .structured_log import get_logger
+
+log = get_logger("trd")
+
+
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-3.5-turbo-16k": 16385,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-4.1-mini": 1047576,
+}
+
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# USD per million tokens as (input, output)
+MODEL_PRICING = {
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4": (30.00, 60.00),
+    "gpt-4-32k": (60.00, 120.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+}
+
+# USD per minute of audio
+AUDIO_PRICING = {
+    "whisper-1": 0.006,
+    "gpt-4o-transcribe": 0.006,
+    "gpt-4o-mini-transcribe": 0.003,
+}
+
+TRANSCRIPTION_SEPARATOR = "\n\n---\n\n"
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in text without a tokenizer.
+
+    Short words are usually a single token and longer words split roughly every
+    four characters; punctuation is counted as one token each. This tends to
+    slightly overestimate for English prose, which is the safe direction for
+    budgeting.
+    """
+    if not text:
+        return 0
+
+    tokens = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        tokens += max(1, math.ceil(len(piece) / 4))
+    return tokens
+
+
+def _lookup_model(table: Dict[str, Any], model: str) -> Optional[Any]:
+    if model in table:
+        return table[model]
+
+    # Dated snapshots such as gpt-4o-2024-08-06 share their base model's entry
+    for base_model in sorted(table, key=len, reverse=True):
+        if model.startswith(base_model):
+            return table[base_model]
+
+    return None
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """Estimated USD cost of a call, or None when the model has no known pricing"""
+    pricing = _lookup_model(MODEL_PRICING, model)
+    if pricing is None:
+        return None
+
+    input_price, output_price = pricing
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+def estimate_audio_cost(model: str, audio_seconds: float) -> Optional[float]:
+    """Estimated USD cost of transcribing audio_seconds, or None when the model has no known pricing"""
+    price_per_minute = _lookup_model(AUDIO_PRICING, model)
+    if price_per_minute is None:
+        return None
+    return audio_seconds / 60 * price_per_minute
+
+
+def estimate_message_tokens(messages: List[Dict[str, str]]) -> int:
+    # Each chat message carries a few tokens of role/formatting overhead,
+    # and the reply is primed with a few more.
+    return sum(estimate_tokens(message.get("content", "")) + 4 for message in messages) + 3
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = "start") -> str:
+    if max_tokens <= 0:
+        return ""
+
+    estimated = estimate_tokens(text)
+    if estimated <= max_tokens:
+        return text
+
+    chars = int(len(text) * max_tokens / estimated)
+    return text[:chars] if keep == "start" else text[-chars:]
+
+
+class TokenBudgetPlanner:
+    """
+    Plans prompt and completion sizes against a model's context window.
+    """
+
+    def __init__(self, model: str, context_window: Optional[int] = None, safety_margin: int = 256,
+                 min_completion_tokens: int = 256, summary_tokens: int = 800):
+        self.model = model
+        self.context_window = context_window or self.get_context_window(model)
+        self.safety_margin = safety_margin
+        self.min_completion_tokens = min_completion_tokens
+        self.summary_tokens = summary_tokens
+
+    @staticmethod
+    def get_context_window(model: str) -> int:
+        return _lookup_model(MODEL_CONTEXT_WINDOWS, model) or DEFAULT_CONTEXT_WINDOW
+
+    def remaining_tokens(self, prompt_tokens: int) -> int:
+        return self.context_window - self.safety_margin - prompt_tokens
+
+    def plan_max_tokens(self, messages: List[Dict[str, str]], desired_max_tokens: int) -> int:
+        """
+        Size max_tokens from what is left of the context window after the prompt.
+        """
+        remaining = self.remaining_tokens(estimate_message_tokens(messages))
+        if remaining < self.min_completion_tokens:
+            raise ValueError(
+                f"Prompt for {self.model} leaves only {remaining} tokens of a "
+                f"{self.context_window}-token context window"
+            )
+
+        return min(desired_max_tokens, remaining)
+
+    def fit_transcriptions(self, transcriptions: List[str], prompt_overhead_tokens: int, completion_tokens: int,
+                           summarize: Optional[Callable[[List[str], int], Optional[str]]] = None) -> List[str]:
+        """
+        Return the transcriptions that fit in the prompt alongside the given overhead
+        while still leaving room for completion_tokens of output.
+
+        The newest transcriptions are kept verbatim. Older ones that do not fit are
+        condensed with summarize (when given) or replaced with an omission note.
+        """
+        available = self.remaining_tokens(prompt_overhead_tokens) - completion_tokens
+        separator_tokens = estimate_tokens(TRANSCRIPTION_SEPARATOR)
+        costs = [estimate_tokens(text) + separator_tokens for text in transcriptions]
+
+        if sum(costs) <= available:
+            return list(transcriptions)
+
+        summary_budget = min(self.summary_tokens, max(available // 4, 0)) if summarize else 0
+        # Leave room for the omission/summary preamble itself
+        budget = available - summary_budget - 32
+
+        kept = []
+        used = 0
+        for text, cost in zip(reversed(transcriptions), reversed(costs)):
+            if used + cost > budget:
+                break
+            kept.insert(0, text)
+            used += cost
+
+        if not kept and transcriptions:
+            # Even the newest transcription alone overflows; keep its most recent part
+            kept = [truncate_to_tokens(transcriptions[-1], budget - separator_tokens, keep="end")]
+
+        overflow = transcriptions[:len(transcriptions) - len(kept)]
+        if not overflow:
+            return kept
+
+        preamble = None
+        if summarize and summary_budget > 0:
+            try:
+                summary = summarize(overflow, summary_budget)
+                if summary:
+                    preamble = (f"Summary of {len(overflow)} earlier transcription(s):\n"
+                                f"{truncate_to_tokens(summary, summary_budget)}")
+            except Exception as e:
+                log.warning("Failed to summarize earlier transcriptions: %s", e)
+
+        if preamble is None:
+            preamble = f"[{len(overflow)} earlier transcription(s) omitted to fit the model context window]"
+
+        return [preamble] + kept
@@ -1,26 +1,39 @@
 import os
 import json
+import time
+from datetime import datetime
 from typing import Optional, Dict, Any
 from pathlib import Path
 import openai
 from django.conf import settings
 
+from .metrics import STAGE_SECONDS, STAGE_ERRORS
+from .token_budget import estimate_audio_cost
+from .usage_accounting import record_usage
+from .chunk_trace import trace_span
+from .structured_log import get_logger
+
+log = get_logger("transcription")
+
 
 class WhisperTranscriber:
-    def __init__(self, api_key: Optional[str] = None, model: str = "whisper-1"):
+    def __init__(self, api_key: Optional[str] = None, model: str = "whisper-1", async_http_client=None):
         self.api_key = api_key or settings.OPENAI_API_KEY
         self.model = model
-        self.client = openai.OpenAI(api_key=self.api_key)
-
         if not self.api_key:
             raise ValueError("OpenAI API key is required")
 
+        self.client = openai.OpenAI(api_key=self.api_key)
+        self.async_client = openai.AsyncOpenAI(api_key=self.api_key, http_client=async_http_client)
+
     def transcribe(self, audio_file_path: str, language: Optional[str] = None) -> Dict[str, Any]:
         if not os.path.exists(audio_file_path):
             raise FileNotFoundError(f"Audio file not found: {audio_file_path}")
 
+        started = time.time()
         try:
-            with open(audio_file_path, "rb") as audio_file:
+            with open(audio_file_path, "rb") as audio_file, STAGE_SECONDS.time(stage="whisper_call"), \
+                    trace_span("whisper_call", model=self.model):
                 transcript = self.client.audio.transcriptions.create(
                     model=self.model,
                     file=audio_file,
@@ -28,43 +41,89 @@ class WhisperTranscriber:
                     response_format="verbose_json"
                 )
 
-            # Convert segments to serializable dictionaries if present
-            segments = []
-            if hasattr(transcript, 'segments') and transcript.segments:
-                for segment in transcript.segments:
-                    segments.append({
-                        "id": getattr(segment, 'id', None),
-                        "seek": getattr(segment, 'seek', None),
-                        "start": getattr(segment, 'start', None),
-                        "end": getattr(segment, 'end', None),
-                        "text": getattr(segment, 'text', ''),
-                        "tokens": getattr(segment, 'tokens', []),
-                        "temperature": getattr(segment, 'temperature', None),
-                        "avg_logprob": getattr(segment, 'avg_logprob', None),
-                        "compression_ratio": getattr(segment, 'compression_ratio', None),
-                        "no_speech_prob": getattr(segment, 'no_speech_prob', None)
-                    })
-
-            return {
-                "text": transcript.text,
-                "language": transcript.language,
-                "duration": transcript.duration,
-                "segments": segments
-            }
+            self._record_usage(started, transcript)
+            return self._build_transcription_result(transcript)
+        except Exception as e:
+            STAGE_ERRORS.inc(stage="whisper_call")
+            self._record_usage(started, error=True)
+            raise Exception(f"Transcription failed: {str(e)}")
+
+    async def atranscribe(self, audio_file_path: str, language: Optional[str] = None) -> Dict[str, Any]:
+        if not os.path.exists(audio_file_path):
+            raise FileNotFoundError(f"Audio file not found: {audio_file_path}")
+
+        started = time.time()
+        try:
+            with open(audio_file_path, "rb") as audio_file:
+                audio_bytes = audio_file.read()
+
+            with STAGE_SECONDS.time(stage="whisper_call"), trace_span("whisper_call", model=self.model):
+                transcript = await self.async_client.audio.transcriptions.create(
+                    model=self.model,
+                    file=(Path(audio_file_path).name, audio_bytes),
+                    language=language,
+                    response_format="verbose_json"
+                )
+
+            self._record_usage(started, transcript)
+            return self._build_transcription_result(transcript)
         except Exception as e:
+            STAGE_ERRORS.inc(stage="whisper_call")
+            self._record_usage(started, error=True)
             raise Exception(f"Transcription failed: {str(e)}")
 
+    def _record_usage(self, started: float, transcript=None, error: bool = False):
+        # Whisper is billed by audio duration, which verbose_json reports
+        audio_seconds = float(getattr(transcript, 'duration', 0) or 0)
+        record_usage({
+            "kind": "transcription",
+            "timestamp": datetime.now().isoformat(),
+            "model": self.model,
+            "audio_seconds": audio_seconds,
+            "latency_seconds": round(time.time() - started, 3),
+            "cached": False,
+            "error": error,
+            "estimated_cost": None if error else estimate_audio_cost(self.model, audio_seconds)
+        })
+
+    def _build_transcription_result(self, transcript) -> Dict[str, Any]:
+        # Convert segments to serializable dictionaries if present
+        segments = []
+        if hasattr(transcript, 'segments') and transcript.segments:
+            for segment in transcript.segments:
+                segments.append({
+                    "id": getattr(segment, 'id', None),
+                    "seek": getattr(segment, 'seek', None),
+                    "start": getattr(segment, 'start', None),
+                    "end": getattr(segment, 'end', None),
+                    "text": getattr(segment, 'text', ''),
+                    "tokens": getattr(segment, 'tokens', []),
+                    "temperature": getattr(segment, 'temperature', None),
+                    "avg_logprob": getattr(segment, 'avg_logprob', None),
+                    "compression_ratio": getattr(segment, 'compression_ratio', None),
+                    "no_speech_prob": getattr(segment, 'no_speech_prob', None)
+                })
+
+        return {
+            "text": transcript.text,
+            "language": transcript.language,
+            "duration": transcript.duration,
+            "segments": segments
+        }
+
     def save_transcription(self, transcription: Dict[str, Any], output_path: str) -> bool:
         try:
             output_dir = Path(output_path).parent
             output_dir.mkdir(parents=True, exist_ok=True)
 
-            with open(output_path, 'w', encoding='utf-8') as f:
+            with open(output_path, 'w', encoding='utf-8') as f, STAGE_SECONDS.time(stage="transcription_write"), \
+                    trace_span("transcription_write"):
                 json.dump(transcription, f, ensure_ascii=False, indent=2)
 
             return True
         except Exception as e:
-            print(f"Failed to save transcription: {str(e)}")
+            STAGE_ERRORS.inc(stage="transcription_write")
+            log.error("Failed to save transcription: %s", e)
             return False
 
     def transcribe_and_save(self, audio_file_path: str, output_path: str, language: Optional[str] = None) -> bool:
@@ -72,5 +131,13 @@ class WhisperTranscriber:
             transcription = self.transcribe(audio_file_path, language)
             return self.save_transcription(transcription, output_path)
         except Exception as e:
-            print(f"Transcribe and save failed: {str(e)}")
-            return False
\ No newline at end of file
+            log.error("Transcribe and save failed: %s", e)
+            return False
+
+    async def atranscribe_and_save(self, audio_file_path: str, output_path: str, language: Optional[str] = None) -> bool:
+        try:
+            transcription = await self.atranscribe(audio_file_path, language)
+            return self.save_transcription(transcription, output_path)
+        except Exception as e:
+            log.error("Transcribe and save failed: %s", e)
+            return False
@@ -0,0 +1,247 @@
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from typing import Optional, Dict, Any, Tuple
+
+
+TRD_TITLE = "Technical Requirements Document"
+
+# Section keys and their headings, in document order
+TRD_SECTIONS = [
+    ("overview", "Overview"),
+    ("requirements", "Requirements"),
+    ("technical_specs", "Technical Specifications"),
+    ("architecture", "Architecture"),
+    ("constraints", "Constraints"),
+    ("assumptions", "Assumptions"),
+    ("acceptance_criteria", "Acceptance Criteria"),
+    ("dependencies", "Dependencies"),
+]
+
+PLACEHOLDER = "To be defined"
+
+_SECTION_KEYS = {key for key, _ in TRD_SECTIONS}
+_SECTION_KEYS_BY_HEADING = {heading.lower(): key for key, heading in TRD_SECTIONS}
+
+# Level 1 and 2 headings; deeper headings are treated as section content
+_HEADING_PATTERN = re.compile(r"^#{1,2}[ \t]+(.+?)[ \t#]*$", re.MULTILINE)
+_FOOTER_PATTERN = re.compile(r"(?:^-{3,}[ \t]*\n\s*)?^\*Generated by X-Scriber on ([^*]+)\*\s*\Z", re.MULTILINE)
+
+_PARSE_CACHE_SIZE = 128
+_parse_cache: "OrderedDict[str, TRDDocument]" = OrderedDict()
+_parse_cache_lock = threading.Lock()
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+@dataclass
+class TRDDocument:
+    """
+    Structured form of a TRD: the eight ontology sections plus where the
+    document came from. version and provenance are tracked by ProjectHandler
+    in the project metadata; the markdown itself only carries the sections and
+    the generation timestamp.
+    """
+    sections: Dict[str, str] = field(default_factory=lambda: {key: "" for key, _ in TRD_SECTIONS})
+    generated_at: Optional[str] = None
+    version: int = 0
+    provenance: Dict[str, Any] = field(default_factory=dict)
+    content_hash: str = ""
+
+    def get_section(self, key: str) -> str:
+        return self.sections.get(key, "")
+
+    def is_defined(self, key: str) -> bool:
+        content = self.get_section(key).strip()
+        return bool(content) and content != PLACEHOLDER
+
+    def with_sections(self, updates: Dict[str, str]) -> "TRDDocument":
+        """Return a copy with the given sections replaced, leaving the others untouched"""
+        unknown = set(updates) - set(self.sections)
+        if unknown:
+            raise KeyError(f"Unknown TRD sections: {', '.join(sorted(unknown))}")
+
+        sections = dict(self.sections)
+        sections.update(updates)
+        return replace(self, sections=sections, provenance=dict(self.provenance), content_hash="")
+
+    def diff(self, other: "TRDDocument") -> Dict[str, Tuple[str, str]]:
+        """Sections whose content differs, mapped to (this content, other content)"""
+        changed = {}
+        for key, _ in TRD_SECTIONS:
+            before = self.get_section(key).strip()
+            after = other.get_section(key).strip()
+            if before != after:
+                changed[key] = (before, after)
+        return changed
+
+    def render(self, generated_at: Optional[str] = None) -> str:
+        timestamp = generated_at or self.generated_at or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        parts = [f"# {TRD_TITLE}\n"]
+        for key, heading in TRD_SECTIONS:
+            content = self.get_section(key).strip() or PLACEHOLDER
+            parts.append(f"## {heading}\n{content}\n")
+        parts.append(f"---\n*Generated by X-Scriber on {timestamp}*\n")
+
+        return "\n".join(parts)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "sections": dict(self.sections),
+            "generated_at": self.generated_at,
+            "version": self.version,
+            "provenance": dict(self.provenance),
+            "content_hash": self.content_hash
+        }
+
+
+def _parse(content: str) -> TRDDocument:
+    sections = {key: "" for key, _ in TRD_SECTIONS}
+
+    generated_at = None
+    body_end = len(content)
+    footer = _FOOTER_PATTERN.search(content)
+    if footer:
+        generated_at = footer.group(1).strip()
+        body_end = footer.start()
+
+    current_key = None
+    current_start = 0
+    for match in _HEADING_PATTERN.finditer(content, 0, body_end):
+        heading_key = _SECTION_KEYS_BY_HEADING.get(match.group(1).strip().lower())
+        is_title = match.group(1).strip().lower() == TRD_TITLE.lower()
+        if heading_key is None and not is_title:
+            continue
+
+        if current_key is not None:
+            sections[current_key] = content[current_start:match.start()].strip()
+
+        current_key = heading_key
+        current_start = match.end() + 1
+
+    if current_key is not None:
+        sections[current_key] = content[current_start:body_end].strip()
+
+    return TRDDocument(sections=sections, generated_at=generated_at, content_hash=content_hash(content))
+
+
+def parse_trd(content: str) -> TRDDocument:
+    """
+    Parse TRD markdown into a TRDDocument in a single pass over its headings.
+
+    Section headings are recognised at level 1 or 2 (so both "# Overview" and
+    "## Overview" work), case-insensitively. Results are cached by content hash;
+    callers always receive their own copy.
+    """
+    key = content_hash(content)
+
+    with _parse_cache_lock:
+        document = _parse_cache.get(key)
+        if document is not None:
+            _parse_cache.move_to_end(key)
+
+    if document is None:
+        document = _parse(content)
+        with _parse_cache_lock:
+            _parse_cache[key] = document
+            while len(_parse_cache) > _PARSE_CACHE_SIZE:
+                _parse_cache.popitem(last=False)
+
+    return replace(document, sections=dict(document.sections), provenance=dict(document.provenance))
+
+
+class TRDPatchError(ValueError):
+    pass
+
+
+PATCH_OPERATIONS = ("add", "replace", "remove")
+
+_ITEM_MARKER_PATTERN = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+")
+
+
+def _normalize_item(text: str) -> str:
+    return " ".join(_ITEM_MARKER_PATTERN.sub("", text).split()).lower()
+
+
+def _find_item_line(lines, item: str) -> int:
+    target = _normalize_item(item)
+    for index, line in enumerate(lines):
+        if line.strip() and _normalize_item(line) == target:
+            return index
+    return -1
+
+
+def _validate_operation(operation: Any, index: int):
+    if not isinstance(operation, dict):
+        raise TRDPatchError(f"Operation {index} is not an object")
+
+    op = operation.get("op")
+    if op not in PATCH_OPERATIONS:
+        raise TRDPatchError(f"Operation {index} has unknown op {op!r}")
+
+    if operation.get("section") not in _SECTION_KEYS:
+        raise TRDPatchError(f"Operation {index} targets unknown section {operation.get('section')!r}")
+
+    required = ("old", "new") if op == "replace" else ("item",)
+    for name in required:
+        value = operation.get(name)
+        if not isinstance(value, str) or not value.strip():
+            raise TRDPatchError(f"Operation {index} ({op}) is missing '{name}'")
+
+
+def apply_trd_patch(document: TRDDocument, operations: Any) -> TRDDocument:
+    """
+    Apply section-level edit operations and return the patched document.
+
+    Operations:
+      {"op": "add", "section": "requirements", "item": "New requirement"}
+      {"op": "replace", "section": "requirements", "old": "Existing item", "new": "Revised item"}
+      {"op": "remove", "section": "requirements", "item": "Existing item"}
+
+    Items are matched line by line, ignoring bullet markers, case and extra
+    whitespace. The whole patch is validated before anything is applied, and any
+    invalid operation or missing target raises TRDPatchError.
+    """
+    if not isinstance(operations, list):
+        raise TRDPatchError("Patch operations must be a list")
+
+    for index, operation in enumerate(operations):
+        _validate_operation(operation, index)
+
+    section_lines = {}
+    for index, operation in enumerate(operations):
+        key = operation["section"]
+        if key not in section_lines:
+            content = document.get_section(key).strip()
+            section_lines[key] = [] if content in ("", PLACEHOLDER) else content.split("\n")
+        lines = section_lines[key]
+
+        op = operation["op"]
+        if op == "add":
+            item = operation["item"].strip()
+            if _find_item_line(lines, item) == -1:
+                lines.append(item if _ITEM_MARKER_PATTERN.match(item) else f"- {item}")
+            continue
+
+        target = operation["old"] if op == "replace" else operation["item"]
+        line_index = _find_item_line(lines, target)
+        if line_index == -1:
+            raise TRDPatchError(f"Operation {index} ({op}) target not found in {key}: {target!r}")
+
+        if op == "replace":
+            # Keep the original bullet marker and indentation
+            marker = _ITEM_MARKER_PATTERN.match(lines[line_index])
+            new_text = _ITEM_MARKER_PATTERN.sub("", operation["new"].strip())
+            lines[line_index] = (marker.group(0) if marker else "") + new_text
+        else:
+            del lines[line_index]
+
+    return document.with_sections({
+        key: "\n".join(lines) if lines else PLACEHOLDER for key, lines in section_lines.items()
+    })
@@ -0,0 +1,162 @@
+import os
+import json
+import uuid
+import asyncio
+from typing import Dict, List, Optional, Any, Callable
+from pathlib import Path
+from datetime import datetime
+
+from .structured_log import get_logger
+
+log = get_logger("trd")
+
+
+class TRDRegenerationJob:
+    """
+    Regenerates the TRD of many projects with a concurrency limit.
+
+    Progress is checkpointed to data/regeneration_jobs/{job_id}.json after every
+    project, so an interrupted job can be resumed and only the projects that had
+    not finished are regenerated again. Projects run on the ProjectHandler's
+    pipeline loop and take the same per-project lock as live TRD updates.
+    """
+
+    PENDING = "pending"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+    def __init__(self, project_handler, job_id: Optional[str] = None, concurrency: int = 4,
+                 bypass_cache: bool = False):
+        self.project_handler = project_handler
+        self.jobs_dir = Path(project_handler.data_dir) / 'regeneration_jobs'
+        self.job_id = job_id or datetime.now().strftime("%Y%m%d_%H%M%S_") + str(uuid.uuid4())[:4]
+        self.concurrency = max(1, concurrency)
+        self.bypass_cache = bypass_cache
+        self.state: Dict[str, Any] = {}
+
+    @property
+    def checkpoint_file(self) -> Path:
+        return self.jobs_dir / f"{self.job_id}.json"
+
+    @staticmethod
+    def select_projects(project_handler, project_ids: Optional[List[str]] = None,
+                        name_contains: Optional[str] = None,
+                        updated_before: Optional[str] = None) -> List[str]:
+        """Project ids to regenerate, oldest first; filters are combined"""
+        selected = []
+        for metadata in reversed(project_handler.list_projects()):
+            project_id = metadata.get("project_id")
+            if project_ids and project_id not in project_ids:
+                continue
+            if name_contains and name_contains.lower() not in metadata.get("name", "").lower():
+                continue
+            if updated_before and metadata.get("last_updated", "") >= updated_before:
+                continue
+            selected.append(project_id)
+        return selected
+
+    def estimate(self, project_ids: List[str]) -> Dict[str, Any]:
+        """Dry-run token and cost estimate for regenerating the given projects"""
+        projects = {}
+        totals = {"prompt_tokens": 0, "completion_tokens": 0, "estimated_cost": 0.0, "skipped": 0}
+
+        for project_id in project_ids:
+            try:
+                estimate = self.project_handler.estimate_trd_regeneration(project_id)
+            except Exception as e:
+                log.warning("Error estimating regeneration for project %s: %s", project_id, e)
+                estimate = None
+
+            projects[project_id] = estimate
+            if estimate is None:
+                totals["skipped"] += 1
+                continue
+
+            totals["prompt_tokens"] += estimate["prompt_tokens"]
+            totals["completion_tokens"] += estimate["completion_tokens"]
+            if estimate["estimated_cost"] is None:
+                totals["estimated_cost"] = None
+            elif totals["estimated_cost"] is not None:
+                totals["estimated_cost"] += estimate["estimated_cost"]
+
+        return {"projects": projects, "totals": totals}
+
+    def create(self, project_ids: List[str], options: Optional[Dict[str, Any]] = None):
+        self.state = {
+            "job_id": self.job_id,
+            "created_at": datetime.now().isoformat(),
+            "updated_at": datetime.now().isoformat(),
+            "options": options or {},
+            "projects": {project_id: {"status": self.PENDING} for project_id in project_ids}
+        }
+        self._save_checkpoint()
+
+    def load(self) -> bool:
+        if not self.checkpoint_file.exists():
+            return False
+
+        try:
+            with open(self.checkpoint_file, 'r') as f:
+                self.state = json.load(f)
+            return True
+        except Exception as e:
+            log.warning("Error reading regeneration checkpoint %s: %s", self.checkpoint_file, e)
+            return False
+
+    def _save_checkpoint(self):
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self.state["updated_at"] = datetime.now().isoformat()
+
+        temp_file = self.jobs_dir / f".{self.job_id}.json.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(temp_file, self.checkpoint_file)
+
+    def get_summary(self) -> Dict[str, int]:
+        summary = {self.PENDING: 0, self.COMPLETED: 0, self.FAILED: 0}
+        for project in self.state.get("projects", {}).values():
+            summary[project["status"]] = summary.get(project["status"], 0) + 1
+        return summary
+
+    def remaining_projects(self, retry_failed: bool = False) -> List[str]:
+        statuses = {self.PENDING, self.FAILED} if retry_failed else {self.PENDING}
+        return [project_id for project_id, project in self.state.get("projects", {}).items()
+                if project["status"] in statuses]
+
+    def run(self, retry_failed: bool = False,
+            on_progress: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, int]:
+        """Regenerate every remaining project and return the job summary"""
+        self.project_handler.pipeline.run(self._arun(self.remaining_projects(retry_failed), on_progress))
+        return self.get_summary()
+
+    async def _arun(self, project_ids: List[str], on_progress):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def regenerate(project_id: str):
+            async with semaphore:
+                started_at = datetime.now()
+                try:
+                    async with self.project_handler.pipeline.project_lock(project_id):
+                        success = await self.project_handler._aupdate_trd_document_comprehensive(
+                            project_id, self.bypass_cache
+                        )
+                    error = None if success else "Regeneration produced no TRD"
+                except Exception as e:
+                    success, error = False, str(e)
+
+                result = {
+                    "status": self.COMPLETED if success else self.FAILED,
+                    "finished_at": datetime.now().isoformat(),
+                    "duration_seconds": round((datetime.now() - started_at).total_seconds(), 2)
+                }
+                if error:
+                    result["error"] = error
+
+                # Checkpoint after every project so an interruption loses at most the in-flight ones
+                self.state["projects"][project_id] = result
+                self._save_checkpoint()
+
+                if on_progress:
+                    on_progress(project_id, result)
+
+        await asyncio.gather(*(regenerate(project_id) for project_id in project_ids))
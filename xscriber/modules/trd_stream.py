@@ -0,0 +1,231 @@
+import os
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Set
+
+from .structured_log import get_logger
+
+log = get_logger("trd_stream")
+
+
+class TRDStreamBroker:
+    """
+    Fan-out of partial TRD content to stream subscribers.
+
+    Each project has a current generation: a new generation starts when a TRD
+    regeneration begins, grows as tokens arrive, and is marked done once the
+    final document has been committed to disk. Subscribers block on a condition
+    variable and receive whatever changed since they last looked, so a slow
+    reader coalesces many tokens into one update instead of falling behind.
+    Appended tokens are buffered and only joined into the content when it is
+    read or written, rather than rebuilding the document for every token.
+
+    With a state_dir, stream state is also mirrored to one JSON file per project
+    so that subscribers in other processes (web servers, when the pipeline runs
+    in run_pipeline workers) can follow generations too. File writes are
+    throttled to one per write_interval while a generation is in progress.
+    Appended tokens never touch the disk themselves: a writer thread mirrors the
+    projects they changed every write_interval, so append() is safe to call from
+    the pipeline's event loop.
+    """
+
+    def __init__(self, state_dir=None, write_interval: float = 0.25, poll_interval: float = 0.25):
+        self._condition = threading.Condition()
+        self._streams: Dict[str, Dict[str, Any]] = {}
+        self._pending: Dict[str, List[str]] = {}
+        self._last_written: Dict[str, float] = {}
+        # Projects with appended tokens not yet mirrored to disk, and the writer thread
+        # that mirrors them
+        self._dirty: Set[str] = set()
+        self._dirty_event = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        # Serialises file writes; _written_at keeps an older snapshot from replacing a newer one
+        self._file_lock = threading.Lock()
+        self._written_at: Dict[str, float] = {}
+        self.state_dir = Path(state_dir) if state_dir else None
+        self.write_interval = write_interval
+        self.poll_interval = poll_interval
+
+        if self.state_dir:
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+
+    def _state_file(self, project_id: str) -> Path:
+        return self.state_dir / f"{project_id}_stream.json"
+
+    def _flush_pending(self, project_id: str):
+        pending = self._pending.pop(project_id, None)
+        if pending:
+            self._streams[project_id]["content"] += "".join(pending)
+
+    def _write_state(self, project_id: str, stream: Dict[str, Any], force: bool = False):
+        if not self.state_dir:
+            return
+
+        now = time.time()
+        if not force and now - self._last_written.get(project_id, 0) < self.write_interval:
+            return
+        self._last_written[project_id] = now
+        self._dirty.discard(project_id)
+        self._flush_pending(project_id)
+        self._dump_state(project_id, stream)
+
+    def _dump_state(self, project_id: str, stream: Dict[str, Any]):
+        with self._file_lock:
+            # Skip snapshots overtaken by a later write or taken before the stream was discarded
+            if project_id not in self._streams or stream.get("updated_at", 0) < self._written_at.get(project_id, 0):
+                return
+            state_file = self._state_file(project_id)
+            temp_file = self.state_dir / f".{project_id}_stream.json.{os.getpid()}.tmp"
+            try:
+                with open(temp_file, 'w') as f:
+                    json.dump(stream, f)
+                os.replace(temp_file, state_file)
+                self._written_at[project_id] = stream.get("updated_at", 0)
+            except Exception as e:
+                log.warning("Failed to write TRD stream state for %s: %s", project_id, e)
+
+    def _mark_dirty(self, project_id: str):
+        if not self.state_dir:
+            return
+        self._dirty.add(project_id)
+        self._dirty_event.set()
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_dirty, name="trd-stream-writer", daemon=True)
+            self._writer.start()
+
+    def _write_dirty(self):
+        while True:
+            self._dirty_event.wait()
+            # Tokens appended within one write_interval go out in one write
+            time.sleep(self.write_interval)
+            with self._condition:
+                self._dirty_event.clear()
+                dirty, self._dirty = self._dirty, set()
+                snapshots = []
+                for project_id in dirty:
+                    self._flush_pending(project_id)
+                    snapshots.append((project_id, dict(self._streams[project_id])))
+            for project_id, stream in snapshots:
+                self._dump_state(project_id, stream)
+
+    def _read_state(self, project_id: str) -> Optional[Dict[str, Any]]:
+        # Prefer whichever of the in-memory and on-disk state is newer
+        self._flush_pending(project_id)
+        stream = self._streams.get(project_id)
+        if not self.state_dir:
+            return stream
+
+        try:
+            with open(self._state_file(project_id), 'r') as f:
+                on_disk = json.load(f)
+        except (OSError, ValueError):
+            return stream
+
+        if stream is None or on_disk.get("updated_at", 0) > stream.get("updated_at", 0):
+            return on_disk
+        return stream
+
+    def start(self, project_id: str):
+        with self._condition:
+            previous = self._read_state(project_id)
+            self._pending.pop(project_id, None)
+            self._streams[project_id] = {
+                "generation": (previous["generation"] + 1) if previous else 1,
+                "content": "",
+                "done": False,
+                "updated_at": time.time()
+            }
+            self._write_state(project_id, self._streams[project_id], force=True)
+            self._condition.notify_all()
+
+    def _current_stream(self, project_id: str) -> Dict[str, Any]:
+        stream = self._streams.get(project_id)
+        if stream is None or stream["done"]:
+            self._pending.pop(project_id, None)
+            self._streams[project_id] = stream = {
+                "generation": (stream["generation"] + 1) if stream else 1,
+                "content": "",
+                "done": False
+            }
+        return stream
+
+    def publish(self, project_id: str, content: str):
+        """Replace the content of the project's current generation"""
+        with self._condition:
+            stream = self._current_stream(project_id)
+            self._pending.pop(project_id, None)
+            stream["content"] = content
+            stream["updated_at"] = time.time()
+            self._write_state(project_id, stream)
+            self._condition.notify_all()
+
+    def append(self, project_id: str, delta: str):
+        """Add newly generated text to the project's current generation"""
+        with self._condition:
+            stream = self._current_stream(project_id)
+            self._pending.setdefault(project_id, []).append(delta)
+            stream["updated_at"] = time.time()
+            self._mark_dirty(project_id)
+            self._condition.notify_all()
+
+    def complete(self, project_id: str, content: str):
+        with self._condition:
+            stream = self._streams.setdefault(project_id, {"generation": 1})
+            self._pending.pop(project_id, None)
+            stream["content"] = content
+            stream["done"] = True
+            stream["updated_at"] = time.time()
+            self._write_state(project_id, stream, force=True)
+            self._condition.notify_all()
+
+    def get_state(self, project_id: str) -> Optional[Dict[str, Any]]:
+        with self._condition:
+            stream = self._read_state(project_id)
+            return dict(stream) if stream else None
+
+    def wait_for_update(self, project_id: str, generation: int, sent_length: int, done: bool,
+                        timeout: float = 15.0) -> Optional[Dict[str, Any]]:
+        """
+        Block until the project's stream differs from what the caller has seen.
+        Returns a snapshot of the stream state, or None if the timeout expires.
+        """
+        def changed_state():
+            stream = self._read_state(project_id)
+            if stream is None:
+                return None
+            if (stream["generation"] != generation or
+                    len(stream["content"]) != sent_length or
+                    stream["done"] != done):
+                return stream
+            return None
+
+        deadline = time.time() + timeout
+        with self._condition:
+            while True:
+                stream = changed_state()
+                if stream is not None:
+                    return dict(stream)
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                # Without a state_dir only this process can publish, so wait for a notify;
+                # otherwise wake periodically to look for updates written by other processes
+                self._condition.wait(min(remaining, self.poll_interval) if self.state_dir else remaining)
+
+    def discard(self, project_id: str):
+        with self._condition:
+            self._streams.pop(project_id, None)
+            self._pending.pop(project_id, None)
+            self._last_written.pop(project_id, None)
+            self._dirty.discard(project_id)
+            if self.state_dir:
+                with self._file_lock:
+                    self._written_at.pop(project_id, None)
+                    try:
+                        self._state_file(project_id).unlink()
+                    except FileNotFoundError:
+                        pass
+            self._condition.notify_all()
@@ -0,0 +1,107 @@
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+
+
+# Usage records collected by active track_usage() blocks in the current thread or task
+_usage_trackers: contextvars.ContextVar = contextvars.ContextVar("usage_trackers", default=())
+
+
+@contextmanager
+def track_usage():
+    """
+    Collect a usage record for every API call made inside the block, by the
+    transcriber or the chat processor, in this thread or task.
+
+        with track_usage() as usage_records:
+            await transcriber.atranscribe_and_save(...)
+    """
+    records = []
+    token = _usage_trackers.set(_usage_trackers.get() + (records,))
+    try:
+        yield records
+    finally:
+        _usage_trackers.reset(token)
+
+
+def record_usage(record: Dict[str, Any]):
+    for records in _usage_trackers.get():
+        records.append(record)
+
+
+def empty_bucket() -> Dict[str, Any]:
+    return {
+        "calls": 0,
+        "cached_calls": 0,
+        "errors": 0,
+        "audio_seconds": 0.0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "latency_seconds": 0.0,
+        "cost": 0.0,
+        # What cache hits would have cost had they gone to the API
+        "saved_cost": 0.0,
+        # Calls to models without known pricing; their cost is not in "cost"
+        "unpriced_calls": 0
+    }
+
+
+def add_to_bucket(bucket: Dict[str, Any], record: Dict[str, Any]):
+    """
+    Add one call to an aggregate. Tokens and audio count only for calls that reached
+    the API; cache hits are counted separately with the spend they avoided.
+    """
+    bucket["calls"] += 1
+    bucket["latency_seconds"] = round(bucket["latency_seconds"] + record.get("latency_seconds", 0.0), 3)
+    cost = record.get("estimated_cost")
+
+    if record.get("error"):
+        bucket["errors"] += 1
+        return
+    if record.get("cached"):
+        bucket["cached_calls"] += 1
+        if cost:
+            bucket["saved_cost"] = round(bucket["saved_cost"] + cost, 6)
+        return
+
+    bucket["audio_seconds"] = round(bucket["audio_seconds"] + (record.get("audio_seconds") or 0.0), 3)
+    bucket["prompt_tokens"] += record.get("prompt_tokens", 0)
+    bucket["completion_tokens"] += record.get("completion_tokens", 0)
+    if cost is None:
+        bucket["unpriced_calls"] += 1
+    else:
+        bucket["cost"] = round(bucket["cost"] + cost, 6)
+
+
+def merge_buckets(target: Dict[str, Any], source: Dict[str, Any]):
+    for key, value in source.items():
+        total = target.get(key, 0) + value
+        target[key] = round(total, 6) if isinstance(total, float) else total
+
+
+def aggregate_usage(usage: Optional[Dict[str, Any]], records: List[Dict[str, Any]],
+                    operation: str) -> Dict[str, Any]:
+    """
+    Fold call records into a project's usage summary: running totals plus buckets per
+    day (of the call), per operation (transcription, trd_patch, ...) and per model.
+    """
+    usage = usage or {"totals": empty_bucket(), "daily": {}, "by_operation": {}, "by_model": {}}
+    for record in records:
+        day = (record.get("timestamp") or datetime.now().isoformat())[:10]
+        add_to_bucket(usage["totals"], record)
+        add_to_bucket(usage["daily"].setdefault(day, empty_bucket()), record)
+        add_to_bucket(usage["by_operation"].setdefault(operation, empty_bucket()), record)
+        add_to_bucket(usage["by_model"].setdefault(record.get("model", "unknown"), empty_bucket()), record)
+    return usage
+
+
+def usage_ratios(totals: Dict[str, Any], trd_versions: int) -> Dict[str, Optional[float]]:
+    """Unit costs for comparing chunking and regeneration policies"""
+    audio_minutes = totals["audio_seconds"] / 60
+    return {
+        "audio_minutes": round(audio_minutes, 3),
+        "cost_per_trd_version": round(totals["cost"] / trd_versions, 6) if trd_versions else None,
+        "cost_per_audio_minute": round(totals["cost"] / audio_minutes, 6) if audio_minutes else None,
+        "cache_hit_rate": round(totals["cached_calls"] / totals["calls"], 4) if totals["calls"] else None
+    }
@@ -0,0 +1,100 @@
+import wave
+import shutil
+import tempfile
+from pathlib import Path
+from django.test import TestCase
+from xscriber.modules.audio_stream import (SessionAudioIndex, RangeNotSatisfiable, WAV_HEADER_SIZE,
+                                           parse_range_header, read_wav_layout)
+
+
+def write_wav(path, frames, sample_rate=16000, channels=1, fill=b"\x01\x00"):
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(fill * channels * frames)
+
+
+class RangeHeaderTests(TestCase):
+    def test_parse_range_header(self):
+        self.assertIsNone(parse_range_header(None, 100))
+        self.assertEqual(parse_range_header("bytes=0-9", 100), (0, 9))
+        self.assertEqual(parse_range_header("bytes=90-", 100), (90, 99))
+        self.assertEqual(parse_range_header("bytes=-10", 100), (90, 99))
+        self.assertEqual(parse_range_header("bytes=50-500", 100), (50, 99))
+        # Multiple ranges are answered with the whole resource
+        self.assertIsNone(parse_range_header("bytes=0-1,5-6", 100))
+
+        for header in ("bytes=100-", "bytes=9-5", "bytes=-0"):
+            with self.assertRaises(RangeNotSatisfiable):
+                parse_range_header(header, 100)
+
+
+class SessionAudioIndexTests(TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.audio_dir = self.temp_dir / 'audio-recordings'
+        self.audio_dir.mkdir()
+        self.index = SessionAudioIndex(self.temp_dir / 'audio_index')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_read_wav_layout(self):
+        path = self.audio_dir / "proj1_audiochunk_1.wav"
+        write_wav(path, 16000)
+
+        layout = read_wav_layout(path)
+        self.assertEqual((layout["channels"], layout["sample_rate"], layout["sample_width"]), (1, 16000, 2))
+        self.assertEqual((layout["data_offset"], layout["data_length"]), (44, 32000))
+
+    def test_index_orders_chunks_numerically_and_skips_unplayable(self):
+        write_wav(self.audio_dir / "proj1_audiochunk_10.wav", 8000)
+        write_wav(self.audio_dir / "proj1_audiochunk_2.wav", 16000)
+        write_wav(self.audio_dir / "proj1_audiochunk_3.wav", 100, sample_rate=44100)
+        (self.audio_dir / "proj1_audiochunk_4.webm").write_bytes(b"webm")
+        write_wav(self.audio_dir / "proj10_audiochunk_1.wav", 100)
+
+        index = self.index.refresh("proj1", self.audio_dir)
+        self.assertEqual([(c["chunk_id"], c["start_time"], c["byte_start"]) for c in index["chunks"]],
+                         [(2, 0.0, WAV_HEADER_SIZE), (10, 1.0, WAV_HEADER_SIZE + 32000)])
+        self.assertEqual(index["duration"], 1.5)
+        self.assertEqual(index["size"], WAV_HEADER_SIZE + 48000)
+        self.assertEqual([s["chunk_id"] for s in index["skipped"]], [3, 4])
+
+        self.assertEqual(SessionAudioIndex.session_time(index, 10, 0.25), 1.25)
+        self.assertIsNone(SessionAudioIndex.session_time(index, 3))
+        self.assertEqual(SessionAudioIndex.byte_offset(index, 1.25), WAV_HEADER_SIZE + 40000)
+
+    def test_refresh_reuses_unchanged_entries(self):
+        write_wav(self.audio_dir / "proj1_audiochunk_1.wav", 1600)
+        self.index.refresh("proj1", self.audio_dir)
+
+        index_file = self.temp_dir / 'audio_index' / 'proj1_audio_index.json'
+        mtime = index_file.stat().st_mtime_ns
+        self.assertEqual(len(self.index.refresh("proj1", self.audio_dir)["chunks"]), 1)
+        self.assertEqual(index_file.stat().st_mtime_ns, mtime)
+
+        write_wav(self.audio_dir / "proj1_audiochunk_2.wav", 1600)
+        self.assertEqual(len(self.index.refresh("proj1", self.audio_dir)["chunks"]), 2)
+
+        self.index.discard("proj1")
+        self.assertFalse(index_file.exists())
+
+    def test_session_bytes_form_one_wav(self):
+        write_wav(self.audio_dir / "proj1_audiochunk_1.wav", 1000, fill=b"\x01\x00")
+        write_wav(self.audio_dir / "proj1_audiochunk_2.wav", 500, fill=b"\x02\x00")
+        index = self.index.refresh("proj1", self.audio_dir)
+
+        session_file = self.temp_dir / "session.wav"
+        session_file.write_bytes(b"".join(
+            SessionAudioIndex.iter_session_bytes(index, self.audio_dir, 0, index["size"] - 1, block_size=300)))
+        with wave.open(str(session_file), 'rb') as f:
+            self.assertEqual(f.getnframes(), 1500)
+            frames = f.readframes(1500)
+        self.assertEqual(frames, b"\x01\x00" * 1000 + b"\x02\x00" * 500)
+
+        # A range straddling the chunk boundary
+        boundary = WAV_HEADER_SIZE + 2000
+        middle = b"".join(SessionAudioIndex.iter_session_bytes(index, self.audio_dir, boundary - 2, boundary + 1))
+        self.assertEqual(middle, b"\x01\x00\x02\x00")
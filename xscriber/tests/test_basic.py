@@ -1,5 +1,18 @@
+import os
+import sys
+import json
+import wave
+import shutil
+import tempfile
+import subprocess
+from pathlib import Path
+from django.conf import settings
+from unittest.mock import patch
 from django.test import TestCase, Client
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
+from xscriber import views
+from xscriber.modules.audio_stream import SessionAudioIndex
 
 
 class BasicViewTests(TestCase):
@@ -23,4 +36,165 @@ class BasicViewTests(TestCase):
             content_type='application/json'
         )
         self.assertEqual(response.status_code, 200)
-        self.assertIn('project_id', response.json())
\ No newline at end of file
+        self.assertIn('project_id', response.json())
+
+
+class UploadBackpressureTests(TestCase):
+    def test_upload_rejected_with_retry_after_when_backlogged(self):
+        rejection = {"admitted": False, "reason": "transcription_backlog", "retry_after": 12, "backlog": 30}
+        with patch.object(views.project_handler, 'check_upload_admission', return_value=rejection), \
+             patch.object(views.project_handler, '_queue_transcription') as mock_queue:
+            response = Client().post(reverse('xscriber:upload_audio_chunk'), {
+                'project_id': 'proj1',
+                'audio_chunk': SimpleUploadedFile('chunk.webm', b'audio', content_type='audio/webm')
+            })
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '12')
+        self.assertEqual(response.json()['reason'], 'transcription_backlog')
+        mock_queue.assert_not_called()
+
+    def test_upload_writes_to_handler_audio_dir(self):
+        audio_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, audio_dir, ignore_errors=True)
+        (audio_dir / 'proj1_audiochunk_4.wav').write_bytes(b'earlier')
+        admitted = {"admitted": True}
+        with patch.object(views.project_handler, 'audio_dir', audio_dir), \
+             patch.object(views.project_handler, 'check_upload_admission', return_value=admitted), \
+             patch.object(views.project_handler, '_audio_decoder', None), \
+             patch('builtins.__import__', side_effect=self._without_pydub), \
+             patch.object(views.project_handler, '_queue_transcription') as mock_queue:
+            response = Client().post(reverse('xscriber:upload_audio_chunk'), {
+                'project_id': 'proj1',
+                'audio_chunk': SimpleUploadedFile('chunk.webm', b'audio', content_type='audio/webm')
+            })
+
+        self.assertEqual(response.json()['chunk_number'], 5)
+        self.assertEqual(mock_queue.call_args.args[1], str(audio_dir.resolve() / 'proj1_audiochunk_5.webm'))
+        self.assertEqual((audio_dir / 'proj1_audiochunk_5.webm').read_bytes(), b'audio')
+
+    _real_import = __import__
+
+    @classmethod
+    def _without_pydub(cls, name, *args, **kwargs):
+        # Decoding falls back to storing the WebM upload as is
+        if name == 'pydub':
+            raise ImportError(name)
+        return cls._real_import(name, *args, **kwargs)
+
+
+class MetricsEndpointTests(TestCase):
+    def test_metrics_exposes_stage_latency_and_queue_gauges(self):
+        views.metrics.STAGE_SECONDS.observe(0.2, stage="decode")
+
+        response = Client().get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+        body = response.content.decode('utf-8')
+        self.assertIn('# TYPE xscriber_stage_duration_seconds histogram', body)
+        self.assertIn('xscriber_stage_duration_seconds_count{stage="decode"}', body)
+        self.assertIn('xscriber_pipeline_queue_depth{stage="transcription"}', body)
+        self.assertIn('# TYPE xscriber_chunk_to_trd_seconds histogram', body)
+
+
+class AudioPlaybackTests(TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        for chunk_id, fill in ((1, b"\x01\x00"), (2, b"\x02\x00")):
+            with wave.open(str(self.temp_dir / f"proj1_audiochunk_{chunk_id}.wav"), 'wb') as f:
+                f.setnchannels(1)
+                f.setsampwidth(2)
+                f.setframerate(16000)
+                f.writeframes(fill * 16000)
+
+        patchers = [patch.object(views.project_handler, 'audio_dir', self.temp_dir),
+                    patch.object(views.project_handler, 'audio_index', SessionAudioIndex(self.temp_dir / 'index'))]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_chunk_supports_range_requests(self):
+        url = reverse('xscriber:audio_chunk', args=['proj1', 1])
+
+        response = Client().get(url)
+        self.assertEqual((response.status_code, response['Content-Length'], response['Accept-Ranges']),
+                         (200, str(44 + 32000), 'bytes'))
+
+        response = Client().get(url, HTTP_RANGE='bytes=44-47')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 44-47/{44 + 32000}')
+        self.assertEqual(b"".join(response.streaming_content), b"\x01\x00\x01\x00")
+
+        self.assertEqual(Client().get(url, HTTP_RANGE='bytes=99999-').status_code, 416)
+        self.assertEqual(Client().get(reverse('xscriber:audio_chunk', args=['proj1', 9])).status_code, 404)
+
+    def test_session_stream_seeks_across_chunks(self):
+        seek = Client().get(reverse('xscriber:session_audio_index', args=['proj1']),
+                            {'chunk_id': 2, 't': 0.5}).json()['seek']
+        self.assertEqual(seek, {'session_time': 1.5, 'byte_offset': 44 + 48000})
+
+        response = Client().get(reverse('xscriber:session_audio', args=['proj1']),
+                                HTTP_RANGE=f"bytes={seek['byte_offset']}-{seek['byte_offset'] + 3}")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f"bytes 48044-48047/{44 + 64000}")
+        self.assertEqual(b"".join(response.streaming_content), b"\x02\x00\x02\x00")
+
+
+class StartupTests(TestCase):
+    # Budgets for a cold process; see "Startup" in the README
+    VIEWS_IMPORT_BUDGET_SECONDS = 0.5
+    WARM_UP_BUDGET_SECONDS = 3.0
+
+    STARTUP_SCRIPT = """
+import json, os, sys, time, threading
+from pathlib import Path
+import django
+django.setup()
+from django.conf import settings
+settings.DATA_DIR = Path(os.environ['STARTUP_DATA_DIR'])
+
+started = time.perf_counter()
+from xscriber import views
+import_seconds = time.perf_counter() - started
+loaded = {name: name in sys.modules for name in ('openai', 'pydub')}
+threads = threading.active_count()
+data_files = sorted(str(path.relative_to(settings.DATA_DIR)) for path in settings.DATA_DIR.rglob('*'))
+
+views.project_handler.start_workers = False
+warm_up = views.project_handler.warm_up()
+print(json.dumps({'import_seconds': import_seconds, 'loaded': loaded, 'threads': threads, 'warm_up': warm_up,
+                  'data_files': data_files}))
+"""
+
+    def _run_cold_process(self, **env_overrides):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir, ignore_errors=True)
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='config.settings', PIPELINE_WARM_UP_ON_START='False',
+                   STARTUP_DATA_DIR=data_dir)
+        env.pop('OPENAI_API_KEY', None)
+        env.update(env_overrides)
+        result = subprocess.run([sys.executable, '-c', self.STARTUP_SCRIPT], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def test_importing_views_is_lazy_and_within_budget(self):
+        stats = self._run_cold_process()
+
+        # No OpenAI SDK, no pydub, no pipeline threads and no API key needed just to import
+        self.assertEqual(stats['loaded'], {'openai': False, 'pydub': False})
+        self.assertEqual(stats['threads'], 1)
+        # Only the project directories: no journal, index, trace, stream or cache files yet
+        self.assertEqual(stats['data_files'], ['audio-recordings', 'output', 'output_cache', 'project_metadata',
+                                               'raw-transcriptions'])
+        self.assertLess(stats['import_seconds'], self.VIEWS_IMPORT_BUDGET_SECONDS)
+
+    def test_warm_up_within_budget(self):
+        stats = self._run_cold_process(OPENAI_API_KEY='test-key')
+
+        self.assertEqual(set(stats['warm_up']), {'transcriber', 'chat_processor', 'audio_decoder', 'pipeline'})
+        self.assertLess(sum(stats['warm_up'].values()), self.WARM_UP_BUDGET_SECONDS)
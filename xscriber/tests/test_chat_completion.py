@@ -3,6 +3,7 @@ import tempfile
 from unittest.mock import patch, MagicMock
 from django.test import TestCase
 from xscriber.modules.chat_completion import ChatCompletionProcessor
+from xscriber.modules.trd_model import TRDDocument, TRDPatchError
 
 
 class ChatCompletionProcessorTests(TestCase):
@@ -19,6 +20,14 @@ class ChatCompletionProcessorTests(TestCase):
             with self.assertRaises(ValueError):
                 ChatCompletionProcessor()
 
+    def test_with_model_shares_clients(self):
+        preview = self.processor.with_model("gpt-4o-mini")
+        self.assertEqual(preview.model, "gpt-4o-mini")
+        self.assertEqual(self.processor.model, "gpt-3.5-turbo")
+        self.assertIs(preview.client, self.processor.client)
+        self.assertEqual(preview.budget_planner.context_window, 128000)
+        self.assertIs(self.processor.with_model("gpt-3.5-turbo"), self.processor)
+
     def test_parse_trd_ontology_empty(self):
         ontology = self.processor.parse_trd_ontology("")
         self.assertEqual(len(ontology), 8)
@@ -128,4 +137,63 @@ Existing requirements
         result = processor.process_transcription_to_trd("New transcription", existing_trd)
 
         self.assertIn("# Technical Requirements Document", result)
-        self.assertIn("Generated by X-Scriber", result)
\ No newline at end of file
+        self.assertIn("Generated by X-Scriber", result)
+    @patch('xscriber.modules.chat_completion.openai.OpenAI')
+    def test_generate_trd_holistically_streams_deltas(self, mock_openai):
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+
+        stream_chunks = []
+        for token in ["# Technical ", "Requirements ", "Document"]:
+            chunk = MagicMock()
+            chunk.choices[0].delta.content = token
+            stream_chunks.append(chunk)
+        mock_client.chat.completions.create.return_value = iter(stream_chunks)
+
+        partials = []
+        processor = ChatCompletionProcessor(api_key="test_key")
+        result = processor.generate_trd_holistically("Transcription", on_delta=partials.append)
+
+        self.assertEqual(partials, ["# Technical ", "Requirements ", "Document"])
+        self.assertTrue(result.startswith("# Technical Requirements Document"))
+        self.assertTrue(mock_client.chat.completions.create.call_args.kwargs["stream"])
+
+    def test_parse_trd_ontology_generated_document(self):
+        trd_content = self.processor.generate_trd_document({
+            "overview": "Generated overview",
+            "requirements": "- Generated requirement"
+        })
+
+        ontology = self.processor.parse_trd_ontology(trd_content)
+        self.assertEqual(ontology["overview"], "Generated overview")
+        self.assertEqual(ontology["requirements"], "- Generated requirement")
+        self.assertEqual(ontology["dependencies"], "To be defined")
+
+    @patch('xscriber.modules.chat_completion.openai.OpenAI')
+    def test_generate_trd_patch(self, mock_openai):
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+
+        mock_response = MagicMock()
+        mock_response.choices[0].message.content = (
+            '```json\n{"operations": [{"op": "add", "section": "requirements", "item": "Export PDF"}]}\n```'
+        )
+        mock_client.chat.completions.create.return_value = mock_response
+
+        processor = ChatCompletionProcessor(api_key="test_key")
+        operations = processor.generate_trd_patch(TRDDocument(), "We need PDF export")
+
+        self.assertEqual(operations, [{"op": "add", "section": "requirements", "item": "Export PDF"}])
+
+    @patch('xscriber.modules.chat_completion.openai.OpenAI')
+    def test_generate_trd_patch_invalid_json(self, mock_openai):
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+
+        mock_response = MagicMock()
+        mock_response.choices[0].message.content = "Here are the changes: add PDF export"
+        mock_client.chat.completions.create.return_value = mock_response
+
+        processor = ChatCompletionProcessor(api_key="test_key")
+        with self.assertRaises(TRDPatchError):
+            processor.generate_trd_patch(TRDDocument(), "We need PDF export")
@@ -0,0 +1,65 @@
+import shutil
+import tempfile
+import threading
+from django.test import TestCase
+from xscriber.modules.chunk_trace import (ChunkTraceStore, collect_spans, trace_span, make_span,
+                                          build_timeline)
+
+
+class ChunkTraceTests(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = ChunkTraceStore(self.temp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_trace_span_records_into_enclosing_collector(self):
+        with trace_span("outside"):
+            pass
+
+        with collect_spans() as spans:
+            with trace_span("whisper_call", model="whisper-1"):
+                pass
+            with self.assertRaises(ValueError), trace_span("transcription_write"):
+                raise ValueError("disk full")
+
+        self.assertEqual([(s["name"], s.get("model"), s.get("error")) for s in spans],
+                         [("whisper_call", "whisper-1", None), ("transcription_write", None, True)])
+
+    def test_store_keeps_first_fields_and_accumulates_spans(self):
+        trace_id = self.store.record("proj1", 3, [make_span("upload_receive", 100.0, 100.5)],
+                                     trace_id="abc", queued_at=100.6)
+        self.assertEqual(trace_id, "abc")
+        self.store.record("proj1", "3", [make_span("transcription", 101.0, 103.0)], transcribed_at=103.0)
+        self.store.record("proj1", "3", [make_span("trd_generation", 104.0, 110.0, trd_version=2)],
+                          trace_id="other", first_trd_version=2, included_at=110.2)
+        self.store.record("proj1", "3", first_trd_version=5)
+
+        trace = self.store.get("proj1", 3)
+        self.assertEqual((trace["trace_id"], trace["first_trd_version"]), ("abc", 2))
+
+        timeline = build_timeline(trace)
+        self.assertEqual([(s["name"], s["offset_seconds"]) for s in timeline["spans"]],
+                         [("upload_receive", 0.0), ("transcription", 1.0), ("trd_generation", 4.0)])
+        self.assertEqual(timeline["chunk_to_transcript_seconds"], 3.0)
+        self.assertEqual(timeline["chunk_to_trd_seconds"], 10.2)
+
+        self.store.discard("proj1")
+        self.assertIsNone(self.store.get("proj1", 3))
+
+    def test_concurrent_writers_keep_every_span(self):
+        # Separate stores share only the trace directory, like the web and worker processes
+        stores = [self.store, ChunkTraceStore(self.temp_dir)]
+
+        def record_spans(store, name):
+            for i in range(25):
+                store.record("proj1", 1, [make_span(f"{name}_{i}", 100.0, 100.1)])
+
+        threads = [threading.Thread(target=record_spans, args=(store, f"writer{n}")) for n, store in enumerate(stores)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.store.get("proj1", 1)["spans"]), 50)
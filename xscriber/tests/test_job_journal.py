@@ -0,0 +1,203 @@
+import time
+import shutil
+import sqlite3
+import tempfile
+from pathlib import Path
+from django.test import TestCase
+from xscriber.modules.job_journal import JobJournal
+
+
+class JobJournalTests(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.journal = JobJournal(Path(self.temp_dir) / 'jobs.sqlite3', lease_seconds=60, max_attempts=2)
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_enqueue_deduplicates_active_jobs(self):
+        first = self.journal.enqueue("transcription", "proj1", {"audio_file_path": "a.wav"}, dedupe_key="a")
+        self.assertIsNotNone(first)
+        self.assertIsNone(self.journal.enqueue("transcription", "proj1", {}, dedupe_key="a"))
+
+        job = self.journal.claim(["transcription"], "worker")
+        self.journal.ack(job["id"], "worker")
+        # Finished jobs no longer block a new one with the same key
+        self.assertIsNotNone(self.journal.enqueue("transcription", "proj1", {}, dedupe_key="a"))
+
+    def test_claim_ack_lifecycle(self):
+        job_id = self.journal.enqueue("transcription", "proj1", {"audio_file_path": "a.wav"})
+
+        job = self.journal.claim(["transcription"], "worker")
+        self.assertEqual(job["id"], job_id)
+        self.assertEqual(job["payload"], {"audio_file_path": "a.wav"})
+        self.assertEqual(job["attempts"], 1)
+        self.assertIsNone(self.journal.claim(["transcription"], "other"))
+
+        self.assertFalse(self.journal.ack(job_id, "other"))
+        self.assertTrue(self.journal.ack(job_id, "worker"))
+        self.assertEqual(self.journal.get_job(job_id)["status"], "done")
+
+    def test_expired_lease_can_be_reclaimed(self):
+        job_id = self.journal.enqueue("transcription", "proj1")
+        self.journal.claim(["transcription"], "crashed-worker")
+        self.journal._connection().execute("UPDATE jobs SET lease_expires_at = ? WHERE id = ?",
+                                           (time.time() - 1, job_id))
+
+        job = self.journal.claim(["transcription"], "worker")
+        self.assertEqual(job["id"], job_id)
+        self.assertFalse(self.journal.renew(job_id, "crashed-worker"))
+
+    def test_lease_expiring_on_the_last_attempt_fails_the_job(self):
+        job_id = self.journal.enqueue("transcription", "proj1")
+        for attempt in range(2):
+            self.assertEqual(self.journal.claim(["transcription"], f"crashed-worker-{attempt}")["id"], job_id)
+            self.journal._connection().execute("UPDATE jobs SET lease_expires_at = ? WHERE id = ?",
+                                               (time.time() - 1, job_id))
+
+        self.assertIsNone(self.journal.claim(["transcription"], "worker"))
+        job = self.journal.get_job(job_id)
+        self.assertEqual((job["status"], job["error"], job["attempts"]), ("failed", "lease expired", 2))
+
+    def test_fail_requeues_until_max_attempts(self):
+        job_id = self.journal.enqueue("transcription", "proj1")
+
+        self.journal.fail(self.journal.claim(["transcription"], "worker")["id"], "worker", "boom")
+        self.assertEqual(self.journal.get_job(job_id)["status"], "queued")
+
+        self.journal.fail(self.journal.claim(["transcription"], "worker")["id"], "worker", "boom again")
+        job = self.journal.get_job(job_id)
+        self.assertEqual(job["status"], "failed")
+        self.assertEqual(job["error"], "boom again")
+
+    def test_one_trd_job_per_project(self):
+        self.journal.enqueue("trd_update", "proj1")
+        self.journal.enqueue("trd_update", "proj1")
+        self.journal.enqueue("trd_update", "proj2")
+
+        first = self.journal.claim(["trd_update", "trd_final"], "w1")
+        second = self.journal.claim(["trd_update", "trd_final"], "w2")
+        self.assertEqual((first["project_id"], second["project_id"]), ("proj1", "proj2"))
+        self.assertIsNone(self.journal.claim(["trd_update", "trd_final"], "w3"))
+
+    def test_final_pass_waits_for_transcriptions(self):
+        self.journal.enqueue("trd_final", "proj1")
+        transcription_id = self.journal.enqueue("transcription", "proj1")
+        self.assertIsNone(self.journal.claim(["trd_update", "trd_final"], "worker"))
+
+        self.journal.claim(["transcription"], "worker")
+        self.journal.ack(transcription_id, "worker")
+        self.assertEqual(self.journal.claim(["trd_update", "trd_final"], "worker")["kind"], "trd_final")
+
+    def test_final_pass_requested_while_one_runs_is_queued(self):
+        running_id = self.journal.enqueue("trd_final", "proj1", dedupe_key="trd_final:proj1")
+        self.assertEqual(self.journal.claim(["trd_update", "trd_final"], "w1")["id"], running_id)
+
+        # A transcription finished during the running pass needs another one after it
+        next_id = self.journal.enqueue("trd_final", "proj1", dedupe_key="trd_final:proj1")
+        self.assertIsNotNone(next_id)
+        self.assertIsNone(self.journal.enqueue("trd_final", "proj1", dedupe_key="trd_final:proj1"))
+        self.assertIsNone(self.journal.claim(["trd_update", "trd_final"], "w2"))
+
+        self.journal.ack(running_id, "w1")
+        self.assertEqual(self.journal.claim(["trd_update", "trd_final"], "w2")["id"], next_id)
+
+    def _claim_all(self):
+        claimed = []
+        while True:
+            job = self.journal.claim(["transcription"], "worker")
+            if job is None:
+                return claimed
+            claimed.append((job["project_id"], job["payload"].get("n")))
+            self.journal.ack(job["id"], "worker")
+
+    def test_claims_by_priority_then_round_robin_across_projects(self):
+        for n in range(3):
+            self.journal.enqueue("transcription", "bulk", {"n": n}, priority=JobJournal.PRIORITY_BULK)
+        for n in range(3):
+            self.journal.enqueue("transcription", "busy", {"n": n}, priority=JobJournal.PRIORITY_LIVE)
+        self.journal.enqueue("transcription", "quiet", {"n": 0}, priority=JobJournal.PRIORITY_LIVE)
+
+        self.assertEqual(self._claim_all(), [
+            ("busy", 0), ("quiet", 0), ("busy", 1), ("busy", 2),
+            ("bulk", 0), ("bulk", 1), ("bulk", 2)
+        ])
+
+    def test_duplicate_enqueue_raises_queued_priority(self):
+        job_id = self.journal.enqueue("trd_final", "proj1", dedupe_key="final", priority=JobJournal.PRIORITY_BULK)
+        self.assertIsNone(self.journal.enqueue("trd_final", "proj1", dedupe_key="final",
+                                               priority=JobJournal.PRIORITY_LIVE))
+        self.assertEqual(self.journal.get_job(job_id)["priority"], JobJournal.PRIORITY_LIVE)
+
+        # A lower-priority duplicate never demotes it
+        self.journal.enqueue("trd_final", "proj1", dedupe_key="final", priority=JobJournal.PRIORITY_BULK)
+        self.assertEqual(self.journal.get_job(job_id)["priority"], JobJournal.PRIORITY_LIVE)
+
+    def test_wait_stats_per_priority_class(self):
+        live_id = self.journal.enqueue("transcription", "proj1", priority=JobJournal.PRIORITY_LIVE)
+        self.journal.enqueue("transcription", "proj2", priority=JobJournal.PRIORITY_BULK)
+        self.journal._connection().execute("UPDATE jobs SET queued_at = ? WHERE id = ?", (time.time() - 2, live_id))
+
+        self.journal.claim(["transcription"], "worker")
+        stats = self.journal.get_wait_stats()
+
+        self.assertEqual(stats["live"]["claimed"], 1)
+        self.assertGreaterEqual(stats["live"]["max_wait_seconds"], 2)
+        self.assertEqual(stats["bulk"]["queued"], 1)
+        self.assertEqual(stats["interactive"], {"queued": 0, "oldest_queued_seconds": 0.0, "claimed": 0,
+                                                "avg_wait_seconds": None, "p95_wait_seconds": None,
+                                                "max_wait_seconds": None})
+
+    def test_existing_database_gains_priority_columns(self):
+        db_path = Path(self.temp_dir) / 'old.sqlite3'
+        connection = sqlite3.connect(str(db_path))
+        connection.execute("CREATE TABLE jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, "
+                           "project_id TEXT NOT NULL, payload TEXT NOT NULL DEFAULT '{}', dedupe_key TEXT, "
+                           "status TEXT NOT NULL DEFAULT 'queued', attempts INTEGER NOT NULL DEFAULT 0, "
+                           "claimed_by TEXT, lease_expires_at REAL, error TEXT, created_at REAL NOT NULL, "
+                           "updated_at REAL NOT NULL)")
+        connection.execute("INSERT INTO jobs (kind, project_id, created_at, updated_at) VALUES ('transcription', 'p', 1, 1)")
+        connection.commit()
+        connection.close()
+
+        journal = JobJournal(db_path)
+        try:
+            job = journal.claim(["transcription"], "worker")
+            self.assertEqual(job["priority"], JobJournal.PRIORITY_INTERACTIVE)
+            self.assertIsNotNone(journal.get_job(job["id"])["wait_seconds"])
+        finally:
+            journal.close()
+
+    def test_cancel_matching_supersedes_older_jobs(self):
+        old_update = self.journal.enqueue("trd_update", "proj1")
+        transcription = self.journal.enqueue("transcription", "proj1")
+        other_project = self.journal.enqueue("trd_update", "proj2")
+        new_update = self.journal.enqueue("trd_update", "proj1")
+
+        cancelled = self.journal.cancel_matching("proj1", ["trd_update"], before_id=new_update,
+                                                 reason=JobJournal.SUPERSEDED)
+
+        self.assertEqual(cancelled, [old_update])
+        self.assertEqual(self.journal.get_job(old_update)["status"], "cancelled")
+        for job_id in (transcription, other_project, new_update):
+            self.assertEqual(self.journal.get_job(job_id)["status"], "queued")
+        self.assertEqual(self.journal.get_cancellation_stats(), {"superseded": 1})
+
+    def test_cancelled_claim_is_no_longer_active(self):
+        job_id = self.journal.enqueue("transcription", "proj1")
+        self.journal.claim(["transcription"], "worker")
+        self.assertTrue(self.journal.is_active(job_id, "worker"))
+
+        self.assertTrue(self.journal.cancel(job_id, JobJournal.PROJECT_DELETED))
+        self.assertFalse(self.journal.is_active(job_id, "worker"))
+        self.assertFalse(self.journal.ack(job_id, "worker"))
+        self.assertEqual(self.journal.get_job(job_id)["error"], "project deleted")
+
+    def test_jobs_past_their_deadline_are_cancelled_not_claimed(self):
+        expired = self.journal.enqueue("transcription", "proj1", deadline_seconds=-1)
+        current = self.journal.enqueue("transcription", "proj1", deadline_seconds=60)
+
+        self.assertEqual(self.journal.claim(["transcription"], "worker")["id"], current)
+        self.assertEqual(self.journal.get_job(expired)["status"], "cancelled")
+        self.assertEqual(self.journal.get_cancellation_stats(), {"deadline exceeded": 1})
@@ -0,0 +1,68 @@
+import urllib.request
+from django.test import TestCase
+from xscriber.modules.metrics import MetricsRegistry, serve_metrics
+
+
+class MetricsRegistryTests(TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter_and_gauge_exposition(self):
+        jobs = self.registry.counter("jobs_total", "Jobs finished", ["stage", "outcome"])
+        depth = self.registry.gauge("queue_depth", "Queued jobs", ["stage"])
+        jobs.inc(stage="trd", outcome="succeeded")
+        jobs.inc(2, stage="trd", outcome="succeeded")
+        depth.set(4, stage="transcription")
+
+        output = self.registry.render()
+        self.assertIn("# TYPE jobs_total counter", output)
+        self.assertIn('jobs_total{stage="trd",outcome="succeeded"} 3.0', output)
+        self.assertIn("# TYPE queue_depth gauge", output)
+        self.assertIn('queue_depth{stage="transcription"} 4', output)
+
+        with self.assertRaises(ValueError):
+            jobs.inc(stage="trd")
+
+    def test_histogram_buckets_are_cumulative(self):
+        latency = self.registry.histogram("stage_seconds", "Stage latency", ["stage"], buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 5.0):
+            latency.observe(value, stage="decode")
+
+        output = self.registry.render()
+        self.assertIn('stage_seconds_bucket{stage="decode",le="0.1"} 1', output)
+        self.assertIn('stage_seconds_bucket{stage="decode",le="1.0"} 3', output)
+        self.assertIn('stage_seconds_bucket{stage="decode",le="+Inf"} 4', output)
+        self.assertIn('stage_seconds_sum{stage="decode"} 6.25', output)
+        self.assertIn('stage_seconds_count{stage="decode"} 4', output)
+
+        with self.assertRaises(RuntimeError):
+            with latency.time(stage="write"):
+                raise RuntimeError("failed write")
+        self.assertEqual(latency.get_count(stage="write"), 1)
+
+    def test_metrics_are_registered_once(self):
+        first = self.registry.counter("uploads_total", "Uploads")
+        self.assertIs(self.registry.counter("uploads_total", "Uploads"), first)
+        with self.assertRaises(ValueError):
+            self.registry.gauge("uploads_total", "Uploads")
+
+    def test_label_values_are_escaped(self):
+        self.registry.counter("errors_total", "Errors", ["reason"]).inc(reason='bad "quote"\n')
+        self.assertIn('errors_total{reason="bad \\"quote\\"\\n"} 1.0', self.registry.render())
+
+    def test_standalone_server(self):
+        refreshed = []
+        self.registry.gauge("up", "Worker is up").set(1)
+        server = serve_metrics(0, host="127.0.0.1", before_render=lambda: refreshed.append(True),
+                               registry=self.registry)
+        try:
+            port = server.server_address[1]
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+                body = response.read().decode("utf-8")
+                self.assertTrue(response.headers["Content-Type"].startswith("text/plain; version=0.0.4"))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertIn("up 1", body)
+        self.assertEqual(refreshed, [True])
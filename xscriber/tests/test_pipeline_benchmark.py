@@ -0,0 +1,93 @@
+import os
+import tempfile
+from django.test import TestCase
+from openai import OpenAI
+from xscriber.modules.fake_openai import FakeOpenAIServer, wav_duration
+from xscriber.modules.pipeline_benchmark import (PipelineBenchmark, percentile_summary, compare_results,
+                                                 write_silent_wav)
+
+
+class FakeOpenAIServerTests(TestCase):
+    def setUp(self):
+        self.server = FakeOpenAIServer(whisper_latency=0, whisper_realtime_factor=0, chat_latency=0,
+                                       token_rate=0, completion_tokens=60).start()
+        self.client = OpenAI(api_key="test", base_url=self.server.base_url, max_retries=0)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _wav(self, seconds):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "chunk.wav")
+            write_silent_wav(path, seconds)
+            with open(path, 'rb') as f:
+                return f.read()
+
+    def test_transcription_segments_follow_audio_duration(self):
+        audio = self._wav(12)
+        self.assertAlmostEqual(wav_duration(audio), 12.0)
+
+        result = self.client.audio.transcriptions.create(model="whisper-1", file=("chunk.wav", audio),
+                                                         response_format="verbose_json")
+        self.assertEqual([(s.start, s.end) for s in result.segments], [(0.0, 5.0), (5.0, 10.0), (10.0, 12.0)])
+        self.assertTrue(result.text)
+
+    def test_chat_completion_plain_and_streamed(self):
+        messages = [{"role": "user", "content": "Write a TRD"}]
+        response = self.client.chat.completions.create(model="gpt-4o", messages=messages)
+        self.assertIn("# Technical Requirements Document", response.choices[0].message.content)
+        self.assertGreater(response.usage.completion_tokens, 0)
+
+        stream = self.client.chat.completions.create(model="gpt-4o", messages=messages, stream=True,
+                                                     stream_options={"include_usage": True})
+        chunks = list(stream)
+        streamed = "".join(c.choices[0].delta.content for c in chunks if c.choices and c.choices[0].delta.content)
+        self.assertEqual(streamed, response.choices[0].message.content)
+        self.assertEqual(chunks[-1].usage.completion_tokens, response.usage.completion_tokens)
+
+        stats = self.server.get_stats()
+        self.assertEqual(stats["chat_completions"]["requests"], 2)
+
+    def test_injected_errors(self):
+        self.server.error_rate = 1.0
+        with self.assertRaises(Exception):
+            self.client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": "x"}])
+        self.assertEqual(self.server.get_stats()["chat_completions"]["errors"], 1)
+
+
+class PipelineBenchmarkTests(TestCase):
+    def test_percentile_summary(self):
+        summary = percentile_summary([float(value) for value in range(1, 101)])
+        self.assertEqual((summary["count"], summary["p50"], summary["p95"], summary["p99"], summary["max"]),
+                         (100, 50.0, 95.0, 99.0, 100.0))
+        self.assertIsNone(percentile_summary([])["p95"])
+
+    def test_compare_results(self):
+        baseline = {"stages": {"trd_update_run": {"p95": 1.0}}, "throughput": {"chunks_per_second": 10.0},
+                    "memory": {"peak_rss_mb": 100.0}}
+        current = {"stages": {"trd_update_run": {"p95": 1.1}, "chunk_to_trd": {"p95": 3.0}},
+                   "throughput": {"chunks_per_second": 9.0}, "memory": {"peak_rss_mb": 110.0}}
+        self.assertEqual(compare_results(baseline, current, tolerance=0.2), [])
+
+        current["stages"]["trd_update_run"]["p95"] = 1.5
+        current["throughput"]["chunks_per_second"] = 5.0
+        regressions = compare_results(baseline, current, tolerance=0.2)
+        self.assertEqual(len(regressions), 2)
+
+    def test_small_run_reaches_final_trd(self):
+        previous_base_url = os.environ.get("OPENAI_BASE_URL")
+        benchmark = PipelineBenchmark(
+            projects=2, chunks_per_project=2, chunk_seconds=1.0, chunk_interval=0, timeout=60,
+            server_options={"whisper_latency": 0, "whisper_realtime_factor": 0, "chat_latency": 0,
+                            "token_rate": 0, "completion_tokens": 60}
+        )
+        result = benchmark.run()
+
+        self.assertTrue(result["completed"])
+        self.assertEqual(result["chunks"], {"uploaded": 4, "transcribed": 4})
+        self.assertEqual(result["jobs"]["transcription"], {"done": 4})
+        self.assertEqual(result["jobs"]["trd_final"], {"done": 2})
+        self.assertEqual(result["stages"]["chunk_to_transcript"]["count"], 4)
+        self.assertEqual(result["stages"]["openai_transcriptions"]["count"], 4)
+        self.assertGreater(result["memory"]["peak_rss_mb"], 0)
+        self.assertEqual(os.environ.get("OPENAI_BASE_URL"), previous_base_url)
@@ -0,0 +1,243 @@
+import asyncio
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from django.test import TestCase
+from xscriber.modules.job_journal import JobJournal
+from xscriber.modules.metrics import PIPELINE_JOBS
+from xscriber.modules import pipeline_engine
+from xscriber.modules.pipeline_engine import PipelineEngine
+
+
+class PipelineEngineTests(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.journal = JobJournal(Path(self.temp_dir) / 'jobs.sqlite3')
+        self.transcribed = []
+        self.trd_updates = []
+        self.engine = self._make_engine()
+        self.engine.start()
+
+    def tearDown(self):
+        self.engine.stop()
+        self.journal.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _make_engine(self):
+        return PipelineEngine(self.journal, self._transcribe, self._update_trd,
+                              transcription_concurrency=2, trd_concurrency=2, poll_interval=0.1)
+
+    async def _transcribe(self, project_id, audio_file_path):
+        self.transcribed.append((project_id, audio_file_path))
+        self.engine.submit_trd_update(project_id, audio_file_path + ".json")
+
+    async def _update_trd(self, project_id, transcription_file, tier):
+        if tier == "final":
+            self.trd_updates.append(("final", project_id))
+            return
+        self.trd_updates.append(("start", project_id))
+        await asyncio.sleep(0.01)
+        self.trd_updates.append(("end", project_id))
+
+    def test_transcription_feeds_trd_stage(self):
+        self.engine.submit_transcription("proj1", "chunk_1.wav")
+        self.assertTrue(self.engine.wait_until_idle(timeout=5))
+
+        self.assertEqual(self.transcribed, [("proj1", "chunk_1.wav")])
+        self.assertEqual(self.trd_updates, [("start", "proj1"), ("end", "proj1")])
+        self.assertEqual(self.journal.get_stats()["transcription"], {"done": 1})
+
+    def test_trd_updates_serialised_per_project(self):
+        for index in range(3):
+            self.engine.submit_trd_update("proj1", f"t_{index}.json")
+        self.assertTrue(self.engine.wait_until_idle(timeout=5))
+
+        # Two workers, one project: updates never overlap
+        self.assertEqual(self.trd_updates, [("start", "proj1"), ("end", "proj1")] * 3)
+
+    def test_final_pass_waits_for_pending_transcriptions(self):
+        # Queue both before any worker runs, or the final pass could be claimed first
+        self.engine.stop()
+        self.engine.submit_final_pass("proj1")
+        self.engine.submit_transcription("proj1", "chunk_1.wav")
+        self.engine = self._make_engine()
+        self.engine.start()
+        self.assertTrue(self.engine.wait_until_idle(timeout=5))
+
+        self.assertEqual(self.trd_updates, [("start", "proj1"), ("end", "proj1"), ("final", "proj1")])
+
+    def test_failed_jobs_are_retried(self):
+        attempts = []
+
+        async def flaky(project_id, audio_file_path):
+            attempts.append(audio_file_path)
+            if len(attempts) == 1:
+                raise RuntimeError("boom")
+            return True
+
+        errors = PIPELINE_JOBS.get(stage="transcription", outcome="error")
+        succeeded = PIPELINE_JOBS.get(stage="transcription", outcome="succeeded")
+
+        self.engine.transcription_handler = flaky
+        self.engine.submit_transcription("proj1", "chunk_1.wav")
+        self.assertTrue(self.engine.wait_until_idle(timeout=5))
+
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(self.journal.get_stats()["transcription"], {"done": 1})
+        self.assertEqual(PIPELINE_JOBS.get(stage="transcription", outcome="error") - errors, 1)
+        self.assertEqual(PIPELINE_JOBS.get(stage="transcription", outcome="succeeded") - succeeded, 1)
+
+    def test_workers_purge_finished_jobs(self):
+        self.engine.stop()
+        self.engine = PipelineEngine(self.journal, self._transcribe, self._update_trd, poll_interval=0.1,
+                                     job_retention_seconds=0, purge_interval=0.05)
+        self.engine.start()
+        self.engine.submit_transcription("proj1", "chunk_1.wav")
+        self.assertTrue(self.engine.wait_until_idle(timeout=5))
+
+        deadline = time.time() + 5
+        while self.journal.get_stats() and time.time() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(self.journal.get_stats(), {})
+        self.assertEqual(self.engine.get_stats()["workers"], 3)
+
+    def test_jobs_submitted_while_stopped_survive_restart(self):
+        self.engine.stop()
+        self.engine.submit_transcription("proj1", "chunk_1.wav")
+        self.assertEqual(self.transcribed, [])
+
+        self.engine = self._make_engine()
+        self.engine.start()
+        self.assertTrue(self.engine.wait_until_idle(timeout=5))
+        self.assertEqual(self.transcribed, [("proj1", "chunk_1.wav")])
+
+    def test_run_returns_coroutine_result(self):
+        async def add(a, b):
+            return a + b
+
+        self.assertEqual(self.engine.run(add(2, 3), timeout=5), 5)
+
+    def test_blocking_calls_do_not_stall_other_jobs(self):
+        lock = threading.Lock()
+        finished = []
+
+        async def write_metadata():
+            # A lock held elsewhere (another process's flock) only holds up this job
+            job = PipelineEngine.current_job()
+            await self.engine.run_blocking(lambda: lock.acquire() and lock.release())
+            finished.append(("metadata", job))
+
+        async def other_job():
+            await asyncio.sleep(0.01)
+            finished.append(("other", None))
+
+        async def both():
+            token = pipeline_engine._current_job.set({"id": 7})
+            blocked = asyncio.ensure_future(write_metadata())
+            pipeline_engine._current_job.reset(token)
+            await other_job()
+            lock.release()
+            await blocked
+
+        lock.acquire()
+        self.engine.run(both(), timeout=5)
+        self.assertEqual(finished, [("other", None), ("metadata", {"id": 7})])
+
+    def test_jobs_enqueued_without_workers_run_in_worker_process(self):
+        # A web process only enqueues; a separate worker (own journal connection) claims
+        producer = PipelineEngine(JobJournal(self.journal.db_path), self._transcribe, self._update_trd)
+        self.engine.stop()
+        try:
+            producer.submit_transcription("proj1", "chunk_1.wav")
+            self.assertEqual(producer.run(asyncio.sleep(0.2, result="ok"), timeout=5), "ok")
+            self.assertFalse(producer.has_workers)
+            self.assertEqual(self.transcribed, [])
+
+            self.engine = self._make_engine()
+            self.engine.start()
+            self.assertTrue(producer.wait_until_idle(timeout=5))
+            self.assertEqual(self.transcribed, [("proj1", "chunk_1.wav")])
+        finally:
+            producer.stop()
+            producer.journal.close()
+
+    def test_follow_up_jobs_inherit_priority(self):
+        self.engine.stop()
+        self.engine.submit_transcription("proj1", "chunk_1.wav", priority=JobJournal.PRIORITY_LIVE)
+        self.engine.submit_trd_update("proj2", "t_bulk.json", priority=JobJournal.PRIORITY_BULK)
+
+        self.engine = self._make_engine()
+        self.engine.start()
+        self.assertTrue(self.engine.wait_until_idle(timeout=5))
+
+        priorities = dict(self.journal._connection().execute(
+            "SELECT json_extract(payload, '$.transcription_file'), priority FROM jobs WHERE kind = 'trd_update'"))
+        self.assertEqual(priorities, {"chunk_1.wav.json": JobJournal.PRIORITY_LIVE,
+                                      "t_bulk.json": JobJournal.PRIORITY_BULK})
+        self.assertEqual(self.engine.get_stats()["queue_wait"]["live"]["claimed"], 2)
+
+    def _start_blocking_trd_handler(self):
+        started = asyncio.Event()
+
+        async def slow_update(project_id, transcription_file, tier):
+            if tier == "final":
+                self.trd_updates.append(("final", project_id))
+                return
+            if project_id != "proj1":
+                return
+            self.engine.loop.call_soon(started.set)
+            await asyncio.sleep(30)
+            self.trd_updates.append(("end", project_id))
+
+        self.engine.trd_handler = slow_update
+
+        async def wait_started():
+            await asyncio.wait_for(started.wait(), 5)
+        return wait_started
+
+    def test_final_pass_supersedes_running_preview_update(self):
+        wait_started = self._start_blocking_trd_handler()
+        self.engine.submit_trd_update("proj1", "t_1.json")
+        self.engine.run(wait_started(), timeout=5)
+
+        self.engine.submit_final_pass("proj1")
+        self.assertTrue(self.engine.wait_until_idle(timeout=5))
+
+        self.assertEqual(self.trd_updates, [("final", "proj1")])
+        stats = self.engine.get_stats()
+        self.assertEqual(stats["trd_cancelled"], 1)
+        self.assertEqual(stats["cancelled_by_reason"], {"superseded": 1})
+
+    def test_newer_update_supersedes_queued_ones(self):
+        self.engine.stop()
+        first = self.engine.submit_trd_update("proj1", "t_1.json", supersede=True)
+        second = self.engine.submit_trd_update("proj1", "t_2.json", supersede=True)
+
+        self.assertEqual(self.journal.get_job(first)["status"], "cancelled")
+        self.assertEqual(self.journal.get_job(second)["status"], "queued")
+
+    def test_cancel_project_stops_running_and_queued_jobs(self):
+        wait_started = self._start_blocking_trd_handler()
+        self.engine.submit_trd_update("proj1", "t_1.json")
+        self.engine.run(wait_started(), timeout=5)
+        # Stays queued behind the running update: one TRD job per project at a time
+        queued = self.engine.submit_trd_update("proj1", "t_2.json")
+        self.engine.submit_transcription("proj2", "chunk_1.wav")
+
+        self.assertGreaterEqual(self.engine.cancel_project("proj1"), 1)
+        self.assertTrue(self.engine.wait_until_idle(timeout=5))
+
+        self.assertNotIn(("end", "proj1"), self.trd_updates)
+        self.assertEqual(self.journal.get_job(queued)["status"], "cancelled")
+        self.assertIn(("proj2", "chunk_1.wav"), self.transcribed)
+
+    def test_running_job_cancelled_at_deadline(self):
+        wait_started = self._start_blocking_trd_handler()
+        job_id = self.engine.submit_trd_update("proj1", "t_1.json", deadline_seconds=0.3)
+        self.engine.run(wait_started(), timeout=5)
+
+        self.assertTrue(self.engine.wait_until_idle(timeout=5))
+        self.assertEqual(self.journal.get_job(job_id)["error"], "deadline exceeded")
+        self.assertEqual(self.engine.get_stats()["trd_cancelled"], 1)
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+from unittest.mock import patch
+from django.contrib.auth.models import User
+from django.test import TestCase, Client, override_settings
+from xscriber import views
+from xscriber.modules.profiling import ProfilingController
+
+
+def busy(seconds: float):
+    deadline = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(range(100))
+    return total
+
+
+class ProfilingControllerTests(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.controller = ProfilingController(self.temp_dir, poll_interval=0, sample_interval=0.001)
+
+    def tearDown(self):
+        self.controller.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_cprofile_covers_next_n_units_in_scope(self):
+        session = self.controller.start("cprofile", scope="jobs", max_units=2)
+
+        with self.controller.profile("requests", "GET /"):
+            busy(0.01)
+        for job in range(3):
+            with self.controller.profile("jobs", f"transcription #{job}"):
+                busy(0.01)
+
+        pid = os.getpid()
+        names = {p["name"] for p in self.controller.list_profiles() if p["session_id"] == session["id"]}
+        self.assertTrue({f"{pid}.prof", f"{pid}-top.txt", f"{pid}-summary.json"} <= names)
+        with open(self.controller.get_profile_file(session["id"], f"{pid}-summary.json")) as f:
+            summary = json.load(f)
+        self.assertEqual(summary["units"], 2)
+        self.assertEqual([unit["unit"] for unit in summary["slowest"]], ["jobs", "jobs"])
+        self.assertIn("busy", self.controller.get_profile_file(session["id"], f"{pid}-top.txt").read_text())
+
+        self.assertIsNone(self.controller.get_profile_file(session["id"], "../active.json"))
+        self.assertIsNone(self.controller.get_profile_file("..", "active.json"))
+
+        # Another process sharing the data directory joins the same session
+        other = ProfilingController(self.temp_dir, poll_interval=0)
+        self.assertEqual(other._current_run().session["id"], session["id"])
+        other.stop()
+
+    def test_sampling_with_allocation_snapshots(self):
+        session = self.controller.start("sampling", scope="requests", duration_seconds=30, allocations=True)
+        with self.controller.profile("requests", "POST /api/recording/upload_chunk/"):
+            data = [bytearray(1024) for _ in range(200)]
+            busy(0.1)
+        self.assertEqual(self.controller.stop()["id"], session["id"])
+        self.assertIsNone(self.controller.status()["active"])
+
+        pid = os.getpid()
+        folded = self.controller.get_profile_file(session["id"], f"{pid}.folded").read_text()
+        self.assertIn("test_profiling.py:busy", folded)
+        self.assertIsNotNone(self.controller.get_profile_file(session["id"], f"{pid}-tracemalloc.txt"))
+        self.assertIsNotNone(self.controller.get_profile_file(session["id"], f"{pid}.snapshot"))
+        self.assertEqual(len(data), 200)
+
+    def test_cprofile_covers_concurrent_requests(self):
+        session = self.controller.start("cprofile", scope="requests", max_units=2)
+        both_running = threading.Barrier(2, timeout=5)
+        errors = []
+
+        def request(label):
+            try:
+                with self.controller.profile("requests", label):
+                    both_running.wait()
+                    busy(0.02)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=request, args=(f"GET /api/projects/{n}/",)) for n in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        pid = os.getpid()
+        with open(self.controller.get_profile_file(session["id"], f"{pid}-summary.json")) as f:
+            summary = json.load(f)
+        self.assertEqual((summary["units"], summary["mode"]), (2, "cprofile"))
+        self.assertIsNotNone(self.controller.get_profile_file(session["id"], f"{pid}.prof"))
+
+    def test_cprofile_falls_back_to_sampling_when_another_profiler_is_active(self):
+        session = self.controller.start("cprofile", scope="jobs", max_units=1)
+        with patch('xscriber.modules.profiling.cProfile.Profile') as mock_profile:
+            mock_profile.return_value.enable.side_effect = ValueError("Another profiling tool is already active")
+            with self.controller.profile("jobs", "trd_update #1"):
+                busy(0.1)
+
+        pid = os.getpid()
+        with open(self.controller.get_profile_file(session["id"], f"{pid}-summary.json")) as f:
+            self.assertEqual(json.load(f)["mode"], "sampling")
+        folded = self.controller.get_profile_file(session["id"], f"{pid}.folded").read_text()
+        self.assertIn("test_profiling.py:busy", folded)
+        self.assertIsNone(self.controller.get_profile_file(session["id"], f"{pid}.prof"))
+
+    def test_invalid_sessions_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.controller.start("strace")
+        with self.assertRaises(ValueError):
+            self.controller.start("cprofile", scope="threads")
+        with self.assertRaises(ValueError):
+            self.controller.start("cprofile", max_units=0)
+
+
+class ProfilingEndpointTests(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.controller = ProfilingController(self.temp_dir, poll_interval=0)
+        patcher = patch.object(views.project_handler, 'profiler', self.controller)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.controller.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_requires_staff_or_token(self):
+        client = Client()
+        self.assertEqual(client.get('/api/admin/profiling/').status_code, 401)
+
+        User.objects.create_user("user", password="pw")
+        client.login(username="user", password="pw")
+        self.assertEqual(client.get('/api/admin/profiling/').status_code, 403)
+
+        User.objects.create_user("admin", password="pw", is_staff=True)
+        client.login(username="admin", password="pw")
+        self.assertEqual(client.get('/api/admin/profiling/').json()["active"], None)
+
+        with override_settings(PROFILING_TOKEN="secret"):
+            response = Client().post('/api/admin/profiling/', json.dumps({"mode": "cprofile", "max_units": 1}),
+                                     content_type='application/json', HTTP_AUTHORIZATION="Bearer secret")
+            self.assertEqual(Client().get('/api/admin/profiling/', HTTP_AUTHORIZATION="Bearer wrong").status_code, 401)
+
+        session = response.json()["session"]
+        self.assertEqual((session["mode"], session["max_units"]), ("cprofile", 1))
+
+        # The next request is profiled by the middleware and the result can be downloaded
+        client.get('/api/projects/')
+        name = f"{os.getpid()}-summary.json"
+        response = client.get(f'/api/admin/profiling/{session["id"]}/{name}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response['Content-Disposition'])
+        summary = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(summary["slowest"][0]["label"], "GET /api/projects/")
+        response.close()
+
+        self.assertEqual(client.get(f'/api/admin/profiling/{session["id"]}/missing.prof').status_code, 404)
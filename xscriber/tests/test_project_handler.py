@@ -2,15 +2,21 @@ import os
 import json
 import tempfile
 import time
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from django.test import TestCase
+from xscriber.modules.chat_completion import ChatCompletionProcessor
+from xscriber.modules.job_journal import JobJournal
 from xscriber.modules.project_handler import ProjectHandler
+from xscriber.modules.recording_handler import RecordingLimitError
+from xscriber.modules.usage_accounting import record_usage
+from xscriber.modules.chunk_trace import make_span, trace_span
 
 
 class ProjectHandlerTests(TestCase):
     def setUp(self):
         self.temp_dir = tempfile.mkdtemp()
-        with patch('django.conf.settings.DATA_DIR', self.temp_dir):
+        with patch('django.conf.settings.DATA_DIR', self.temp_dir), \
+             patch('django.conf.settings.JOB_RECONCILE_ON_STARTUP', False):
             self.handler = ProjectHandler(data_dir=self.temp_dir)
 
     def tearDown(self):
@@ -24,8 +30,8 @@ class ProjectHandlerTests(TestCase):
             dir_path = os.path.join(self.temp_dir, dirname)
             self.assertTrue(os.path.exists(dir_path))
 
-    @patch('xscriber.modules.project_handler.WhisperTranscriber')
-    @patch('xscriber.modules.project_handler.ChatCompletionProcessor')
+    @patch('xscriber.modules.transcriber.WhisperTranscriber')
+    @patch('xscriber.modules.chat_completion.ChatCompletionProcessor')
     def test_create_project(self, mock_chat_processor, mock_transcriber):
         mock_chat_processor.return_value.generate_trd_document.return_value = "# Test TRD"
 
@@ -141,6 +147,47 @@ class ProjectHandlerTests(TestCase):
         self.assertTrue(result)
         mock_handler_instance.start_recording.assert_called_once_with(project_id)
 
+    @patch('xscriber.modules.project_handler.RecordingHandler')
+    def test_projects_record_in_concurrent_sessions(self, mock_recording_handler):
+        handlers = {}
+
+        def make_handler(**options):
+            handler = MagicMock()
+            handler.start_recording.side_effect = lambda project_id: handlers.setdefault(project_id, handler) and True
+            handler.get_current_project_id.side_effect = lambda: next(p for p, h in handlers.items() if h is handler)
+            handler.stop_recording.return_value = True
+            return handler
+
+        mock_recording_handler.side_effect = make_handler
+        self.handler.recording_sessions.max_sessions = 2
+        project_ids = [self.handler.create_project(name) for name in ("One", "Two", "Three")]
+
+        self.assertTrue(self.handler.start_recording(project_ids[0]))
+        self.assertTrue(self.handler.start_recording(project_ids[1]))
+        with self.assertRaises(RecordingLimitError):
+            self.handler.start_recording(project_ids[2])
+        self.assertEqual(mock_recording_handler.call_args.kwargs["output_dir"], self.handler.audio_dir)
+
+        # Each session queues its chunks for its own project
+        self.handler._queue_transcription = MagicMock()
+        callback = handlers[project_ids[1]].set_chunk_saved_callback.call_args.args[0]
+        callback("/tmp/chunk_3.wav")
+        self.handler._queue_transcription.assert_called_once_with(project_ids[1], "/tmp/chunk_3.wav")
+
+        self.handler.finalize_session = MagicMock()
+        self.assertFalse(self.handler.stop_recording())
+        self.assertTrue(self.handler.stop_recording(project_ids[0]))
+        self.handler.finalize_session.assert_called_once_with(project_ids[0])
+        self.assertEqual([s["project_id"] for s in self.handler.get_recording_sessions()], [project_ids[1]])
+
+    def test_create_project_writes_skeleton_without_api_client(self):
+        project_id = self.handler.create_project("Test Project")
+
+        self.assertIsNone(self.handler._chat_processor)
+        document = self.handler.get_trd_document(project_id)
+        self.assertFalse(any(document.is_defined(key) for key in document.sections))
+        self.assertEqual(set(document.sections), set(ChatCompletionProcessor(api_key="test_key").trd_ontology_prompts))
+
     def test_start_recording_project_not_found(self):
         result = self.handler.start_recording("nonexistent")
         self.assertFalse(result)
@@ -180,4 +227,312 @@ class ProjectHandlerTests(TestCase):
         self.assertEqual(len(result), 2)
         self.assertEqual(result[0]['chunk_id'], 1)
         self.assertEqual(result[0]['text'], "First transcription")
-        self.assertEqual(result[1]['chunk_id'], 2)
\ No newline at end of file
+        self.assertEqual(result[1]['chunk_id'], 2)
+
+    def _write_patch_fixture(self, project_id):
+        trd_file = os.path.join(self.temp_dir, 'output', f'{project_id}_trd.md')
+        with open(trd_file, 'w') as f:
+            f.write("# Technical Requirements Document\n\n## Requirements\n- Record audio\n")
+
+        trans_file = os.path.join(self.temp_dir, 'raw-transcriptions', f'{project_id}_transcription_2.json')
+        with open(trans_file, 'w') as f:
+            json.dump({"text": "We also need PDF export"}, f)
+
+        metadata_file = os.path.join(self.temp_dir, 'project_metadata', f'{project_id}_metadata.json')
+        with open(metadata_file, 'w') as f:
+            json.dump({"project_id": project_id, "name": "Test Project"}, f)
+
+        return trd_file, trans_file
+
+    def test_update_trd_document_patch_applies_operations(self):
+        project_id = "test123"
+        trd_file, trans_file = self._write_patch_fixture(project_id)
+
+        self.handler.chat_processor = MagicMock()
+        self.handler.chat_processor.model = "gpt-4o-mini"
+        self.handler.chat_processor.with_model.return_value = self.handler.chat_processor
+        self.handler.chat_processor.agenerate_trd_patch = AsyncMock(return_value=[
+            {"op": "add", "section": "requirements", "item": "Export PDF"}
+        ])
+
+        self.handler._update_trd_document_patch(project_id, trans_file)
+
+        with open(trd_file, 'r') as f:
+            self.assertIn("- Record audio\n- Export PDF", f.read())
+        metadata = self.handler.get_project_metadata(project_id)
+        self.assertEqual(metadata["trd_version"], 1)
+        self.assertEqual(metadata["trd_provenance"]["method"], "patch")
+        self.assertEqual(metadata["trd_provenance"]["tier"], "preview")
+        self.assertEqual(metadata["trd_provenance"]["model"], "gpt-4o-mini")
+
+    def test_update_trd_document_patch_falls_back_on_invalid_patch(self):
+        project_id = "test123"
+        _, trans_file = self._write_patch_fixture(project_id)
+
+        self.handler.chat_processor = MagicMock()
+        self.handler.chat_processor.with_model.return_value = self.handler.chat_processor
+        self.handler.chat_processor.agenerate_trd_patch = AsyncMock(return_value=[
+            {"op": "replace", "section": "requirements", "old": "Missing item", "new": "x"}
+        ])
+
+        with patch.object(self.handler, '_aupdate_trd_document_comprehensive', new_callable=AsyncMock) as mock_comprehensive:
+            self.handler._update_trd_document_patch(project_id, trans_file)
+            mock_comprehensive.assert_awaited_once_with(project_id, tier="preview")
+
+    def test_model_policy_defaults_and_overrides(self):
+        project_id = "test123"
+        self._write_patch_fixture(project_id)
+
+        # An explicit key keeps the processor independent of OPENAI_API_KEY in the environment
+        self.handler.chat_processor = ChatCompletionProcessor(api_key="test_key")
+        with patch('django.conf.settings.TRD_PREVIEW_MODEL', 'gpt-4o-mini'), \
+             patch('django.conf.settings.TRD_FINAL_MODEL', 'gpt-4o'):
+            self.assertEqual(self.handler.get_model_policy(project_id),
+                             {"preview_model": "gpt-4o-mini", "final_model": "gpt-4o"})
+
+            self.assertTrue(self.handler.set_model_policy(project_id, {"final_model": "gpt-4.1"}))
+            self.assertEqual(self.handler.get_model_policy(project_id)["final_model"], "gpt-4.1")
+            self.assertEqual(self.handler._processor_for_tier(project_id, "final").model, "gpt-4.1")
+            self.assertEqual(self.handler._processor_for_tier(project_id, "preview").model, "gpt-4o-mini")
+
+        with self.assertRaises(ValueError):
+            self.handler.set_model_policy(project_id, {"draft_model": "gpt-4o"})
+
+    def test_final_pass_uses_final_tier(self):
+        project_id = "test123"
+        self._write_patch_fixture(project_id)
+
+        with patch.object(self.handler, '_aupdate_trd_document_comprehensive',
+                          new_callable=AsyncMock, return_value=True) as mock_comprehensive:
+            self.assertTrue(self.handler.finalize_session(project_id))
+            self.assertTrue(self.handler.pipeline.wait_until_idle(timeout=5))
+            mock_comprehensive.assert_awaited_once_with(project_id, tier="final")
+
+    def test_reconcile_jobs_requeues_missing_work(self):
+        project_id = "test123"
+        self._write_patch_fixture(project_id)
+        audio_file = os.path.join(self.temp_dir, 'audio-recordings', f'{project_id}_audiochunk_3.wav')
+        with open(audio_file, 'wb') as f:
+            f.write(b'fake audio')
+        # Chunk 2 already has a transcription
+        with open(os.path.join(self.temp_dir, 'audio-recordings', f'{project_id}_audiochunk_2.wav'), 'wb') as f:
+            f.write(b'fake audio')
+
+        with patch.object(self.handler.pipeline, 'submit_transcription', return_value=1) as mock_transcription, \
+             patch.object(self.handler.pipeline, 'submit_final_pass', return_value=2) as mock_final:
+            result = self.handler.reconcile_jobs()
+
+        # Backfill after a restart is bulk work; it must not delay live sessions
+        mock_transcription.assert_called_once_with(project_id, os.path.realpath(audio_file),
+                                                   priority=JobJournal.PRIORITY_BULK)
+        mock_final.assert_called_once_with(project_id, priority=JobJournal.PRIORITY_BULK)
+        self.assertEqual(result, {"transcriptions": 1, "trd_passes": 1})
+
+    def test_handler_without_workers_only_enqueues(self):
+        project_id = "test123"
+        self._write_patch_fixture(project_id)
+        # Stand-in for the run_pipeline process sharing this data directory
+        self.handler.pipeline.stop()
+
+        with patch('django.conf.settings.DATA_DIR', self.temp_dir):
+            web_handler = ProjectHandler(data_dir=self.temp_dir, start_workers=False)
+        try:
+            self.assertTrue(web_handler.finalize_session(project_id))
+
+            self.assertFalse(web_handler.pipeline.has_workers)
+            self.assertEqual(web_handler.job_journal.count_active(project_id=project_id), 1)
+        finally:
+            web_handler.cleanup()
+
+    def test_metadata_updates_are_locked_and_atomic(self):
+        project_id = "test123"
+        self._write_patch_fixture(project_id)
+
+        # Nested acquisitions (update inside a read-modify-write) must not deadlock
+        with self.handler._metadata_locked():
+            self.assertTrue(self.handler.update_project_metadata(project_id, {"chunk_count": 3}))
+        self.assertIsNone(self.handler._metadata_lock_file)
+
+        self.assertEqual(self.handler.get_project_metadata(project_id)["chunk_count"], 3)
+        leftovers = [name for name in os.listdir(os.path.join(self.temp_dir, 'project_metadata'))
+                     if name.endswith('.tmp')]
+        self.assertEqual(leftovers, [])
+
+    def test_clients_and_workers_are_created_on_first_use(self):
+        self.assertIsNone(self.handler._transcriber)
+        self.assertIsNone(self.handler._chat_processor)
+        self.assertFalse(self.handler.pipeline.has_workers)
+
+        with patch('xscriber.modules.transcriber.WhisperTranscriber') as mock_transcriber:
+            self.assertIs(self.handler.transcriber, mock_transcriber.return_value)
+            self.assertIs(self.handler.transcriber, mock_transcriber.return_value)
+        mock_transcriber.assert_called_once_with(async_http_client=self.handler.pipeline.http_client)
+
+        self.handler._queue_transcription("proj1", "/tmp/missing_audiochunk_1.wav")
+        self.assertTrue(self.handler.pipeline.has_workers)
+
+    def test_queued_regeneration_uses_interactive_priority(self):
+        project_id = "test123"
+        self._write_patch_fixture(project_id)
+
+        with patch.object(self.handler.pipeline, 'submit_final_pass', return_value=1) as mock_final:
+            self.assertTrue(self.handler.queue_trd_regeneration(project_id))
+            self.assertTrue(self.handler.finalize_session(project_id))
+            self.assertFalse(self.handler.queue_trd_regeneration("missing"))
+
+        self.assertEqual(mock_final.call_args_list, [
+            ((project_id,), {"priority": JobJournal.PRIORITY_INTERACTIVE}),
+            ((project_id,), {"priority": JobJournal.PRIORITY_LIVE}),
+        ])
+
+    def test_delete_project_cancels_pending_jobs(self):
+        project_id = "test123"
+        self._write_patch_fixture(project_id)
+        self.handler.pipeline.stop()
+        job_id = self.handler.pipeline.submit_transcription(project_id, "/tmp/test123_audiochunk_1.wav")
+
+        self.assertTrue(self.handler.delete_project(project_id))
+
+        job = self.handler.job_journal.get_job(job_id)
+        self.assertEqual((job["status"], job["error"]), ("cancelled", "project deleted"))
+
+    def test_upload_admission_follows_transcription_backlog(self):
+        self.handler.pipeline.stop()
+        self.assertTrue(self.handler.check_upload_admission("proj1")["admitted"])
+
+        for chunk in range(3):
+            self.handler.pipeline.submit_transcription("proj1", f"/tmp/proj1_audiochunk_{chunk}.wav")
+        # A run_pipeline worker in another process is transcribing one of them
+        self.handler.job_journal.claim(["transcription"], "run-pipeline-worker")
+
+        with patch('django.conf.settings.UPLOAD_MAX_PROJECT_BACKLOG', 2), \
+             patch.object(self.handler.job_journal, 'get_average_duration', return_value=8.0):
+            admission = self.handler.check_upload_admission("proj1")
+            # Another project is still under its own limit
+            self.assertTrue(self.handler.check_upload_admission("proj2")["admitted"])
+
+        # Two chunks over the limit at 8s each, for the one worker busy on them
+        self.assertFalse(admission["admitted"])
+        self.assertEqual(admission["reason"], "transcription_backlog")
+        self.assertEqual(admission["retry_after"], 16)
+        self.assertEqual(self.handler.get_pipeline_stats()["upload_rejections"], {"transcription_backlog": 1})
+
+    def test_upload_admission_rejects_when_disk_is_nearly_full(self):
+        with patch('xscriber.modules.project_handler.shutil.disk_usage', return_value=MagicMock(free=10 * 1024 * 1024)), \
+             patch('django.conf.settings.UPLOAD_MAX_RETRY_AFTER_SECONDS', 90):
+            admission = self.handler.check_upload_admission("proj1")
+
+        self.assertEqual((admission["admitted"], admission["reason"], admission["retry_after"]),
+                         (False, "disk_space", 90))
+
+    def test_completed_transcriptions_are_searchable(self):
+        project_id = "test123"
+        self._write_patch_fixture(project_id)
+        self.handler.pipeline.stop()
+
+        async def fake_transcribe(audio_path, output_path, language=None):
+            with open(output_path, 'w') as f:
+                json.dump({"text": "Export invoices monthly", "segments": [
+                    {"id": 0, "start": 4.0, "end": 7.5, "text": " Export invoices monthly"}
+                ]}, f)
+            return True
+
+        self.handler.transcriber = MagicMock()
+        self.handler.transcriber.atranscribe_and_save = fake_transcribe
+        self.assertTrue(self.handler.pipeline.run(
+            self.handler._aprocess_transcription(project_id, f"/tmp/{project_id}_audiochunk_2.wav")))
+
+        results = self.handler.search_transcriptions("invoices")
+        self.assertEqual([(r["project_id"], r["chunk_id"], r["start"]) for r in results], [(project_id, 2, 4.0)])
+        self.assertEqual(results[0]["project_name"], "Test Project")
+
+        self.handler.delete_project(project_id)
+        self.assertEqual(self.handler.search_transcriptions("invoices"), [])
+
+    def test_chunk_trace_follows_chunk_to_first_trd_version(self):
+        project_id = "test123"
+        _, trans_file = self._write_patch_fixture(project_id)
+        audio_file = os.path.join(self.temp_dir, 'audio-recordings', f'{project_id}_audiochunk_2.wav')
+        with open(audio_file, 'wb') as f:
+            f.write(b'audio')
+        self.handler.pipeline.stop()
+        self.handler.trd_update_mode = "patch"
+
+        uploaded = time.time()
+        with patch.object(self.handler, '_ensure_pipeline'), \
+             patch.object(self.handler.pipeline, 'submit_transcription') as mock_submit:
+            self.handler._queue_transcription(project_id, audio_file, trace_id="abc",
+                                              spans=[make_span("upload_receive", uploaded, uploaded + 0.01)])
+        self.assertEqual(mock_submit.call_args.kwargs["trace_id"], "abc")
+
+        async def fake_transcribe(audio_path, output_path, language=None):
+            with trace_span("whisper_call"):
+                pass
+            return True
+
+        self.handler.transcriber = MagicMock()
+        self.handler.transcriber.atranscribe_and_save = fake_transcribe
+        with patch.object(self.handler, '_submit_preview_update') as mock_preview:
+            self.handler.pipeline.run(self.handler._aprocess_transcription(project_id, audio_file))
+        self.assertEqual(mock_preview.call_args.kwargs["trace_id"], "abc")
+
+        self.handler.chat_processor = MagicMock()
+        self.handler.chat_processor.model = "gpt-4o-mini"
+        self.handler.chat_processor.with_model.return_value = self.handler.chat_processor
+        self.handler.chat_processor.agenerate_trd_patch = AsyncMock(return_value=[
+            {"op": "add", "section": "requirements", "item": "Export PDF"}
+        ])
+        self.handler.pipeline.run(self.handler._aprocess_trd_update(project_id, trans_file, "preview"))
+
+        timeline = self.handler.get_chunk_timeline(project_id, 2)
+        self.assertEqual((timeline["trace_id"], timeline["first_trd_version"]), ("abc", 1))
+        self.assertEqual(timeline["trd_version"]["method"], "patch")
+        self.assertEqual([span["name"] for span in timeline["spans"]],
+                         ["upload_receive", "transcription", "whisper_call", "trd_generation",
+                          "cache_trd_version", "trd_write"])
+        self.assertEqual(timeline["spans"][-1]["trd_version"], 1)
+        self.assertGreaterEqual(timeline["chunk_to_trd_seconds"], timeline["chunk_to_transcript_seconds"])
+        self.assertIsNone(self.handler.get_chunk_timeline(project_id, 9))
+
+    def test_usage_is_aggregated_per_project_and_day(self):
+        project_id = "test123"
+        self._write_patch_fixture(project_id)
+        self.handler.pipeline.stop()
+
+        async def fake_transcribe(audio_path, output_path, language=None):
+            record_usage({"kind": "transcription", "timestamp": "2025-01-01T10:00:00", "model": "whisper-1",
+                          "audio_seconds": 30.0, "latency_seconds": 2.0, "cached": False,
+                          "estimated_cost": 0.003})
+            with open(output_path, 'w') as f:
+                json.dump({"text": "Export invoices monthly", "segments": []}, f)
+            return True
+
+        self.handler.transcriber = MagicMock()
+        self.handler.transcriber.atranscribe_and_save = fake_transcribe
+        self.handler.pipeline.run(
+            self.handler._aprocess_transcription(project_id, f"/tmp/{project_id}_audiochunk_2.wav"))
+        self.handler._record_usage(project_id, [
+            {"kind": "chat", "timestamp": "2025-01-02T09:00:00", "model": "gpt-4o", "prompt_tokens": 1000,
+             "completion_tokens": 200, "latency_seconds": 3.0, "cached": False, "estimated_cost": 0.0045},
+            {"kind": "chat", "timestamp": "2025-01-02T09:05:00", "model": "gpt-4o", "prompt_tokens": 1000,
+             "completion_tokens": 200, "latency_seconds": 0.0, "cached": True, "estimated_cost": 0.0045}
+        ], "trd_patch_preview")
+        self.handler.update_project_metadata(project_id, {"trd_version": 3})
+
+        usage = self.handler.get_project_usage(project_id)
+        self.assertEqual(usage["totals"]["calls"], 3)
+        self.assertAlmostEqual(usage["totals"]["cost"], 0.0075)
+        self.assertAlmostEqual(usage["totals"]["saved_cost"], 0.0045)
+        self.assertEqual(usage["totals"]["audio_seconds"], 30.0)
+        self.assertAlmostEqual(usage["cost_per_trd_version"], 0.0025)
+        self.assertAlmostEqual(usage["cost_per_audio_minute"], 0.015)
+        self.assertEqual([day["date"] for day in usage["daily"]], ["2025-01-01", "2025-01-02"])
+        self.assertEqual(set(usage["by_operation"]), {"transcription", "trd_patch_preview"})
+        self.assertEqual(usage["by_operation"]["trd_patch_preview"]["cached_calls"], 1)
+        # Only chat calls go into the legacy token totals
+        self.assertEqual(self.handler.get_project_metadata(project_id)["token_usage"]["prompt_tokens"], 2000)
+
+        report = self.handler.get_usage_report()
+        self.assertEqual([p["project_id"] for p in report["projects"]], [project_id])
+        self.assertAlmostEqual(report["totals"]["cost"], 0.0075)
+        self.assertEqual(self.handler.get_usage_report(days=1)["projects"], [])
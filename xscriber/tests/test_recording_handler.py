@@ -1,9 +1,10 @@
 import os
 import tempfile
 import time
+import wave
 from unittest.mock import patch, MagicMock
 from django.test import TestCase
-from xscriber.modules.recording_handler import RecordingHandler
+from xscriber.modules.recording_handler import RecordingHandler, RecordingSessionManager, RecordingLimitError
 
 
 class RecordingHandlerTests(TestCase):
@@ -120,4 +121,94 @@ class RecordingHandlerTests(TestCase):
         result = self.handler.stop_recording()
         self.assertTrue(result)
         self.assertFalse(self.handler.is_recording)
-        self.assertIsNone(self.handler.current_project_id)
\ No newline at end of file
+        self.assertIsNone(self.handler.current_project_id)
+
+    def test_recording_loop_splits_chunks_by_sample_count(self):
+        # 10 frames of 16-bit mono per chunk, read 4 frames at a time so reads straddle chunks
+        handler = RecordingHandler(chunk_duration=1, output_dir=self.temp_dir, sample_rate=10, chunk_size=4)
+        reads = [bytes(range(i * 8, i * 8 + 8)) for i in range(6)]
+
+        def read(size, exception_on_overflow=True):
+            if len(reads) == 1:
+                handler.is_recording = False
+            return reads.pop(0)
+
+        handler.current_project_id = "test_project"
+        handler.chunk_counter = 1
+        handler.is_recording = True
+        handler.audio_interface = MagicMock()
+        handler.audio_interface.get_sample_size.return_value = 2
+        handler.audio_stream = MagicMock()
+        handler.audio_stream.read.side_effect = read
+        saved = []
+        handler.set_chunk_saved_callback(saved.append)
+
+        with patch('xscriber.modules.recording_handler.pyaudio', MagicMock()):
+            handler._recording_loop()
+
+        audio = []
+        for path in saved:
+            with wave.open(path, 'rb') as wf:
+                audio.append(wf.readframes(wf.getnframes()))
+        self.assertEqual([os.path.basename(path) for path in saved],
+                         ["test_project_audiochunk_1.wav", "test_project_audiochunk_2.wav",
+                          "test_project_audiochunk_3.wav"])
+        # Two full chunks, then the partial last chunk saved when recording stops
+        self.assertEqual([len(chunk) for chunk in audio], [20, 20, 8])
+        self.assertEqual(b"".join(audio), bytes(range(48)))
+
+
+class RecordingSessionManagerTests(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.manager = RecordingSessionManager(
+            max_sessions=2,
+            handler_factory=lambda **options: RecordingHandler(chunk_duration=0.05, output_dir=self.temp_dir,
+                                                               chunk_size=4, **options)
+        )
+        mock_pyaudio = MagicMock()
+        mock_pyaudio.PyAudio.return_value.open.return_value.read.side_effect = \
+            lambda size, exception_on_overflow=True: (time.sleep(0.005), b'\x00\x00' * size)[1]
+        mock_pyaudio.PyAudio.return_value.get_sample_size.return_value = 2
+        patcher = patch('xscriber.modules.recording_handler.pyaudio', mock_pyaudio)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.manager.cleanup()
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_sessions_capture_independently_up_to_limit(self):
+        with open(os.path.join(self.temp_dir, "proj_b_audiochunk_4.wav"), 'w') as f:
+            f.write("earlier chunk")
+        saved = {"proj_a": [], "proj_b": []}
+
+        self.assertEqual(self.manager.start_session("proj_a", saved["proj_a"].append), "proj_a")
+        self.assertEqual(self.manager.start_session("proj_b", saved["proj_b"].append, session_id="s2"), "s2")
+        self.assertIsNone(self.manager.start_session("proj_a"))
+        with self.assertRaises(RecordingLimitError):
+            self.manager.start_session("proj_c")
+
+        time.sleep(0.2)
+        self.assertTrue(self.manager.stop_session("s2"))
+        self.assertFalse(self.manager.stop_session("s2"))
+        self.assertEqual([s["project_id"] for s in self.manager.list_sessions()], ["proj_a"])
+        # The freed slot can be reused while the first session keeps recording
+        self.assertEqual(self.manager.start_session("proj_c"), "proj_c")
+        self.manager.cleanup()
+
+        self.assertEqual(self.manager.active_count(), 0)
+        self.assertTrue(saved["proj_a"] and saved["proj_b"])
+        for project_id, first_chunk in (("proj_a", 1), ("proj_b", 5)):
+            numbers = [int(path.rsplit('_', 1)[-1][:-4]) for path in saved[project_id]]
+            self.assertEqual(numbers, list(range(first_chunk, first_chunk + len(numbers))))
+            self.assertTrue(all(os.path.basename(path).startswith(project_id) for path in saved[project_id]))
+        with wave.open(saved["proj_a"][0], 'rb') as wf:
+            self.assertEqual((wf.getnchannels(), wf.getsampwidth()), (1, 2))
+            self.assertGreater(wf.getnframes(), 0)
+
+    def test_failed_start_frees_the_slot(self):
+        with patch('xscriber.modules.recording_handler.pyaudio.PyAudio', side_effect=Exception("No device")):
+            self.assertIsNone(self.manager.start_session("proj_a"))
+        self.assertEqual(self.manager.list_sessions(), [])
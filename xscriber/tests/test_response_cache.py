@@ -0,0 +1,98 @@
+import os
+import time
+import tempfile
+from unittest.mock import patch, MagicMock
+from django.test import TestCase
+from xscriber.modules.response_cache import ResponseCache
+from xscriber.modules.chat_completion import ChatCompletionProcessor
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = ResponseCache(self.temp_dir, max_entries=3)
+        self.messages = [{"role": "user", "content": "Hello"}]
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_make_key_depends_on_all_parameters(self):
+        key = self.cache.make_key("gpt-3.5-turbo", 0.3, 1000, self.messages)
+        self.assertEqual(key, self.cache.make_key("gpt-3.5-turbo", 0.3, 1000, self.messages))
+        self.assertNotEqual(key, self.cache.make_key("gpt-4", 0.3, 1000, self.messages))
+        self.assertNotEqual(key, self.cache.make_key("gpt-3.5-turbo", 0.5, 1000, self.messages))
+        self.assertNotEqual(key, self.cache.make_key("gpt-3.5-turbo", 0.3, 2000, self.messages))
+        self.assertNotEqual(key, self.cache.make_key("gpt-3.5-turbo", 0.3, 1000, [{"role": "user", "content": "Hi"}]))
+
+    def test_get_set_and_stats(self):
+        key = self.cache.make_key("gpt-3.5-turbo", 0.3, 1000, self.messages)
+        self.assertIsNone(self.cache.get(key))
+
+        self.cache.set(key, "Cached answer")
+        self.assertEqual(self.cache.get(key)["content"], "Cached answer")
+
+        stats = self.cache.get_stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["entries"], 1)
+
+    def test_expired_entry_is_a_miss(self):
+        cache = ResponseCache(self.temp_dir, ttl_seconds=0)
+        cache.set("expired", "Old answer")
+        time.sleep(0.01)
+        self.assertIsNone(cache.get("expired"))
+
+    def test_lru_eviction(self):
+        for i in range(3):
+            self.cache.set(f"key{i}", f"Answer {i}")
+            entry_path = os.path.join(self.temp_dir, f"key{i}.json")
+            os.utime(entry_path, (time.time() - 100 + i, time.time() - 100 + i))
+
+        # Touch the oldest entry so key1 becomes least recently used
+        self.cache.get("key0")
+        self.cache.set("key3", "Answer 3")
+
+        self.assertIsNotNone(self.cache.get("key0"))
+        self.assertIsNone(self.cache.get("key1"))
+        self.assertEqual(self.cache.get_stats()["evictions"], 1)
+
+
+class ChatCompletionCacheTests(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    @patch('xscriber.modules.chat_completion.openai.OpenAI')
+    def test_identical_requests_served_from_cache(self, mock_openai):
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+
+        mock_response = MagicMock()
+        mock_response.choices[0].message.content = "Updated section content"
+        mock_client.chat.completions.create.return_value = mock_response
+
+        processor = ChatCompletionProcessor(api_key="test_key", cache=ResponseCache(self.temp_dir))
+        first = processor.update_trd_section("overview", "Old content", "New transcription")
+        second = processor.update_trd_section("overview", "Old content", "New transcription")
+
+        self.assertEqual(first, second)
+        mock_client.chat.completions.create.assert_called_once()
+
+    @patch('xscriber.modules.chat_completion.openai.OpenAI')
+    def test_bypass_cache_forces_fresh_generation(self, mock_openai):
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+
+        mock_response = MagicMock()
+        mock_response.choices[0].message.content = "Updated section content"
+        mock_client.chat.completions.create.return_value = mock_response
+
+        processor = ChatCompletionProcessor(api_key="test_key", cache=ResponseCache(self.temp_dir))
+        processor.update_trd_section("overview", "Old content", "New transcription")
+        processor.update_trd_section("overview", "Old content", "New transcription", bypass_cache=True)
+
+        self.assertEqual(mock_client.chat.completions.create.call_count, 2)
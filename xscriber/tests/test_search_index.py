@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+from pathlib import Path
+from django.test import TestCase
+from xscriber.modules.search_index import TranscriptSearchIndex
+
+
+def make_transcription(*texts):
+    return {
+        "text": " ".join(texts),
+        "duration": 10.0 * len(texts),
+        "segments": [
+            {"id": i, "start": 10.0 * i, "end": 10.0 * (i + 1), "text": f" {text}"}
+            for i, text in enumerate(texts)
+        ]
+    }
+
+
+class TranscriptSearchIndexTests(TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.transcription_dir = self.temp_dir / 'raw-transcriptions'
+        self.transcription_dir.mkdir()
+        self.index = TranscriptSearchIndex(self.temp_dir / 'search.sqlite3')
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def write_transcription(self, project_id, chunk_id, transcription):
+        path = self.transcription_dir / f"{project_id}_transcription_{chunk_id}.json"
+        with open(path, 'w') as f:
+            json.dump(transcription, f)
+        return path
+
+    def test_search_returns_segment_times_and_snippets(self):
+        self.index.index_transcription("proj1", 3, make_transcription(
+            "Users need to export reports", "The login page should support single sign-on"))
+
+        results = self.index.search("sign-on login")
+        self.assertEqual(len(results), 1)
+        result = results[0]
+        self.assertEqual((result["project_id"], result["chunk_id"], result["segment_index"]), ("proj1", 3, 1))
+        self.assertEqual((result["start"], result["end"]), (10.0, 20.0))
+        self.assertIn("<mark>login</mark>", result["snippet"])
+        self.assertGreater(result["score"], 0)
+
+    def test_results_are_ranked_and_filtered_by_project(self):
+        self.index.index_transcription("proj1", 1, make_transcription("export the billing export as csv export"))
+        self.index.index_transcription("proj2", 1, make_transcription("we discussed billing and one export"))
+
+        results = self.index.search("export")
+        self.assertEqual([r["project_id"] for r in results], ["proj1", "proj2"])
+        self.assertEqual([r["project_id"] for r in self.index.search("export", project_id="proj2")], ["proj2"])
+        self.assertEqual(len(self.index.search("export", limit=1, offset=1)), 1)
+
+    def test_stemming_prefix_and_unsafe_queries(self):
+        self.index.index_transcription("proj1", 1, make_transcription("The reports were exported nightly"))
+
+        self.assertEqual(len(self.index.search("report")), 1)
+        self.assertEqual(len(self.index.search("night*")), 1)
+        # FTS syntax in user input is treated as plain text rather than raising
+        self.assertEqual(self.index.search('"reports AND (NEAR'), [])
+        self.assertEqual(self.index.search("   "), [])
+
+    def test_reindexing_a_chunk_replaces_its_segments(self):
+        self.index.index_transcription("proj1", 1, make_transcription("old wording"))
+        self.index.index_transcription("proj1", 1, make_transcription("new wording"))
+
+        self.assertEqual(self.index.search("old"), [])
+        self.assertEqual(len(self.index.search("wording")), 1)
+        self.assertEqual(self.index.get_stats()["segments"], 1)
+
+    def test_transcription_without_segments_is_indexed_whole(self):
+        self.index.index_transcription("proj1", 1, {"text": "plain text only", "duration": 4.0})
+
+        result = self.index.search("plain")[0]
+        self.assertEqual((result["start"], result["end"]), (0.0, 4.0))
+
+    def test_remove_project(self):
+        self.index.index_transcription("proj1", 1, make_transcription("shared term"))
+        self.index.index_transcription("proj2", 1, make_transcription("shared term"))
+
+        self.index.remove_project("proj1")
+        self.assertEqual([r["project_id"] for r in self.index.search("shared")], ["proj2"])
+
+    def test_rebuild_is_incremental(self):
+        first = self.write_transcription("proj1", 1, make_transcription("alpha"))
+        self.write_transcription("proj1", 2, make_transcription("beta"))
+        (self.transcription_dir / "notes.json").write_text("{}")
+
+        self.assertEqual(self.index.rebuild(self.transcription_dir),
+                         {"indexed": 2, "unchanged": 0, "removed": 0, "errors": 0})
+        self.assertEqual(self.index.rebuild(self.transcription_dir)["unchanged"], 2)
+
+        with open(first, 'w') as f:
+            json.dump(make_transcription("gamma"), f)
+        os.utime(first, (time.time() + 5, time.time() + 5))
+        (self.transcription_dir / "proj1_transcription_2.json").unlink()
+
+        counts = self.index.rebuild(self.transcription_dir)
+        self.assertEqual((counts["indexed"], counts["removed"]), (1, 1))
+        self.assertEqual(self.index.search("alpha"), [])
+        self.assertEqual(self.index.search("beta"), [])
+        self.assertEqual(len(self.index.search("gamma")), 1)
+
+        self.assertEqual(self.index.rebuild(self.transcription_dir, full=True)["indexed"], 1)
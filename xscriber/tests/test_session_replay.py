@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+import tempfile
+from pathlib import Path
+from datetime import datetime
+from django.test import TestCase
+from xscriber.modules.pipeline_benchmark import write_silent_wav
+from xscriber.modules.session_replay import (SessionReplay, RecordedTranscriber, load_source_session,
+                                             original_chunk_to_trd)
+
+
+class SessionReplayTests(TestCase):
+    def setUp(self):
+        self.source_dir = Path(tempfile.mkdtemp())
+        for directory in ('project_metadata', 'audio-recordings', 'raw-transcriptions'):
+            (self.source_dir / directory).mkdir()
+
+        # A session recorded an hour ago: chunks 1, 2 and 4 arrived 3 seconds apart
+        self.recorded_at = time.time() - 3600
+        self.arrivals = {1: self.recorded_at, 2: self.recorded_at + 3, 4: self.recorded_at + 6}
+        for chunk_id, arrived_at in self.arrivals.items():
+            audio_file = self.source_dir / 'audio-recordings' / f"proj1_audiochunk_{chunk_id}.wav"
+            write_silent_wav(audio_file, 1.0)
+            os.utime(audio_file, (arrived_at, arrived_at))
+            with open(self.source_dir / 'raw-transcriptions' / f"proj1_transcription_{chunk_id}.json", 'w') as f:
+                json.dump({"text": f"recorded chunk {chunk_id}", "duration": 1.0, "segments": []}, f)
+
+        metadata = {
+            "name": "Recorded",
+            "trd_versions": [
+                {"version": 1, "generated_at": datetime.fromtimestamp(self.recorded_at + 5).isoformat(),
+                 "new_chunk_ids": ["1", "2"]},
+                {"version": 2, "generated_at": datetime.fromtimestamp(self.recorded_at + 10).isoformat(),
+                 "new_chunk_ids": ["4"]}
+            ]
+        }
+        with open(self.source_dir / 'project_metadata' / 'proj1_metadata.json', 'w') as f:
+            json.dump(metadata, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.source_dir, ignore_errors=True)
+
+    def test_load_source_session_uses_arrival_times(self):
+        source = load_source_session(self.source_dir, "proj1")
+        self.assertEqual([(c["chunk_id"], round(c["offset"], 2)) for c in source["chunks"]],
+                         [(1, 0.0), (2, 3.0), (4, 6.0)])
+        self.assertEqual(source["timing"], "mtime")
+        self.assertEqual([round(latency, 2) for latency in original_chunk_to_trd(source)], [5.0, 2.0, 4.0])
+
+        # Without distinct mtimes the chunks are spaced by their duration
+        for chunk_id in self.arrivals:
+            os.utime(self.source_dir / 'audio-recordings' / f"proj1_audiochunk_{chunk_id}.wav",
+                     (self.recorded_at, self.recorded_at))
+        source = load_source_session(self.source_dir, "proj1")
+        self.assertEqual(source["timing"], "duration")
+        self.assertEqual([c["offset"] for c in source["chunks"]], [0.0, 1.0, 2.0])
+
+        self.assertIsNone(load_source_session(self.source_dir, "missing"))
+
+    def test_recorded_transcriber_copies_stored_transcript(self):
+        transcriber = RecordedTranscriber({"1": self.source_dir / 'raw-transcriptions' / "proj1_transcription_4.json"})
+        output = self.source_dir / "out" / "replay_transcription_1.json"
+
+        self.assertTrue(asyncio.run(transcriber.atranscribe_and_save("/tmp/replay_audiochunk_1.wav", str(output))))
+        with open(output) as f:
+            self.assertEqual(json.load(f)["text"], "recorded chunk 4")
+        with self.assertLogs("xscriber.replay", level="WARNING") as logs:
+            self.assertFalse(transcriber.transcribe_and_save("/tmp/replay_audiochunk_2.wav", str(output)))
+        self.assertIn("No recorded transcript for replayed chunk 2", logs.output[0])
+
+    def test_stub_replay_reports_freshness_and_backlog(self):
+        replay = SessionReplay("proj1", source_dir=self.source_dir, speed=20, backend="stub",
+                               sample_interval=0.05, timeout=60,
+                               server_options={"whisper_latency": 0, "whisper_realtime_factor": 0,
+                                               "chat_latency": 0, "token_rate": 0, "completion_tokens": 60})
+        result = replay.run()
+
+        self.assertTrue(result["completed"])
+        self.assertEqual(result["uploads"], {"sent": 3, "failed": 0, "rejected": 0})
+        # Replayed chunks are numbered in arrival order, as upload_audio_chunk would
+        self.assertEqual([(c["chunk"], c["source_chunk_id"]) for c in result["chunks"]], [(1, 1), (2, 2), (3, 4)])
+        self.assertTrue(all(c["first_trd_version"] for c in result["chunks"]))
+        self.assertEqual(result["freshness"]["chunk_to_trd"]["count"], 3)
+        self.assertEqual(result["freshness"]["original_chunk_to_trd"]["count"], 3)
+        # 6 seconds of session at 20x
+        self.assertGreaterEqual(result["chunks"][-1]["sent_at"], 0.29)
+
+        final_sample = result["timeline"][-1]
+        self.assertEqual((final_sample["chunks_in_trd"], final_sample["stale_chunks"]), (3, 0))
+        self.assertEqual((final_sample["transcription_backlog"], final_sample["trd_backlog"]), (0, 0))
+
+    def test_unknown_project_or_backend(self):
+        with self.assertRaises(ValueError):
+            SessionReplay("missing", source_dir=self.source_dir).run()
+        with self.assertRaises(ValueError):
+            SessionReplay("proj1", backend="live")
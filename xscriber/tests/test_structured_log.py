@@ -0,0 +1,87 @@
+import io
+import json
+import logging
+from types import SimpleNamespace
+from django.test import TestCase
+from xscriber.modules.structured_log import (configure_logging, get_logger, get_log_stats, log_context,
+                                             sampled, chunk_correlation_id)
+
+
+class StructuredLogTests(TestCase):
+    def configure(self, **overrides):
+        options = {"LOG_LEVEL": "INFO", "LOG_LEVELS": "", "LOG_SAMPLING": "", "LOG_FORMAT": "json",
+                   "LOG_QUEUE_SIZE": 100}
+        options.update(overrides)
+        self.stream = io.StringIO()
+        self.handler = configure_logging(SimpleNamespace(**options), stream=self.stream)
+        return self.handler
+
+    def records(self):
+        self.handler.stop()
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def tearDown(self):
+        for stage in ("trd", "pipeline"):
+            get_logger(stage).setLevel(logging.NOTSET)
+        configure_logging()
+
+    def test_records_are_json_with_context(self):
+        self.configure()
+        with log_context(project_id="proj1", correlation_id=chunk_correlation_id("proj1", "/data/proj1_audiochunk_3.wav")):
+            get_logger("transcription").info("Transcription completed for %s", "proj1_audiochunk_3.wav",
+                                             extra={"chunk_id": "3"})
+        get_logger("upload").warning("outside the context")
+
+        first, second = self.records()
+        self.assertEqual(first["stage"], "transcription")
+        self.assertEqual(first["level"], "INFO")
+        self.assertEqual(first["msg"], "Transcription completed for proj1_audiochunk_3.wav")
+        self.assertEqual((first["project_id"], first["correlation_id"], first["chunk_id"]), ("proj1", "proj1:3", "3"))
+        self.assertNotIn("correlation_id", second)
+        # The transcription file of the same chunk correlates with its audio
+        self.assertEqual(chunk_correlation_id("proj1", "proj1_transcription_3.json"), "proj1:3")
+        self.assertEqual(chunk_correlation_id("proj1", None), "proj1:final")
+
+    def test_exceptions_are_rendered_in_the_caller(self):
+        self.configure()
+        try:
+            raise ValueError("bad patch")
+        except ValueError:
+            get_logger("trd").exception("Error patching TRD document")
+
+        record, = self.records()
+        self.assertEqual(record["level"], "ERROR")
+        self.assertIn("ValueError: bad patch", record["exc"])
+
+    def test_per_stage_levels(self):
+        self.configure(LOG_LEVEL="WARNING", LOG_LEVELS="trd=DEBUG")
+        get_logger("trd").debug("trd detail")
+        get_logger("pipeline").info("pipeline detail")
+        get_logger("pipeline").warning("pipeline problem")
+
+        self.assertEqual([r["msg"] for r in self.records()], ["trd detail", "pipeline problem"])
+
+    def test_sampling_keeps_one_in_n_but_never_warnings(self):
+        self.configure(LOG_SAMPLING="chunk_progress=3")
+        log = get_logger("transcription")
+        for chunk in range(6):
+            log.info("chunk %d", chunk, extra=sampled("chunk_progress"))
+        log.warning("chunk failed", extra=sampled("chunk_progress"))
+
+        records = self.records()
+        self.assertEqual([r["msg"] for r in records], ["chunk 0", "chunk 3", "chunk failed"])
+        self.assertEqual(records[0]["sample_every"], 3)
+        self.assertEqual(get_log_stats()["suppressed"], {"chunk_progress": 4})
+
+    def test_writer_starts_lazily_and_full_queue_drops(self):
+        handler = self.configure(LOG_QUEUE_SIZE=2)
+        self.assertIsNone(handler._listener)
+
+        # Fill the queue without a writer draining it
+        handler.start()
+        handler._listener.stop()
+        for i in range(4):
+            get_logger("upload").info("record %d", i)
+        self.assertEqual(get_log_stats()["dropped"], 2)
+        self.assertEqual(get_log_stats()["queued"], 2)
+        handler._listener = None
@@ -0,0 +1,102 @@
+from unittest.mock import patch, MagicMock
+from django.test import TestCase
+from xscriber.modules.token_budget import (
+    TokenBudgetPlanner, estimate_tokens, estimate_message_tokens, truncate_to_tokens, estimate_cost,
+    estimate_audio_cost
+)
+from xscriber.modules.chat_completion import ChatCompletionProcessor
+
+
+class TokenEstimateTests(TestCase):
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("The API"), 2)
+        self.assertEqual(estimate_tokens("authentication, please."), 8)
+
+    def test_estimate_message_tokens_includes_overhead(self):
+        messages = [{"role": "user", "content": "Hello there"}]
+        self.assertEqual(estimate_message_tokens(messages), estimate_tokens("Hello there") + 7)
+
+    def test_truncate_to_tokens(self):
+        text = "word " * 100
+        self.assertEqual(truncate_to_tokens(text, 1000), text)
+        self.assertLessEqual(estimate_tokens(truncate_to_tokens(text, 10)), 10)
+        self.assertTrue(text.endswith(truncate_to_tokens(text, 10, keep="end")))
+
+    def test_estimate_cost(self):
+        self.assertAlmostEqual(estimate_cost("gpt-4o", 1_000_000, 100_000), 3.5)
+        self.assertAlmostEqual(estimate_cost("gpt-4o-2024-08-06", 1_000_000, 0), 2.5)
+        self.assertIsNone(estimate_cost("unknown-model", 1000, 1000))
+
+    def test_estimate_audio_cost(self):
+        self.assertAlmostEqual(estimate_audio_cost("whisper-1", 90), 0.009)
+        self.assertIsNone(estimate_audio_cost("unknown-model", 60))
+
+
+class TokenBudgetPlannerTests(TestCase):
+    def test_context_window_lookup(self):
+        self.assertEqual(TokenBudgetPlanner.get_context_window("gpt-4"), 8192)
+        self.assertEqual(TokenBudgetPlanner.get_context_window("gpt-4o-2024-08-06"), 128000)
+        self.assertEqual(TokenBudgetPlanner.get_context_window("unknown-model"), 8192)
+
+    def test_plan_max_tokens_limited_by_remaining_context(self):
+        planner = TokenBudgetPlanner("test", context_window=2000, safety_margin=0)
+        messages = [{"role": "user", "content": "word " * 1000}]
+        self.assertEqual(planner.plan_max_tokens(messages, 4096), 2000 - estimate_message_tokens(messages))
+        self.assertEqual(planner.plan_max_tokens([{"role": "user", "content": "Hi"}], 500), 500)
+
+    def test_plan_max_tokens_raises_when_prompt_overflows(self):
+        planner = TokenBudgetPlanner("test", context_window=1000)
+        with self.assertRaises(ValueError):
+            planner.plan_max_tokens([{"role": "user", "content": "word " * 2000}], 500)
+
+    def test_fit_transcriptions_keeps_everything_when_it_fits(self):
+        planner = TokenBudgetPlanner("test", context_window=10000)
+        transcriptions = ["first chunk", "second chunk"]
+        self.assertEqual(planner.fit_transcriptions(transcriptions, 100, 1000), transcriptions)
+
+    def test_fit_transcriptions_drops_oldest(self):
+        planner = TokenBudgetPlanner("test", context_window=1000, safety_margin=0)
+        transcriptions = ["old " * 300, "middle " * 300, "new " * 300]
+
+        result = planner.fit_transcriptions(transcriptions, 100, 200)
+
+        self.assertEqual(result[-1], transcriptions[-1])
+        self.assertIn("omitted", result[0])
+        self.assertNotIn(transcriptions[0], result)
+
+    def test_fit_transcriptions_summarizes_oldest(self):
+        planner = TokenBudgetPlanner("test", context_window=1000, safety_margin=0)
+        transcriptions = ["old " * 300, "middle " * 300, "new " * 200]
+        summarize = MagicMock(return_value="- Key decision")
+
+        result = planner.fit_transcriptions(transcriptions, 100, 200, summarize=summarize)
+
+        summarize.assert_called_once()
+        self.assertIn("- Key decision", result[0])
+        self.assertEqual(result[-1], transcriptions[-1])
+
+
+class ChatCompletionUsageTests(TestCase):
+    @patch('xscriber.modules.chat_completion.openai.OpenAI')
+    def test_track_usage_records_tokens(self, mock_openai):
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+
+        mock_response = MagicMock()
+        mock_response.choices[0].message.content = "Updated section content"
+        mock_response.usage.prompt_tokens = 120
+        mock_response.usage.completion_tokens = 30
+        mock_response.usage.total_tokens = 150
+        mock_client.chat.completions.create.return_value = mock_response
+
+        processor = ChatCompletionProcessor(api_key="test_key")
+        with processor.track_usage() as usage_records:
+            processor.update_trd_section("overview", "Old content", "New transcription")
+
+        self.assertEqual(len(usage_records), 1)
+        self.assertEqual(usage_records[0]["prompt_tokens"], 120)
+        self.assertEqual(usage_records[0]["completion_tokens"], 30)
+        self.assertFalse(usage_records[0]["cached"])
+        self.assertEqual(usage_records[0]["kind"], "chat")
+        self.assertAlmostEqual(usage_records[0]["estimated_cost"], (120 * 0.5 + 30 * 1.5) / 1_000_000)
@@ -1,9 +1,11 @@
 import os
 import json
+import asyncio
 import tempfile
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from django.test import TestCase
 from xscriber.modules.transcriber import WhisperTranscriber
+from xscriber.modules.usage_accounting import track_usage
 
 
 class WhisperTranscriberTests(TestCase):
@@ -44,6 +46,33 @@ class WhisperTranscriberTests(TestCase):
         self.assertEqual(result['language'], "en")
         self.assertEqual(result['duration'], 10.5)
 
+    @patch('xscriber.modules.transcriber.openai.AsyncOpenAI')
+    def test_atranscribe_success(self, mock_async_openai):
+        mock_client = MagicMock()
+        mock_async_openai.return_value = mock_client
+
+        mock_transcript = MagicMock()
+        mock_transcript.text = "Async transcription"
+        mock_transcript.language = "en"
+        mock_transcript.duration = 4.0
+        mock_transcript.segments = []
+        mock_client.audio.transcriptions.create = AsyncMock(return_value=mock_transcript)
+
+        with tempfile.NamedTemporaryFile(suffix='.wav') as temp_audio:
+            temp_audio.write(b'fake audio data')
+            temp_audio.flush()
+
+            transcriber = WhisperTranscriber(api_key="test_key")
+            with track_usage() as usage_records:
+                result = asyncio.run(transcriber.atranscribe(temp_audio.name))
+
+        self.assertEqual(result['text'], "Async transcription")
+        self.assertEqual(len(usage_records), 1)
+        self.assertEqual((usage_records[0]["kind"], usage_records[0]["audio_seconds"]), ("transcription", 4.0))
+        self.assertAlmostEqual(usage_records[0]["estimated_cost"], 0.0004)
+        uploaded = mock_client.audio.transcriptions.create.call_args.kwargs['file']
+        self.assertEqual(uploaded, (os.path.basename(temp_audio.name), b'fake audio data'))
+
     def test_transcribe_file_not_found(self):
         with self.assertRaises(FileNotFoundError):
             self.transcriber.transcribe("nonexistent_file.wav")
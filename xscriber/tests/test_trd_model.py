@@ -0,0 +1,113 @@
+from django.test import TestCase
+from xscriber.modules.trd_model import TRDDocument, TRDPatchError, TRD_SECTIONS, parse_trd, apply_trd_patch
+
+
+SAMPLE_TRD = """# Technical Requirements Document
+
+## Overview
+Live transcription service
+
+## Requirements
+- Record audio
+- Transcribe chunks
+
+### Non-functional
+- Low latency
+
+## Technical Specifications
+To be defined
+
+## Dependencies
+- OpenAI Whisper
+
+---
+*Generated by X-Scriber on 2025-09-23 02:42:14*
+"""
+
+
+class TRDModelTests(TestCase):
+    def test_parse_level_two_headings(self):
+        document = parse_trd(SAMPLE_TRD)
+
+        self.assertEqual(document.get_section("overview"), "Live transcription service")
+        self.assertEqual(document.get_section("requirements"),
+                         "- Record audio\n- Transcribe chunks\n\n### Non-functional\n- Low latency")
+        self.assertEqual(document.get_section("dependencies"), "- OpenAI Whisper")
+        self.assertEqual(document.get_section("architecture"), "")
+        self.assertEqual(document.generated_at, "2025-09-23 02:42:14")
+
+    def test_parse_level_one_headings(self):
+        document = parse_trd("# Overview\nThe overview\n\n# Constraints\nNone yet\n")
+        self.assertEqual(document.get_section("overview"), "The overview")
+        self.assertEqual(document.get_section("constraints"), "None yet")
+
+    def test_render_round_trip(self):
+        document = parse_trd(SAMPLE_TRD)
+        rendered = document.render()
+
+        reparsed = parse_trd(rendered)
+        for key, _ in TRD_SECTIONS:
+            if document.is_defined(key):
+                self.assertEqual(reparsed.get_section(key), document.get_section(key))
+            else:
+                self.assertFalse(reparsed.is_defined(key))
+        self.assertIn("## Architecture\nTo be defined", rendered)
+        self.assertTrue(rendered.endswith("*Generated by X-Scriber on 2025-09-23 02:42:14*\n"))
+
+    def test_parse_returns_independent_copies(self):
+        first = parse_trd(SAMPLE_TRD)
+        first.sections["overview"] = "Changed"
+        self.assertEqual(parse_trd(SAMPLE_TRD).get_section("overview"), "Live transcription service")
+
+    def test_with_sections_and_diff(self):
+        document = parse_trd(SAMPLE_TRD)
+        updated = document.with_sections({"constraints": "- Must run on-premise"})
+
+        self.assertEqual(list(document.diff(updated).keys()), ["constraints"])
+        self.assertEqual(updated.get_section("overview"), document.get_section("overview"))
+
+        with self.assertRaises(KeyError):
+            document.with_sections({"unknown": "content"})
+
+    def test_empty_document_has_all_sections(self):
+        document = TRDDocument()
+        self.assertEqual(set(document.sections), {key for key, _ in TRD_SECTIONS})
+        self.assertFalse(document.is_defined("overview"))
+
+
+class TRDPatchTests(TestCase):
+    def setUp(self):
+        self.document = parse_trd(SAMPLE_TRD)
+
+    def test_add_replace_remove(self):
+        patched = apply_trd_patch(self.document, [
+            {"op": "add", "section": "requirements", "item": "Export TRD as PDF"},
+            {"op": "replace", "section": "requirements", "old": "record audio", "new": "Record audio in the browser"},
+            {"op": "remove", "section": "dependencies", "item": "OpenAI Whisper"},
+            {"op": "add", "section": "constraints", "item": "Runs on-premise"},
+        ])
+
+        requirements = patched.get_section("requirements")
+        self.assertIn("- Record audio in the browser", requirements)
+        self.assertTrue(requirements.endswith("- Export TRD as PDF"))
+        self.assertFalse(patched.is_defined("dependencies"))
+        self.assertEqual(patched.get_section("constraints"), "- Runs on-premise")
+        self.assertEqual(patched.get_section("overview"), self.document.get_section("overview"))
+
+    def test_add_existing_item_is_noop(self):
+        patched = apply_trd_patch(self.document, [
+            {"op": "add", "section": "requirements", "item": "Transcribe chunks"}
+        ])
+        self.assertEqual(self.document.diff(patched), {})
+
+    def test_invalid_patches_raise(self):
+        invalid_patches = [
+            {"op": "add"},
+            [{"op": "rewrite", "section": "overview", "item": "x"}],
+            [{"op": "add", "section": "unknown", "item": "x"}],
+            [{"op": "replace", "section": "requirements", "old": "Not there", "new": "x"}],
+            [{"op": "remove", "section": "requirements", "item": ""}],
+        ]
+        for patch in invalid_patches:
+            with self.assertRaises(TRDPatchError):
+                apply_trd_patch(self.document, patch)
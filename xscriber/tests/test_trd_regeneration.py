@@ -0,0 +1,76 @@
+import os
+import json
+import shutil
+import tempfile
+from unittest.mock import patch, AsyncMock
+from django.test import TestCase
+from xscriber.modules.project_handler import ProjectHandler
+from xscriber.modules.trd_regeneration import TRDRegenerationJob
+
+
+class TRDRegenerationJobTests(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.handler = ProjectHandler(data_dir=self.temp_dir)
+        for project_id, name, updated in [("aaa", "Alpha", "2024-01-01T00:00:00"),
+                                          ("bbb", "Beta", "2024-03-01T00:00:00"),
+                                          ("ccc", "Alphabet", "2024-02-01T00:00:00")]:
+            metadata_file = os.path.join(self.temp_dir, 'project_metadata', f'{project_id}_metadata.json')
+            with open(metadata_file, 'w') as f:
+                json.dump({"project_id": project_id, "name": name, "last_updated": updated}, f)
+
+    def tearDown(self):
+        self.handler.cleanup()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_select_projects_oldest_first_with_filters(self):
+        self.assertEqual(TRDRegenerationJob.select_projects(self.handler), ["aaa", "ccc", "bbb"])
+        self.assertEqual(TRDRegenerationJob.select_projects(self.handler, name_contains="alpha"), ["aaa", "ccc"])
+        self.assertEqual(TRDRegenerationJob.select_projects(self.handler, updated_before="2024-02-15"), ["aaa", "ccc"])
+        self.assertEqual(TRDRegenerationJob.select_projects(self.handler, project_ids=["bbb"]), ["bbb"])
+
+    def test_run_checkpoints_results(self):
+        job = TRDRegenerationJob(self.handler, job_id="job1", concurrency=2)
+        job.create(["aaa", "bbb", "ccc"])
+
+        async def regenerate(project_id, bypass_cache):
+            return project_id != "bbb"
+
+        with patch.object(self.handler, '_aupdate_trd_document_comprehensive', side_effect=regenerate):
+            summary = job.run()
+
+        self.assertEqual(summary, {"pending": 0, "completed": 2, "failed": 1})
+
+        with open(job.checkpoint_file, 'r') as f:
+            saved = json.load(f)
+        self.assertEqual(saved["projects"]["bbb"]["status"], "failed")
+        self.assertEqual(saved["projects"]["aaa"]["status"], "completed")
+
+    def test_resume_only_runs_remaining_projects(self):
+        job = TRDRegenerationJob(self.handler, job_id="job2")
+        job.create(["aaa", "bbb", "ccc"])
+        job.state["projects"]["aaa"] = {"status": "completed"}
+        job.state["projects"]["bbb"] = {"status": "failed"}
+        job._save_checkpoint()
+
+        resumed = TRDRegenerationJob(self.handler, job_id="job2")
+        self.assertTrue(resumed.load())
+        self.assertEqual(resumed.remaining_projects(), ["ccc"])
+        self.assertEqual(resumed.remaining_projects(retry_failed=True), ["bbb", "ccc"])
+
+        with patch.object(self.handler, '_aupdate_trd_document_comprehensive',
+                          new_callable=AsyncMock, return_value=True) as mock_regenerate:
+            resumed.run()
+            mock_regenerate.assert_awaited_once_with("ccc", False)
+
+    def test_estimate_totals_and_skips_projects_without_transcriptions(self):
+        trans_file = os.path.join(self.temp_dir, 'raw-transcriptions', 'aaa_transcription_1.json')
+        with open(trans_file, 'w') as f:
+            json.dump({"text": "The system must export reports as PDF."}, f)
+
+        estimate = TRDRegenerationJob(self.handler).estimate(["aaa", "bbb"])
+
+        self.assertIsNone(estimate["projects"]["bbb"])
+        self.assertEqual(estimate["totals"]["skipped"], 1)
+        self.assertGreater(estimate["totals"]["prompt_tokens"], 0)
+        self.assertGreater(estimate["totals"]["estimated_cost"], 0)
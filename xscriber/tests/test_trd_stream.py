@@ -0,0 +1,101 @@
+import shutil
+import tempfile
+import threading
+from unittest.mock import patch
+from django.test import TestCase
+from xscriber.modules.trd_stream import TRDStreamBroker
+
+
+class TRDStreamBrokerTests(TestCase):
+    def setUp(self):
+        self.broker = TRDStreamBroker()
+
+    def test_get_state_unknown_project(self):
+        self.assertIsNone(self.broker.get_state("unknown"))
+
+    def test_generation_lifecycle(self):
+        self.broker.start("proj1")
+        self.broker.publish("proj1", "# Technical")
+        state = self.broker.get_state("proj1")
+        self.assertEqual(state["generation"], 1)
+        self.assertEqual(state["content"], "# Technical")
+        self.assertFalse(state["done"])
+
+        self.broker.complete("proj1", "# Technical Requirements Document")
+        self.assertTrue(self.broker.get_state("proj1")["done"])
+
+        self.broker.start("proj1")
+        self.assertEqual(self.broker.get_state("proj1")["generation"], 2)
+
+    def test_appended_deltas_accumulate_into_content(self):
+        self.broker.start("proj1")
+        for delta in ["# Technical ", "Requirements ", "Document"]:
+            self.broker.append("proj1", delta)
+        self.assertEqual(self.broker.wait_for_update("proj1", 1, 12, False, timeout=0.05)["content"],
+                         "# Technical Requirements Document")
+
+        # A new generation does not carry over unread deltas
+        self.broker.append("proj1", " draft")
+        self.broker.start("proj1")
+        self.broker.append("proj1", "# New")
+        self.assertEqual(self.broker.get_state("proj1")["content"], "# New")
+
+    def test_wait_for_update_times_out_without_changes(self):
+        self.broker.start("proj1")
+        self.assertIsNone(self.broker.wait_for_update("proj1", 1, 0, False, timeout=0.05))
+
+    def test_wait_for_update_wakes_on_publish(self):
+        self.broker.start("proj1")
+        timer = threading.Timer(0.05, self.broker.publish, args=("proj1", "partial"))
+        timer.start()
+
+        state = self.broker.wait_for_update("proj1", 1, 0, False, timeout=2.0)
+        timer.join()
+
+        self.assertEqual(state["content"], "partial")
+
+
+class FileBackedTRDStreamBrokerTests(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_state_is_shared_between_brokers(self):
+        # Two brokers on one directory stand in for a worker and a web process
+        worker = TRDStreamBroker(state_dir=self.temp_dir, write_interval=0)
+        web = TRDStreamBroker(state_dir=self.temp_dir, poll_interval=0.01)
+
+        worker.start("proj1")
+        worker.publish("proj1", "# Technical")
+        self.assertEqual(web.get_state("proj1")["content"], "# Technical")
+
+        timer = threading.Timer(0.05, worker.complete, args=("proj1", "# Technical Requirements Document"))
+        timer.start()
+        state = web.wait_for_update("proj1", 1, len("# Technical"), False, timeout=2.0)
+        timer.join()
+        self.assertTrue(state["done"])
+
+        worker.discard("proj1")
+        self.assertIsNone(web.get_state("proj1"))
+
+    def test_appended_tokens_are_written_by_the_writer_thread(self):
+        worker = TRDStreamBroker(state_dir=self.temp_dir, write_interval=0.05)
+        web = TRDStreamBroker(state_dir=self.temp_dir, poll_interval=0.01)
+        worker.start("proj1")
+
+        writers = []
+        dump_state = worker._dump_state
+
+        def record_writer(*args):
+            writers.append(threading.current_thread().name)
+            dump_state(*args)
+
+        with patch.object(worker, '_dump_state', side_effect=record_writer):
+            for delta in ["# Technical ", "Requirements"]:
+                worker.append("proj1", delta)
+            state = web.wait_for_update("proj1", 1, 0, False, timeout=2.0)
+
+        self.assertEqual(state["content"], "# Technical Requirements")
+        self.assertEqual(set(writers), {"trd-stream-writer"})
@@ -0,0 +1,48 @@
+from django.test import TestCase
+from xscriber.modules.usage_accounting import (track_usage, record_usage, aggregate_usage, merge_buckets,
+                                               empty_bucket, usage_ratios)
+
+
+class UsageAccountingTests(TestCase):
+    def test_track_usage_nests(self):
+        with track_usage() as outer:
+            record_usage({"kind": "chat"})
+            with track_usage() as inner:
+                record_usage({"kind": "transcription"})
+        record_usage({"kind": "untracked"})
+
+        self.assertEqual([r["kind"] for r in outer], ["chat", "transcription"])
+        self.assertEqual([r["kind"] for r in inner], ["transcription"])
+
+    def test_aggregate_separates_billed_cached_and_failed_calls(self):
+        records = [
+            {"timestamp": "2025-03-01T10:00:00", "model": "whisper-1", "audio_seconds": 60.0,
+             "latency_seconds": 1.5, "cached": False, "estimated_cost": 0.006},
+            {"timestamp": "2025-03-01T10:01:00", "model": "gpt-4o", "prompt_tokens": 500, "completion_tokens": 50,
+             "latency_seconds": 0.01, "cached": True, "estimated_cost": 0.00175},
+            {"timestamp": "2025-03-02T09:00:00", "model": "whisper-1", "audio_seconds": 0.0,
+             "latency_seconds": 30.0, "cached": False, "error": True, "estimated_cost": None},
+            {"timestamp": "2025-03-02T09:01:00", "model": "local-model", "prompt_tokens": 100,
+             "completion_tokens": 10, "latency_seconds": 1.0, "cached": False, "estimated_cost": None}
+        ]
+        usage = aggregate_usage(None, records, "transcription")
+
+        totals = usage["totals"]
+        self.assertEqual((totals["calls"], totals["cached_calls"], totals["errors"], totals["unpriced_calls"]),
+                         (4, 1, 1, 1))
+        self.assertEqual((totals["prompt_tokens"], totals["completion_tokens"]), (100, 10))
+        self.assertEqual((totals["cost"], totals["saved_cost"], totals["audio_seconds"]), (0.006, 0.00175, 60.0))
+        self.assertEqual(sorted(usage["daily"]), ["2025-03-01", "2025-03-02"])
+        self.assertEqual(usage["by_model"]["whisper-1"]["calls"], 2)
+
+        ratios = usage_ratios(totals, trd_versions=2)
+        self.assertEqual((ratios["audio_minutes"], ratios["cost_per_trd_version"], ratios["cost_per_audio_minute"]),
+                         (1.0, 0.003, 0.006))
+        self.assertEqual(ratios["cache_hit_rate"], 0.25)
+        self.assertIsNone(usage_ratios(empty_bucket(), 0)["cost_per_trd_version"])
+
+    def test_merge_buckets(self):
+        total = empty_bucket()
+        merge_buckets(total, {**empty_bucket(), "calls": 2, "cost": 0.1})
+        merge_buckets(total, {**empty_bucket(), "calls": 1, "cost": 0.2})
+        self.assertEqual((total["calls"], total["cost"]), (3, 0.3))
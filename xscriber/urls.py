@@ -7,10 +7,27 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('api/projects/', views.project_list, name='project_list'),
     path('api/projects/<str:project_id>/', views.project_detail, name='project_detail'),
+    path('api/projects/<str:project_id>/trd/', views.trd_document, name='trd_document'),
+    path('api/projects/<str:project_id>/trd/stream/', views.trd_stream, name='trd_stream'),
+    path('api/projects/<str:project_id>/finalize/', views.finalize_session, name='finalize_session'),
+    path('api/projects/<str:project_id>/regenerate/', views.regenerate_trd, name='regenerate_trd'),
+    path('api/projects/<str:project_id>/model_policy/', views.model_policy, name='model_policy'),
+    path('api/projects/<str:project_id>/usage/', views.project_usage, name='project_usage'),
     path('api/projects/<str:project_id>/transcriptions/', views.transcription_list, name='transcription_list'),
     path('api/projects/<str:project_id>/transcriptions/<int:chunk_id>/', views.transcription_detail, name='transcription_detail'),
+    path('api/projects/<str:project_id>/audio/session/', views.session_audio, name='session_audio'),
+    path('api/projects/<str:project_id>/audio/session/index/', views.session_audio_index, name='session_audio_index'),
+    path('api/projects/<str:project_id>/audio/<int:chunk_id>/', views.audio_chunk, name='audio_chunk'),
+    path('api/projects/<str:project_id>/chunks/<int:chunk_id>/trace/', views.chunk_trace, name='chunk_trace'),
+    path('api/usage/', views.usage_report, name='usage_report'),
+    path('api/search/', views.search_transcriptions, name='search_transcriptions'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('api/pipeline/status/', views.pipeline_status, name='pipeline_status'),
+    path('api/admin/profiling/', views.profiling, name='profiling'),
+    path('api/admin/profiling/<str:session_id>/<str:name>', views.profile_download, name='profile_download'),
     path('api/recording/start/', views.start_recording, name='start_recording'),
     path('api/recording/stop/', views.stop_recording, name='stop_recording'),
+    path('api/recording/sessions/', views.recording_sessions, name='recording_sessions'),
     path('api/recording/upload_chunk/', views.upload_audio_chunk, name='upload_audio_chunk'),
     path('api/create_project/', views.create_project, name='create_project'),
     path('api/delete_project/<str:project_id>/', views.delete_project, name='delete_project'),
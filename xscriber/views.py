@@ -1,15 +1,26 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse, FileResponse
+from django.conf import settings
+from django.middleware.csrf import CsrfViewMiddleware
 from django.views.decorators.csrf import csrf_exempt
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 import json
+import hmac
 import os
 import tempfile
-from pydub import AudioSegment
+import time
 from .modules.project_handler import ProjectHandler
+from .modules.recording_handler import RecordingLimitError
+from .modules import metrics
+from .modules.structured_log import get_logger, log_context, chunk_correlation_id
+from .modules.chunk_trace import new_trace_id, trace_span
+from .modules.audio_stream import (CONTENT_TYPES, RangeNotSatisfiable, SessionAudioIndex,
+                                   iter_file_range, parse_range_header)
 
 project_handler = ProjectHandler()
+log = get_logger("views")
+upload_log = get_logger("upload")
 
 
 def index(request):
@@ -41,6 +52,65 @@ def project_detail(request, project_id):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+def trd_document(request, project_id):
+    try:
+        document = project_handler.get_trd_document(project_id)
+        if not document:
+            return JsonResponse({'error': 'TRD not found'}, status=404)
+
+        return JsonResponse({'project_id': project_id, 'trd': document.to_dict()})
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def trd_stream(request, project_id):
+    """
+    Server-Sent Events stream of the project's TRD as it is being generated.
+
+    Events:
+      snapshot - full TRD content (sent on connect and when a new generation starts)
+      delta    - text appended to the current generation since the previous event
+      complete - final committed TRD content
+    """
+    if not project_handler.get_project_metadata(project_id):
+        return JsonResponse({'error': 'Project not found'}, status=404)
+
+    def format_event(event, payload):
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+    def event_stream():
+        state = project_handler.trd_stream.get_state(project_id)
+        if state:
+            generation, content, done = state["generation"], state["content"], state["done"]
+        else:
+            generation, content, done = 0, project_handler.get_trd_content(project_id), True
+
+        yield "retry: 3000\n\n"
+        yield format_event('complete' if done else 'snapshot', {'generation': generation, 'content': content})
+
+        # Bound the connection lifetime; EventSource reconnects automatically
+        deadline = time.time() + 300
+        while time.time() < deadline:
+            state = project_handler.trd_stream.wait_for_update(project_id, generation, len(content), done)
+            if state is None:
+                yield ": keep-alive\n\n"
+                continue
+
+            if state["done"]:
+                yield format_event('complete', {'generation': state["generation"], 'content': state["content"]})
+            elif state["generation"] != generation or not state["content"].startswith(content):
+                yield format_event('snapshot', {'generation': state["generation"], 'content': state["content"]})
+            else:
+                yield format_event('delta', {'generation': state["generation"], 'delta': state["content"][len(content):]})
+
+            generation, content, done = state["generation"], state["content"], state["done"]
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 def transcription_list(request, project_id):
     try:
         transcriptions = project_handler.get_transcriptions(project_id)
@@ -62,6 +132,105 @@ def transcription_detail(request, project_id, chunk_id):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+def _ranged_response(request, size, content_type, read_range):
+    """Serve read_range(start, end) for the request's Range header, or the whole resource"""
+    try:
+        byte_range = parse_range_header(request.META.get('HTTP_RANGE'), size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    start, end = byte_range or (0, size - 1)
+    response = StreamingHttpResponse(read_range(start, end) if size else iter(()),
+                                     status=206 if byte_range else 200, content_type=content_type)
+    response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def audio_chunk(request, project_id, chunk_id):
+    audio_file = project_handler.get_audio_chunk_file(project_id, chunk_id)
+    if not audio_file:
+        return JsonResponse({'error': 'Audio chunk not found'}, status=404)
+
+    return _ranged_response(request, audio_file.stat().st_size, CONTENT_TYPES[audio_file.suffix[1:]],
+                            lambda start, end: iter_file_range(audio_file, start, end))
+
+
+def session_audio(request, project_id):
+    """The project's WAV chunks played back to back as one WAV, assembled on the fly"""
+    index = project_handler.refresh_audio_index(project_id)
+    if not index or not index['chunks']:
+        return JsonResponse({'error': 'No playable audio for this project'}, status=404)
+
+    audio_dir = project_handler.audio_dir
+    return _ranged_response(request, index['size'], CONTENT_TYPES['wav'],
+                            lambda start, end: SessionAudioIndex.iter_session_bytes(index, audio_dir, start, end))
+
+
+def session_audio_index(request, project_id):
+    """Chunk offsets within the session stream; ?chunk_id=&t= resolves a seek target"""
+    index = project_handler.refresh_audio_index(project_id)
+    if index is None:
+        return JsonResponse({'error': 'Failed to index audio'}, status=500)
+
+    data = {key: index[key] for key in ('format', 'duration', 'size', 'chunks', 'skipped')}
+    if 'chunk_id' in request.GET:
+        try:
+            chunk_id = int(request.GET['chunk_id'])
+            offset = float(request.GET.get('t', 0))
+        except ValueError:
+            return JsonResponse({'error': 'chunk_id and t must be numbers'}, status=400)
+
+        session_time = SessionAudioIndex.session_time(index, chunk_id, offset)
+        if session_time is None:
+            return JsonResponse({'error': 'Chunk is not part of the session stream'}, status=404)
+        data['seek'] = {'session_time': session_time,
+                        'byte_offset': SessionAudioIndex.byte_offset(index, session_time)}
+
+    return JsonResponse(data)
+
+
+def search_transcriptions(request):
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'q is required'}, status=400)
+
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+        offset = max(int(request.GET.get('offset', 0)), 0)
+    except ValueError:
+        return JsonResponse({'error': 'limit and offset must be integers'}, status=400)
+
+    try:
+        results = project_handler.search_transcriptions(
+            query, project_id=request.GET.get('project_id') or None, limit=limit, offset=offset
+        )
+        return JsonResponse({'query': query, 'results': results})
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def metrics_view(request):
+    """Prometheus text exposition of this process's stage latencies, counters and gauges"""
+    try:
+        project_handler.refresh_metrics()
+    except Exception as e:
+        log.error("Error refreshing metrics: %s", e)
+    return HttpResponse(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
+def pipeline_status(request):
+    """Job counts from the shared journal; workers may be running in other processes"""
+    try:
+        return JsonResponse({'pipeline': project_handler.get_pipeline_stats()})
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
 @csrf_exempt
 def start_recording(request):
     if request.method == 'POST':
@@ -72,7 +241,11 @@ def start_recording(request):
             if not project_id:
                 return JsonResponse({'error': 'project_id is required'}, status=400)
 
-            success = project_handler.start_recording(project_id)
+            try:
+                success = project_handler.start_recording(project_id, data.get('input_device_index'))
+            except RecordingLimitError as e:
+                return JsonResponse({'error': str(e),
+                                     'sessions': project_handler.get_recording_sessions()}, status=429)
 
             if success:
                 return JsonResponse({'status': 'recording_started', 'project_id': project_id})
@@ -88,10 +261,13 @@ def start_recording(request):
 def stop_recording(request):
     if request.method == 'POST':
         try:
-            success = project_handler.stop_recording()
+            # Without a project_id, stops the only active session
+            data = json.loads(request.body) if request.body else {}
+            project_id = data.get('project_id')
+            success = project_handler.stop_recording(project_id)
 
             if success:
-                return JsonResponse({'status': 'recording_stopped'})
+                return JsonResponse({'status': 'recording_stopped', 'project_id': project_id})
             else:
                 return JsonResponse({'error': 'Failed to stop recording'}, status=500)
 
@@ -100,6 +276,157 @@ def stop_recording(request):
     return JsonResponse({'error': 'Method not allowed'}, status=405)
 
 
+def recording_sessions(request):
+    return JsonResponse({'sessions': project_handler.get_recording_sessions()})
+
+
+@csrf_exempt
+def finalize_session(request, project_id):
+    """Queue the end-of-session TRD pass with the project's final-tier model"""
+    if request.method == 'POST':
+        try:
+            if not project_handler.finalize_session(project_id):
+                return JsonResponse({'error': 'Project not found'}, status=404)
+
+            return JsonResponse({'status': 'final_pass_queued', 'project_id': project_id})
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
+    return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+
+@csrf_exempt
+def regenerate_trd(request, project_id):
+    """Queue a comprehensive TRD regeneration ahead of bulk work"""
+    if request.method == 'POST':
+        try:
+            if not project_handler.queue_trd_regeneration(project_id):
+                return JsonResponse({'error': 'Project not found'}, status=404)
+
+            return JsonResponse({'status': 'regeneration_queued', 'project_id': project_id})
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
+    return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+
+@csrf_exempt
+def model_policy(request, project_id):
+    try:
+        if not project_handler.get_project_metadata(project_id):
+            return JsonResponse({'error': 'Project not found'}, status=404)
+
+        if request.method == 'POST':
+            data = json.loads(request.body)
+            try:
+                project_handler.set_model_policy(project_id, data)
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+        elif request.method != 'GET':
+            return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+        return JsonResponse({'project_id': project_id, 'model_policy': project_handler.get_model_policy(project_id)})
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def project_usage(request, project_id):
+    try:
+        usage = project_handler.get_project_usage(project_id)
+        if usage is None:
+            return JsonResponse({'error': 'Project not found'}, status=404)
+        return JsonResponse(usage)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def chunk_trace(request, project_id, chunk_id):
+    """A chunk's timeline from upload to the first TRD version that included it"""
+    try:
+        timeline = project_handler.get_chunk_timeline(project_id, chunk_id)
+        if timeline is None:
+            return JsonResponse({'error': 'Chunk not found'}, status=404)
+        return JsonResponse(timeline)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def _profiling_access_error(request):
+    """
+    Profiling is for staff users (Django admin login) or callers presenting PROFILING_TOKEN
+    as a bearer token; returns the error response for anyone else
+    """
+    token = getattr(settings, 'PROFILING_TOKEN', '')
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if token and authorization.startswith('Bearer ') and hmac.compare_digest(authorization[7:], token):
+        return None
+
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    if not user.is_staff:
+        return JsonResponse({'error': 'Staff access required'}, status=403)
+    # Cookie-authenticated changes still need the CSRF token
+    if request.method not in ('GET', 'HEAD'):
+        return CsrfViewMiddleware(lambda r: None).process_view(request, None, (), {})
+    return None
+
+
+@csrf_exempt
+def profiling(request):
+    """
+    GET: the active profiling session and the profiles written so far.
+    POST {"mode", "scope", "duration_seconds", "max_units", "tracemalloc"}: start a session.
+    DELETE: stop it.
+    """
+    error = _profiling_access_error(request)
+    if error is not None:
+        return error
+    try:
+        if request.method == 'POST':
+            data = json.loads(request.body or b'{}')
+            try:
+                session = project_handler.profiler.start(
+                    data.get('mode', 'cprofile'), scope=data.get('scope', 'all'),
+                    duration_seconds=data.get('duration_seconds'), max_units=data.get('max_units'),
+                    allocations=bool(data.get('tracemalloc'))
+                )
+            except (TypeError, ValueError) as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            return JsonResponse({'session': session})
+        if request.method == 'DELETE':
+            return JsonResponse({'stopped': project_handler.profiler.stop()})
+        if request.method != 'GET':
+            return JsonResponse({'error': 'Method not allowed'}, status=405)
+        return JsonResponse(project_handler.profiler.status())
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def profile_download(request, session_id, name):
+    error = _profiling_access_error(request)
+    if error is not None:
+        return error
+    path = project_handler.profiler.get_profile_file(session_id, name)
+    if path is None:
+        return JsonResponse({'error': 'Profile not found'}, status=404)
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=f"{session_id}-{name}")
+
+
+def usage_report(request):
+    """API spend per day and per project; ?days=N limits it to the last N days"""
+    try:
+        days = request.GET.get('days')
+        try:
+            days = int(days) if days else None
+        except ValueError:
+            return JsonResponse({'error': 'days must be a whole number'}, status=400)
+        if days is not None and days < 1:
+            return JsonResponse({'error': 'days must be at least 1'}, status=400)
+
+        return JsonResponse(project_handler.get_usage_report(days))
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
 @csrf_exempt
 def create_project(request):
     if request.method == 'POST':
@@ -131,8 +458,20 @@ def upload_audio_chunk(request):
             if not all([project_id, audio_file]):
                 return JsonResponse({'error': 'Missing required parameters'}, status=400)
 
-            # Automatically determine the next chunk number based on existing files
-            output_dir = os.path.join('data', 'audio-recordings')
+            # Backpressure: turn the chunk away before it is written or converted when the
+            # pipeline is behind; the recorder keeps it buffered and retries after Retry-After
+            with log_context(project_id=project_id):
+                admission = project_handler.check_upload_admission(project_id)
+            if not admission['admitted']:
+                response = JsonResponse({'error': 'Server is busy, retry later', **admission},
+                                        status=429)
+                response['Retry-After'] = str(admission['retry_after'])
+                return response
+
+            # Automatically determine the next chunk number based on existing files. Chunks go
+            # to the handler's audio directory, where transcription and playback look for them
+            output_dir = str(project_handler.audio_dir)
+            os.makedirs(output_dir, exist_ok=True)
             existing_files = [f for f in os.listdir(output_dir) if f.startswith(f"{project_id}_audiochunk_") and (f.endswith('.webm') or f.endswith('.wav'))]
 
             if not existing_files:
@@ -150,8 +489,13 @@ def upload_audio_chunk(request):
                         continue
                 chunk_number = max_chunk + 1
 
+            # Spans of the chunk's trace, which follows it through transcription and the TRD
+            trace_id = new_trace_id()
+            spans = []
+
             # Create temporary file for the uploaded audio
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.webm') as temp_webm:
+            with tempfile.NamedTemporaryFile(delete=False, suffix='.webm') as temp_webm, \
+                    metrics.STAGE_SECONDS.time(stage="upload_receive"), trace_span("upload_receive", spans):
                 for chunk in audio_file.chunks():
                     temp_webm.write(chunk)
                 temp_webm_path = temp_webm.name
@@ -159,34 +503,33 @@ def upload_audio_chunk(request):
             try:
                 # Try to convert WebM to WAV using pydub (requires ffmpeg)
                 try:
-                    audio = AudioSegment.from_file(temp_webm_path, format="webm")
-
-                    # Ensure the output directory exists
-                    output_dir = os.path.join('data', 'audio-recordings')
-                    os.makedirs(output_dir, exist_ok=True)
+                    with metrics.STAGE_SECONDS.time(stage="decode"), trace_span("decode", spans):
+                        audio = project_handler.audio_decoder.from_file(temp_webm_path, format="webm")
 
                     # Save as WAV file
                     filename = f"{project_id}_audiochunk_{chunk_number}.wav"
                     wav_path = os.path.join(output_dir, filename)
 
                     # Export as WAV with settings compatible with Whisper
-                    audio.export(wav_path, format="wav", parameters=["-ar", "16000"])
+                    with metrics.STAGE_SECONDS.time(stage="audio_write"), trace_span("audio_write", spans):
+                        audio.export(wav_path, format="wav", parameters=["-ar", "16000"])
 
                     file_size = os.path.getsize(wav_path)
                     duration = len(audio) / 1000.0
 
                 except Exception as conversion_error:
                     # Fallback: Save WebM directly and let OpenAI handle it
-                    print(f"Audio conversion failed (ffmpeg not available): {conversion_error}")
-                    output_dir = os.path.join('data', 'audio-recordings')
-                    os.makedirs(output_dir, exist_ok=True)
-
+                    metrics.STAGE_ERRORS.inc(stage="decode")
+                    upload_log.warning("Audio conversion failed (ffmpeg not available): %s", conversion_error,
+                                       extra={"project_id": project_id, "trace_id": trace_id,
+                                              "correlation_id": chunk_correlation_id(project_id, chunk_number)})
                     filename = f"{project_id}_audiochunk_{chunk_number}.webm"
                     webm_path = os.path.join(output_dir, filename)
 
                     # Copy the temp file to final location
                     import shutil
-                    shutil.copy2(temp_webm_path, webm_path)
+                    with trace_span("audio_write", spans, format="webm"):
+                        shutil.copy2(temp_webm_path, webm_path)
 
                     file_size = os.path.getsize(webm_path)
                     duration = None  # Can't determine without conversion
@@ -194,12 +537,17 @@ def upload_audio_chunk(request):
 
                 # Queue the file for transcription (works with WebM too)
                 full_path = os.path.abspath(wav_path)
-                project_handler._queue_transcription(project_id, full_path)
+                project_handler._queue_transcription(project_id, full_path, trace_id=trace_id, spans=spans)
+
+                # The last chunk of a session triggers the final-tier TRD pass
+                if request.POST.get('final') == 'true':
+                    project_handler.finalize_session(project_id)
 
                 return JsonResponse({
                     'status': 'success',
                     'filename': filename,
                     'chunk_number': chunk_number,
+                    'trace_id': trace_id,
                     'size': file_size,
                     'duration': duration,
                     'format': 'wav' if filename.endswith('.wav') else 'webm',